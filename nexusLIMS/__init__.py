@@ -68,6 +68,176 @@ See the ``.env.example`` file for more documentation and examples.
     is provided in the ``.env.example`` file that should work for most users,
     but this setting allows for further customization of the file-finding routine.
 
+.. _NexusLIMS-file-finder:
+
+`NexusLIMS_file_finder`
+    The method used to find the files for each session. ``gnu`` (the default)
+    uses the system's GNU ``find`` command (see
+    :py:func:`~nexusLIMS.utils.gnu_find_file_info_by_mtime`), while
+    ``scandir`` uses a pure Python implementation that lists directories
+    concurrently (see
+    :py:func:`~nexusLIMS.utils.scandir_find_file_info_by_mtime`), which does
+    not require ``find`` and can be faster on high-latency network shares.
+    Both return the same files.
+
+.. _NexusLIMS-find-processes:
+
+`NexusLIMS_find_processes`
+    When an instrument's data folder contains symbolic links to other folders
+    (such as separate storage volumes), GNU ``find`` searches each linked folder
+    in a separate process. This sets how many of those processes can run at
+    once (defaults to ``4``; ``1`` searches all the folders with a single
+    ``find`` command).
+
+.. _NexusLIMS-extraction-workers:
+
+`NexusLIMS_extraction_workers`
+    The number of worker processes used to extract metadata and generate preview
+    images for the files of a session. If ``0`` (the default), files are
+    processed one at a time in the record builder process. Any larger value
+    distributes the files over a pool of that many processes; the results are
+    reassembled in modification-time order, so the generated records are
+    identical either way. When using worker processes, a file that cannot be
+    processed is logged and left out of the record, rather than causing the
+    whole session to fail.
+
+.. _NexusLIMS-session-workers:
+
+`NexusLIMS_session_workers`
+    The maximum number of sessions for which records are built at the same
+    time. If ``1`` (the default), sessions are built one after another. With
+    a larger value, sessions are built concurrently, and metadata extraction
+    for each session is done in worker processes (see
+    :ref:`NexusLIMS_extraction_workers <NexusLIMS-extraction-workers>`) since
+    preview generation cannot be run in multiple threads.
+
+.. _NexusLIMS-instrument-session-workers:
+
+`NexusLIMS_instrument_session_workers`
+    When building sessions concurrently, the maximum number of sessions from
+    any single instrument that will be built at the same time (defaults to
+    ``1``). This limits the load placed on any one instrument's file share.
+
+.. _NexusLIMS-extraction-cache:
+
+`NexusLIMS_extraction_cache`
+    If set to ``true``, the metadata extracted from each file is stored in a
+    cache database next to the NexusLIMS database (see
+    :py:mod:`~nexusLIMS.extractors.cache`), and is reused when building a
+    record that includes a file that has not changed since it was last
+    extracted. Defaults to ``false``.
+
+.. _NexusLIMS-extraction-stats:
+
+`NexusLIMS_extraction_stats`
+    If set to ``true``, the time taken (and the memory used) to extract the
+    metadata of (and generate a preview for) each file is recorded in a
+    database next to the NexusLIMS database, which can be summarized with
+    ``python -m nexusLIMS.extractors.stats --report`` (see
+    :py:mod:`~nexusLIMS.extractors.stats`). Defaults to ``false``.
+
+.. _NexusLIMS-force-preview-refresh:
+
+`NexusLIMS_force_preview_refresh`
+    When building records, preview images are only regenerated if the file
+    they were created from (or the preview rendering code, or the
+    :ref:`NexusLIMS_thumbnail_renderer <NexusLIMS-thumbnail-renderer>`) has
+    changed since they were last generated. If this variable is set to ``true``, all preview
+    images are regenerated instead. Defaults to ``false``.
+
+.. _NexusLIMS-thumbnail-renderer:
+
+`NexusLIMS_thumbnail_renderer`
+    How preview images of files containing a single 2D image are drawn.
+    ``matplotlib`` (the default) plots the image with HyperSpy, while
+    ``pillow`` draws the image (down-sampled, with its contrast stretched),
+    its scalebar and its title directly with NumPy and Pillow, which is much
+    faster. Previews of other kinds of data, of RGB images, and of
+    DigitalMicrograph images with annotations are always drawn with
+    matplotlib. Changing this setting causes existing previews to be
+    regenerated (with the new renderer) the next time they are needed.
+
+.. _NexusLIMS-file-index:
+
+`NexusLIMS_file_index`
+    If set to ``true``, the files in each instrument's data folder are
+    recorded in an index database next to the NexusLIMS database (see
+    :py:mod:`~nexusLIMS.db.file_index`), which is updated before new sessions
+    are built and then used to find the files for each session, rather than
+    searching the whole folder each time. If an instrument's index is not up to
+    date, the folder is searched directly instead. Defaults to ``false``.
+
+.. _NexusLIMS-file-watcher-mode:
+
+`NexusLIMS_file_watcher_mode`
+    How the :py:mod:`~nexusLIMS.db.file_watcher` detects changes to the files
+    in each instrument's data folder. ``inotify`` uses Linux's file system
+    notifications, ``poll`` periodically scans each folder for changes, and
+    ``auto`` (the default) uses ``inotify`` except for folders on network file
+    systems (where it cannot see changes made by other machines).
+
+.. _NexusLIMS-file-watcher-poll-interval:
+
+`NexusLIMS_file_watcher_poll_interval`
+    The number of seconds between scans of each polled data folder when
+    running the :py:mod:`~nexusLIMS.db.file_watcher` (defaults to ``300``).
+
+.. _NexusLIMS-clustering-method:
+
+`NexusLIMS_clustering_method`
+    How the files of a session are grouped into acquisition activities (see
+    :py:func:`~nexusLIMS.schemas.activity.cluster_filelist_mtimes`). ``fast``
+    (the default) computes the kernel density estimate of the files'
+    modification times with :py:mod:`~nexusLIMS.schemas.kde`, which takes
+    close to linear time in the number of files, while ``grid_search`` uses
+    scikit-learn's leave-one-out grid search, which fits a separate estimate
+    for every file and becomes very slow for sessions with many files. Both
+    give the same activities.
+
+.. _NexusLIMS-segmentation-strategy:
+
+`NexusLIMS_segmentation_strategy`
+    The strategy used to split the files of a session into acquisition
+    activities (see :py:mod:`~nexusLIMS.schemas.segmentation`): ``kde`` (the
+    default) finds minima in the density of file modification times,
+    ``gap_quantile`` splits at gaps much longer than is typical for the session,
+    and ``changepoint`` splits where a gap is unusually long compared to the
+    rest of the current activity. To use different strategies for different
+    instruments, provide a JSON object mapping instrument names (or
+    ``"default"``) to strategy names instead, such as
+    ``{"default": "kde", "FEI-Quanta200-ESEM-633137_n": "gap_quantile"}``.
+
+.. _NexusLIMS-metrics-file:
+
+`NexusLIMS_metrics_file`
+    If set, the path of a file to which the record builder appends one line of
+    JSON for every session it builds (and every batch of records it uploads),
+    giving the wall time, CPU time, number of files and bytes read of each
+    stage of building the record (see :py:mod:`~nexusLIMS.builder.metrics`).
+
+.. _NexusLIMS-metrics-textfile:
+
+`NexusLIMS_metrics_textfile`
+    If set, the path of a file (ending in ``.prom``) that the record builder
+    keeps up to date with the total time, files and bytes read of each stage
+    for each instrument, in the format read by the "textfile" collector of the
+    Prometheus node exporter.
+
+.. _NexusLIMS-daemon-interval:
+
+`NexusLIMS_daemon_interval`
+    The number of seconds the record builder
+    :py:mod:`daemon <nexusLIMS.builder.daemon>` waits between checks for new
+    sessions to build (300 by default).
+
+.. _NexusLIMS-daemon-status-file:
+
+`NexusLIMS_daemon_status_file`
+    The JSON file to which the record builder
+    :py:mod:`daemon <nexusLIMS.builder.daemon>` writes its state. If not set,
+    ``nexuslims_builder_status.json`` in the same folder as the
+    :ref:`nexusLIMS_db_path <nexusLIMS-db-path>` is used.
+
 .. _nexusLIMS-user:
 
 `nexusLIMS_user`
@@ -0,0 +1,615 @@
+#  NIST Public License - 2019
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Run the record builder continuously, instead of once per ``cron`` invocation.
+
+Each run of ``process_new_records.sh`` starts a new Python interpreter, which
+has to import HyperSpy, scikit-learn, matplotlib, etc. and read the
+instruments from the database before it can check for new sessions (and
+every metadata extraction worker process has to do the same). The
+:py:class:`BuilderDaemon` instead stays running: every
+:ref:`NexusLIMS_daemon_interval <NexusLIMS-daemon-interval>` seconds it
+harvests new usage events and builds and uploads the records of any sessions
+waiting to be built (using
+:py:func:`~nexusLIMS.builder.record_builder.process_new_records`), keeping
+its imports and metadata extraction worker processes (see
+:py:func:`~nexusLIMS.builder.record_builder.keep_extraction_pool`) between
+checks. Only the usage events that started since the previous successful
+harvest (less :py:data:`HARVEST_OVERLAP`, and no later than the start of the
+oldest event that was still in progress then) are harvested, rather than
+those of the last week every time. The instruments are re-read from the
+database before every check, so changes to them are picked up without a
+restart (the extraction worker processes are restarted when the instruments
+change).
+
+Like ``process_new_records.sh``, the daemon does not build records while the
+``.builder.lock`` file in the parent folder of ``nexusLIMS_path`` exists, and
+creates it while building, so that the two never run at the same time (while
+moving from one to the other, for instance). The daemon writes its process ID
+and host name to the lock file, so that a lock left behind by a daemon that
+was killed while building is removed by the next one started on the same host.
+
+The state of the daemon is written to a JSON status file (see
+:py:func:`get_status_path`) when it changes, and at least once a minute, which
+can be used to monitor it. For example, to start the daemon and check on it
+(the check exits with an error if the daemon is not running, has stopped
+updating its status file, if its last few checks failed or found the lock
+file, or if none of its checks succeeded for a long time):
+
+.. code-block:: bash
+
+    $ poetry run python -m nexusLIMS.builder.daemon -v
+    $ poetry run python -m nexusLIMS.builder.daemon --check
+
+The daemon stops once the check in progress (if any) is finished when it
+receives ``SIGTERM`` or ``SIGINT``; a second signal stops it immediately.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+from contextlib import nullcontext
+from datetime import datetime as dt
+from datetime import timedelta as td
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from nexusLIMS.builder import record_builder
+from nexusLIMS.harvesters.nemo import utils as nemo_utils
+from nexusLIMS.instruments import reload_instrument_db
+from nexusLIMS.utils import current_system_tz, get_env_int
+from nexusLIMS.version import __version__
+
+logger = logging.getLogger(__name__)
+
+STATUS_FILENAME = "nexuslims_builder_status.json"
+LOCK_FILENAME = ".builder.lock"
+DEFAULT_INTERVAL = 300
+HEARTBEAT = 60
+HARVEST_WINDOW = td(weeks=1)
+HARVEST_OVERLAP = td(minutes=30)
+MIN_SUCCESS_AGE = td(hours=6)
+
+
+def get_status_path() -> Path:
+    """
+    Get the path of the daemon's status file.
+
+    This is the value of
+    :ref:`NexusLIMS_daemon_status_file <NexusLIMS-daemon-status-file>`, if
+    set, and otherwise ``nexuslims_builder_status.json`` in the same folder as
+    the NexusLIMS database.
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the status file
+    """
+    path = os.environ.get("NexusLIMS_daemon_status_file")
+    if path:
+        return Path(path)
+    return Path(os.environ["nexusLIMS_db_path"]).with_name(STATUS_FILENAME)
+
+
+def get_lock_path() -> Path:
+    """
+    Get the path of the lock file shared with ``process_new_records.sh``.
+
+    Returns
+    -------
+    pathlib.Path
+        The ``.builder.lock`` file in the parent folder of ``nexusLIMS_path``
+    """
+    return Path(os.environ["nexusLIMS_path"]).parent / LOCK_FILENAME
+
+
+def _now() -> dt:
+    return dt.now(tz=current_system_tz())
+
+
+def _acquire_lock(lock_path: Path) -> bool:
+    """
+    Create the lock file, unless another record builder holds it.
+
+    A stale lock (see :py:func:`_lock_is_stale`) is removed first.
+
+    Returns
+    -------
+    bool
+        Whether the lock file was created
+    """
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _lock_is_stale(lock_path):
+                return False
+            logger.warning(
+                "Removing lock file at %s left by a process that no longer exists",
+                lock_path,
+            )
+            lock_path.unlink(missing_ok=True)
+        else:
+            os.write(fd, f"{os.getpid()} {socket.gethostname()}\n".encode())
+            os.close(fd)
+            return True
+    return False
+
+
+def _lock_is_stale(lock_path: Path) -> bool:
+    """
+    Check whether a lock file was left by a process that no longer exists.
+
+    Only locks written by a daemon (with its process ID and host name) on this
+    host can be checked; any other lock (such as the empty one created by
+    ``process_new_records.sh``) is assumed to be held.
+    """
+    try:
+        pid, host = lock_path.read_text(encoding="utf-8").split()
+        pid = int(pid)
+    except (OSError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # e.g. PermissionError: the process exists, but belongs to another user
+        return False
+    return False
+
+
+class BuilderDaemon:
+    """
+    A record builder that checks for sessions to build at a regular interval.
+
+    Parameters
+    ----------
+    interval
+        The number of seconds to wait between the end of one check for new
+        sessions and the start of the next. If ``None``, the value of
+        :ref:`NexusLIMS_daemon_interval <NexusLIMS-daemon-interval>` is used
+        (five minutes by default)
+    status_path
+        The status file to write. If ``None``, :py:func:`get_status_path` is
+        used
+    harvest_window
+        How far back to look for new usage events at the first check after
+        starting (as is done when running the record builder once); later
+        checks only look back to the start of the previous successful harvest
+
+    Attributes
+    ----------
+    status : dict
+        The current status of the daemon, as written to the status file
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        status_path: Optional[Path] = None,
+        harvest_window: td = HARVEST_WINDOW,
+    ):
+        if interval is None:
+            interval = get_env_int(
+                "NexusLIMS_daemon_interval",
+                DEFAULT_INTERVAL,
+                minimum=1,
+            )
+        self.interval = interval
+        self.status_path = get_status_path() if status_path is None else status_path
+        self.harvest_window = harvest_window
+        self._stop = threading.Event()
+        self._status_lock = threading.Lock()
+        self.status: Dict[str, Any] = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "version": __version__,
+            "started": _now().isoformat(),
+            "updated": None,
+            "state": "starting",
+            "interval": interval,
+            "cycles": 0,
+            "consecutive_errors": 0,
+            "consecutive_locked": 0,
+            "last_cycle": None,
+            "last_success": None,
+            "last_harvest": None,
+            "oldest_unfinished_event": None,
+            "next_cycle": None,
+        }
+
+    def update_status(self, **values):
+        """
+        Update the status of the daemon and write it to the status file.
+
+        The file is replaced atomically, so it can be read at any time.
+
+        Parameters
+        ----------
+        **values
+            The status values to change
+        """
+        with self._status_lock:
+            self.status.update(values, updated=_now().isoformat())
+            tmp_path = self.status_path.with_name(f".{self.status_path.name}.tmp")
+            try:
+                self.status_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path.write_text(
+                    json.dumps(self.status, indent=2) + "\n",
+                    encoding="utf-8",
+                )
+                tmp_path.replace(self.status_path)
+            except OSError as exc:
+                logger.warning("Could not write status file %s: %s", tmp_path, exc)
+
+    def stop(self):
+        """Stop the daemon once the check in progress (if any) is finished."""
+        self._stop.set()
+
+    def run_cycle(self) -> Dict[str, Any]:
+        """
+        Check for new sessions once, and build and upload their records.
+
+        Returns
+        -------
+        dict
+            The start and end time, result (``"built"``, ``"no_sessions"``,
+            ``"locked"`` or ``"error"``), number of records built and error
+            message (if any) of the check
+        """
+        started = _now()
+        cycle = {"started": started.isoformat(), "records": 0, "error": None}
+        lock_path = get_lock_path()
+        if not _acquire_lock(lock_path):
+            logger.warning(
+                "Lock file at %s exists, so not building any records",
+                lock_path,
+            )
+            cycle["result"] = "locked"
+        else:
+            self.update_status(state="building")
+            try:
+                if reload_instrument_db():
+                    # the extraction workers still have the old instruments
+                    record_builder.recycle_extraction_pool()
+                unfinished = nemo_utils.add_all_usage_events_to_db(
+                    dt_from=self._harvest_start(started),
+                )
+                if unfinished is not None:
+                    unfinished = unfinished.isoformat()
+                self.update_status(
+                    last_harvest=started.isoformat(),
+                    oldest_unfinished_event=unfinished,
+                )
+                xml_files = record_builder.process_new_records(harvest=False)
+            except SystemExit as exc:
+                # build_new_session_records() exits if there is nothing to build
+                logger.info("%s", exc.code)
+                cycle["result"] = "no_sessions"
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.exception("Error while building new records")
+                cycle["result"] = "error"
+                cycle["error"] = repr(exc)
+            else:
+                cycle["result"] = "built"
+                cycle["records"] = len(xml_files)
+            finally:
+                lock_path.unlink(missing_ok=True)
+        cycle["finished"] = _now().isoformat()
+        return cycle
+
+    def _harvest_start(self, now: dt) -> dt:
+        """
+        Get the time from which to harvest usage events in a check.
+
+        Parameters
+        ----------
+        now
+            The start time of the check
+
+        Returns
+        -------
+        datetime.datetime
+            ``now`` less :py:attr:`harvest_window` if no harvest succeeded yet;
+            otherwise the start of the last successful harvest less
+            :py:data:`HARVEST_OVERLAP`, or the start of the oldest usage event
+            that was unfinished then, whichever is earlier (NEMO only returns
+            events by their start time, and unfinished events are not added to
+            the database)
+        """
+        if self.status["last_harvest"] is None:
+            return now - self.harvest_window
+        start = dt.fromisoformat(self.status["last_harvest"]) - HARVEST_OVERLAP
+        if self.status["oldest_unfinished_event"] is not None:
+            start = min(start, dt.fromisoformat(self.status["oldest_unfinished_event"]))
+        return start
+
+    def run(self, max_cycles: Optional[int] = None):
+        """
+        Check for new sessions at a regular interval until stopped.
+
+        Parameters
+        ----------
+        max_cycles
+            Stop after this many checks (if ``None``, run until
+            :py:meth:`stop` is called or a ``SIGTERM`` or ``SIGINT`` signal is
+            received)
+        """
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            name="builder_daemon_heartbeat",
+            daemon=True,
+        )
+        heartbeat.start()
+        logger.info(
+            "Starting record builder daemon (checking every %s s); status in %s",
+            self.interval,
+            self.status_path,
+        )
+        try:
+            with _extraction_pool():
+                while not self._stop.is_set():
+                    cycle = self.run_cycle()
+                    errors = self.status["consecutive_errors"]
+                    locked = self.status["consecutive_locked"]
+                    self.update_status(
+                        state="idle",
+                        cycles=self.status["cycles"] + 1,
+                        # a locked check neither fails nor succeeds
+                        consecutive_errors={"error": errors + 1, "locked": errors}.get(
+                            cycle["result"],
+                            0,
+                        ),
+                        consecutive_locked=locked + 1
+                        if cycle["result"] == "locked"
+                        else 0,
+                        last_cycle=cycle,
+                        last_success=self.status["last_success"]
+                        if cycle["result"] in ("error", "locked")
+                        else cycle["finished"],
+                        next_cycle=(_now() + td(seconds=self.interval)).isoformat(),
+                    )
+                    if max_cycles is not None and self.status["cycles"] >= max_cycles:
+                        break
+                    self._stop.wait(self.interval)
+        finally:
+            self._stop.set()
+            heartbeat.join()
+            self.update_status(state="stopped", next_cycle=None)
+            logger.info("Record builder daemon stopped")
+
+    def _heartbeat(self):
+        """Rewrite the status file regularly, so it shows the daemon is alive."""
+        self.update_status()
+        while not self._stop.wait(HEARTBEAT):
+            self.update_status()
+
+    def handle_signals(self):
+        """
+        Stop the daemon gracefully on ``SIGTERM`` or ``SIGINT``.
+
+        The first signal stops the daemon once the check in progress is
+        finished; a second one is handled as usual (stopping it immediately).
+        """
+        default_handlers = {}
+
+        def _handler(signum, _frame):
+            logger.warning(
+                "Received %s; stopping after the current check (signal again to "
+                "stop now)",
+                signal.Signals(signum).name,
+            )
+            self.stop()
+            for sig, handler in default_handlers.items():
+                signal.signal(sig, handler)
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            default_handlers[sig] = signal.getsignal(sig)
+            signal.signal(sig, _handler)
+
+
+def _extraction_pool():
+    """
+    Keep the metadata extraction worker processes between checks, if any.
+
+    The pool is sized for as many sessions being built at once (with their
+    extraction workers) as the record builder settings allow.
+    """
+    extraction_workers = get_env_int("NexusLIMS_extraction_workers", 0)
+    session_workers = get_env_int("NexusLIMS_session_workers", 1, minimum=1)
+    if session_workers > 1:
+        # concurrent sessions always use at least one worker process each
+        n_workers = max(1, extraction_workers) * session_workers
+    else:
+        n_workers = extraction_workers
+    if n_workers <= 0:
+        return nullcontext()
+    return record_builder.keep_extraction_pool(n_workers)
+
+
+def read_status(status_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    Read the status file written by a :py:class:`BuilderDaemon`.
+
+    Parameters
+    ----------
+    status_path
+        The status file. If ``None``, :py:func:`get_status_path` is used
+
+    Returns
+    -------
+    dict or None
+        The status of the daemon, or ``None`` if there is no (readable) status
+        file
+    """
+    path = get_status_path() if status_path is None else status_path
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def check_status(  # noqa: PLR0911
+    status_path: Optional[Path] = None,
+    max_errors: int = 3,
+    max_locked: int = 12,
+    max_success_age: Optional[float] = None,
+) -> Tuple[bool, str]:
+    """
+    Check whether the daemon is running and building records successfully.
+
+    The daemon is considered healthy if its status file was updated within
+    the last few heartbeats, it has not stopped, fewer than ``max_errors``
+    checks in a row have failed, fewer than ``max_locked`` checks in a row
+    found the lock file (e.g. because it was left behind by
+    ``process_new_records.sh``), and a check succeeded (or the daemon
+    started) within the last ``max_success_age`` seconds.
+
+    Parameters
+    ----------
+    status_path
+        The status file. If ``None``, :py:func:`get_status_path` is used
+    max_errors
+        The number of failed checks in a row at which the daemon is
+        considered unhealthy
+    max_locked
+        The number of checks in a row that found the lock file at which the
+        daemon is considered unhealthy
+    max_success_age
+        The number of seconds without a successful check after which the
+        daemon is considered unhealthy. If ``None``, twelve times the interval
+        of the daemon is used, but at least six hours (so that building a
+        large session does not make the daemon seem unhealthy)
+
+    Returns
+    -------
+    tuple of (bool, str)
+        Whether the daemon is healthy, and a description of its state
+    """
+    status = read_status(status_path)
+    if status is None:
+        return False, "no status file found; the daemon is not running"
+    if status["state"] == "stopped":
+        return False, f"the daemon stopped at {status['updated']}"
+    age = (_now() - dt.fromisoformat(status["updated"])).total_seconds()
+    if age > 5 * HEARTBEAT:
+        return False, (
+            f"the status file was last updated {age:.0f} s ago; the daemon "
+            f"(process {status['pid']} on {status['host']}) is not responding"
+        )
+    last = status["last_cycle"]
+    description = (
+        f"the daemon is {status['state']} (process {status['pid']} on "
+        f"{status['host']}); {status['cycles']} checks done"
+    )
+    if last is not None:
+        description += (
+            f", the last one finished at {last['finished']} "
+            f"({last['result']}, {last['records']} records built)"
+        )
+    if status["consecutive_errors"] >= max_errors:
+        return False, (
+            f"{description}; the last {status['consecutive_errors']} checks "
+            f"failed (last error: {last['error']})"
+        )
+    if status.get("consecutive_locked", 0) >= max_locked:
+        return False, (
+            f"{description}; the last {status['consecutive_locked']} checks "
+            "found the lock file, which may have been left behind"
+        )
+    if max_success_age is None:
+        max_success_age = max(
+            MIN_SUCCESS_AGE.total_seconds(),
+            12 * status["interval"],
+        )
+    last_success = status["last_success"] or status["started"]
+    success_age = (_now() - dt.fromisoformat(last_success)).total_seconds()
+    if success_age > max_success_age:
+        return False, (
+            f"{description}; no check succeeded in the last {success_age:.0f} s "
+            f"(since {last_success})"
+        )
+    return True, description
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from nexusLIMS.utils import setup_loggers
+
+    parser = argparse.ArgumentParser(
+        description="Build new records continuously, checking for new sessions "
+        "at a regular interval",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="Seconds between checks for new sessions (default: "
+        "NexusLIMS_daemon_interval, or 300)",
+    )
+    parser.add_argument(
+        "--status-file",
+        type=Path,
+        default=None,
+        help="The status file to write (default: NexusLIMS_daemon_status_file, "
+        f"or {STATUS_FILENAME} next to the NexusLIMS database)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Check the status of a running daemon and exit (with an error if "
+        "it is not healthy)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Verbosity (-v, -vv); corresponds to python logging level. "
+        "0 is WARN, 1 (-v) is INFO, 2 (-vv) is DEBUG.",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        healthy, message = check_status(args.status_file)
+        print(message)  # noqa: T201
+        sys.exit(0 if healthy else 1)
+
+    logging_levels = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+    setup_loggers(logging_levels[min(args.verbose, 2)])
+    logger.setLevel(logging_levels[min(args.verbose, 2)])
+
+    daemon = BuilderDaemon(interval=args.interval, status_path=args.status_file)
+    daemon.handle_signals()
+    daemon.run()
@@ -0,0 +1,429 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Collect timing and resource metrics for each stage of building a record.
+
+While a record is built by the record builder, the time spent in each stage
+(see :py:data:`STAGES`) is recorded: the wall time, the CPU time used by the
+thread building the record (or, for metadata extraction and preview generation
+done in worker processes, by the workers), the number of files processed and
+the number of bytes read from them. The bytes read are the size of the files
+for extraction and preview generation (an upper bound, since files with cached
+metadata or an up-to-date preview are not read in full), and the size of the
+record for validation and upload. When the files of several sessions are found
+with a single search (see
+:py:func:`~nexusLIMS.builder.record_builder.find_session_files`), that search
+is not part of any session's ``discovery`` stage.
+
+Once a session has been built, its metrics are written to the files given by
+two environment variables (if set):
+
+- :ref:`NexusLIMS_metrics_file <NexusLIMS-metrics-file>` gets one line of
+  JSON per session (or per batch of uploaded records), giving the session,
+  instrument, outcome, and the metrics of each stage. For example (wrapped
+  here for readability):
+
+  .. code-block:: json
+
+      {"timestamp": "2021-03-01T10:02:11.124-05:00",
+       "session": "https://nemo.example.com/api/usage_events/?id=1234",
+       "instrument": "FEI-Titan-TEM-635816_n", "status": "COMPLETED",
+       "stages": {"discovery": {"wall_time": 0.81, "cpu_time": 0.02,
+                                "files": 52, "bytes_read": 0}, ...}}
+
+- :ref:`NexusLIMS_metrics_textfile <NexusLIMS-metrics-textfile>` is kept up to
+  date with the totals for each instrument and stage since the record builder
+  started, in the format read by the "textfile" collector of the Prometheus
+  node exporter.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime as dt
+from pathlib import Path
+from timeit import default_timer
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from nexusLIMS.utils import current_system_tz
+
+logger = logging.getLogger(__name__)
+
+STAGES = (
+    "discovery",
+    "clustering",
+    "extraction",
+    "preview",
+    "xml",
+    "validation",
+    "upload",
+)
+"""The stages of building (and uploading) a record, in order."""
+
+FIELDS = ("wall_time", "cpu_time", "files", "bytes_read")
+"""The values recorded for each stage."""
+
+_CURRENT = threading.local()
+_LOCK = threading.Lock()
+_TOTALS: Dict[Tuple[Optional[str], str], Dict[str, float]] = {}
+_SESSIONS: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+_LAST_BUILD: Dict[Optional[str], float] = {}
+
+_PROMETHEUS_METRICS = [
+    ("wall_time", "stage_seconds_total", "Wall time spent in each stage"),
+    ("cpu_time", "stage_cpu_seconds_total", "CPU time used in each stage"),
+    ("files", "stage_files_total", "Files processed in each stage"),
+    ("bytes_read", "stage_bytes_read_total", "Bytes read in each stage"),
+]
+
+
+class BuildMetrics:
+    """
+    The metrics of each stage of building one record.
+
+    Parameters
+    ----------
+    session
+        The identifier of the session being built
+    instrument
+        The name of the session's instrument
+
+    Attributes
+    ----------
+    timestamp : datetime.datetime
+        When the metrics started being collected
+    status : str or None
+        The outcome of the build (such as ``"COMPLETED"``), once known
+    stages : dict
+        The values of each of :py:data:`FIELDS` for each stage that has been
+        recorded
+    """
+
+    def __init__(
+        self,
+        session: Optional[str] = None,
+        instrument: Optional[str] = None,
+    ):
+        self.session = session
+        self.instrument = instrument
+        self.timestamp = dt.now(tz=current_system_tz())
+        self.status: Optional[str] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def add(self, name: str, **values: float):
+        """
+        Add values to the totals of a stage.
+
+        Parameters
+        ----------
+        name
+            The stage
+        **values
+            The amount to add to any of the :py:data:`FIELDS`
+        """
+        totals = self.stages.setdefault(name, dict.fromkeys(FIELDS, 0))
+        for field, value in values.items():
+            totals[field] += value
+
+    def merge(self, stages: Dict[str, Dict[str, float]]):
+        """
+        Add the metrics collected elsewhere (such as in a worker process).
+
+        Parameters
+        ----------
+        stages
+            The values for each stage (as in :py:attr:`stages`)
+        """
+        for name, values in stages.items():
+            self.add(name, **values)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Get the metrics as a (JSON serializable) dictionary.
+
+        Returns
+        -------
+        dict
+            The session, instrument, status, and stages (in the order of
+            :py:data:`STAGES`)
+        """
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "session": self.session,
+            "instrument": self.instrument,
+            "status": self.status,
+            "stages": {s: self.stages[s] for s in STAGES if s in self.stages},
+        }
+
+
+def current() -> Optional[BuildMetrics]:
+    """
+    Get the metrics being collected by this thread.
+
+    Returns
+    -------
+    BuildMetrics or None
+        The metrics, or ``None`` if they are not being collected
+    """
+    return getattr(_CURRENT, "metrics", None)
+
+
+@contextmanager
+def collect(
+    session: Optional[str] = None,
+    instrument: Optional[str] = None,
+) -> Iterator[BuildMetrics]:
+    """
+    Collect the metrics of the stages run by this thread.
+
+    Parameters
+    ----------
+    session
+        The identifier of the session being built
+    instrument
+        The name of the session's instrument
+
+    Yields
+    ------
+    BuildMetrics
+        The metrics collected until the context is exited
+    """
+    previous = current()
+    _CURRENT.metrics = BuildMetrics(session, instrument)
+    try:
+        yield _CURRENT.metrics
+    finally:
+        _CURRENT.metrics = previous
+
+
+@contextmanager
+def stage(
+    name: str,
+    *,
+    paths: Sequence[Union[Path, str]] = (),
+    files: Optional[int] = None,
+):
+    """
+    Record the time spent in a stage (if metrics are being collected).
+
+    Parameters
+    ----------
+    name
+        The stage (one of :py:data:`STAGES`)
+    paths
+        The files read during the stage (their sizes are added to the bytes
+        read)
+    files
+        The number of files processed (if not given, the number of ``paths``)
+    """
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    start_wall, start_cpu = default_timer(), time.thread_time()
+    try:
+        yield
+    finally:
+        metrics.add(
+            name,
+            wall_time=default_timer() - start_wall,
+            cpu_time=time.thread_time() - start_cpu,
+            files=len(paths) if files is None else files,
+            bytes_read=sum(_file_size(p) for p in paths),
+        )
+
+
+def count(name: str, **values: float):
+    """
+    Add to the totals of a stage (if metrics are being collected).
+
+    Parameters
+    ----------
+    name
+        The stage (one of :py:data:`STAGES`)
+    **values
+        The amount to add to any of the :py:data:`FIELDS`
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.add(name, **values)
+
+
+def set_status(status: str):
+    """
+    Set the outcome of the build (if metrics are being collected).
+
+    Parameters
+    ----------
+    status
+        The outcome (such as the session's new status in the database)
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.status = status
+
+
+def record(metrics: BuildMetrics):
+    """
+    Save the metrics of a finished build.
+
+    The metrics are appended to the :ref:`NexusLIMS_metrics_file
+    <NexusLIMS-metrics-file>` and added to the totals written to the
+    :ref:`NexusLIMS_metrics_textfile <NexusLIMS-metrics-textfile>` (for each
+    of those that is set). Errors writing either file are logged, but do not
+    stop the record builder.
+
+    Parameters
+    ----------
+    metrics
+        The metrics to save
+    """
+    logger.info(
+        "Stage times for %s: %s",
+        metrics.session or "upload",
+        ", ".join(
+            f"{name} {values['wall_time']:.2f} s"
+            for name, values in metrics.as_dict()["stages"].items()
+        ),
+    )
+    metrics_file = os.environ.get("NexusLIMS_metrics_file")
+    textfile = os.environ.get("NexusLIMS_metrics_textfile")
+    with _LOCK:
+        for name, values in metrics.stages.items():
+            totals = _TOTALS.setdefault(
+                (metrics.instrument, name),
+                dict.fromkeys(FIELDS, 0),
+            )
+            for field, value in values.items():
+                totals[field] += value
+        if metrics.session is not None:
+            key = (metrics.instrument, metrics.status)
+            _SESSIONS[key] = _SESSIONS.get(key, 0) + 1
+            _LAST_BUILD[metrics.instrument] = metrics.timestamp.timestamp()
+        try:
+            if metrics_file:
+                with Path(metrics_file).open(mode="a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics.as_dict()) + "\n")
+            if textfile:
+                _write_textfile(Path(textfile))
+        except OSError as exception:
+            logger.warning("Could not write build metrics: %s", exception)
+
+
+def _write_textfile(path: Path):
+    """
+    Write the totals of each stage in the Prometheus text format.
+
+    The file is written under a temporary name and then renamed, so that the
+    node exporter never reads a partially written file.
+
+    Parameters
+    ----------
+    path
+        The file to write
+    """
+    lines = []
+    for field, name, description in _PROMETHEUS_METRICS:
+        lines += [
+            f"# HELP nexuslims_build_{name} {description} of building records",
+            f"# TYPE nexuslims_build_{name} counter",
+        ]
+        lines += [
+            f"nexuslims_build_{name}"
+            f"{_labels(instrument=instrument, stage=stage_name)} {values[field]}"
+            for (instrument, stage_name), values in sorted(
+                _TOTALS.items(),
+                key=lambda item: (item[0][0] or "", STAGES.index(item[0][1])),
+            )
+        ]
+    lines += [
+        "# HELP nexuslims_build_sessions_total Sessions built, by outcome",
+        "# TYPE nexuslims_build_sessions_total counter",
+    ]
+    lines += [
+        f"nexuslims_build_sessions_total{_labels(instrument=i, status=s)} {n}"
+        for (i, s), n in sorted(_SESSIONS.items(), key=lambda x: str(x[0]))
+    ]
+    lines += [
+        "# HELP nexuslims_build_last_timestamp_seconds When a session of each "
+        "instrument was last built",
+        "# TYPE nexuslims_build_last_timestamp_seconds gauge",
+    ]
+    lines += [
+        f"nexuslims_build_last_timestamp_seconds{_labels(instrument=i)} {t}"
+        for i, t in sorted(_LAST_BUILD.items(), key=lambda x: str(x[0]))
+    ]
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def _labels(**labels: Optional[str]) -> str:
+    """
+    Format the labels of a Prometheus sample (leaving out any that are None).
+
+    Parameters
+    ----------
+    **labels
+        The label values
+
+    Returns
+    -------
+    str
+        The labels, such as ``{instrument="FEI-Titan-TEM-635816_n"}``
+    """
+    escaped = {
+        k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for k, v in labels.items()
+        if v is not None
+    }
+    if not escaped:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def _file_size(path: Union[Path, str]) -> int:
+    """
+    Get the size of a file, or 0 if it cannot be read.
+
+    Parameters
+    ----------
+    path
+        The file
+
+    Returns
+    -------
+    int
+        The size of the file (in bytes)
+    """
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return 0
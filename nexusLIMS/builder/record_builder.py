@@ -33,41 +33,73 @@ Attributes
 XSD_PATH
     A string containing the path to the Nexus Experiment schema file,
     which is used to validate XML records built by this module
+EXTRACTION_QUEUE_PER_WORKER
+    The number of files per worker process that are submitted for metadata
+    extraction ahead of the file currently being added to a record
 """
 import argparse
 import logging
 import os
 import shutil
+import sqlite3
 import sys
+import threading
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import datetime as dt
 from datetime import timedelta as td
 from importlib import import_module, util
-from io import BytesIO
+from io import BytesIO, TextIOBase
+from itertools import islice
+from multiprocessing import get_context
 from pathlib import Path
+from subprocess import CalledProcessError
 from timeit import default_timer
-from typing import List, Optional
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 from uuid import uuid4
 
 from lxml import etree
 
 from nexusLIMS import version
+from nexusLIMS.builder import metrics
 from nexusLIMS.cdcs import upload_record_files
+from nexusLIMS.db import file_index
 from nexusLIMS.db.session_handler import Session, db_query, get_sessions_to_build
 from nexusLIMS.extractors import extension_reader_map as ext_map
+from nexusLIMS.extractors import parse_metadata
 from nexusLIMS.harvesters import nemo, sharepoint_calendar
 from nexusLIMS.harvesters.nemo import utils as nemo_utils
 from nexusLIMS.harvesters.reservation_event import ReservationEvent
+from nexusLIMS.instruments import Instrument
 from nexusLIMS.schemas import activity
-from nexusLIMS.schemas.activity import AcquisitionActivity, cluster_filelist_mtimes
+from nexusLIMS.schemas.activity import AcquisitionActivity
+from nexusLIMS.schemas.segmentation import find_activity_boundaries
 from nexusLIMS.utils import (
+    FileInfo,
     current_system_tz,
-    find_files_by_mtime,
-    gnu_find_files_by_mtime,
+    find_timestamp,
+    get_env_bool,
+    get_env_int,
+    gnu_find_file_info_by_mtime,
     has_delay_passed,
+    scandir_find_file_info_by_mtime,
 )
 
 logger = logging.getLogger(__name__)
 XSD_PATH: str = Path(activity.__file__).parent / "nexus-experiment.xsd"
+EXTRACTION_QUEUE_PER_WORKER = 4
+_SCHEMA_CACHE = threading.local()
+# the metadata extraction pool kept running by keep_extraction_pool(), if any
+_RESIDENT_POOL: Dict[str, Any] = {}
+_RESIDENT_POOL_LOCK = threading.Lock()
 
 
 def build_record(
@@ -75,6 +107,8 @@ def build_record(
     sample_id: Optional[str] = None,
     *,
     generate_previews: bool = True,
+    extraction_workers: Optional[int] = None,
+    files: Optional[List[FileInfo]] = None,
 ) -> str:
     """
     Build a NexusLIMS XML record of an Experiment.
@@ -85,6 +119,9 @@ def build_record(
     and date range (for backwards compatibility). For calendar parsing,
     currently no logic is implemented for a query that returns multiple records.
 
+    The record is assembled by :py:func:`write_record`, one acquisition
+    activity at a time.
+
     Parameters
     ----------
     session
@@ -97,6 +134,14 @@ def build_record(
         collected in this record. If None, a UUIDv4 will be generated
     generate_previews
         Whether to create the preview thumbnail images
+    extraction_workers
+        The number of worker processes to use for metadata extraction and
+        preview generation (passed through to :py:func:`build_acq_activities`).
+        If ``None``, the value of the ``NexusLIMS_extraction_workers``
+        environment variable is used
+    files
+        The files to include in the record, if they have already been found
+        (passed through to :py:func:`build_acq_activities`)
 
     Returns
     -------
@@ -104,14 +149,65 @@ def build_record(
         A formatted string containing a well-formed and valid XML document
         for the data contained in the provided path
     """
+    record = BytesIO()
+    write_record(
+        session,
+        record,
+        sample_id,
+        generate_previews=generate_previews,
+        extraction_workers=extraction_workers,
+        files=files,
+    )
+    return record.getvalue().decode()
+
+
+def write_record(
+    session: Session,
+    output: Union[Path, BinaryIO],
+    sample_id: Optional[str] = None,
+    *,
+    generate_previews: bool = True,
+    extraction_workers: Optional[int] = None,
+    files: Optional[List[FileInfo]] = None,
+):
+    """
+    Write a NexusLIMS XML record of an Experiment to a file.
+
+    Unlike building the whole document in memory, the record is written
+    incrementally (using :py:class:`lxml.etree.xmlfile`): the acquisition
+    activities are built one at a time by :py:func:`iter_acq_activities`, and
+    each is written out (and its metadata released) before the files of the
+    next one are processed, so the memory used does not grow with the number
+    of files in the session.
+
+    Parameters
+    ----------
+    session
+        The :py:class:`~nexusLIMS.db.session_handler.Session` to build a
+        record for
+    output
+        The file to write the record to (either a path, or a file-like object
+        opened in binary mode)
+    sample_id
+        A unique identifier pointing to a sample identifier for data
+        collected in this record. If None, a UUIDv4 will be generated
+    generate_previews
+        Whether to create the preview thumbnail images
+    extraction_workers
+        The number of worker processes to use for metadata extraction and
+        preview generation (see :py:func:`iter_acq_activities`)
+    files
+        The files to include in the record, if they have already been found
+        (see :py:func:`iter_acq_activities`)
+    """
     if sample_id is None:
         sample_id = str(uuid4())
 
-    # setup XML namespaces
+    # setup XML namespaces (the incremental writer only declares one prefix
+    # per namespace, so the default namespace is used rather than "nx:")
     nx_namespace = "https://data.nist.gov/od/dm/nexus/experiment/v1.0"
     xsi_namespace = "http://www.w3.org/2001/XMLSchema-instance"
-    ns_map = {None: nx_namespace, "xsi": xsi_namespace, "nx": nx_namespace}
-    xml = etree.Element("Experiment", nsmap=ns_map)
+    ns_map = {None: nx_namespace, "xsi": xsi_namespace}
 
     logger.info(
         "Getting calendar events with instrument: %s, from %s to %s, "
@@ -125,32 +221,50 @@ def build_record(
     # this returns a nexusLIMS.harvesters.reservation_event.ReservationEvent
     res_event = get_reservation_event(session)
 
-    output = res_event.as_xml()
-
-    for child in output:
-        xml.append(child)
-
     logger.info(
         "Building acquisition activities for timespan from %s to %s",
         session.dt_from.isoformat(),
         session.dt_to.isoformat(),
     )
-    activities = build_acq_activities(
+    # files are found (and any errors raised) here, before output is started
+    activities = iter_acq_activities(
         session.instrument,
         session.dt_from,
         session.dt_to,
         generate_previews,
+        n_workers=extraction_workers,
+        files=files,
     )
-    for i, this_activity in enumerate(activities):
-        a_xml = this_activity.as_xml(i, sample_id)
-        xml.append(a_xml)
 
-    return etree.tostring(
-        xml,
-        xml_declaration=True,
-        encoding="UTF-8",
-        pretty_print=True,
-    ).decode()
+    if isinstance(output, Path):
+        output = str(output)
+    with etree.xmlfile(output, encoding="UTF-8") as xml_file:
+        xml_file.write_declaration()
+        with xml_file.element(f"{{{nx_namespace}}}Experiment", nsmap=ns_map):
+            with metrics.stage("xml"):
+                for child in res_event.as_xml():
+                    _write_indented(xml_file, child)
+            for i, this_activity in enumerate(activities):
+                with metrics.stage("xml"):
+                    _write_indented(xml_file, this_activity.as_xml(i, sample_id))
+                    xml_file.flush()
+            xml_file.write("\n")
+
+
+def _write_indented(xml_file, element: etree.Element):
+    """
+    Write a pretty-printed child of the root element to an incremental XML file.
+
+    Parameters
+    ----------
+    xml_file
+        The :py:class:`lxml.etree.xmlfile` writer (inside the root element)
+    element
+        The element to write
+    """
+    etree.indent(element, level=1)
+    xml_file.write("\n  ")
+    xml_file.write(element)
 
 
 def get_reservation_event(session: Session) -> ReservationEvent:
@@ -208,7 +322,15 @@ def get_reservation_event(session: Session) -> ReservationEvent:
     return harvester.res_event_from_session(session)
 
 
-def build_acq_activities(instrument, dt_from, dt_to, generate_previews):
+def build_acq_activities(
+    instrument,
+    dt_from,
+    dt_to,
+    generate_previews,
+    *,
+    n_workers: Optional[int] = None,
+    files: Optional[List[FileInfo]] = None,
+):
     """
     Build an XML string representation of each AcquisitionActivity for a session.
 
@@ -231,6 +353,20 @@ def build_acq_activities(instrument, dt_from, dt_to, generate_previews):
         which files should be associated with this record
     generate_previews : bool
         Whether or not to create the preview thumbnail images
+    n_workers : typing.Optional[int]
+        The number of worker processes to use for metadata extraction and
+        preview generation. If ``0``, files are processed one after another in
+        the current process. If ``None``, the value of the
+        :ref:`NexusLIMS_extraction_workers <NexusLIMS-extraction-workers>`
+        environment variable is used (defaulting to ``0``)
+    files : typing.Optional[typing.List[~nexusLIMS.utils.FileInfo]]
+        The files modified between ``dt_from`` and ``dt_to`` (sorted by
+        modification time), if they have already been found (such as by
+        :py:func:`find_session_files`). If ``None``, they are found using
+        :py:func:`get_files`
+
+    See :py:func:`iter_acq_activities` to get the activities one at a time
+    instead (without keeping them all in memory).
 
     Returns
     -------
@@ -239,93 +375,606 @@ def build_acq_activities(instrument, dt_from, dt_to, generate_previews):
         The list of :py:class:`~nexusLIMS.schemas.activity.AcquisitionActivity`
         objects generated for the record
     """
+    return list(
+        iter_acq_activities(
+            instrument,
+            dt_from,
+            dt_to,
+            generate_previews,
+            n_workers=n_workers,
+            files=files,
+        ),
+    )
+
+
+def iter_acq_activities(
+    instrument: Instrument,
+    dt_from: dt,
+    dt_to: dt,
+    generate_previews: bool,  # noqa: FBT001
+    *,
+    n_workers: Optional[int] = None,
+    files: Optional[List[FileInfo]] = None,
+) -> Iterator[AcquisitionActivity]:
+    """
+    Build the AcquisitionActivities for a session, one at a time.
+
+    The files of the session are found and assigned to activities immediately
+    (so a :py:exc:`FileNotFoundError` is raised by this function if there are
+    none), but the metadata of each activity's files is only extracted as the
+    returned iterator reaches it. Each activity is yielded as soon as its last
+    file has been processed (with its setup parameters and unique metadata
+    already stored), so only one activity's metadata needs to be held in memory
+    at a time. The parameters are the same as for
+    :py:func:`build_acq_activities`.
+
+    Parameters
+    ----------
+    instrument
+        The instrument the session was on
+    dt_from
+        The start of the session
+    dt_to
+        The end of the session
+    generate_previews
+        Whether or not to create the preview thumbnail images
+    n_workers
+        The number of worker processes to use for metadata extraction and
+        preview generation
+    files
+        The files modified between ``dt_from`` and ``dt_to``, if they have
+        already been found
+
+    Returns
+    -------
+    typing.Iterator[~nexusLIMS.schemas.activity.AcquisitionActivity]
+        The activities of the session, in order
+    """
     logging.getLogger("hyperspy.io_plugins.digital_micrograph").setLevel(
         logging.WARNING,
     )
 
-    start_timer = default_timer()
-    path = Path(os.environ["mmfnexus_path"]) / instrument.filestore_path
+    if n_workers is None:
+        n_workers = get_env_int("NexusLIMS_extraction_workers", 0)
 
-    # find the files to be included (list of Paths)
-    files = get_files(path, dt_from, dt_to)
+    if files is None:
+        start_timer = default_timer()
+        path = Path(os.environ["mmfnexus_path"]) / instrument.filestore_path
 
-    logger.info(
-        "Found %i files in %.2f seconds",
-        len(files),
-        default_timer() - start_timer,
-    )
+        # find the files to be included (list of FileInfo, which hold the path,
+        # mtime, and size of each file so they do not have to be read again)
+        with metrics.stage("discovery"):
+            files = get_files(path, dt_from, dt_to, instrument=instrument)
+
+        logger.info(
+            "Found %i files in %.2f seconds",
+            len(files),
+            default_timer() - start_timer,
+        )
+    else:
+        logger.info("Using %i previously found files", len(files))
+    metrics.count("discovery", files=len(files))
 
     # raise error if no file found were found
     if len(files) == 0:
         msg = "No files found in this time range"
         raise FileNotFoundError(msg)
 
+    with metrics.stage("clustering", files=len(files)):
+        _, aa_indices = _assign_activities(files, instrument)
+    return _iter_activities(
+        files,
+        aa_indices,
+        instrument,
+        generate_previews,
+        n_workers,
+    )
+
+
+def _iter_activities(
+    files: List[FileInfo],
+    aa_indices: List[int],
+    instrument: Instrument,
+    generate_previews: bool,  # noqa: FBT001
+    n_workers: int,
+) -> Iterator[AcquisitionActivity]:
+    """
+    Extract the files of a session and yield each activity once it is complete.
+
+    Parameters
+    ----------
+    files
+        The files of the session (sorted by modification time)
+    aa_indices
+        The index of the activity each file belongs to (see
+        :py:func:`_assign_activities`)
+    instrument
+        The instrument the session was on
+    generate_previews
+        Whether or not to create the preview thumbnail images
+    n_workers
+        The number of worker processes to use (or ``0`` to process the files in
+        this process)
+
+    Yields
+    ------
+    ~nexusLIMS.schemas.activity.AcquisitionActivity
+        Each (non-empty) activity, with its setup parameters and unique
+        metadata stored
+    """
+    if n_workers > 0:
+        parsed = _iter_extracted_files(files, generate_previews, n_workers)
+    else:
+        parsed = (None for _ in files)
+
+    this_activity: Optional[AcquisitionActivity] = None
+    this_idx = None
+    n_done = 0
+    for i, (f, aa_idx, result) in enumerate(zip(files, aa_indices, parsed)):
+        if this_activity is not None and aa_idx != this_idx:
+            yield _finish_activity(this_activity, n_done)
+            this_activity = None
+            n_done += 1
+
+        if n_workers > 0 and result is None:
+            # extraction failed in a worker process (already logged), so leave
+            # this file out of the record rather than failing the whole session
+            continue
+
+        # if there is no current activity, we need to start a new AA:
+        if this_activity is None:
+            this_activity = AcquisitionActivity(
+                start=dt.fromtimestamp(f.mtime, tz=instrument.timezone),
+            )
+            this_idx = aa_idx
+
+        # add this file to the AA
+        logger.info(
+            "Adding file %i/%i %s to activity %i",
+            i,
+            len(files),
+            str(f.path).replace(os.environ["mmfnexus_path"], "").strip("/"),
+            aa_idx,
+        )
+        if result is None:
+            this_activity.add_file(
+                fname=f.path,
+                generate_preview=generate_previews,
+                mtime=f.mtime,
+                size=f.size,
+            )
+        else:
+            this_activity.add_parsed_file(f.path, *result)
+        # assume this file is the last one in the activity (this will be
+        # true on the last iteration where mtime is <= to the
+        # aa_bounds value)
+        this_activity.end = dt.fromtimestamp(f.mtime, tz=instrument.timezone)
+
+    if this_activity is not None:
+        yield _finish_activity(this_activity, n_done)
+    logger.info("Finished detecting activities")
+
+
+def _finish_activity(
+    this_activity: AcquisitionActivity,
+    seqno: int,
+) -> AcquisitionActivity:
+    """
+    Store the setup parameters and unique metadata of a completed activity.
+
+    Parameters
+    ----------
+    this_activity
+        The activity, with all of its files added
+    seqno
+        The index of the activity in the session (for logging)
+
+    Returns
+    -------
+    ~nexusLIMS.schemas.activity.AcquisitionActivity
+        The same activity
+    """
+    logger.info("Activity %i: storing setup parameters", seqno)
+    this_activity.store_setup_params()
+    logger.info("Activity %i: storing unique metadata values", seqno)
+    this_activity.store_unique_metadata()
+    return this_activity
+
+
+def _assign_activities(
+    files: List[FileInfo],
+    instrument: Instrument,
+) -> Tuple[int, List[int]]:
+    """
+    Determine which acquisition activity each file belongs to.
+
+    The boundaries between activities are found using the instrument's
+    segmentation strategy (see :py:mod:`~nexusLIMS.schemas.segmentation`).
+
+    Parameters
+    ----------
+    files
+        The files of a session (sorted by modification time)
+    instrument
+        The instrument the files are from
+
+    Returns
+    -------
+    n_activities : int
+        The number of activities the files are split into
+    aa_indices : typing.List[int]
+        The index of the activity for each file
+    """
     # get the timestamp boundaries of acquisition activities
-    aa_bounds = cluster_filelist_mtimes(files)
+    aa_bounds = find_activity_boundaries(files, instrument)
 
     # add the last file's modification time to the boundaries list to make
     # the loop below easier to process
-    aa_bounds.append(files[-1].stat().st_mtime)
-
-    activities: List[Optional[AcquisitionActivity]] = [None] * len(aa_bounds)
+    aa_bounds.append(files[-1].mtime)
 
-    i = 0
+    # determine which activity each file belongs to (files are sorted by mtime)
+    aa_indices = []
     aa_idx = 0
-    while i < len(files):
-        f = files[i]
-        mtime = f.stat().st_mtime
-
-        # check this file's mtime, if it is less than this iteration's value
-        # in the AA bounds, then it belongs to this iteration's AA
-        # if not, then we should move to the next activity
-        if mtime <= aa_bounds[aa_idx]:
-            # if current activity index is None, we need to start a new AA:
-            if activities[aa_idx] is None:
-                activities[aa_idx] = AcquisitionActivity(
-                    start=dt.fromtimestamp(mtime, tz=instrument.timezone),
-                )
+    for mtime in (f.mtime for f in files):
+        # check this file's mtime, if it is more than this iteration's value
+        # in the AA bounds, then it (and all following files) belong to a
+        # later activity
+        while mtime > aa_bounds[aa_idx]:
+            aa_idx += 1
+        aa_indices.append(aa_idx)
+    return len(aa_bounds), aa_indices
+
+
+def _init_extraction_worker():
+    """Set up logging in a metadata extraction worker process."""
+    logging.getLogger("hyperspy.io_plugins.digital_micrograph").setLevel(
+        logging.WARNING,
+    )
+
+
+def _new_extraction_pool(n_workers: int) -> ProcessPoolExecutor:
+    """Start a pool of metadata extraction worker processes."""
+    # "spawn" is used since the builder may be running other threads, which do
+    # not mix well with fork()
+    return ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_extraction_worker,
+    )
+
+
+@contextmanager
+def keep_extraction_pool(n_workers: int) -> Iterator[None]:
+    """
+    Keep the metadata extraction worker processes running between sessions.
 
-            # add this file to the AA
-            logger.info(
-                "Adding file %i/%i %s to activity %i",
-                i,
-                len(files),
-                str(f).replace(os.environ["mmfnexus_path"], "").strip("/"),
-                aa_idx,
+    Normally, a new pool of worker processes is started (and has to import
+    HyperSpy and the other extraction dependencies) for every session built.
+    Within this context, all sessions instead share one pool of ``n_workers``
+    processes, which is started when first needed and shut down on exit. If
+    the pool breaks (e.g. because a worker was killed), a new one is started
+    for the next session. This is used by the record builder
+    :py:mod:`daemon <nexusLIMS.builder.daemon>`.
+
+    Parameters
+    ----------
+    n_workers
+        The number of worker processes in the shared pool
+    """
+    with _RESIDENT_POOL_LOCK:
+        _RESIDENT_POOL["workers"] = n_workers
+    try:
+        yield
+    finally:
+        with _RESIDENT_POOL_LOCK:
+            executor = _RESIDENT_POOL.pop("executor", None)
+            _RESIDENT_POOL.clear()
+        if executor is not None:
+            executor.shutdown()
+
+
+def recycle_extraction_pool():
+    """
+    Replace the worker processes of the shared extraction pool.
+
+    The workers read the instruments from the database when they start, so
+    after the instruments change (see
+    :py:func:`~nexusLIMS.instruments.reload_instrument_db`) the shared pool of
+    :py:func:`keep_extraction_pool` is shut down, and a new one is started when
+    next needed. This does nothing if there is no shared pool.
+    """
+    with _RESIDENT_POOL_LOCK:
+        executor = _RESIDENT_POOL.pop("executor", None)
+    if executor is not None:
+        logger.info("Starting new metadata extraction workers")
+        executor.shutdown()
+
+
+@contextmanager
+def _extraction_pool(n_workers: int) -> Iterator[ProcessPoolExecutor]:
+    """
+    Get a pool of metadata extraction worker processes.
+
+    Uses the shared pool if within :py:func:`keep_extraction_pool`, and
+    otherwise starts a pool of ``n_workers`` processes just for this context.
+    """
+    with _RESIDENT_POOL_LOCK:
+        if _RESIDENT_POOL and "executor" not in _RESIDENT_POOL:
+            _RESIDENT_POOL["executor"] = _new_extraction_pool(
+                _RESIDENT_POOL["workers"],
             )
-            activities[aa_idx].add_file(fname=f, generate_preview=generate_previews)
-            # assume this file is the last one in the activity (this will be
-            # true on the last iteration where mtime is <= to the
-            # aa_bounds value)
-            activities[aa_idx].end = dt.fromtimestamp(mtime, tz=instrument.timezone)
-            i += 1
+        executor = _RESIDENT_POOL.get("executor")
+    if executor is None:
+        with _new_extraction_pool(n_workers) as executor:
+            yield executor
+        return
+    try:
+        yield executor
+    except BrokenProcessPool:
+        _discard_extraction_pool(executor)
+        raise
+
+
+def _discard_extraction_pool(executor: ProcessPoolExecutor):
+    """Stop using a broken shared extraction pool, so a new one is started."""
+    with _RESIDENT_POOL_LOCK:
+        if _RESIDENT_POOL.get("executor") is not executor:
+            return
+        del _RESIDENT_POOL["executor"]
+    logger.warning("The metadata extraction pool broke; starting a new one")
+    executor.shutdown(wait=False)
+
+
+def _extract_file(
+    fname: Path,
+    mtime: Optional[float],
+    size: Optional[int],
+    generate_preview: bool,  # noqa: FBT001
+) -> Tuple[Optional[Dict[str, Any]], Optional[Path], Dict[str, Dict[str, float]]]:
+    """
+    Parse the metadata of (and generate a preview for) one file.
+
+    Runs in a worker process; only the ``nx_meta`` portion of the metadata is
+    returned, since that is all that is needed to build the record (the full
+    metadata is written to the NexusLIMS folder by
+    :py:func:`~nexusLIMS.extractors.parse_metadata`), along with the
+    :py:mod:`~nexusLIMS.builder.metrics` of the extraction and preview stages.
+    """
+    with metrics.collect() as file_metrics:
+        meta, preview_fname = parse_metadata(
+            fname,
+            generate_preview=generate_preview,
+            overwrite_preview=get_env_bool("NexusLIMS_force_preview_refresh"),
+            mtime=mtime,
+            size=size,
+        )
+    if meta is not None:
+        meta = {"nx_meta": meta["nx_meta"]}
+    return meta, preview_fname, file_metrics.stages
+
+
+def _extract_files_in_pool(
+    files: List[FileInfo],
+    generate_previews: bool,  # noqa: FBT001
+    n_workers: int,
+) -> List[Optional[Tuple[Optional[Dict[str, Any]], Optional[Path]]]]:
+    """
+    Extract metadata and generate previews for a list of files in parallel.
+
+    Parameters
+    ----------
+    files
+        The files to process
+    generate_previews
+        Whether or not to create the preview thumbnail images
+    n_workers
+        The number of worker processes to use
+
+    Returns
+    -------
+    list
+        One entry per file (in the same order as ``files``); each is either the
+        ``(metadata, preview_fname)`` tuple for that file, or None if extraction
+        failed (the error is logged, but does not affect the other files)
+    """
+    return list(_iter_extracted_files(files, generate_previews, n_workers))
+
+
+def _iter_extracted_files(
+    files: List[FileInfo],
+    generate_previews: bool,  # noqa: FBT001
+    n_workers: int,
+) -> Iterator[Optional[Tuple[Optional[Dict[str, Any]], Optional[Path]]]]:
+    """
+    Extract metadata and generate previews in parallel, yielding results in order.
+
+    Only a limited number of files (:py:data:`EXTRACTION_QUEUE_PER_WORKER` per
+    worker) are submitted to the worker processes ahead of the result being
+    yielded, so results do not pile up in memory while the caller is busy
+    with earlier ones.
+
+    If a worker process dies (e.g. because it crashed or was killed for using
+    too much memory), the pool is replaced, and the files that had not
+    finished are tried again one at a time, so that a file that kills its
+    worker again can be told apart from the files that were merely being
+    processed at the same time. Only that file is then skipped.
+
+    Parameters
+    ----------
+    files
+        The files to process
+    generate_previews
+        Whether or not to create the preview thumbnail images
+    n_workers
+        The number of worker processes to use
+
+    Yields
+    ------
+    tuple or None
+        For each file (in the same order as ``files``), either the
+        ``(metadata, preview_fname)`` tuple for that file, or None if extraction
+        failed (the error is logged, but does not affect the other files)
+    """
+    logger.info(
+        "Extracting metadata from %i files using %i worker processes",
+        len(files),
+        n_workers,
+    )
+    pending = deque()
+    to_submit = iter(files)
+    window = n_workers * EXTRACTION_QUEUE_PER_WORKER
+    try:
+        finished = False
+        while not finished:
+            with _extraction_pool(n_workers) as executor:
+                finished = yield from _extract_until_broken(
+                    executor,
+                    pending,
+                    to_submit,
+                    window,
+                    generate_previews,
+                )
+    finally:
+        # a shared pool outlives this session, so do not leave its files
+        # queued if the session was abandoned
+        for entry in pending:
+            if entry["future"] is not None:
+                entry["future"].cancel()
+
+
+def _extract_until_broken(
+    executor: ProcessPoolExecutor,
+    pending: deque,
+    to_submit: Iterator[FileInfo],
+    window: int,
+    generate_previews: bool,  # noqa: FBT001
+) -> Iterator[Optional[Tuple[Optional[Dict[str, Any]], Optional[Path]]]]:
+    """
+    Run the extraction of :py:func:`_iter_extracted_files` in one pool.
+
+    Each entry of ``pending`` is a dictionary holding a ``file``, its
+    ``future`` (if submitted to this pool), whether it is a ``suspect`` (that
+    was running when a worker process died), and whether it is ``done`` (with
+    its ``result``). Returns ``True`` once every file has been yielded, or
+    ``False`` if the pool broke and needs to be replaced.
+    """
+    while True:
+        pending.extend(
+            {"file": f, "future": None, "suspect": False, "done": False}
+            for f in islice(to_submit, window - len(pending))
+        )
+        while pending and pending[0]["done"]:
+            yield pending.popleft()["result"]
+        if not pending:
+            return True
+
+        waiting = [e for e in pending if not e["done"]]
+        running = [e for e in waiting if e["future"] is not None]
+        suspects = [e for e in waiting if e["suspect"]]
+        if not suspects:
+            to_run = [e for e in waiting if e["future"] is None]
         else:
-            # this file's mtime is after the boundary and is thus part of the
-            # next activity, so increment AA counter and reprocess file (do
-            # not increment i)
-            aa_idx += 1
+            # run suspects on their own, so a crash can only be due to that file
+            to_run = [] if running else suspects[:1]
+        for entry in to_run:
+            f = entry["file"]
+            try:
+                entry["future"] = executor.submit(
+                    _extract_file,
+                    f.path,
+                    f.mtime,
+                    f.size,
+                    generate_previews,
+                )
+            except BrokenProcessPool:
+                _recover_broken_pool(executor, pending)
+                return False
+            running.append(entry)
 
-    # Remove any "None" activities from list
-    activities: List[AcquisitionActivity] = [a for a in activities if a is not None]
+        wait([e["future"] for e in running], return_when=FIRST_COMPLETED)
+        for entry in running:
+            if entry["future"].done() and not _collect_extraction(entry):
+                _recover_broken_pool(executor, pending)
+                return False
 
-    logger.info("Finished detecting activities")
-    for i, this_activity in enumerate(activities):
-        logger.info("Activity %i: storing setup parameters", i)
-        this_activity.store_setup_params()
-        logger.info("Activity %i: storing unique metadata values", i)
-        this_activity.store_unique_metadata()
 
-    return activities
+def _collect_extraction(entry: Dict[str, Any]) -> bool:
+    """
+    Store the result of a finished extraction in its ``pending`` entry.
+
+    Returns ``False`` (leaving the entry as it was) if the worker process
+    running it died.
+    """
+    try:
+        *result, stages = entry["future"].result()
+    except BrokenProcessPool:
+        return False
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception(
+            "Metadata extraction failed for %s; skipping",
+            entry["file"].path,
+        )
+        entry["result"] = None
+    else:
+        for name, values in stages.items():
+            metrics.count(name, **values)
+        entry["result"] = tuple(result)
+    entry["done"] = True
+    return True
+
+
+def _recover_broken_pool(executor: ProcessPoolExecutor, pending: deque):
+    """
+    Sort out the files of a pool in which a worker process died.
+
+    Files that finished before the pool broke keep their results. The others
+    become suspects to be tried again in a new pool, unless they already were
+    (and were running on their own), in which case they are skipped.
+    """
+    _discard_extraction_pool(executor)
+    running = [e for e in pending if e["future"] is not None and not e["done"]]
+    # once broken, every remaining future fails (or has already finished)
+    wait([e["future"] for e in running])
+    logger.warning(
+        "A metadata extraction worker process died; trying its unfinished files "
+        "again one at a time",
+    )
+    for entry in running:
+        if _collect_extraction(entry):
+            continue
+        if entry["suspect"]:
+            logger.error(
+                "A metadata extraction worker process died again while "
+                "processing %s; skipping",
+                entry["file"].path,
+            )
+            entry.update(done=True, result=None)
+        else:
+            entry.update(suspect=True, future=None)
 
 
 def get_files(
     path: Path,
     dt_from: dt,
     dt_to: dt,
-) -> List[Path]:
+    *,
+    instrument: Optional[Instrument] = None,
+) -> List[FileInfo]:
     """
     Get files under a path that were last modified between the two given timestamps.
 
+    Files are found using GNU ``find`` (see
+    :py:func:`~nexusLIMS.utils.gnu_find_file_info_by_mtime`) unless the
+    :ref:`NexusLIMS_file_finder <NexusLIMS-file-finder>` environment variable
+    is set to ``scandir`` (or ``find`` is not available), in which case
+    :py:func:`~nexusLIMS.utils.scandir_find_file_info_by_mtime` is used.
+
+    If the :ref:`NexusLIMS_file_index <NexusLIMS-file-index>` environment
+    variable is enabled and an ``instrument`` is given, the files are looked up
+    in the :py:mod:`~nexusLIMS.db.file_index`. If the index has not been
+    updated since ``dt_to`` (or cannot be read), the file system is searched
+    directly instead.
+
     Parameters
     ----------
     path
@@ -336,12 +985,16 @@ def get_files(
     dt_to : datetime.datetime
         The ending timestamp used to determine the last point in time for
         which files should be associated with this record
+    instrument
+        The instrument whose data is stored at ``path``, used to look up its
+        files in the file index
 
     Returns
     -------
-    files : List[pathlib.Path]
-        A list of the files that have modification times within the
-        time range provided (sorted by modification time)
+    files : List[~nexusLIMS.utils.FileInfo]
+        A list of the files (with their modification times and sizes) that have
+        modification times within the time range provided (sorted by
+        modification time)
     """
     logger.info("Starting new file-finding in %s", path)
 
@@ -357,18 +1010,50 @@ def get_files(
 
     extension_arg = None if strategy == "inclusive" else ext_map.keys()
 
-    try:
-        files = gnu_find_files_by_mtime(path, dt_from, dt_to, extensions=extension_arg)
-
-    # exclude following from coverage because find_files_by_mtime is deprecated as of
-    # 1.2.0 and does not support extensions at all (like the above method)
-    except (NotImplementedError, RuntimeError) as exception:  # pragma: no cover
+    if instrument is not None and file_index.is_enabled():
+        try:
+            files = file_index.get_files_by_mtime(
+                instrument,
+                dt_from,
+                dt_to,
+                extensions=extension_arg,
+            )
+        except sqlite3.Error as exception:
+            logger.warning("Could not read file index: %s", exception)
+            files = None
+        if files is not None:
+            return files
+        logger.info("File index is not up to date; searching for files directly")
+
+    finder = os.environ.get("NexusLIMS_file_finder", "gnu").lower()
+    if finder not in ["gnu", "scandir"]:
         logger.warning(
-            "GNU find returned error: %s\nFalling back to pure Python implementation",
-            exception,
+            'File finder (env variable "NexusLIMS_file_finder") had an unexpected '
+            'value: "%s". Setting value to "gnu".',
+            finder,
         )
-        files = find_files_by_mtime(path, dt_from, dt_to)
-    return files
+        finder = "gnu"
+
+    if finder == "gnu":
+        try:
+            return gnu_find_file_info_by_mtime(
+                path,
+                dt_from,
+                dt_to,
+                extensions=extension_arg,
+            )
+        except (NotImplementedError, RuntimeError) as exception:
+            logger.warning(
+                "GNU find returned error: %s\nFalling back to pure Python "
+                "implementation",
+                exception,
+            )
+    return scandir_find_file_info_by_mtime(
+        path,
+        dt_from,
+        dt_to,
+        extensions=extension_arg,
+    )
 
 
 def dump_record(
@@ -410,32 +1095,130 @@ def dump_record(
             + ".xml",
         )
     filename.parent.mkdir(parents=True, exist_ok=True)
-    with filename.open(mode="w", encoding="utf-8") as f:
-        text = build_record(session=session, generate_previews=generate_previews)
-        f.write(text)
+    write_record(session, filename, generate_previews=generate_previews)
     return filename
 
 
-def validate_record(xml_filename):
+def get_schema() -> etree.XMLSchema:
+    """
+    Get the compiled Nexus Experiment schema.
+
+    The schema is read from :py:data:`XSD_PATH` and compiled the first time it
+    is needed in each thread, and then reused for every record validated by
+    that thread (lxml validators should not be used by several threads at
+    once).
+
+    Returns
+    -------
+    lxml.etree.XMLSchema
+        The compiled schema
+    """
+    schema = getattr(_SCHEMA_CACHE, "schema", None)
+    if schema is None:
+        schema = etree.XMLSchema(etree.parse(str(XSD_PATH)))  # noqa: S320
+        _SCHEMA_CACHE.schema = schema
+    return schema
+
+
+def validate_record(xml_filename) -> bool:
     """
     Validate an .xml record against the Nexus schema.
 
+    Parsed documents (such as those returned by :py:func:`lxml.etree.parse`)
+    are validated directly. Otherwise, the record is validated as it is
+    parsed, discarding each top-level element once it has been checked, so
+    the document is never held in memory as a whole (other than the text read
+    from text streams, such as :py:class:`io.StringIO`).
+
     Parameters
     ----------
-    xml_filename : str or io.StringIO or io.BytesIO
+    xml_filename : str or pathlib.Path or io.IOBase or lxml.etree._ElementTree
         The path to the xml file to be validated (can also be a file-like
-        object like StringIO or BytesIO)
+        object like StringIO or BytesIO, or an already parsed element or
+        element tree)
 
     Returns
     -------
     validates : bool
         Whether the record validates against the Nexus schema
     """
-    xsd_doc = etree.parse(XSD_PATH)  # noqa: S320
-    xml_schema = etree.XMLSchema(xsd_doc)
-    xml_doc = etree.parse(xml_filename)  # noqa: S320
+    schema = get_schema()
+    if etree.iselement(xml_filename) or isinstance(
+        xml_filename,
+        etree._ElementTree,  # noqa: SLF001
+    ):
+        return schema.validate(xml_filename)
+
+    encoding = None
+    if isinstance(xml_filename, Path):
+        xml_filename = str(xml_filename)
+    elif isinstance(xml_filename, TextIOBase):
+        # iterparse only reads bytes (in the encoding given by the document's
+        # XML declaration, which is overridden here)
+        xml_filename = BytesIO(xml_filename.read().encode("utf-8"))
+        encoding = "utf-8"
+    try:
+        for _, element in etree.iterparse(
+            xml_filename,
+            events=("end",),
+            schema=schema,
+            encoding=encoding,
+        ):
+            parent = element.getparent()
+            if parent is not None and parent.getparent() is None:
+                # this is a (fully validated) child of the root element
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+    except etree.XMLSyntaxError as exception:
+        logger.warning("Record did not validate: %s", exception)
+        return False
+    return True
+
+
+def validate_records(
+    filenames: List[Path],
+    n_workers: Optional[int] = None,
+) -> List[bool]:
+    """
+    Validate many record files against the Nexus schema using worker processes.
 
-    return xml_schema.validate(xml_doc)
+    Parameters
+    ----------
+    filenames
+        The record files to validate
+    n_workers
+        The number of worker processes to use. If ``None``, one per CPU is
+        used; if ``0`` or ``1``, the records are validated one at a time in
+        the current process
+
+    Returns
+    -------
+    typing.List[bool]
+        Whether each record validates (in the same order as ``filenames``)
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    filenames = [str(f) for f in filenames]
+    if n_workers <= 1 or len(filenames) <= 1:
+        return [validate_record(f) for f in filenames]
+
+    logger.info(
+        "Validating %i records using %i worker processes",
+        len(filenames),
+        n_workers,
+    )
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=get_context("spawn"),
+    ) as executor:
+        return list(
+            executor.map(
+                validate_record,
+                filenames,
+                chunksize=max(1, len(filenames) // (n_workers * 4)),
+            ),
+        )
 
 
 def build_new_session_records() -> List[Path]:
@@ -446,6 +1229,17 @@ def build_new_session_records() -> List[Path]:
     those records using :py:func:`build_record` (saving to the NexusLIMS folder), and
     returns a list of resulting .xml files to be uploaded to CDCS.
 
+    By default, sessions are built one at a time. If the
+    ``NexusLIMS_session_workers`` environment variable is set to a value larger
+    than one, up to that many sessions will be built at once (with at most
+    ``NexusLIMS_instrument_session_workers`` sessions from any single
+    instrument running at the same time). See
+    :py:func:`_build_sessions_concurrently` for details.
+
+    If the :ref:`NexusLIMS_file_index <NexusLIMS-file-index>` is enabled, it is
+    updated for each instrument with a session to build before any records are
+    built.
+
     Returns
     -------
     xml_files : typing.List[pathlib.Path]
@@ -459,75 +1253,388 @@ def build_new_session_records() -> List[Path]:
     sessions = get_sessions_to_build()
     if not sessions:
         sys.exit("No 'TO_BE_BUILT' sessions were found. Exiting.")
+
+    n_workers = get_env_int("NexusLIMS_session_workers", 1, minimum=1)
+    instrument_limit = get_env_int(
+        "NexusLIMS_instrument_session_workers",
+        1,
+        minimum=1,
+    )
+    if file_index.is_enabled():
+        _update_file_index({s.instrument.name: s.instrument for s in sessions})
+
+    session_files = find_session_files(sessions)
+    if n_workers > 1 and len(sessions) > 1:
+        return _build_sessions_concurrently(
+            sessions,
+            n_workers,
+            instrument_limit,
+            session_files,
+        )
+
     xml_files = []
     # loop through the sessions
-    for s in sessions:
+    for s, files in zip(sessions, session_files):
+        xml_files += _build_session_record(s, **_files_kwarg(files))
+
+    return xml_files
+
+
+def find_session_files(
+    sessions: List[Session],
+) -> List[Optional[List[FileInfo]]]:
+    """
+    Find the files for sessions on the same instrument with a single search.
+
+    Sessions are grouped by instrument, and for each instrument with more than
+    one session, the files modified over the whole span of those sessions are
+    found once (using :py:func:`get_files`) and then divided up between the
+    sessions by modification time. This means a backlog of sessions from one
+    instrument requires only one traversal of its file store, rather than one
+    per session.
+
+    Parameters
+    ----------
+    sessions
+        The sessions for which to find files
+
+    Returns
+    -------
+    typing.List[typing.Optional[typing.List[~nexusLIMS.utils.FileInfo]]]
+        The files for each session (in the same order as ``sessions``), or
+        ``None`` for a session whose files were not found (because it is the
+        only session on its instrument, or the search failed), in which case
+        they will be found when its record is built
+    """
+    session_files: List[Optional[List[FileInfo]]] = [None] * len(sessions)
+    groups: Dict[str, List[int]] = {}
+    for idx, s in enumerate(sessions):
+        if isinstance(s.instrument, Instrument):
+            groups.setdefault(s.instrument.name, []).append(idx)
+
+    for name, indices in groups.items():
+        if len(indices) < 2:  # noqa: PLR2004
+            continue
+        instrument = sessions[indices[0]].instrument
+        dt_from = min(sessions[i].dt_from for i in indices)
+        dt_to = max(sessions[i].dt_to for i in indices)
+        logger.info(
+            "Finding files for %i sessions on %s between %s and %s",
+            len(indices),
+            name,
+            dt_from.isoformat(),
+            dt_to.isoformat(),
+        )
+        path = Path(os.environ["mmfnexus_path"]) / instrument.filestore_path
         try:
-            db_row = s.insert_record_generation_event()
-            record_text = build_record(session=s)
-        except (  # pylint: disable=broad-exception-caught
-            FileNotFoundError,
-            Exception,
-        ) as exception:
-            if isinstance(exception, FileNotFoundError):
-                # if no files were found for this session log, mark it as so in
-                # the database
-                path = Path(os.environ["mmfnexus_path"]) / s.instrument.filestore_path
-                logger.warning(
-                    "No files found in %s between %s and %s",
-                    path,
-                    s.dt_from.isoformat(),
-                    s.dt_to.isoformat(),
-                )
+            files = get_files(path, dt_from, dt_to, instrument=instrument)
+        except (OSError, RuntimeError, CalledProcessError) as exception:
+            logger.warning(
+                "Could not find files for %s (%s); searching for each session "
+                "separately",
+                name,
+                exception,
+            )
+            continue
+        # files are sorted by mtime, so each session's files are a contiguous
+        # slice (using the same bounds as find's -newermt test)
+        mtimes = [f.mtime for f in files]
+        for i in indices:
+            start = bisect_right(mtimes, find_timestamp(sessions[i].dt_from))
+            end = bisect_right(mtimes, find_timestamp(sessions[i].dt_to))
+            session_files[i] = files[start:end]
+    return session_files
+
+
+def _files_kwarg(files: Optional[List[FileInfo]]) -> Dict[str, List[FileInfo]]:
+    """
+    Get the keyword argument that passes a session's files to :py:func:`build_record`.
+
+    Parameters
+    ----------
+    files
+        The files found by :py:func:`find_session_files` for a session
+
+    Returns
+    -------
+    dict
+        ``{"files": files}``, or an empty dictionary if the files were not
+        found in advance
+    """
+    return {} if files is None else {"files": files}
+
+
+def _update_file_index(instruments: Dict[str, Instrument]):
+    """
+    Refresh the file index for the instruments that have sessions to build.
+
+    Failures are logged, but otherwise ignored, since :py:func:`get_files`
+    will search the file system directly for any instrument whose index could
+    not be updated.
+
+    Parameters
+    ----------
+    instruments
+        The instruments to scan, keyed by name
+    """
+    for name, instrument in instruments.items():
+        try:
+            file_index.scan(instrument)
+        except (OSError, sqlite3.Error) as exception:
+            logger.warning("Could not update file index for %s: %s", name, exception)
+
+
+def _build_session_record(s: Session, **build_kwargs) -> List[Path]:
+    """
+    Build, validate, and save the record for a single session.
+
+    Handles the full lifecycle of one session (see
+    :py:func:`_build_and_save_record`), and saves the metrics of each stage of
+    building its record (see :py:mod:`~nexusLIMS.builder.metrics`).
+
+    Parameters
+    ----------
+    s
+        The session for which to build a record
+    **build_kwargs
+        Any additional keyword arguments to pass to :py:func:`build_record`
+
+    Returns
+    -------
+    xml_files : typing.List[pathlib.Path]
+        A list containing the saved record file (or an empty list if no
+        record was saved for this session)
+    """
+    instrument = s.instrument
+    if isinstance(instrument, Instrument):
+        instrument = instrument.name
+    with metrics.collect(s.session_identifier, instrument) as build_metrics:
+        xml_files = _build_and_save_record(s, **build_kwargs)
+    metrics.record(build_metrics)
+    return xml_files
+
 
-                if has_delay_passed(s.dt_to):
-                    logger.warning(
-                        'Marking %s as "NO_FILES_FOUND"',
-                        s.session_identifier,
-                    )
-                    s.update_session_status("NO_FILES_FOUND")
-                else:
-                    # if the delay hasn't passed, log and delete the record
-                    # generation event we inserted previously
-                    logger.warning(
-                        "Configured record building delay has not passed; "
-                        "Removing previously inserted RECORD_GENERATION row for %s",
-                        s.session_identifier,
-                    )
-                    db_query(
-                        "DELETE FROM session_log WHERE id_session_log = ?",
-                        (  # pylint: disable=used-before-assignment
-                            db_row["id_session_log"],
-                        ),
-                    )
-            elif isinstance(exception, nemo.exceptions.NoDataConsentError):
+def _build_and_save_record(s: Session, **build_kwargs) -> List[Path]:
+    """
+    Build, validate, and save the record for a single session.
+
+    Inserts the ``RECORD_GENERATION`` event, builds the record, and updates the
+    session's status in the database depending on the outcome.
+
+    Parameters
+    ----------
+    s
+        The session for which to build a record
+    **build_kwargs
+        Any additional keyword arguments to pass to :py:func:`build_record`
+
+    Returns
+    -------
+    xml_files : typing.List[pathlib.Path]
+        A list containing the saved record file (or an empty list if no
+        record was saved for this session)
+    """
+    try:
+        db_row = s.insert_record_generation_event()
+        record_text = build_record(session=s, **build_kwargs)
+    except (  # pylint: disable=broad-exception-caught
+        FileNotFoundError,
+        Exception,
+    ) as exception:
+        if isinstance(exception, FileNotFoundError):
+            # if no files were found for this session log, mark it as so in
+            # the database
+            path = Path(os.environ["mmfnexus_path"]) / s.instrument.filestore_path
+            logger.warning(
+                "No files found in %s between %s and %s",
+                path,
+                s.dt_from.isoformat(),
+                s.dt_to.isoformat(),
+            )
+
+            if has_delay_passed(s.dt_to):
                 logger.warning(
-                    "User requested this session not be harvested, "
-                    "so no record was built. %s",
-                    exception,
+                    'Marking %s as "NO_FILES_FOUND"',
+                    s.session_identifier,
                 )
-                logger.info('Marking %s as "NO_CONSENT"', s.session_identifier)
-                s.update_session_status("NO_CONSENT")
-            elif isinstance(exception, nemo.exceptions.NoMatchingReservationError):
+                s.update_session_status("NO_FILES_FOUND")
+                metrics.set_status("NO_FILES_FOUND")
+            else:
+                # if the delay hasn't passed, log and delete the record
+                # generation event we inserted previously
                 logger.warning(
-                    "No matching reservation found for this session, "
-                    "so assuming no consent was given. %s",
-                    exception,
+                    "Configured record building delay has not passed; "
+                    "Removing previously inserted RECORD_GENERATION row for %s",
+                    s.session_identifier,
                 )
-                logger.info('Marking %s as "NO_RESERVATION"', s.session_identifier)
-                s.update_session_status("NO_RESERVATION")
-            else:
-                logger.exception("Could not generate record text")
-                logger.exception('Marking %s as "ERROR"', s.session_identifier)
-                s.update_session_status("ERROR")
+                db_query(
+                    "DELETE FROM session_log WHERE id_session_log = ?",
+                    (  # pylint: disable=used-before-assignment
+                        db_row["id_session_log"],
+                    ),
+                )
+                metrics.set_status("TO_BE_BUILT")
+        elif isinstance(exception, nemo.exceptions.NoDataConsentError):
+            logger.warning(
+                "User requested this session not be harvested, "
+                "so no record was built. %s",
+                exception,
+            )
+            logger.info('Marking %s as "NO_CONSENT"', s.session_identifier)
+            s.update_session_status("NO_CONSENT")
+            metrics.set_status("NO_CONSENT")
+        elif isinstance(exception, nemo.exceptions.NoMatchingReservationError):
+            logger.warning(
+                "No matching reservation found for this session, "
+                "so assuming no consent was given. %s",
+                exception,
+            )
+            logger.info('Marking %s as "NO_RESERVATION"', s.session_identifier)
+            s.update_session_status("NO_RESERVATION")
+            metrics.set_status("NO_RESERVATION")
         else:
-            xml_files = _record_validation_flow(record_text, s, xml_files)
+            logger.exception("Could not generate record text")
+            logger.exception('Marking %s as "ERROR"', s.session_identifier)
+            s.update_session_status("ERROR")
+            metrics.set_status("ERROR")
+        return []
+
+    return _record_validation_flow(record_text, s, [])
 
-    return xml_files
+
+def _build_sessions_concurrently(
+    sessions: List[Session],
+    n_workers: int,
+    instrument_limit: int,
+    session_files: Optional[List[Optional[List[FileInfo]]]] = None,
+) -> List[Path]:
+    """
+    Build records for a number of sessions at the same time.
+
+    Sessions are started in the order given on a pool of ``n_workers``
+    threads, but a session is held back while ``instrument_limit`` sessions
+    from the same instrument are already running (so that a single
+    instrument's file share is not overloaded). Since preview generation is
+    not thread-safe, metadata extraction for each session is always done in
+    worker processes (using ``NexusLIMS_extraction_workers`` processes per
+    session, or one if that value is not set). Once all sessions are
+    finished, a report of which sessions were built in parallel is logged.
+
+    Parameters
+    ----------
+    sessions
+        The sessions for which to build records
+    n_workers
+        The maximum number of sessions to build at once
+    instrument_limit
+        The maximum number of sessions from any one instrument to build at once
+    session_files
+        The files for each session, if already found (see
+        :py:func:`find_session_files`)
+
+    Returns
+    -------
+    xml_files : typing.List[pathlib.Path]
+        A list of record files that were successfully built and saved to
+        centralized storage (in the same order as ``sessions``)
+    """
+    extraction_workers = max(1, get_env_int("NexusLIMS_extraction_workers", 0))
+    logger.info(
+        "Building %i sessions using up to %i workers (at most %i per instrument)",
+        len(sessions),
+        n_workers,
+        instrument_limit,
+    )
+
+    if session_files is None:
+        session_files = [None] * len(sessions)
+
+    def _timed_build(idx: int, s: Session) -> Tuple[List[Path], float, float]:
+        start = default_timer()
+        files = _build_session_record(
+            s,
+            extraction_workers=extraction_workers,
+            **_files_kwarg(session_files[idx]),
+        )
+        return files, start, default_timer()
+
+    pending = list(enumerate(sessions))
+    running = {}
+    instrument_counts = Counter()
+    results = {}
+    timings = {}
+    with ThreadPoolExecutor(
+        max_workers=n_workers,
+        thread_name_prefix="record_builder",
+    ) as executor:
+        while pending or running:
+            # start as many sessions as the global and instrument limits allow
+            for idx, s in list(pending):
+                if len(running) >= n_workers:
+                    break
+                if instrument_counts[s.instrument.name] >= instrument_limit:
+                    continue
+                pending.remove((idx, s))
+                instrument_counts[s.instrument.name] += 1
+                running[executor.submit(_timed_build, idx, s)] = (idx, s)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, s = running.pop(future)
+                instrument_counts[s.instrument.name] -= 1
+                try:
+                    results[idx], start, end = future.result()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception("Unexpected error while building %s", s)
+                    continue
+                timings[s.session_identifier] = (start, end)
+
+    for s_id, overlapping in _parallel_session_report(timings).items():
+        start, end = timings[s_id]
+        logger.info(
+            "Session %s took %.2f s; ran in parallel with: %s",
+            s_id,
+            end - start,
+            ", ".join(overlapping) if overlapping else "(none)",
+        )
+
+    return [f for idx in sorted(results) for f in results[idx]]
+
+
+def _parallel_session_report(
+    timings: Dict[str, Tuple[float, float]],
+) -> Dict[str, List[str]]:
+    """
+    Determine which sessions were built at the same time as one another.
+
+    Parameters
+    ----------
+    timings
+        A mapping of session identifier to the (start, end) times at which
+        that session was being built
+
+    Returns
+    -------
+    report : dict
+        A mapping of each session identifier to a list of the identifiers of
+        the other sessions whose build times overlapped with its own
+    """
+    return {
+        s_id: [
+            other
+            for other, (o_start, o_end) in timings.items()
+            if other != s_id and o_start < end and start < o_end
+        ]
+        for s_id, (start, end) in timings.items()
+    }
 
 
 def _record_validation_flow(record_text, s, xml_files) -> List[Path]:
-    if validate_record(BytesIO(bytes(record_text, "UTF-8"))):
+    record_bytes = record_text.encode()
+    with metrics.stage("validation", files=1):
+        valid = validate_record(BytesIO(record_bytes))
+    metrics.count("validation", bytes_read=len(record_bytes))
+    if valid:
         logger.info("Validated newly generated record")
         # generate filename for saved record and make sure path exists
         # DONE: fix this for NEMO records since session_identifier is
@@ -553,10 +1660,12 @@ def _record_validation_flow(record_text, s, xml_files) -> List[Path]:
         # Mark this session as completed in the database
         logger.info('Marking %s as "COMPLETED"', s.session_identifier)
         s.update_session_status("COMPLETED")
+        metrics.set_status("COMPLETED")
     else:
         logger.error('Marking %s as "ERROR"', s.session_identifier)
         logger.error("Could not validate record, did not write to disk")
         s.update_session_status("ERROR")
+        metrics.set_status("ERROR")
     return xml_files
 
 
@@ -565,7 +1674,8 @@ def process_new_records(
     dry_run: bool = False,
     dt_from: Optional[dt] = None,
     dt_to: Optional[dt] = None,
-):
+    harvest: bool = True,
+) -> List[Path]:
     """
     Process new records (this is the main entrypoint to the record builder).
 
@@ -589,6 +1699,17 @@ def process_new_records(
         no date filtering will be performed. This parameter currently only
         has an effect for the NEMO harvester. All SharePoint events will always
         be fetched.
+    harvest
+        Whether to fetch new usage events from the NEMO harvesters (between
+        ``dt_from`` and ``dt_to``) first. The record builder
+        :py:mod:`daemon <nexusLIMS.builder.daemon>` fetches them itself, to
+        keep track of which events it has already seen
+
+    Returns
+    -------
+    xml_files : typing.List[pathlib.Path]
+        The record files that were built (whether or not they could be
+        uploaded); always empty for a dry run
     """
     if dry_run:
         logger.info("!!DRY RUN!! Only finding files, not building records")
@@ -596,13 +1717,14 @@ def process_new_records(
         sessions = get_sessions_to_build()
         # get Session objects for NEMO usage events without adding to DB
         # DONE: NEMO usage events fetched should take a time range;
-        sessions += nemo_utils.get_usage_events_as_sessions(
-            dt_from=dt_from,
-            dt_to=dt_to,
-        )
+        if harvest:
+            sessions += nemo_utils.get_usage_events_as_sessions(
+                dt_from=dt_from,
+                dt_to=dt_to,
+            )
         if not sessions:
             logger.warning("No 'TO_BE_BUILT' sessions were found. Exiting.")
-            return
+            return []
         for s in sessions:
             # at this point, sessions can be from any type of harvester
             logger.info("")
@@ -613,15 +1735,23 @@ def process_new_records(
             #       event)
             get_reservation_event(s)
             dry_run_file_find(s)
+        xml_files = []
     else:
         # DONE: NEMO usage events fetcher should take a time range; we also
         #  need a consistent response for testing
-        nemo_utils.add_all_usage_events_to_db(dt_from=dt_from, dt_to=dt_to)
+        if harvest:
+            nemo_utils.add_all_usage_events_to_db(dt_from=dt_from, dt_to=dt_to)
         xml_files = build_new_session_records()
         if len(xml_files) == 0:
             logger.warning("No XML files built, so no files uploaded")
         else:
-            files_uploaded, _ = upload_record_files(xml_files)
+            with metrics.collect() as upload_metrics:
+                with metrics.stage("upload", paths=xml_files):
+                    files_uploaded, _ = upload_record_files(xml_files)
+                metrics.set_status(
+                    "COMPLETED" if len(files_uploaded) == len(xml_files) else "ERROR",
+                )
+            metrics.record(upload_metrics)
             for f in files_uploaded:
                 uploaded_dir = Path(f).parent / "uploaded"
                 Path(uploaded_dir).mkdir(parents=True, exist_ok=True)
@@ -635,7 +1765,7 @@ def process_new_records(
                     "Some record files were not uploaded: %s",
                     files_not_uploaded,
                 )
-    return
+    return xml_files
 
 
 def dry_run_get_sharepoint_reservation_event(
@@ -686,7 +1816,7 @@ def dry_run_file_find(s: Session) -> List[Path]:
         s.dt_from.isoformat(),
         s.dt_to.isoformat(),
     )
-    files = get_files(path, s.dt_from, s.dt_to)
+    files = get_files(path, s.dt_from, s.dt_to, instrument=s.instrument)
 
     logger.info("Results for %s on %s:", s.session_identifier, s.instrument)
     if len(files) == 0:
@@ -694,12 +1824,9 @@ def dry_run_file_find(s: Session) -> List[Path]:
     else:
         logger.info("Found %i files for this session", len(files))
     for f in files:
-        mtime = dt.fromtimestamp(
-            f.stat().st_mtime,
-            tz=s.instrument.timezone,
-        ).isoformat()
-        logger.info("*mtime* %s - %s", mtime, f)
-    return files
+        mtime = dt.fromtimestamp(f.mtime, tz=s.instrument.timezone).isoformat()
+        logger.info("*mtime* %s - %s", mtime, f.path)
+    return [f.path for f in files]
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -728,6 +1855,21 @@ if __name__ == "__main__":  # pragma: no cover
         "CRITICAL are always shown.",
     )
 
+    # Validate existing records instead of building new ones
+    parser.add_argument(
+        "--validate",
+        nargs="+",
+        type=Path,
+        metavar="RECORD",
+        help="Validate the given record files against the schema and exit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes used by --validate (default: one per CPU)",
+    )
+
     # Specify output of "--version"
     parser.add_argument(
         "--version",
@@ -749,6 +1891,14 @@ if __name__ == "__main__":  # pragma: no cover
     # explicitly since the setup_loggers function won't find it
     logger.setLevel(logging_levels[args.verbose])
 
+    if args.validate:
+        results = validate_records(args.validate, n_workers=args.workers)
+        for record, valid in zip(args.validate, results):
+            if not valid:
+                logger.error("%s does not validate", record)
+        logger.warning("%i of %i records validated", sum(results), len(results))
+        sys.exit(0 if all(results) else 1)
+
     # by default only fetch the last week's worth of data from the NEMO
     # harvesters to speed things up
     process_new_records(
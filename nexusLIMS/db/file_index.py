@@ -0,0 +1,707 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Maintain an index of the files in each instrument's file store.
+
+Finding the files for a session with :py:func:`~nexusLIMS.utils.gnu_find_files_by_mtime`
+requires a full traversal of an instrument's data folder, which can take
+several minutes on a large network share. When the
+:ref:`NexusLIMS_file_index <NexusLIMS-file-index>` environment variable is
+enabled, the path, modification time, size, and extension of every file under
+each instrument's ``filestore_path`` are instead recorded in a SQLite database
+next to the NexusLIMS database (see :ref:`nexusLIMS_db_path <nexusLIMS-db-path>`),
+and finding the files for a session becomes a range query on that table (see
+:py:func:`get_files_by_mtime`).
+
+The index is refreshed by :py:func:`scan`. After the first (full) scan of an
+instrument, later scans only list the contents of directories whose
+modification time has changed (which happens whenever a file is added,
+removed, or renamed within them), so files in unchanged directories are never
+``stat``-ed again. Since a file that is modified in place does not change its
+directory's modification time, files that were modified shortly before the
+previous scan (and so might still have been being written) are checked again
+individually. The record builder refreshes the index for each instrument
+before building its sessions, and the index can also be managed by running
+this module directly:
+
+.. code-block:: bash
+
+    $ python -m nexusLIMS.db.file_index --scan
+    $ python -m nexusLIMS.db.file_index --scan --full FEI-Titan-TEM-635816_n
+    $ python -m nexusLIMS.db.file_index --stats
+    $ python -m nexusLIMS.db.file_index --clear
+
+If an instrument has not been scanned since the end of the requested time
+range, the index is considered stale, and the record builder falls back to
+searching the file system directly.
+"""
+import argparse
+import contextlib
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from nexusLIMS.instruments import Instrument
+from nexusLIMS.utils import FileInfo, current_system_tz, find_timestamp, get_env_bool
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "nexuslims_file_index.sqlite"
+"""The name of the file index database (created next to the NexusLIMS DB)."""
+
+RECENT_FILE_WINDOW = 24 * 60 * 60
+"""
+Files modified within this many seconds before an instrument's previous scan
+are checked again (by ``stat``) during an incremental scan.
+"""
+
+_CREATE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS files ("
+    "instrument TEXT NOT NULL, "
+    "path TEXT NOT NULL, "
+    "directory TEXT NOT NULL, "
+    "mtime REAL NOT NULL, "
+    "size INTEGER NOT NULL, "
+    "extension TEXT NOT NULL, "
+    "PRIMARY KEY (instrument, path))",
+    "CREATE INDEX IF NOT EXISTS files_instrument_mtime ON files (instrument, mtime)",
+    "CREATE INDEX IF NOT EXISTS files_instrument_directory "
+    "ON files (instrument, directory)",
+    "CREATE TABLE IF NOT EXISTS directories ("
+    "instrument TEXT NOT NULL, "
+    "path TEXT NOT NULL, "
+    "mtime_ns INTEGER NOT NULL, "
+    "PRIMARY KEY (instrument, path))",
+    "CREATE TABLE IF NOT EXISTS scans ("
+    "instrument TEXT PRIMARY KEY, "
+    "root TEXT NOT NULL, "
+    "started REAL NOT NULL, "
+    "finished REAL NOT NULL)",
+)
+
+
+def is_enabled() -> bool:
+    """
+    Determine whether the file index should be used.
+
+    Returns
+    -------
+    bool
+        The value of the ``NexusLIMS_file_index`` environment variable
+        (``False`` if it is not set)
+    """
+    return get_env_bool("NexusLIMS_file_index", default=False)
+
+
+def get_index_path() -> Path:
+    """
+    Get the location of the file index database.
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the index database, which lives in the same folder as the
+        NexusLIMS database
+    """
+    return Path(os.environ["nexusLIMS_db_path"]).parent / INDEX_FILENAME
+
+
+def get_instrument_root(instrument: Instrument) -> Path:
+    """
+    Get the folder containing an instrument's data.
+
+    Parameters
+    ----------
+    instrument
+        The instrument
+
+    Returns
+    -------
+    pathlib.Path
+        The instrument's ``filestore_path``, relative to the
+        :ref:`mmfnexus_path <mmfnexus-path>` folder
+    """
+    return Path(os.environ["mmfnexus_path"]) / instrument.filestore_path
+
+
+def _connect() -> contextlib.closing:
+    """
+    Open a connection to the index database, creating the tables if needed.
+
+    Returns
+    -------
+    contextlib.closing
+        A wrapped :py:class:`sqlite3.Connection` that will be closed when used
+        as a context manager
+    """
+    conn = sqlite3.connect(get_index_path(), timeout=30)
+    with conn:
+        for statement in _CREATE_TABLES:
+            conn.execute(statement)
+    return contextlib.closing(conn)
+
+
+def _extension(fname: str) -> str:
+    """
+    Get the (lowercase) extension of a file name, without the leading period.
+
+    Parameters
+    ----------
+    fname
+        The file name or path
+
+    Returns
+    -------
+    str
+        The extension (an empty string if the file has none)
+    """
+    return os.path.splitext(fname)[1][1:].lower()  # noqa: PTH122
+
+
+def _walk(root: Path, known_dirs: Dict[str, int], *, full: bool):
+    """
+    Walk an instrument's data folder, listing the files in changed directories.
+
+    Symbolic links to directories are followed (as the ``find`` command is in
+    :py:func:`~nexusLIMS.utils.gnu_find_file_info_by_mtime`), but each directory
+    is only visited once.
+
+    Parameters
+    ----------
+    root
+        The folder to walk
+    known_dirs
+        The directories (and their modification times, in nanoseconds) seen
+        during the previous scan
+    full
+        If ``True``, list the files in every directory, even if it has not
+        changed
+
+    Returns
+    -------
+    visited : Dict[str, int]
+        The modification time (in nanoseconds) of every directory visited
+    listed : Dict[str, List[FileInfo]]
+        The files within each directory that was listed (those that are new or
+        have changed since the previous scan)
+    """
+    visited = {}
+    listed = {}
+    seen = set()
+    stack = [str(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            stat = os.stat(directory)  # noqa: PTH116
+        except OSError as exception:
+            logger.warning("Could not read %s: %s", directory, exception)
+            continue
+        if (stat.st_dev, stat.st_ino) in seen:
+            continue
+        seen.add((stat.st_dev, stat.st_ino))
+        visited[directory] = stat.st_mtime_ns
+
+        relist = full or known_dirs.get(directory) != stat.st_mtime_ns
+        files = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif relist and entry.is_file(follow_symlinks=False):
+                        file_stat = entry.stat(follow_symlinks=False)
+                        files.append(
+                            FileInfo(
+                                Path(entry.path),
+                                file_stat.st_mtime,
+                                file_stat.st_size,
+                            ),
+                        )
+        except OSError as exception:
+            logger.warning("Could not list %s: %s", directory, exception)
+            # make sure this directory is listed again during the next scan
+            visited[directory] = -1
+            continue
+        if relist:
+            listed[directory] = files
+    return visited, listed
+
+
+def scan(instrument: Instrument, *, full: bool = False) -> Dict[str, int]:
+    """
+    Update the index of the files in an instrument's data folder.
+
+    If the instrument has not been scanned before (or its ``filestore_path``
+    has changed), every file is indexed. Otherwise, only the directories whose
+    modification times have changed are listed again, and the files that were
+    recently modified (within :py:data:`RECENT_FILE_WINDOW` seconds of the
+    previous scan) are checked for changes.
+
+    Parameters
+    ----------
+    instrument
+        The instrument whose files should be indexed
+    full
+        If ``True``, list the contents of every directory, even if the
+        directory has not changed since the previous scan
+
+    Returns
+    -------
+    dict
+        The number of ``directories`` visited, the number of directories that
+        were ``listed``, the number of ``files`` (re)indexed, and the number of
+        files ``removed`` from the index
+    """
+    root = get_instrument_root(instrument)
+    name = instrument.name
+    started = time.time()
+    logger.info("Scanning %s for the file index", root)
+
+    with _connect() as conn:
+        previous = conn.execute(
+            "SELECT root, started FROM scans WHERE instrument = ?",
+            (name,),
+        ).fetchone()
+        if previous is None or previous[0] != str(root):
+            full = True
+        known_dirs = dict(
+            conn.execute(
+                "SELECT path, mtime_ns FROM directories WHERE instrument = ?",
+                (name,),
+            ).fetchall(),
+        )
+
+        visited, listed = _walk(root, known_dirs, full=full)
+
+        with conn:
+            gone = [d for d in known_dirs if d not in visited]
+            old_paths = set()
+            for directory in [*listed, *gone]:
+                old_paths.update(
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT path FROM files WHERE instrument = ? AND directory = ?",
+                        (name, directory),
+                    )
+                )
+                conn.execute(
+                    "DELETE FROM files WHERE instrument = ? AND directory = ?",
+                    (name, directory),
+                )
+            conn.executemany(
+                "DELETE FROM directories WHERE instrument = ? AND path = ?",
+                [(name, d) for d in gone],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO directories (instrument, path, mtime_ns) "
+                "VALUES (?, ?, ?)",
+                [(name, d, mtime_ns) for d, mtime_ns in visited.items()],
+            )
+            rows = [
+                (name, str(f.path), directory, f.mtime, f.size, _extension(f.path.name))
+                for directory, files in listed.items()
+                for f in files
+            ]
+            _insert_files(conn, rows)
+            removed = len(old_paths - {row[1] for row in rows})
+            if not full:
+                updated, deleted = _check_recent_files(
+                    conn,
+                    name,
+                    previous[1] - RECENT_FILE_WINDOW,
+                    listed,
+                )
+                rows.extend(updated)
+                removed += deleted
+            conn.execute(
+                "INSERT OR REPLACE INTO scans (instrument, root, started, finished) "
+                "VALUES (?, ?, ?, ?)",
+                (name, str(root), started, time.time()),
+            )
+
+    result = {
+        "directories": len(visited),
+        "listed": len(listed),
+        "files": len(rows),
+        "removed": removed,
+    }
+    logger.info(
+        "Indexed %s in %.2f s: %s",
+        name,
+        time.time() - started,
+        result,
+    )
+    return result
+
+
+def _insert_files(conn: sqlite3.Connection, rows: List[tuple]):
+    """
+    Add (or replace) entries in the ``files`` table.
+
+    Parameters
+    ----------
+    conn
+        An open connection to the index database
+    rows
+        The rows to insert, as tuples of ``(instrument, path, directory, mtime,
+        size, extension)``
+    """
+    conn.executemany(
+        "INSERT OR REPLACE INTO files "
+        "(instrument, path, directory, mtime, size, extension) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _check_recent_files(
+    conn: sqlite3.Connection,
+    instrument_name: str,
+    cutoff: float,
+    listed: Dict[str, List[FileInfo]],
+):
+    """
+    Update the index entries of files that were modified before the last scan.
+
+    Parameters
+    ----------
+    conn
+        An open connection to the index database
+    instrument_name
+        The name of the instrument being scanned
+    cutoff
+        Indexed files with a modification time after this timestamp are checked
+    listed
+        The directories that were already listed during this scan (whose files
+        do not need to be checked again)
+
+    Returns
+    -------
+    updated : list
+        The index rows that were updated
+    deleted : int
+        The number of files removed from the index (since they no longer exist)
+    """
+    updated = []
+    deleted = []
+    for path, directory, mtime, size in conn.execute(
+        "SELECT path, directory, mtime, size FROM files "
+        "WHERE instrument = ? AND mtime >= ?",
+        (instrument_name, cutoff),
+    ).fetchall():
+        if directory in listed:
+            continue
+        try:
+            stat = os.stat(path)  # noqa: PTH116
+        except OSError:
+            deleted.append((instrument_name, path))
+            continue
+        if (stat.st_mtime, stat.st_size) != (mtime, size):
+            updated.append(
+                (
+                    instrument_name,
+                    path,
+                    directory,
+                    stat.st_mtime,
+                    stat.st_size,
+                    _extension(path),
+                ),
+            )
+    conn.executemany(
+        "DELETE FROM files WHERE instrument = ? AND path = ?",
+        deleted,
+    )
+    _insert_files(conn, updated)
+    return updated, len(deleted)
+
+
+def update_paths(
+    instrument: Instrument,
+    paths: Iterable[str],
+    *,
+    synced: float,
+) -> Dict[str, int]:
+    """
+    Update the index entries for specific files and directories.
+
+    This is used by the :py:mod:`~nexusLIMS.db.file_watcher` to record
+    changes as they happen, rather than scanning the whole data folder. Each
+    path is checked (by ``stat``) and its entry is added, updated, or removed
+    as needed; if a removed path was a directory, the entries for everything
+    within it are removed as well. All changes are written in a single
+    transaction.
+
+    Parameters
+    ----------
+    instrument
+        The instrument whose data folder contains the paths
+    paths
+        The paths of the files (or directories) that changed
+    synced
+        The time (as a POSIX timestamp) up to which all changes to the data
+        folder have been recorded; if the instrument has been scanned before,
+        this is recorded as the time of its last update so that
+        :py:func:`get_files_by_mtime` will rely on the index for time ranges
+        ending before then
+
+    Returns
+    -------
+    dict
+        The number of ``files`` (re)indexed and the number of paths ``removed``
+        from the index
+    """
+    name = instrument.name
+    rows = []
+    removed = []
+    directories = {}
+    for path in paths:
+        parent = os.path.dirname(path)  # noqa: PTH120
+        with contextlib.suppress(OSError):
+            directories[parent] = os.stat(parent).st_mtime_ns  # noqa: PTH116
+        try:
+            stat = os.stat(path)  # noqa: PTH116
+        except OSError:
+            removed.append(path)
+            continue
+        if os.path.isdir(path):  # noqa: PTH112
+            directories[path] = stat.st_mtime_ns
+        elif os.path.isfile(path):  # noqa: PTH113
+            rows.append(
+                (name, path, parent, stat.st_mtime, stat.st_size, _extension(path)),
+            )
+
+    n_removed = 0
+    with _connect() as conn, conn:
+        for path in removed:
+            prefix = path.rstrip("/") + "/"
+            n_removed += conn.execute(
+                "DELETE FROM files WHERE instrument = ? AND (path = ? "
+                "OR substr(directory || '/', 1, ?) = ?)",
+                (name, path, len(prefix), prefix),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM directories WHERE instrument = ? AND (path = ? "
+                "OR substr(path, 1, ?) = ?)",
+                (name, path, len(prefix), prefix),
+            )
+        _insert_files(conn, rows)
+        conn.executemany(
+            "INSERT OR REPLACE INTO directories (instrument, path, mtime_ns) "
+            "VALUES (?, ?, ?)",
+            [(name, d, mtime_ns) for d, mtime_ns in directories.items()],
+        )
+        conn.execute(
+            "UPDATE scans SET started = ?, finished = ? "
+            "WHERE instrument = ? AND started < ?",
+            (synced, time.time(), name, synced),
+        )
+    return {"files": len(rows), "removed": n_removed}
+
+
+def get_files_by_mtime(
+    instrument: Instrument,
+    dt_from: datetime,
+    dt_to: datetime,
+    extensions: Optional[Iterable[str]] = None,
+) -> Optional[List[FileInfo]]:
+    """
+    Get the indexed files for an instrument that were modified between two times.
+
+    This returns the same files as
+    :py:func:`~nexusLIMS.utils.gnu_find_file_info_by_mtime` (including the
+    handling of the ``NexusLIMS_ignore_patterns`` environment variable), but
+    using the index rather than searching the file system.
+
+    Parameters
+    ----------
+    instrument
+        The instrument whose files should be found
+    dt_from
+        The "starting" point of the search timeframe
+    dt_to
+        The "ending" point of the search timeframe
+    extensions
+        The extensions of the files to find. If None, all files modified
+        between the two times are found.
+
+    Returns
+    -------
+    List[FileInfo] or None
+        The files with modification times within the time range provided
+        (sorted by modification time), or ``None`` if the instrument has not
+        been scanned since ``dt_to`` (or its ``filestore_path`` has changed
+        since it was last scanned), meaning the index cannot be relied upon
+    """
+    ts_from = find_timestamp(dt_from)
+    ts_to = find_timestamp(dt_to)
+    with _connect() as conn:
+        scan_row = conn.execute(
+            "SELECT root, started FROM scans WHERE instrument = ?",
+            (instrument.name,),
+        ).fetchone()
+        if scan_row is None or scan_row[0] != str(get_instrument_root(instrument)):
+            logger.info("Instrument %s has not been indexed", instrument.name)
+            return None
+        if scan_row[1] < ts_to:
+            logger.info(
+                "File index for %s was last updated at %s, before the end of the "
+                "requested time range",
+                instrument.name,
+                datetime.fromtimestamp(scan_row[1], tz=current_system_tz()).isoformat(),
+            )
+            return None
+
+        query = (
+            "SELECT path, mtime, size FROM files WHERE instrument = ? "
+            "AND mtime > ? AND mtime <= ?"
+        )
+        args = [instrument.name, ts_from, ts_to]
+        if extensions is not None:
+            extensions = [e.lower() for e in extensions]
+            query += f" AND extension IN ({', '.join('?' * len(extensions))})"
+            args += extensions
+        query += " ORDER BY mtime, path"
+        rows = conn.execute(query, args).fetchall()
+
+    ignore_patterns = json.loads(os.environ.get("NexusLIMS_ignore_patterns", "[]"))
+    ignore_patterns = [p.lower() for p in ignore_patterns]
+    files = [
+        FileInfo(Path(path), mtime, size)
+        for path, mtime, size in rows
+        if not any(
+            fnmatch.fnmatchcase(Path(path).name.lower(), p) for p in ignore_patterns
+        )
+    ]
+    logger.info("Found %i files in the file index", len(files))
+    return files
+
+
+def clear() -> int:
+    """
+    Remove all entries from the file index.
+
+    Returns
+    -------
+    int
+        The number of files removed
+    """
+    with _connect() as conn, conn:
+        removed = conn.execute("DELETE FROM files").rowcount
+        conn.execute("DELETE FROM directories")
+        conn.execute("DELETE FROM scans")
+    logger.info("Cleared %i files from the file index", removed)
+    return removed
+
+
+def index_stats() -> Dict[str, Any]:
+    """
+    Summarize the contents of the file index.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the index's ``path`` and, for each indexed
+        instrument (in ``instruments``), the number of ``files``, their total
+        ``size`` (in bytes), and when the instrument was ``last_scanned``
+    """
+    with _connect() as conn:
+        counts = {
+            name: (count, size)
+            for name, count, size in conn.execute(
+                "SELECT instrument, COUNT(*), COALESCE(SUM(size), 0) FROM files "
+                "GROUP BY instrument",
+            ).fetchall()
+        }
+        scans = conn.execute("SELECT instrument, started FROM scans").fetchall()
+    instruments = {}
+    for name, started in scans:
+        count, size = counts.get(name, (0, 0))
+        last_scanned = datetime.fromtimestamp(started, tz=current_system_tz())
+        instruments[name] = {
+            "files": count,
+            "size": size,
+            "last_scanned": last_scanned.isoformat(),
+        }
+    return {"path": get_index_path(), "instruments": instruments}
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from nexusLIMS.instruments import instrument_db
+    from nexusLIMS.utils import setup_loggers
+
+    parser = argparse.ArgumentParser(
+        description="Manage the NexusLIMS file index",
+    )
+    parser.add_argument(
+        "--scan",
+        nargs="*",
+        metavar="INSTRUMENT",
+        help="Update the index for these instruments (or all instruments, if "
+        "none are given)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="When scanning, list every directory, even if it has not changed",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Show a summary of the index contents (the default action)",
+    )
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="Remove all entries from the index",
+    )
+    args = parser.parse_args()
+
+    setup_loggers(logging.INFO)
+    logger.setLevel(logging.INFO)
+
+    if args.clear:
+        clear()
+    if args.scan is not None:
+        for instr_name in args.scan or list(instrument_db):
+            scan(instrument_db[instr_name], full=args.full)
+    stats = index_stats()
+    logger.info("%s:", stats["path"])
+    for instr_name, instr_stats in sorted(stats["instruments"].items()):
+        logger.info(
+            "    %s: %i files (%.1f GiB), last scanned %s",
+            instr_name,
+            instr_stats["files"],
+            instr_stats["size"] / 2**30,
+            instr_stats["last_scanned"],
+        )
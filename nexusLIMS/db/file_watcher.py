@@ -0,0 +1,627 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Keep the file index up to date as files are written by instruments.
+
+Rather than rescanning each instrument's data folder on a schedule, this module
+provides a long-running process (a :py:class:`FileWatcher`) that records new,
+modified, and removed files in the :py:mod:`~nexusLIMS.db.file_index` as they
+change. On Linux, changes are reported by the kernel's ``inotify`` interface
+(accessed directly through the C library, so no additional packages are
+needed). Since ``inotify`` does not report changes made by other machines to a
+network file system (such as an NFS or SMB share), instruments whose data is
+on such a mount (or for which ``inotify`` is not available) are instead polled
+by running an incremental :py:func:`~nexusLIMS.db.file_index.scan`
+periodically (see :ref:`NexusLIMS_file_watcher_mode
+<NexusLIMS-file-watcher-mode>`).
+
+Changes are collected in memory and written to the index in batches (see
+:py:attr:`FileWatcher.batch_size` and :py:attr:`FileWatcher.flush_interval`),
+so the thousands of events produced by acquiring an image series result in a
+handful of database transactions.
+
+The watcher is started by running this module directly (it runs until
+interrupted):
+
+.. code-block:: bash
+
+    $ python -m nexusLIMS.db.file_watcher
+    $ python -m nexusLIMS.db.file_watcher FEI-Titan-TEM-635816_n --mode poll
+"""
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import signal
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from nexusLIMS.db import file_index
+from nexusLIMS.instruments import Instrument
+from nexusLIMS.utils import get_env_int
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags (see inotify(7))
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+"""The events watched for in each directory."""
+
+NETWORK_FS_TYPES = {
+    "9p",
+    "afs",
+    "ceph",
+    "cifs",
+    "fuse.sshfs",
+    "glusterfs",
+    "lustre",
+    "ncpfs",
+    "nfs",
+    "nfs4",
+    "smb3",
+    "smbfs",
+}
+"""File system types on which ``inotify`` will not see remote changes."""
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    A minimal wrapper around the Linux ``inotify`` API.
+
+    Raises
+    ------
+    OSError
+        If ``inotify`` is not available on this system
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_init1.restype = ctypes.c_int
+        except (OSError, AttributeError) as exception:
+            msg = f"inotify is not available: {exception}"
+            raise OSError(msg) from exception
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise("inotify_init1")
+
+    def _raise(self, func: str):
+        errno = ctypes.get_errno()
+        msg = f"{func} failed: {os.strerror(errno)}"
+        raise OSError(errno, msg)
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """
+        Watch a directory for events.
+
+        Parameters
+        ----------
+        path
+            The directory to watch
+        mask
+            The events to watch for
+
+        Returns
+        -------
+        int
+            The watch descriptor, which identifies the directory in events
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise(f"inotify_add_watch({path})")
+        return wd
+
+    def rm_watch(self, wd: int):
+        """
+        Stop watching a directory (errors are ignored).
+
+        Parameters
+        ----------
+        wd
+            The watch descriptor returned by :py:meth:`add_watch`
+        """
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """
+        Wait for (and read) any pending events.
+
+        Parameters
+        ----------
+        timeout
+            The maximum time (in seconds) to wait for an event
+
+        Returns
+        -------
+        list
+            The events, as tuples of ``(watch descriptor, mask, name)``,
+            where ``name`` is the name of the file within the watched
+            directory (empty for events about the directory itself)
+        """
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        events = []
+        while readable:
+            try:
+                buffer = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = buffer[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        """Close the ``inotify`` file descriptor."""
+        os.close(self.fd)
+
+
+def is_network_fs(path: Path) -> bool:
+    """
+    Determine whether a path is on a network file system.
+
+    Parameters
+    ----------
+    path
+        The path to check
+
+    Returns
+    -------
+    bool
+        Whether the mount containing ``path`` (according to ``/proc/mounts``)
+        has one of the :py:data:`NETWORK_FS_TYPES`; ``False`` if this cannot
+        be determined
+    """
+    real_path = os.path.realpath(path)
+    try:
+        mounts = Path("/proc/mounts").read_text().splitlines()
+    except OSError:
+        return False
+    best, fs_type = "", None
+    for line in mounts:
+        fields = line.split()
+        if len(fields) < 3:  # noqa: PLR2004
+            continue
+        # spaces in mount points are escaped as octal in /proc/mounts
+        mount_point = fields[1].replace("\\040", " ")
+        prefix = mount_point.rstrip("/") + "/"
+        if (real_path == mount_point or real_path.startswith(prefix)) and len(
+            mount_point,
+        ) >= len(best):
+            best, fs_type = mount_point, fields[2]
+    return fs_type in NETWORK_FS_TYPES
+
+
+class FileWatcher:
+    """
+    Watch instrument data folders and record changes in the file index.
+
+    Parameters
+    ----------
+    instruments
+        The instruments whose data folders should be watched
+    mode
+        How to detect changes: ``"inotify"``, ``"poll"``, or ``"auto"`` (use
+        ``inotify`` unless an instrument's data is on a network file system,
+        or ``inotify`` is unavailable or runs out of watches). If not given,
+        the value of the ``NexusLIMS_file_watcher_mode`` environment variable
+        is used (defaulting to ``"auto"``).
+    poll_interval
+        The number of seconds between scans of polled instruments. If not
+        given, the value of the ``NexusLIMS_file_watcher_poll_interval``
+        environment variable is used (defaulting to 300).
+    batch_size
+        Pending changes are written to the index once this many paths have
+        changed
+    flush_interval
+        Pending changes are written to the index at least this often (in
+        seconds)
+    """
+
+    def __init__(
+        self,
+        instruments: Iterable[Instrument],
+        *,
+        mode: Optional[str] = None,
+        poll_interval: Optional[int] = None,
+        batch_size: int = 5000,
+        flush_interval: float = 5.0,
+    ):
+        self.instruments = {i.name: i for i in instruments}
+        if mode is None:
+            mode = os.environ.get("NexusLIMS_file_watcher_mode", "auto").lower()
+        if mode not in ("auto", "inotify", "poll"):
+            logger.warning(
+                'Unexpected file watcher mode "%s"; using "auto" instead',
+                mode,
+            )
+            mode = "auto"
+        self.mode = mode
+        if poll_interval is None:
+            poll_interval = get_env_int(
+                "NexusLIMS_file_watcher_poll_interval",
+                300,
+                minimum=1,
+            )
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._inotify: Optional[Inotify] = None
+        # watch descriptor -> (instrument name, directory path)
+        self._watches: Dict[int, Tuple[str, str]] = {}
+        # instrument name -> changed paths waiting to be written to the index
+        self._pending: Dict[str, Set[str]] = {}
+        # instruments whose watches may be incomplete (because events were lost
+        # or a directory could not be watched)
+        self._rescan: Set[str] = set()
+        self._polled: Dict[str, float] = {}
+        self._last_flush = time.time()
+        self._synced = self._last_flush
+        self._stopped = False
+
+    @property
+    def watched(self) -> List[str]:
+        """The names of the instruments watched with ``inotify``."""
+        return sorted({name for name, _ in self._watches.values()})
+
+    @property
+    def polled(self) -> List[str]:
+        """The names of the instruments that are polled."""
+        return sorted(self._polled)
+
+    def start(self):
+        """
+        Set up watches (or polling) for each instrument and bring the index up to date.
+
+        Watches are added before each instrument's initial scan, so no
+        changes made during the scan are missed.
+        """
+        if self.mode != "poll":
+            try:
+                self._inotify = Inotify()
+            except OSError as exception:
+                if self.mode == "inotify":
+                    raise
+                logger.warning("%s; polling all instruments", exception)
+        for name, instrument in self.instruments.items():
+            root = file_index.get_instrument_root(instrument)
+            use_inotify = self._inotify is not None
+            if use_inotify and self.mode == "auto" and is_network_fs(root):
+                logger.info("%s is on a network file system; polling it", root)
+                use_inotify = False
+            if use_inotify:
+                try:
+                    self._watch_tree(name, str(root))
+                except OSError as exception:
+                    if self.mode == "inotify":
+                        raise
+                    logger.warning(
+                        "Could not watch %s (%s); polling it instead",
+                        root,
+                        exception,
+                    )
+                    self._unwatch(name, str(root))
+                    use_inotify = False
+            file_index.scan(instrument)
+            if not use_inotify:
+                self._polled[name] = time.time()
+        logger.info(
+            "Watching %s; polling %s (every %i s)",
+            self.watched,
+            self.polled,
+            self.poll_interval,
+        )
+
+    def _watch_tree(self, name: str, root: str) -> List[str]:
+        """
+        Add watches for a directory and every directory within it.
+
+        Parameters
+        ----------
+        name
+            The name of the instrument the directory belongs to
+        root
+            The directory to watch
+
+        Returns
+        -------
+        list of str
+            The paths of the files found within the watched directories
+        """
+        files = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            wd = self._inotify.add_watch(directory)
+            if wd in self._watches:
+                # inotify returns the existing watch for a directory that is
+                # already watched (such as through a symbolic link)
+                continue
+            self._watches[wd] = (name, directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        else:
+                            files.append(entry.path)
+            except OSError as exception:
+                logger.warning("Could not list %s: %s", directory, exception)
+        return files
+
+    def _unwatch(self, name: str, directory: str):
+        """
+        Remove the watches for a directory and every directory within it.
+
+        Parameters
+        ----------
+        name
+            The name of the instrument the directory belongs to
+        directory
+            The directory to stop watching
+        """
+        prefix = directory.rstrip("/") + "/"
+        for wd, (instr_name, path) in list(self._watches.items()):
+            if instr_name == name and (path == directory or path.startswith(prefix)):
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def _rewatch(self, name: str):
+        """
+        Watch an instrument's whole data folder again, and rescan it.
+
+        This is needed when events have been lost or a directory could not be
+        watched, since directories created in the meantime would otherwise
+        never be watched. If the folder can no longer be watched (for example,
+        because the ``inotify`` watch limit has been reached), the instrument
+        is polled instead.
+
+        Parameters
+        ----------
+        name
+            The name of the instrument
+        """
+        instrument = self.instruments[name]
+        root = str(file_index.get_instrument_root(instrument))
+        self._unwatch(name, root)
+        try:
+            self._watch_tree(name, root)
+        except OSError as exception:
+            logger.warning(
+                "Could not watch %s (%s); polling it instead",
+                root,
+                exception,
+            )
+            self._unwatch(name, root)
+        # watches are added before scanning, so no changes are missed
+        file_index.scan(instrument)
+        self._pending.pop(name, None)
+        if name not in self.watched:
+            self._polled[name] = time.time()
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        """
+        Record the path affected by an ``inotify`` event.
+
+        Parameters
+        ----------
+        wd
+            The watch descriptor of the directory the event happened in
+        mask
+            The event's flags
+        name
+            The name of the affected file within the directory
+        """
+        if mask & IN_Q_OVERFLOW:
+            # events were lost (including the creation of directories that
+            # then need to be watched), so every watched instrument needs to be
+            # watched and scanned again
+            logger.warning("inotify event queue overflowed; rescanning")
+            self._rescan.update(self.watched)
+            return
+        if wd not in self._watches:
+            return
+        instr_name, directory = self._watches[wd]
+        if mask & (IN_IGNORED | IN_DELETE_SELF):
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+            return
+
+        path = os.path.join(directory, name)  # noqa: PTH118
+        pending = self._pending.setdefault(instr_name, set())
+        pending.add(path)
+        if mask & IN_ISDIR:
+            if mask & IN_MOVED_FROM:
+                self._unwatch(instr_name, path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                # files may have been written before the watch was added
+                try:
+                    pending.update(self._watch_tree(instr_name, path))
+                except OSError as exception:
+                    logger.warning("Could not watch %s: %s", path, exception)
+                    self._rescan.add(instr_name)
+
+    def flush(self):
+        """
+        Write all pending changes to the file index.
+
+        The index of each watched instrument is then marked as up to date (as
+        of when the pending events were read). Instruments whose watches may be
+        incomplete are watched and scanned again first (see
+        :py:meth:`_rewatch`), and polled instruments are only marked as up to
+        date by their scans.
+        """
+        for name in sorted(self._rescan):
+            self._rewatch(name)
+        self._rescan.clear()
+
+        synced = self._synced
+        for name, paths in self._pending.items():
+            if name in self._polled:
+                continue
+            if paths:
+                result = file_index.update_paths(
+                    self.instruments[name],
+                    sorted(paths),
+                    synced=synced,
+                )
+                logger.debug("Updated file index for %s: %s", name, result)
+        # instruments without changes are also up to date as of now
+        for name in self.watched:
+            if name not in self._pending:
+                file_index.update_paths(self.instruments[name], [], synced=synced)
+        self._pending.clear()
+        self._last_flush = time.time()
+
+    def _n_pending(self) -> int:
+        return sum(len(paths) for paths in self._pending.values())
+
+    def process(self, timeout: float):
+        """
+        Wait for and handle changes once, flushing or polling if it is time to.
+
+        Parameters
+        ----------
+        timeout
+            The maximum time (in seconds) to wait for changes
+        """
+        now = time.time()
+        deadlines = [self._last_flush + self.flush_interval]
+        deadlines += [t + self.poll_interval for t in self._polled.values()]
+        timeout = min([timeout] + [d - now for d in deadlines])
+
+        if self._inotify is not None and self._watches:
+            # everything that happened before this point will have been read
+            synced = time.time()
+            for event in self._inotify.read_events(timeout):
+                self._handle_event(*event)
+            self._synced = synced
+        else:
+            time.sleep(max(timeout, 0))
+            self._synced = time.time()
+
+        now = time.time()
+        if (
+            self._n_pending() >= self.batch_size
+            or self._rescan
+            or now - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+        for name, last_polled in self._polled.items():
+            if now - last_polled >= self.poll_interval:
+                file_index.scan(self.instruments[name])
+                self._polled[name] = time.time()
+
+    def run(self):
+        """Watch for changes until :py:meth:`stop` is called (or on SIGTERM)."""
+        self.start()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        try:
+            while not self._stopped:
+                self.process(self.flush_interval)
+        except KeyboardInterrupt:
+            logger.info("Interrupted; stopping file watcher")
+        finally:
+            self.close()
+
+    def stop(self):
+        """Stop a running watcher (after pending changes have been written)."""
+        self._stopped = True
+
+    def close(self):
+        """Write any pending changes and release the ``inotify`` watches."""
+        self.flush()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from nexusLIMS.instruments import instrument_db
+    from nexusLIMS.utils import setup_loggers
+
+    parser = argparse.ArgumentParser(
+        description="Keep the NexusLIMS file index up to date as files change",
+    )
+    parser.add_argument(
+        "instruments",
+        nargs="*",
+        metavar="INSTRUMENT",
+        help="The instruments to watch (all instruments, if none are given)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["auto", "inotify", "poll"],
+        help="How to detect changes (overrides NexusLIMS_file_watcher_mode)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Increase verbosity of output",
+    )
+    args = parser.parse_args()
+
+    setup_loggers(logging.DEBUG if args.verbose else logging.INFO)
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    names = args.instruments or list(instrument_db)
+    FileWatcher([instrument_db[n] for n in names], mode=args.mode).run()
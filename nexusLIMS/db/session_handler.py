@@ -265,22 +265,14 @@ class Session:
             dt.now(tz=current_system_tz()),
         )
 
-        # use contextlib to auto-close the connection and database cursors
-        with contextlib.closing(  # noqa: SIM117
-            sqlite3.connect(os.environ["nexusLIMS_db_path"]),
-        ) as conn:
-            with conn:  # auto-commits
-                with contextlib.closing(conn.cursor()) as cursor:  # auto-closes
-                    results = cursor.execute(insert_query, args)
-
+        # insert the row and read it back by its row id within the same
+        # transaction, so the result is correct even if other sessions are
+        # being built (and logged) concurrently
         check_query = (
             "SELECT id_session_log, event_type, "
             "session_identifier, timestamp FROM session_log "
-            "WHERE instrument = ?"
-            "AND event_type = ?"
-            "ORDER BY timestamp DESC LIMIT 1"
+            "WHERE id_session_log = ?"
         )
-        args = (self.instrument.name, "RECORD_GENERATION")
 
         # use contextlib to auto-close the connection and database cursors
         with contextlib.closing(
@@ -289,7 +281,8 @@ class Session:
             conn.row_factory = sqlite3.Row
             with conn:  # auto-commits  # noqa: SIM117
                 with contextlib.closing(conn.cursor()) as cursor:  # auto-closes
-                    results = cursor.execute(check_query, args)
+                    cursor.execute(insert_query, args)
+                    results = cursor.execute(check_query, (cursor.lastrowid,))
                     res = results.fetchone()
 
         event_match = res["event_type"] == "RECORD_GENERATION"
@@ -0,0 +1,405 @@
+r"""
+Time each metadata extractor and preview renderer on the test files.
+
+Runs every extractor in :py:data:`nexusLIMS.extractors.extension_reader_map`
+and every preview renderer (the ``_plot_*`` functions of
+:py:mod:`~nexusLIMS.extractors.thumbnail_generator` used by
+:py:func:`~nexusLIMS.extractors.thumbnail_generator.sig_to_thumbnail`, as well
+as the renderers for images and text files) in isolation on the test files in
+``tests/files``, and reports the (median) time and peak memory use of each.
+For the ``_plot_*`` renderers, loading the file is not included in the time,
+and each case is named after the ``_plot_*`` function that drew the preview.
+
+Peak memory is measured with :py:mod:`tracemalloc` in a separate run, since
+tracing allocations slows everything down. It counts the memory allocated by
+Python and NumPy (but not, for example, by matplotlib's rendering backend).
+
+Each run is compared with a baseline (by default, the results saved in
+``benchmark_extractors_baseline.json`` next to this script), and the script
+exits with an error if any case has become slower (or uses more memory) than
+allowed by ``--tolerance``, or if there is no baseline to compare with. After
+an intended change, the baseline can be replaced with ``--save-baseline``.
+Since the times depend on the computer used, the baseline should be made (and
+the benchmark always run) on the same computer.
+
+The script can be run from any folder, but should be run directly rather than
+with ``python -m`` (which imports the ``nexusLIMS`` package, and so reads its
+settings, before the benchmark has set them up). For example:
+
+.. code-block:: bash
+
+    $ python nexusLIMS/dev_scripts/benchmark_extractors.py
+    $ python nexusLIMS/dev_scripts/benchmark_extractors.py --filter _plot_ \
+        --repeat 10 --save-baseline
+"""
+# ruff: noqa: T201, INP001
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from functools import partial, wraps
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from unittest import mock
+
+# the benchmark scripts import each other directly, rather than through the
+# nexusLIMS package (which reads its settings when imported)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from benchmark_record_building import TEST_FILES, setup_environment  # noqa: E402
+
+BASELINE = Path(__file__).with_name("benchmark_extractors_baseline.json")
+
+# the test files (or archives of them) to run the extractors and renderers on
+DATA_FILES = [
+    "643_Titan_survey_image_dataZeroed.dm3.tar.gz",
+    "643_Titan_STEM_stack_dataZeroed.dm3.tar.gz",
+    "643_Titan_EELS_SI_dataZeroed.dm3.tar.gz",
+    "643_Titan_EDS_SI_dataZeroed.dm4.tar.gz",
+    "643_Titan_EELS_proc_intgrate_and_bg_dataZeroed.dm3.tar.gz",
+    "642_Titan_opmode_diffraction_dataZeroed_annotations.dm3.tar.gz",
+    "FFT.dm3.tar.gz",
+    "quad1image_001.tif.tar.gz",
+    "fei_emi_ser_test_files.tar.gz",
+    "647_leo_edax_test.spc",
+    "647_leo_edax_test.msa",
+    "test_image_thumb_sources.tar.gz",
+    "text_preview_test_data.txt",
+]
+
+
+def find_files(scratch: Path) -> List[Path]:
+    """
+    Find (and if needed, extract) the test files to benchmark.
+
+    Parameters
+    ----------
+    scratch
+        A folder to extract archived test files into
+
+    Returns
+    -------
+    list of pathlib.Path
+        The test files that are available
+    """
+    files = []
+    for name in DATA_FILES:
+        path = TEST_FILES / name
+        if not path.is_file():
+            print(f"Test file {name} is not available; skipping it")
+        elif name.endswith(".tar.gz"):
+            with tarfile.open(path, "r:gz") as tar:
+                tar.extractall(path=scratch / name)
+            files.extend(sorted(p for p in (scratch / name).rglob("*") if p.is_file()))
+        else:
+            files.append(path)
+    return files
+
+
+def load_signal(fname: Path):
+    """
+    Load a file as a HyperSpy signal, as is done to generate its preview.
+
+    Parameters
+    ----------
+    fname
+        The file to load
+
+    Returns
+    -------
+    hyperspy.signal.BaseSignal
+        The (first) signal in the file, with its data loaded
+    """
+    import hyperspy.api as hs
+
+    load_options = {"lazy": True}
+    if fname.suffix == ".ser":
+        load_options["only_valid_data"] = True
+    s = hs.load(fname, **load_options)
+    if isinstance(s, list):
+        s = s[0]
+    s.compute(show_progressbar=False)
+    return s
+
+
+def plot_path(s, out_path: Path) -> str:
+    """
+    Find which ``_plot_*`` function draws the preview of a signal.
+
+    Parameters
+    ----------
+    s : hyperspy.signal.BaseSignal
+        The signal
+    out_path
+        Where to save the preview
+
+    Returns
+    -------
+    str
+        The name of the innermost ``_plot_*`` function called
+    """
+    from nexusLIMS.extractors import thumbnail_generator
+
+    called = []
+
+    def record(name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            called.append(name)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    with ExitStack() as stack:
+        for name in dir(thumbnail_generator):
+            if name.startswith("_plot_"):
+                func = record(name, getattr(thumbnail_generator, name))
+                stack.enter_context(mock.patch.object(thumbnail_generator, name, func))
+        thumbnail_generator.sig_to_thumbnail(s, out_path)
+    return called[-1]
+
+
+def get_cases(files: List[Path], out_dir: Path) -> Dict[str, Tuple[Callable, str]]:
+    """
+    Get the extractor and renderer calls to benchmark for the test files.
+
+    Parameters
+    ----------
+    files
+        The test files
+    out_dir
+        The folder to save previews to
+
+    Returns
+    -------
+    dict
+        The function to time and the name of the file it runs on, for each
+        case (named after the function)
+    """
+    from nexusLIMS.extractors import extension_reader_map as ext_map
+    from nexusLIMS.extractors import thumbnail_generator, unextracted_preview_map
+
+    cases = {}
+    for fname in files:
+        ext = fname.suffix[1:]
+        out_path = out_dir / f"{fname.name}.thumb.png"
+        if ext in ext_map:
+            cases[f"{ext_map[ext].__name__} {fname.name}"] = (
+                partial(ext_map[ext], fname),
+                fname.name,
+            )
+        if ext == "tif":
+            func = partial(
+                thumbnail_generator.down_sample_image,
+                fname,
+                out_path=out_path,
+                factor=2,
+            )
+            cases[f"down_sample_image {fname.name}"] = (func, fname.name)
+        elif ext in ext_map:
+            try:
+                s = load_signal(fname)
+                name = plot_path(s, out_path)
+            except Exception as exception:  # pylint: disable=broad-exception-caught
+                print(f"Could not render {fname.name}: {exception!r}; skipping it")
+                continue
+            func = partial(thumbnail_generator.sig_to_thumbnail, s, out_path)
+            cases[f"{name} {fname.name}"] = (func, fname.name)
+        elif ext in unextracted_preview_map:
+            func = partial(
+                unextracted_preview_map[ext],
+                f=fname,
+                out_path=out_path,
+                output_size=500,
+            )
+            cases[f"{unextracted_preview_map[ext].__name__} {fname.name}"] = (
+                func,
+                fname.name,
+            )
+    return cases
+
+
+def run_case(func: Callable, repeat: int) -> Dict:
+    """
+    Time a function, and measure its peak memory use.
+
+    Parameters
+    ----------
+    func
+        The function to benchmark
+    repeat
+        The number of times to time it
+
+    Returns
+    -------
+    dict
+        The median time (in seconds), the time of each run, and the peak
+        memory use (in bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time": statistics.median(times), "times": times, "peak_memory": peak}
+
+
+def compare(
+    results: Dict,
+    baseline: Dict,
+    tolerance: float,
+    min_time: float,
+    min_memory: int,
+) -> List[str]:
+    """
+    Print how each case compares with the baseline.
+
+    Parameters
+    ----------
+    results
+        The results of this run
+    baseline
+        The baseline results
+    tolerance
+        The largest allowed relative increase in time or memory use
+    min_time
+        Cases that took less than this long (in seconds) in both runs are not
+        checked for slowdowns, since their times are mostly noise
+    min_memory
+        Increases in memory use smaller than this (in bytes) are ignored
+
+    Returns
+    -------
+    list of str
+        The cases that regressed
+    """
+    print(f"\n{'':<60}{'time':>9}{'memory':>9}")
+    regressions = []
+    for name, new in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            print(f"{name:<60}{'(new)':>9}")
+            continue
+        time_change = (new["time"] - old["time"]) / old["time"]
+        mem_change = (new["peak_memory"] - old["peak_memory"]) / max(
+            old["peak_memory"],
+            1,
+        )
+        slower = max(new["time"], old["time"]) >= min_time and time_change > tolerance
+        bigger = (
+            new["peak_memory"] - old["peak_memory"] >= min_memory
+            and mem_change > tolerance
+        )
+        flag = "  " + " and ".join(
+            w for w, f in [("SLOWER", slower), ("LARGER", bigger)] if f
+        )
+        if slower or bigger:
+            regressions.append(name)
+        print(f"{name:<60}{time_change:+9.1%}{mem_change:+9.1%}{flag.rstrip()}")
+    for name in baseline["cases"].keys() - results["cases"].keys():
+        print(f"{name:<60}{'(not run)':>9}")
+    return regressions
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case")
+    parser.add_argument("--filter", default="", help="Only run matching cases")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline",
+    )
+    parser.add_argument("--output", type=Path, help="Also save the results here")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative increase in time or memory use",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.01,
+        help="Ignore slowdowns of cases shorter than this (in seconds)",
+    )
+    parser.add_argument(
+        "--min-memory",
+        type=float,
+        default=1.0,
+        help="Ignore memory increases smaller than this (in MB)",
+    )
+    args = parser.parse_args()
+    if not args.save_baseline and not args.baseline.is_file():
+        parser.error(
+            f"no baseline found at {args.baseline}; create one on this computer "
+            "with --save-baseline",
+        )
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(tz=timezone.utc).isoformat(),
+        "repeat": args.repeat,
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scratch = Path(tmp_dir)
+        setup_environment(scratch, warm=False)
+        # NexusLIMS reads its settings when imported, so import it only now
+        from nexusLIMS.version import __version__
+
+        logging.disable(logging.WARNING)  # many test files cause warnings
+        results["nexusLIMS_version"] = __version__
+        files = find_files(scratch / "files")
+        cases = get_cases(files, scratch / "nexusLIMS")
+        for name, (func, fname) in cases.items():
+            if args.filter not in name:
+                continue
+            try:
+                result = run_case(func, args.repeat)
+            except Exception as exception:  # pylint: disable=broad-exception-caught
+                print(f"{name:<60} failed: {exception!r}")
+                continue
+            result["file"] = fname
+            results["cases"][name] = result
+            print(
+                f"{name:<60}{result['time']:8.3f} s "
+                f"{result['peak_memory'] / 2**20:8.1f} MB",
+            )
+
+    for path in [args.output, args.baseline if args.save_baseline else None]:
+        if path is not None:
+            path.write_text(json.dumps(results, indent=2) + "\n")
+            print(f"Saved results to {path}")
+
+    if not args.save_baseline:
+        regressions = compare(
+            results,
+            json.loads(args.baseline.read_text()),
+            args.tolerance,
+            args.min_time,
+            int(args.min_memory * 2**20),
+        )
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed compared with the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
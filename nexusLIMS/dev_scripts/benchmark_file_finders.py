@@ -0,0 +1,155 @@
+"""
+Compare the speed of the GNU ``find`` and ``os.scandir`` file finders.
+
+Builds a synthetic instrument data tree (or uses an existing folder), then times
+:py:func:`~nexusLIMS.utils.gnu_find_file_info_by_mtime` and
+:py:func:`~nexusLIMS.utils.scandir_find_file_info_by_mtime` searching it for the
+files of a session, checking that both return the same files. For example:
+
+.. code-block:: bash
+
+    $ python nexusLIMS/dev_scripts/benchmark_file_finders.py --dirs 2000 --files 50
+    $ python nexusLIMS/dev_scripts/benchmark_file_finders.py --root /mnt/mmfnexus/Titan
+"""
+# ruff: noqa: T201, INP001
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from nexusLIMS.extractors import extension_reader_map as ext_map
+from nexusLIMS.utils import gnu_find_file_info_by_mtime, scandir_find_file_info_by_mtime
+
+EXTENSIONS = [*ext_map.keys(), "txt", "mib"]
+START = datetime(2021, 1, 1, tzinfo=timezone.utc)
+SPAN = timedelta(days=365)
+
+
+def make_tree(root: Path, n_dirs: int, n_files: int, depth: int, seed: int = 0):
+    """
+    Create a synthetic tree of (empty) files with random modification times.
+
+    Parameters
+    ----------
+    root
+        The folder in which to create the tree
+    n_dirs
+        The number of leaf directories to create
+    n_files
+        The number of files in each leaf directory
+    depth
+        The number of directory levels above each leaf directory
+    seed
+        The seed for the random number generator
+    """
+    rng = random.Random(seed)
+    for d in range(n_dirs):
+        parts = [f"level{i}_{rng.randrange(10)}" for i in range(depth)]
+        directory = root.joinpath(*parts, f"dir{d:05d}")
+        directory.mkdir(parents=True, exist_ok=True)
+        for f in range(n_files):
+            fname = directory / f"file{f:04d}.{rng.choice(EXTENSIONS)}"
+            fname.touch()
+            mtime = (START + SPAN * rng.random()).timestamp()
+            os.utime(fname, (mtime, mtime))
+
+
+def time_finder(finder, repeat: int, *args, **kwargs):
+    """
+    Run a file finder several times.
+
+    Parameters
+    ----------
+    finder
+        The finder function
+    repeat
+        The number of times to run it
+    *args
+        The positional arguments for the finder
+    **kwargs
+        The keyword arguments for the finder
+
+    Returns
+    -------
+    times : list of float
+        The duration of each run (in seconds)
+    files : list of FileInfo
+        The files found by the last run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        files = finder(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return times, files
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--root", type=Path, help="Search this existing folder")
+    parser.add_argument("--dirs", type=int, default=500, help="Leaf directories")
+    parser.add_argument("--files", type=int, default=20, help="Files per directory")
+    parser.add_argument("--depth", type=int, default=3, help="Directory depth")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per finder")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16],
+        help="Thread counts to try for the scandir finder",
+    )
+    parser.add_argument(
+        "--days",
+        type=float,
+        default=7,
+        help="Length of the searched time range (in days)",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("mmfnexus_path", "/")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = args.root
+        if root is None:
+            root = Path(tmp_dir)
+            start = time.perf_counter()
+            make_tree(root, args.dirs, args.files, args.depth)
+            print(
+                f"Created {args.dirs * args.files} files in {args.dirs} "
+                f"directories in {time.perf_counter() - start:.1f} s",
+            )
+        dt_from = START + SPAN / 2
+        dt_to = dt_from + timedelta(days=args.days)
+        finder_args = (root, dt_from, dt_to)
+
+        gnu_times, gnu_files = time_finder(
+            gnu_find_file_info_by_mtime,
+            args.repeat,
+            *finder_args,
+            extensions=ext_map.keys(),
+        )
+        print(
+            f"{'GNU find':<20} median {statistics.median(gnu_times):8.3f} s "
+            f"({len(gnu_files)} files)",
+        )
+        for n_threads in args.threads:
+            times, files = time_finder(
+                scandir_find_file_info_by_mtime,
+                args.repeat,
+                *finder_args,
+                extensions=ext_map.keys(),
+                n_threads=n_threads,
+            )
+            match = "same files" if files == gnu_files else "DIFFERENT FILES"
+            print(
+                f"{f'scandir ({n_threads} threads)':<20} median "
+                f"{statistics.median(times):8.3f} s ({len(files)} files; {match})",
+            )
+
+
+if __name__ == "__main__":
+    main()
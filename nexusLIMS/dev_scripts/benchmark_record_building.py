@@ -0,0 +1,495 @@
+r"""
+Time building a record end to end for a synthetic session.
+
+Creates a scratch file store containing a session made of copies of the test
+files in ``tests/files`` (``.dm3``, ``.tif``, ``.ser``/``.emi``, ``.spc`` and
+``.msa`` files, in configurable numbers), with modification times spread over
+a number of acquisition activities like those of a real session. Then times
+:py:func:`~nexusLIMS.builder.record_builder.build_record` for that session,
+and breaks the time down into the stages of building a record (finding files,
+splitting them into activities, extracting metadata, generating previews,
+summarizing each activity, and everything else, such as writing the XML),
+as well as timing the validation of the finished record.
+
+The scratch file store, database and NexusLIMS folder are created in a
+temporary folder, so no existing configuration is needed (the reservation
+details of the session are also made up, rather than fetched from a
+harvester). By default, every run starts from scratch; with ``--warm``, the
+previews (and the extraction cache) of the previous run are reused, as when
+rebuilding a record.
+
+The results can be saved as JSON with ``--output``, and compared with the
+results of an earlier run with ``--baseline`` (in which case the script exits
+with an error if any stage has become slower than allowed by ``--tolerance``).
+For example:
+
+.. code-block:: bash
+
+    $ python nexusLIMS/dev_scripts/benchmark_record_building.py --output base.json
+    $ python nexusLIMS/dev_scripts/benchmark_record_building.py --dm3 100 --tif 50 \
+        --activities 10 --baseline base.json
+"""
+# ruff: noqa: T201, INP001
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest import mock
+
+TEST_FILES = Path(__file__).parents[2] / "tests" / "files"
+DB_SCRIPT = (
+    Path(__file__).parents[1] / "db" / "dev" / "NexusLIMS_db_creation_script.sql"
+)
+
+# the test files (or archives of them) to use for each type of file, in order
+# of preference (a type is left out of the session if none are available)
+SOURCES = {
+    "dm3": [
+        "643_Titan_survey_image_dataZeroed.dm3.tar.gz",
+        "643_Titan_EELS_proc_intgrate_and_bg_dataZeroed.dm3.tar.gz",
+    ],
+    "tif": [
+        "quad1image_001.tif.tar.gz",
+        "quad1image_001_no_beam_scan_or_system_meta.tar.gz",
+    ],
+    "ser": ["fei_emi_ser_test_files.tar.gz"],
+    "spc": ["647_leo_edax_test.spc"],
+    "msa": ["647_leo_edax_test.msa"],
+}
+STAGES = ["find_files", "segmentation", "extraction", "preview", "summarize"]
+INSTRUMENT = "benchmark-instrument"
+START = datetime(2021, 3, 1, 9, tzinfo=timezone.utc)
+
+
+def find_templates(scratch: Path) -> Dict[str, List[Path]]:
+    """
+    Find (and if needed, extract) a test file to copy for each type of file.
+
+    Parameters
+    ----------
+    scratch
+        A folder to extract archived test files into
+
+    Returns
+    -------
+    dict
+        The file(s) making up one copy of each available type of file (for
+        ``.ser`` files, the ``.ser`` file and its ``.emi`` file)
+    """
+    templates = {}
+    for ext, names in SOURCES.items():
+        for name in names:
+            path = TEST_FILES / name
+            if not path.is_file():
+                continue
+            if not name.endswith(".tar.gz"):
+                templates[ext] = [path]
+                break
+            dest = scratch / name
+            with tarfile.open(path, "r:gz") as tar:
+                tar.extractall(path=dest)
+            found = sorted(p for p in dest.rglob(f"*.{ext}") if p.is_file())
+            if ext == "ser":
+                # a .ser file needs the .emi file it was saved with
+                found = [
+                    [p, p.with_name(f"{p.stem.rsplit('_', 1)[0]}.emi")] for p in found
+                ]
+                found = [pair for pair in found if pair[1].is_file()]
+            else:
+                found = [[p] for p in found]
+            if found:
+                templates[ext] = found[0]
+                break
+        else:
+            print(f"No test file available for .{ext} files; leaving them out")
+    return templates
+
+
+def make_session(  # noqa: PLR0913
+    root: Path,
+    templates: Dict[str, List[Path]],
+    counts: Dict[str, int],
+    n_activities: int,
+    file_interval: float = 20.0,
+    activity_gap: tuple = (600.0, 1800.0),
+    seed: int = 0,
+) -> datetime:
+    """
+    Create the files of a synthetic session.
+
+    The files of each type are shuffled together and split evenly between the
+    activities. Within an activity, the time between files is exponentially
+    distributed (with a mean of ``file_interval``), and each activity starts a
+    random time (between the two values of ``activity_gap``) after the previous
+    one ends.
+
+    Parameters
+    ----------
+    root
+        The folder in which to create the files
+    templates
+        The test file(s) to copy for each type of file (see
+        :py:func:`find_templates`)
+    counts
+        The number of files of each type to create
+    n_activities
+        The number of activities to spread the files over
+    file_interval
+        The mean time between files in an activity (in seconds)
+    activity_gap
+        The shortest and longest time between activities (in seconds)
+    seed
+        The seed for the random number generator
+
+    Returns
+    -------
+    datetime.datetime
+        The modification time of the last file
+    """
+    rng = random.Random(seed)
+    exts = [ext for ext, n in counts.items() if ext in templates for _ in range(n)]
+    rng.shuffle(exts)
+    n_activities = max(1, min(n_activities, len(exts)))
+    per_activity = len(exts) / n_activities
+
+    mtime = START.timestamp()
+    for i, ext in enumerate(exts):
+        if i and int(i / per_activity) != int((i - 1) / per_activity):
+            mtime += rng.uniform(*activity_gap)
+        else:
+            mtime += 1 + rng.expovariate(1 / file_interval)
+        directory = root / f"activity_{int(i / per_activity):03d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        # keep the part of each name that links the files together (e.g. the
+        # "_1.ser" of a .ser file, which is read along with its .emi file)
+        base = templates[ext][-1].stem
+        for template in templates[ext]:
+            dest = directory / f"{ext}_{i:05d}{template.name[len(base):]}"
+            shutil.copyfile(template, dest)
+            os.utime(dest, (mtime, mtime))
+    return datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+
+def setup_environment(scratch: Path, *, warm: bool):
+    """
+    Point NexusLIMS at a scratch database and folders.
+
+    Parameters
+    ----------
+    scratch
+        The folder to create the database and folders in
+    warm
+        Whether to enable the extraction cache
+    """
+    os.environ["nexusLIMS_db_path"] = str(scratch / "nexuslims_db.sqlite")
+    os.environ["mmfnexus_path"] = str(scratch / "mmfnexus")
+    os.environ["nexusLIMS_path"] = str(scratch / "nexusLIMS")
+    os.environ["NexusLIMS_file_strategy"] = "exclusive"
+    os.environ["NexusLIMS_ignore_patterns"] = '["*.mib","*.db","*.emi"]'
+    os.environ["NexusLIMS_file_index"] = "false"
+    os.environ["NexusLIMS_extraction_cache"] = "true" if warm else "false"
+    os.environ["NexusLIMS_force_preview_refresh"] = "false"
+    with sqlite3.connect(os.environ["nexusLIMS_db_path"]) as conn:
+        conn.executescript(DB_SCRIPT.read_text())
+    (scratch / "mmfnexus").mkdir()
+    (scratch / "nexusLIMS").mkdir()
+
+
+def timed(stage_times: Dict[str, float], stage: str, func: Callable) -> Callable:
+    """
+    Wrap a function so the time spent in it is added to a stage's total.
+
+    Parameters
+    ----------
+    stage_times
+        The total time of each stage (updated by the wrapped function)
+    stage
+        The stage to add the time to
+    func
+        The function to wrap
+
+    Returns
+    -------
+    typing.Callable
+        The wrapped function
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stage_times[stage] += time.perf_counter() - start
+
+    return wrapper
+
+
+def run_once(session, res_event, workers: int, *, previews: bool) -> Dict:
+    """
+    Build (and validate) the record of a session once, timing each stage.
+
+    Parameters
+    ----------
+    session
+        The :py:class:`~nexusLIMS.db.session_handler.Session` to build
+    res_event
+        The reservation to use for the session
+    workers
+        The number of extraction worker processes (the extraction and preview
+        stages are only timed separately when this is ``0``)
+    previews
+        Whether to generate preview images
+
+    Returns
+    -------
+    dict
+        The total time, the time of each stage, and whether the record was
+        valid
+    """
+    from nexusLIMS import extractors
+    from nexusLIMS.builder import record_builder
+
+    stage_times = dict.fromkeys(STAGES, 0.0)
+    wrapped = [
+        (record_builder, "get_files", "find_files"),
+        (record_builder, "_assign_activities", "segmentation"),
+        (extractors, "_extract_metadata", "extraction"),
+        (extractors, "create_preview", "preview"),
+        (record_builder, "_finish_activity", "summarize"),
+    ]
+    with ExitStack() as stack:
+        for module, name, stage in wrapped:
+            func = timed(stage_times, stage, getattr(module, name))
+            stack.enter_context(mock.patch.object(module, name, func))
+        stack.enter_context(
+            mock.patch.object(
+                record_builder,
+                "get_reservation_event",
+                return_value=res_event,
+            ),
+        )
+        start = time.perf_counter()
+        record = record_builder.build_record(
+            session,
+            "benchmark-sample",
+            generate_previews=previews,
+            extraction_workers=workers,
+        )
+        total = time.perf_counter() - start
+
+    start = time.perf_counter()
+    valid = record_builder.validate_record(BytesIO(record.encode()))
+    stage_times["validation"] = time.perf_counter() - start
+    stage_times["other"] = total - sum(stage_times[s] for s in STAGES)
+    return {"total": total, "stages": stage_times, "valid": valid}
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_time: float):
+    """
+    Print how the median times compare with those of a baseline run.
+
+    Parameters
+    ----------
+    results
+        The results of this run (as saved with ``--output``)
+    baseline
+        The results of the baseline run
+    tolerance
+        The largest allowed relative increase in time (e.g. 0.2 for 20%)
+    min_time
+        Stages that took less than this long (in seconds) in both runs are
+        not checked, since their times are mostly noise
+
+    Returns
+    -------
+    list of str
+        The stages (or ``"total"``) that are slower than allowed
+    """
+    if results["config"] != baseline["config"]:
+        print("Warning: the baseline was run with a different configuration")
+    print(f"\n{'':<14}{'baseline':>10}{'this run':>10}{'change':>9}")
+    regressions = []
+    for key in ["total", *results["median"]["stages"]]:
+        if key == "total":
+            new, old = results["median"]["total"], baseline["median"]["total"]
+        else:
+            new = results["median"]["stages"][key]
+            old = baseline["median"]["stages"].get(key)
+        if old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if max(new, old) >= min_time and change > tolerance:
+            flag = "  SLOWER"
+            regressions.append(key)
+        print(f"{key:<14}{old:10.3f}{new:10.3f}{change:+9.1%}{flag}")
+    return regressions
+
+
+def main():  # noqa: PLR0915
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    for ext, default in [("dm3", 40), ("tif", 40), ("ser", 10), ("spc", 5)]:
+        parser.add_argument(
+            f"--{ext}",
+            type=int,
+            default=default,
+            help=f"Number of .{ext} files",
+        )
+    parser.add_argument("--msa", type=int, default=5, help="Number of .msa files")
+    parser.add_argument("--activities", type=int, default=8, help="Activities")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs")
+    parser.add_argument("--workers", type=int, default=0, help="Extraction workers")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--no-previews",
+        dest="previews",
+        action="store_false",
+        help="Do not generate preview images",
+    )
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Reuse previews and extracted metadata between runs",
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="Compare with saved results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown compared with the baseline",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.05,
+        help="Ignore slowdowns of stages shorter than this (in seconds)",
+    )
+    args = parser.parse_args()
+    counts = {ext: getattr(args, ext) for ext in SOURCES}
+    config = {
+        "counts": counts,
+        "activities": args.activities,
+        "workers": args.workers,
+        "seed": args.seed,
+        "previews": args.previews,
+        "warm": args.warm,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scratch = Path(tmp_dir)
+        setup_environment(scratch, warm=args.warm)
+        # NexusLIMS reads its settings when imported, so import it only now
+        from nexusLIMS.db.session_handler import Session
+        from nexusLIMS.harvesters.reservation_event import ReservationEvent
+        from nexusLIMS.instruments import Instrument
+
+        logging.disable(logging.INFO)  # logging every file would dominate
+        from nexusLIMS.version import __version__
+
+        templates = find_templates(scratch / "templates")
+        start = time.perf_counter()
+        end = make_session(
+            scratch / "mmfnexus" / "benchmark",
+            templates,
+            counts,
+            args.activities,
+            seed=args.seed,
+        )
+        n_files = sum(n for ext, n in counts.items() if ext in templates)
+        print(
+            f"Created {n_files} files in {time.perf_counter() - start:.1f} s "
+            f"({', '.join(f'{counts[e]} .{e}' for e in templates if counts[e])})",
+        )
+
+        instrument = Instrument(
+            name=INSTRUMENT,
+            filestore_path="benchmark",
+            harvester="nemo",
+            timezone="UTC",
+        )
+        session = Session(
+            "benchmark-session",
+            instrument,
+            (START - timedelta(minutes=5), end + timedelta(minutes=5)),
+            "benchmark",
+        )
+        res_event = ReservationEvent(
+            experiment_title="Record building benchmark",
+            instrument=instrument,
+            username="benchmark",
+            start_time=session.dt_from,
+            end_time=session.dt_to,
+        )
+
+        runs = []
+        for i in range(args.repeat):
+            if not args.warm:
+                shutil.rmtree(os.environ["nexusLIMS_path"])
+            run = run_once(session, res_event, args.workers, previews=args.previews)
+            runs.append(run)
+            print(
+                f"Run {i + 1}: {run['total']:.2f} s "
+                f"({n_files / run['total']:.1f} files/s)"
+                + ("" if run["valid"] else " -- record did not validate!"),
+            )
+
+    median_total = statistics.median(r["total"] for r in runs)
+    results = {
+        "nexusLIMS_version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(tz=timezone.utc).isoformat(),
+        "config": config,
+        "files": n_files,
+        "runs": runs,
+        "median": {
+            "total": median_total,
+            "stages": {
+                s: statistics.median(r["stages"][s] for r in runs)
+                for s in runs[0]["stages"]
+            },
+        },
+        "files_per_second": n_files / median_total,
+    }
+
+    print(f"\nMedian of {len(runs)} runs ({n_files} files):")
+    for stage, seconds in results["median"]["stages"].items():
+        print(f"  {stage:<14}{seconds:8.3f} s")
+    print(f"  {'total':<14}{median_total:8.3f} s")
+    if args.workers:
+        print("(extraction and previews happen in the workers, so count as other)")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.tolerance, args.min_time)
+        if regressions:
+            print(f"\nSlower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+    if not all(r["valid"] for r in runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
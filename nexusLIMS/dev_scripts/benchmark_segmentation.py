@@ -0,0 +1,214 @@
+r"""
+Compare the activity segmentation strategies on recorded file modification times.
+
+Times each strategy in :py:data:`nexusLIMS.schemas.segmentation.strategies` on a
+set of sessions, and reports how well its boundaries agree with those of a
+reference strategy (``kde`` by default). Agreement is measured by which gaps
+between consecutive files each strategy splits at: the F1 score is 1.0 when
+both strategies split at exactly the same gaps.
+
+Sessions are read from text files containing one modification time (a Unix
+timestamp) per line, or from JSON files containing a list of them. Such a file
+can be written for a real session with ``--record``. If no files are given, a
+few synthetic sessions are generated instead. For example:
+
+.. code-block:: bash
+
+    $ python nexusLIMS/dev_scripts/benchmark_segmentation.py
+    $ python nexusLIMS/dev_scripts/benchmark_segmentation.py --record \
+        FEI-Titan-TEM-635816_n 2018-11-13T13:00:00-05:00 \
+        2018-11-13T16:00:00-05:00 titan.txt
+    $ python nexusLIMS/dev_scripts/benchmark_segmentation.py titan.txt
+"""
+# ruff: noqa: T201, INP001
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Set
+
+import numpy as np
+
+from nexusLIMS.schemas.segmentation import strategies
+from nexusLIMS.utils import FileInfo
+
+
+def synthetic_sessions(seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Generate the modification times of some typical sessions.
+
+    Parameters
+    ----------
+    seed
+        The seed for the random number generator
+
+    Returns
+    -------
+    dict
+        The modification times of each session, by name
+    """
+    rng = np.random.default_rng(seed)
+    start = 1.6e9
+
+    def bursts(n_bursts, files_per_burst, spacing, spread):
+        centers = start + np.cumsum(rng.exponential(spacing, n_bursts))
+        return np.concatenate(
+            [c + np.sort(rng.uniform(0, spread, files_per_burst)) for c in centers],
+        )
+
+    return {
+        "regular (1 file / 30 s)": start + np.arange(200) * 30 + rng.normal(0, 2, 200),
+        "imaging bursts": bursts(10, 20, 900, 120),
+        "spectrum image tiles": bursts(4, 500, 1800, 10),
+        "mixed": np.concatenate(
+            [
+                start + np.arange(50) * 45.0,
+                bursts(5, 100, 600, 20) + 3600,
+                start + 7200 + np.cumsum(rng.exponential(60, 100)),
+            ],
+        ),
+        "large burst session": bursts(20, 1000, 1200, 60),
+    }
+
+
+def read_session(path: Path) -> np.ndarray:
+    """
+    Read the modification times of a recorded session.
+
+    Parameters
+    ----------
+    path
+        A JSON file with a list of timestamps, or a text file with one
+        timestamp per line
+
+    Returns
+    -------
+    numpy.ndarray
+        The modification times
+    """
+    text = path.read_text()
+    if path.suffix == ".json":
+        return np.array(json.loads(text), dtype=float)
+    return np.array([float(line) for line in text.split()])
+
+
+def record_session(instrument: str, dt_from: str, dt_to: str, path: Path):
+    """
+    Write the modification times of the files of a real session to a file.
+
+    Parameters
+    ----------
+    instrument
+        The name of the instrument
+    dt_from
+        The start of the session (in ISO format)
+    dt_to
+        The end of the session (in ISO format)
+    path
+        The text file to write
+    """
+    # these need a configured NexusLIMS environment, so are only imported here
+    from nexusLIMS.builder.record_builder import get_files
+    from nexusLIMS.instruments import instrument_db
+
+    instr = instrument_db[instrument]
+    files = get_files(
+        Path(instr.filestore_path),
+        datetime.fromisoformat(dt_from),
+        datetime.fromisoformat(dt_to),
+        instrument=instr,
+    )
+    path.write_text("".join(f"{f.mtime!r}\n" for f in files))
+    print(f"Wrote {len(files)} modification times to {path}")
+
+
+def split_gaps(mtimes: np.ndarray, boundaries: List[float]) -> Set[int]:
+    """
+    Find which gaps between consecutive files a set of boundaries split.
+
+    Parameters
+    ----------
+    mtimes
+        The sorted unique modification times
+    boundaries
+        The boundaries between activities
+
+    Returns
+    -------
+    set of int
+        The indices of the files that start a new activity
+    """
+    split = np.searchsorted(mtimes, boundaries, side="right")
+    return {int(i) for i in split if 0 < i < len(mtimes)}
+
+
+def f1_score(reference: Set[int], other: Set[int]) -> float:
+    """
+    Compute the F1 score of a set of split gaps against a reference.
+
+    Parameters
+    ----------
+    reference
+        The gaps split by the reference strategy
+    other
+        The gaps split by the strategy being compared
+
+    Returns
+    -------
+    float
+        The F1 score (1.0 if neither splits the session)
+    """
+    if not reference and not other:
+        return 1.0
+    return 2 * len(reference & other) / (len(reference) + len(other))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("sessions", type=Path, nargs="*", help="Recorded sessions")
+    parser.add_argument("--reference", default="kde", choices=list(strategies))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per strategy")
+    parser.add_argument(
+        "--record",
+        nargs=4,
+        metavar=("INSTRUMENT", "FROM", "TO", "OUTPUT"),
+        help="Record the modification times of a session's files and exit",
+    )
+    args = parser.parse_args()
+
+    if args.record:
+        record_session(*args.record[:3], Path(args.record[3]))
+        return
+
+    if args.sessions:
+        sessions = {p.name: read_session(p) for p in args.sessions}
+    else:
+        sessions = synthetic_sessions()
+
+    names = [args.reference] + [n for n in strategies if n != args.reference]
+    for session, mtimes in sessions.items():
+        mtimes = np.unique(mtimes)  # noqa: PLW2901
+        files = [FileInfo(Path(f"{i}"), float(m), 0) for i, m in enumerate(mtimes)]
+        print(f"\n{session} ({len(files)} files)")
+        reference = None
+        for name in names:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                boundaries = strategies[name](files)
+                times.append(time.perf_counter() - start)
+            gaps = split_gaps(mtimes, boundaries)
+            if reference is None:
+                reference = gaps
+            print(
+                f"  {name:<14} median {statistics.median(times):8.4f} s "
+                f"{len(gaps) + 1:5d} activities  "
+                f"F1 vs {args.reference}: {f1_score(reference, gaps):.2f}",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ expected (although not enforced):
 * ``'Instrument ID'`` - instrument PID pulled from the instrument database
 """
 import base64
+import hashlib
 import inspect
 import json
 import logging
@@ -25,27 +26,34 @@ from datetime import datetime as dt
 from pathlib import Path
 from typing import Any, Callable, Dict, Optional, Tuple
 
-import hyperspy.api_nogui as hs
 import numpy as np
 
+from nexusLIMS.builder import metrics
 from nexusLIMS.instruments import get_instr_from_filepath
 from nexusLIMS.utils import current_system_tz, replace_mmf_path
 from nexusLIMS.version import __version__
 
+from . import cache as extraction_cache
+from . import stats as extraction_stats
 from .basic_metadata import get_basic_metadata
 from .digital_micrograph import get_dm3_metadata
 from .edax import get_msa_metadata, get_spc_metadata
 from .fei_emi import get_ser_metadata
 from .quanta_tif import get_quanta_metadata
 from .thumbnail_generator import (
+    RENDERER_VERSION,
+    _thumbnail_renderer,
     down_sample_image,
     image_to_square_thumbnail,
     sig_to_thumbnail,
     text_to_thumbnail,
 )
+from .utils import load_signal, shared_signals
 
 logger = logging.getLogger(__name__)
 PLACEHOLDER_PREVIEW = Path(__file__).parent / "extractor_error.png"
+PREVIEW_MANIFEST_SUFFIX = ".thumb.json"
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
 
 extension_reader_map = {
     "dm3": get_dm3_metadata,
@@ -110,12 +118,64 @@ def _add_extraction_details(
     return nx_meta
 
 
+def _extract_metadata(
+    fname: Path,
+    extractor_method: Callable,
+    mtime: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Run an extractor on a file, using the extraction cache if it is enabled.
+
+    Parameters
+    ----------
+    fname
+        The filename from which to read data
+    extractor_method
+        The extractor function to use for this file
+    mtime
+        The modification time of the file, if already known (passed on to the
+        extractor so it does not need to be read again)
+
+    Returns
+    -------
+    nx_meta : dict or None
+        The metadata dictionary (as returned by the extractor), with the
+        extraction details added
+    """
+
+    def _extract():
+        nx_meta = (
+            extractor_method(fname)
+            if mtime is None
+            else extractor_method(fname, mtime=mtime)
+        )
+        return _add_extraction_details(nx_meta, extractor_method)
+
+    module = inspect.getmodule(extractor_method).__name__
+    with extraction_stats.record_call("extraction", fname, module) as call:
+        nx_meta = None
+        if extraction_cache.is_enabled():
+            # use previously extracted metadata if this file has not changed
+            nx_meta = extraction_cache.get_cached_metadata(fname, module)
+        if nx_meta is not None:
+            call["outcome"] = "cached"
+        else:
+            nx_meta = _extract()
+            call["outcome"] = "extracted" if nx_meta is not None else "failed"
+            if nx_meta is not None and extraction_cache.is_enabled():
+                extraction_cache.cache_metadata(fname, module, nx_meta)
+    return nx_meta
+
+
 def parse_metadata(
     fname: Path,
     *,
     write_output: bool = True,
     generate_preview: bool = True,
     overwrite: bool = True,
+    overwrite_preview: Optional[bool] = None,
+    mtime: Optional[float] = None,
+    size: Optional[int] = None,
 ) -> Tuple[Optional[Dict[str, Any]], Optional[Path]]:
     """
     Parse metadata from a file and optionaly generate a preview image.
@@ -126,6 +186,18 @@ def parse_metadata(
     NexusLIMS directory as JSON by default). Also calls the preview
     generation method, if desired.
 
+    If the :ref:`NexusLIMS_extraction_cache <NexusLIMS-extraction-cache>`
+    environment variable is enabled, metadata previously extracted from an
+    unchanged file is read from the :py:mod:`~nexusLIMS.extractors.cache`
+    rather than from the file itself. If the
+    :ref:`NexusLIMS_extraction_stats <NexusLIMS-extraction-stats>` environment
+    variable is enabled, the time taken to extract the metadata (and generate
+    the preview) is recorded by :py:mod:`~nexusLIMS.extractors.stats`.
+
+    The file is only loaded once: the signal loaded by the extractor is shared
+    (see :py:func:`~nexusLIMS.extractors.utils.shared_signals`) with the
+    preview generation, rather than being read from the file a second time.
+
     Parameters
     ----------
     fname
@@ -140,12 +212,25 @@ def parse_metadata(
     overwrite
         Whether to overwrite the .json metadata file and thumbnail
         image if either exists
+    overwrite_preview
+        If given, controls whether the thumbnail image is overwritten
+        separately from the .json metadata file (see the ``overwrite``
+        parameter of :py:func:`create_preview`). If ``None``, the value of
+        ``overwrite`` is used
+    mtime
+        The modification time of the file, if it is already known (such as
+        from :py:class:`~nexusLIMS.utils.FileInfo`), so that it does not need
+        to be read from the file system again by the extractor
+    size
+        The size of the file (in bytes), if it is already known, so that it
+        does not need to be read from the file system again to record the
+        :py:mod:`~nexusLIMS.builder.metrics` of the extraction and preview
 
     Returns
     -------
     nx_meta : dict or None
         The "relevant" metadata that is of use for NexusLIMS. If None,
-        the file could not be opened
+        the file could not be opened (or does not exist)
     preview_fname : Path or None
         The file path of the generated preview image, or `None` if it was not
         requested
@@ -172,61 +257,96 @@ def parse_metadata(
     else:
         extractor_method = extension_reader_map[extension]
 
-    nx_meta = extractor_method(fname)
-    nx_meta = _add_extraction_details(nx_meta, extractor_method)
-    preview_fname = None
-
-    # nx_meta should never be None, because the extractors are defensive and
-    # will always return _something_
-    if nx_meta is not None:
-        # Set the dataset type to Misc if it was not set by the file reader
-        if "DatasetType" not in nx_meta["nx_meta"]:
-            nx_meta["nx_meta"]["DatasetType"] = "Misc"
-            nx_meta["nx_meta"]["Data Type"] = "Miscellaneous"
-
-        if write_output:
-            out_fname = replace_mmf_path(fname, ".json")
-
-            if not out_fname.exists() or overwrite:
-                # Create the directory for the metadata file, if needed
-                out_fname.parent.mkdir(parents=True, exist_ok=True)
-                # Make sure that the nx_meta dict comes first in the json output
-                out_dict = {"nx_meta": nx_meta["nx_meta"]}
-                for k, v in nx_meta.items():
-                    if k == "nx_meta":
-                        pass
-                    else:
-                        out_dict[k] = v
-                with out_fname.open(mode="w", encoding="utf-8") as f:
-                    logger.debug("Dumping metadata to %s", out_fname)
-                    json.dump(
-                        out_dict,
-                        f,
-                        sort_keys=False,
-                        indent=2,
-                        cls=_CustomEncoder,
-                    )
-
-    if generate_preview:
-        preview_fname = create_preview(fname=fname, overwrite=overwrite)
+    # the signal loaded by the extractor (if any) is reused for the preview
+    with shared_signals():
+        with _file_stage("extraction", fname, size):
+            try:
+                nx_meta = _extract_metadata(fname, extractor_method, mtime)
+            except FileNotFoundError:
+                # the file was removed after it was found
+                logger.warning("%s was not found", fname)
+                return None, None
+        preview_fname = None
+
+        # nx_meta should never be None, because the extractors are defensive and
+        # will always return _something_
+        if nx_meta is not None:
+            # Set the dataset type to Misc if it was not set by the file reader
+            if "DatasetType" not in nx_meta["nx_meta"]:
+                nx_meta["nx_meta"]["DatasetType"] = "Misc"
+                nx_meta["nx_meta"]["Data Type"] = "Miscellaneous"
+
+            if write_output:
+                out_fname = replace_mmf_path(fname, ".json")
+
+                if not out_fname.exists() or overwrite:
+                    # Create the directory for the metadata file, if needed
+                    out_fname.parent.mkdir(parents=True, exist_ok=True)
+                    # Make sure that the nx_meta dict comes first in the json output
+                    out_dict = {"nx_meta": nx_meta["nx_meta"]}
+                    for k, v in nx_meta.items():
+                        if k == "nx_meta":
+                            pass
+                        else:
+                            out_dict[k] = v
+                    with out_fname.open(mode="w", encoding="utf-8") as f:
+                        logger.debug("Dumping metadata to %s", out_fname)
+                        json.dump(
+                            out_dict,
+                            f,
+                            sort_keys=False,
+                            indent=2,
+                            cls=_CustomEncoder,
+                        )
+
+        if generate_preview:
+            with _file_stage("preview", fname, size):
+                preview_fname = create_preview(
+                    fname=fname,
+                    overwrite=overwrite
+                    if overwrite_preview is None
+                    else overwrite_preview,
+                )
 
     return nx_meta, preview_fname
 
 
-def create_preview(fname: Path, *, overwrite: bool) -> Optional[Path]:  # noqa: PLR0912
+def _file_stage(name: str, fname: Path, size: Optional[int]):
+    """
+    Record the metrics of a stage processing one file.
+
+    The size of the file is only read from the file system if it is not
+    already known (and metrics are being collected).
+    """
+    if size is None:
+        return metrics.stage(name, paths=[fname])
+    metrics.count(name, bytes_read=size)
+    return metrics.stage(name, files=1)
+
+
+def create_preview(fname: Path, *, overwrite: bool) -> Optional[Path]:
     """
     Generate a preview image for a given file using one of a few different methods.
 
     For most files, this method will try to load the file using HyperSpy and generate
     a preview using that library's capabilities.
 
+    Whenever a preview is generated, a manifest (a small .json file next to the
+    preview image) is written that records the size, modification time, and a
+    content fingerprint of the source file, as well as the version of the
+    preview renderer. Unless ``overwrite`` is ``True``, a preview with a
+    matching manifest is reused as-is. Any other preview is regenerated: one
+    whose manifest no longer matches (because the file or the renderer has
+    changed), and one without a manifest (such as a placeholder image, or a
+    preview made before manifests were written).
+
     Parameters
     ----------
     fname
         The filename from which to read data
     overwrite
-        Whether to overwrite the .json metadata file and thumbnail
-        image if either exists
+        Whether to force the thumbnail image to be regenerated, even if an
+        up-to-date one already exists
 
     Returns
     -------
@@ -235,7 +355,59 @@ def create_preview(fname: Path, *, overwrite: bool) -> Optional[Path]:  # noqa:
         successfully generated.
     """
     preview_fname = replace_mmf_path(fname, ".thumb.png")
+    manifest_fname = replace_mmf_path(fname, PREVIEW_MANIFEST_SUFFIX)
+    extractor = extension_reader_map.get(fname.suffix[1:], get_basic_metadata)
+    module = inspect.getmodule(extractor).__name__
+
+    with extraction_stats.record_call("preview", fname, module) as call:
+        if (
+            not overwrite
+            and preview_fname.is_file()
+            and manifest_fname.is_file()
+            and _read_preview_manifest(manifest_fname) == _preview_manifest(fname)
+        ):
+            logger.info("Preview is up to date: %s", preview_fname)
+            call["outcome"] = "up_to_date"
+            return preview_fname
+        # remove any existing manifest, since it will no longer be accurate if a
+        # new preview cannot be generated
+        manifest_fname.unlink(missing_ok=True)
+
+        preview_fname, rendered = _generate_preview(fname, preview_fname)
+        if rendered:
+            _write_preview_manifest(fname, manifest_fname)
+            call["outcome"] = "rendered"
+        else:
+            call["outcome"] = "placeholder" if preview_fname else "failed"
+
+    return preview_fname
+
+
+def _generate_preview(
+    fname: Path,
+    preview_fname: Path,
+) -> Tuple[Optional[Path], bool]:
+    """
+    Render the preview image for a file (used by :py:func:`create_preview`).
 
+    Any existing preview image is overwritten.
+
+    Parameters
+    ----------
+    fname
+        The filename from which to read data
+    preview_fname
+        The filename to which the preview image should be written
+
+    Returns
+    -------
+    preview_fname : Optional[pathlib.Path]
+        The filename of the preview image; if None, a preview could not be
+        successfully generated.
+    rendered : bool
+        Whether a preview was rendered from the file's data (``False`` if a
+        placeholder image was used instead)
+    """
     extension = fname.suffix[1:]
 
     if extension == "tif":
@@ -260,25 +432,24 @@ def create_preview(fname: Path, *, overwrite: bool) -> Optional[Path]:  # noqa:
 
         # handle the case where PIL cannot open an image
         if preview_return is False:
-            preview_fname = None
-            return preview_fname
+            return None, False
 
     else:
-        load_options = {"lazy": True}
+        load_options = {}
         if extension == "ser":
             load_options["only_valid_data"] = True
 
         # noinspection PyBroadException
         try:
-            s = hs.load(fname, **load_options)
+            # reuses the signal already loaded by the extractor, if there is one
+            s = load_signal(fname, **load_options)
         except Exception:  # pylint: disable=broad-exception-caught
             logger.warning(
                 "Signal could not be loaded by HyperSpy. "
                 "Using placeholder image for preview.",
             )
-            preview_fname = replace_mmf_path(fname, ".thumb.png")
             shutil.copyfile(PLACEHOLDER_PREVIEW, preview_fname)
-            return preview_fname
+            return preview_fname, False
 
         # If s is a list of signals, use just the first one for
         # our purposes
@@ -296,22 +467,111 @@ def create_preview(fname: Path, *, overwrite: bool) -> Optional[Path]:  # noqa:
                 "",
             ).strip(".")
 
-        # only generate the preview if it doesn't exist, or overwrite
-        # parameter is explicitly provided
-        if not preview_fname.is_file() or overwrite:
-            logger.info("Generating preview: %s", preview_fname)
-            # Create the directory for the thumbnail, if needed
-            preview_fname.parent.mkdir(
-                parents=True,
-                exist_ok=True,
-            )
-            # Generate the thumbnail
-            s.compute(show_progressbar=False)
-            sig_to_thumbnail(s, out_path=preview_fname)
-        else:
-            logger.info("Preview already exists: %s", preview_fname)
+        logger.info("Generating preview: %s", preview_fname)
+        # Create the directory for the thumbnail, if needed
+        preview_fname.parent.mkdir(
+            parents=True,
+            exist_ok=True,
+        )
+        # Generate the thumbnail
+        s.compute(show_progressbar=False)
+        sig_to_thumbnail(s, out_path=preview_fname)
 
-    return preview_fname
+    return preview_fname, True
+
+
+def _file_fingerprint(fname: Path, size: int) -> str:
+    """
+    Get a quick fingerprint of a file's contents.
+
+    Rather than hashing the whole (potentially very large) file, only the
+    file's size and its first and last :py:data:`FINGERPRINT_CHUNK_SIZE` bytes
+    are hashed.
+
+    Parameters
+    ----------
+    fname
+        The file to fingerprint
+    size
+        The size of the file (in bytes)
+
+    Returns
+    -------
+    str
+        The hexadecimal SHA-256 digest of the file's size and sampled content
+    """
+    digest = hashlib.sha256(str(size).encode())
+    with fname.open(mode="rb") as f:
+        digest.update(f.read(FINGERPRINT_CHUNK_SIZE))
+        if size > FINGERPRINT_CHUNK_SIZE:
+            f.seek(max(FINGERPRINT_CHUNK_SIZE, size - FINGERPRINT_CHUNK_SIZE))
+            digest.update(f.read(FINGERPRINT_CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def _preview_manifest(fname: Path) -> Dict[str, Any]:
+    """
+    Get the preview manifest describing the current state of a file.
+
+    Parameters
+    ----------
+    fname
+        The file from which a preview is generated
+
+    Returns
+    -------
+    dict
+        The file's ``size``, modification time (``mtime_ns``), content
+        ``fingerprint``, and the current preview ``renderer_version`` and
+        ``renderer`` (see :ref:`NexusLIMS_thumbnail_renderer
+        <NexusLIMS-thumbnail-renderer>`), so that previews are regenerated
+        when either changes
+    """
+    stat = fname.stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "fingerprint": _file_fingerprint(fname, stat.st_size),
+        "renderer_version": RENDERER_VERSION,
+        "renderer": _thumbnail_renderer(),
+    }
+
+
+def _read_preview_manifest(manifest_fname: Path) -> Optional[Dict[str, Any]]:
+    """
+    Read a preview manifest, returning ``None`` if it is not readable.
+
+    Parameters
+    ----------
+    manifest_fname
+        The path of the manifest file
+
+    Returns
+    -------
+    dict or None
+        The contents of the manifest
+    """
+    try:
+        with manifest_fname.open(encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_preview_manifest(fname: Path, manifest_fname: Path):
+    """
+    Write the preview manifest for a file whose preview was just generated.
+
+    Parameters
+    ----------
+    fname
+        The file from which the preview was generated
+    manifest_fname
+        The path to which the manifest should be written
+    """
+    manifest_fname.parent.mkdir(parents=True, exist_ok=True)
+    with manifest_fname.open(mode="w", encoding="utf-8") as f:
+        json.dump(_preview_manifest(fname), f, indent=2)
 
 
 def flatten_dict(_dict, parent_key="", separator=" "):
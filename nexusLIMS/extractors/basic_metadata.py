@@ -37,7 +37,7 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def get_basic_metadata(filename):
+def get_basic_metadata(filename, mtime=None):
     """
     Get basic metadata from a file.
 
@@ -47,6 +47,9 @@ def get_basic_metadata(filename):
     ----------
     filename : str
         path to a file saved in the harvested directory of the instrument
+    mtime : float or None
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
@@ -58,7 +61,8 @@ def get_basic_metadata(filename):
     mdict["nx_meta"]["Data Type"] = "Unknown"
 
     # get the modification time (as ISO format):
-    mtime = os.path.getmtime(filename)
+    if mtime is None:
+        mtime = os.path.getmtime(filename)
     instr = get_instr_from_filepath(filename)
     mtime_iso = dt.fromtimestamp(
         mtime,
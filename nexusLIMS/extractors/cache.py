@@ -0,0 +1,444 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Cache the results of metadata extraction between record builder runs.
+
+Extracting metadata requires opening (and often reading in full) each data file,
+which is by far the slowest part of building a record. Since the files in the
+centralized file store do not change once written, the results of
+:py:func:`~nexusLIMS.extractors.parse_metadata` can be safely reused when a
+session is built again (for example, after fixing whatever caused it to be
+marked as ``"ERROR"``).
+
+The cache is a SQLite database stored next to the NexusLIMS database (see
+:ref:`nexusLIMS_db_path <nexusLIMS-db-path>`), and is only used if the
+:ref:`NexusLIMS_extraction_cache <NexusLIMS-extraction-cache>` environment
+variable is enabled. Entries are keyed on a file's path, size, and modification
+time (in nanoseconds), as well as the name of the extractor module and the
+NexusLIMS version used to extract it, so a file that changes on disk (or an
+upgrade of NexusLIMS) will result in a fresh extraction. The metadata is
+stored as JSON, in the same form as the metadata files written to the
+NexusLIMS folder.
+
+The cache can be managed by running this module directly:
+
+.. code-block:: bash
+
+    $ python -m nexusLIMS.extractors.cache --stats
+    $ python -m nexusLIMS.extractors.cache --invalidate /path/to/file_or_dir
+    $ python -m nexusLIMS.extractors.cache --evict-older-than 90
+    $ python -m nexusLIMS.extractors.cache --prune
+    $ python -m nexusLIMS.extractors.cache --clear
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+from nexusLIMS.utils import get_env_bool
+from nexusLIMS.version import __version__
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = "nexuslims_extraction_cache.sqlite"
+"""The name of the cache database file (created next to the NexusLIMS DB)."""
+
+_CREATE_TABLE = (
+    "CREATE TABLE IF NOT EXISTS extraction_cache ("
+    "path TEXT NOT NULL, "
+    "size INTEGER NOT NULL, "
+    "mtime_ns INTEGER NOT NULL, "
+    "module TEXT NOT NULL, "
+    "version TEXT NOT NULL, "
+    "metadata TEXT NOT NULL, "
+    "created REAL NOT NULL, "
+    "accessed REAL NOT NULL, "
+    "PRIMARY KEY (path, module, version))"
+)
+
+_CREATED_TABLES: Set[Path] = set()
+"""The cache databases in which this process has already created the table."""
+
+
+def is_enabled() -> bool:
+    """
+    Determine whether the extraction cache should be used.
+
+    Returns
+    -------
+    bool
+        The value of the ``NexusLIMS_extraction_cache`` environment variable
+        (``False`` if it is not set)
+    """
+    return get_env_bool("NexusLIMS_extraction_cache", default=False)
+
+
+def get_cache_path() -> Path:
+    """
+    Get the location of the extraction cache database.
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the cache database, which lives in the same folder as the
+        NexusLIMS database
+    """
+    return Path(os.environ["nexusLIMS_db_path"]).parent / CACHE_FILENAME
+
+
+def _connect() -> contextlib.closing:
+    """
+    Open a connection to the cache database, creating the table if needed.
+
+    The table is only created by the first connection (to each cache
+    database) of a process.
+
+    Returns
+    -------
+    contextlib.closing
+        A wrapped :py:class:`sqlite3.Connection` that will be closed when used
+        as a context manager
+    """
+    cache_path = get_cache_path()
+    conn = sqlite3.connect(cache_path, timeout=30)
+    if cache_path not in _CREATED_TABLES:
+        with conn:
+            conn.execute(_CREATE_TABLE)
+        _CREATED_TABLES.add(cache_path)
+    return contextlib.closing(conn)
+
+
+def _cache_key(path: Union[str, Path]) -> str:
+    """Get the (absolute) path under which a file's entries are stored."""
+    return str(Path(path).absolute())
+
+
+def get_cached_metadata(fname: Path, module: str) -> Optional[Dict[str, Any]]:
+    """
+    Get previously extracted metadata for a file from the cache.
+
+    Only the file's size and modification time are checked (using
+    :py:meth:`pathlib.Path.stat`), so the file itself is never opened.
+
+    Parameters
+    ----------
+    fname
+        The file for which to get metadata
+    module
+        The fully qualified name of the extractor module that would be used to
+        extract the metadata (e.g. ``nexusLIMS.extractors.digital_micrograph``)
+
+    Returns
+    -------
+    nx_meta : dict or None
+        The metadata dictionary (as returned by the extractor) if a matching
+        entry was found, or ``None`` if the file needs to be extracted
+    """
+    stat = fname.stat()
+    key = _cache_key(fname)
+    query = (
+        "SELECT metadata FROM extraction_cache WHERE path = ? AND size = ? "
+        "AND mtime_ns = ? AND module = ? AND version = ?"
+    )
+    args = (key, stat.st_size, stat.st_mtime_ns, module, __version__)
+    try:
+        with _connect() as conn, conn:
+            row = conn.execute(query, args).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE extraction_cache SET accessed = ? "
+                "WHERE path = ? AND module = ? AND version = ?",
+                (time.time(), key, module, __version__),
+            )
+    except sqlite3.Error as exception:
+        logger.warning("Could not read extraction cache: %s", exception)
+        return None
+
+    try:
+        nx_meta = json.loads(row[0])
+    except ValueError as exception:
+        # e.g. an entry written in another format by an older NexusLIMS
+        logger.warning("Could not read cached metadata for %s: %s", fname, exception)
+        return None
+    logger.debug("Using cached metadata for %s", fname)
+    return nx_meta
+
+
+def cache_metadata(fname: Path, module: str, nx_meta: Dict[str, Any]) -> bool:
+    """
+    Store the extracted metadata for a file in the cache.
+
+    Any existing entry for the same file, extractor module, and NexusLIMS
+    version is replaced.
+
+    Parameters
+    ----------
+    fname
+        The file from which the metadata was extracted
+    module
+        The fully qualified name of the extractor module used to extract the
+        metadata
+    nx_meta
+        The metadata dictionary (as returned by the extractor)
+
+    Returns
+    -------
+    bool
+        Whether the metadata was successfully stored
+    """
+    # imported here, since nexusLIMS.extractors imports this module
+    from nexusLIMS.extractors import _CustomEncoder
+
+    stat = fname.stat()
+    try:
+        metadata = json.dumps(nx_meta, cls=_CustomEncoder)
+    except (TypeError, ValueError) as exception:
+        logger.warning("Could not cache metadata for %s: %s", fname, exception)
+        return False
+
+    now = time.time()
+    query = (
+        "INSERT OR REPLACE INTO extraction_cache (path, size, mtime_ns, module, "
+        "version, metadata, created, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    args = (
+        _cache_key(fname),
+        stat.st_size,
+        stat.st_mtime_ns,
+        module,
+        __version__,
+        metadata,
+        now,
+        now,
+    )
+    try:
+        with _connect() as conn, conn:
+            conn.execute(query, args)
+    except sqlite3.Error as exception:
+        logger.warning("Could not write to extraction cache: %s", exception)
+        return False
+    return True
+
+
+def invalidate(paths: List[Union[str, Path]]) -> int:
+    """
+    Remove the cache entries for specific files or folders.
+
+    Parameters
+    ----------
+    paths
+        Files to remove from the cache; if a value is a folder, the entries
+        for every file underneath it are removed
+
+    Returns
+    -------
+    int
+        The number of entries removed
+    """
+    removed = 0
+    with _connect() as conn, conn:
+        for path in paths:
+            path = _cache_key(path)  # noqa: PLW2901
+            prefix = path.rstrip("/") + "/"
+            removed += conn.execute(
+                "DELETE FROM extraction_cache WHERE path = ? "
+                "OR substr(path, 1, ?) = ?",
+                (path, len(prefix), prefix),
+            ).rowcount
+    logger.info("Removed %i entries from the extraction cache", removed)
+    return removed
+
+
+def evict_older_than(days: float) -> int:
+    """
+    Remove cache entries that have not been used recently.
+
+    Parameters
+    ----------
+    days
+        Entries that have not been read (or written) in this many days are
+        removed
+
+    Returns
+    -------
+    int
+        The number of entries removed
+    """
+    cutoff = time.time() - days * 24 * 60 * 60
+    with _connect() as conn, conn:
+        removed = conn.execute(
+            "DELETE FROM extraction_cache WHERE accessed < ?",
+            (cutoff,),
+        ).rowcount
+    logger.info("Evicted %i entries from the extraction cache", removed)
+    return removed
+
+
+def prune() -> int:
+    """
+    Remove cache entries that can no longer be used.
+
+    An entry is removed if it was created by a different version of NexusLIMS,
+    or if its file no longer exists (or has a different size or modification
+    time than when it was cached).
+
+    Returns
+    -------
+    int
+        The number of entries removed
+    """
+    with _connect() as conn, conn:
+        removed = conn.execute(
+            "DELETE FROM extraction_cache WHERE version != ?",
+            (__version__,),
+        ).rowcount
+        stale = []
+        for path, size, mtime_ns in conn.execute(
+            "SELECT path, size, mtime_ns FROM extraction_cache",
+        ).fetchall():
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                stale.append((path,))
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                stale.append((path,))
+        conn.executemany("DELETE FROM extraction_cache WHERE path = ?", stale)
+        removed += len(stale)
+    logger.info("Pruned %i entries from the extraction cache", removed)
+    return removed
+
+
+def clear() -> int:
+    """
+    Remove all entries from the extraction cache.
+
+    Returns
+    -------
+    int
+        The number of entries removed
+    """
+    with _connect() as conn, conn:
+        removed = conn.execute("DELETE FROM extraction_cache").rowcount
+    logger.info("Cleared %i entries from the extraction cache", removed)
+    return removed
+
+
+def cache_stats() -> Dict[str, Any]:
+    """
+    Summarize the contents of the extraction cache.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the cache's ``path``, the number of
+        ``entries``, the total ``size`` of the stored metadata (in bytes), and
+        the number of entries per extractor ``modules``
+    """
+    with _connect() as conn:
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(metadata)), 0) "
+            "FROM extraction_cache",
+        ).fetchone()
+        modules = dict(
+            conn.execute(
+                "SELECT module, COUNT(*) FROM extraction_cache GROUP BY module",
+            ).fetchall(),
+        )
+    return {
+        "path": get_cache_path(),
+        "entries": entries,
+        "size": size,
+        "modules": modules,
+    }
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from nexusLIMS.utils import setup_loggers
+
+    parser = argparse.ArgumentParser(
+        description="Manage the NexusLIMS metadata extraction cache",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Show a summary of the cache contents (the default action)",
+    )
+    parser.add_argument(
+        "--invalidate",
+        nargs="+",
+        metavar="PATH",
+        help="Remove the entries for these files (or all files within these "
+        "folders)",
+    )
+    parser.add_argument(
+        "--evict-older-than",
+        type=float,
+        metavar="DAYS",
+        dest="evict_days",
+        help="Remove entries that have not been used in this many days",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Remove entries for files that have changed or no longer exist, "
+        "or that were created by a different NexusLIMS version",
+    )
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="Remove all entries from the cache",
+    )
+    args = parser.parse_args()
+
+    setup_loggers(logging.INFO)
+    logger.setLevel(logging.INFO)
+
+    if args.clear:
+        clear()
+    if args.invalidate:
+        invalidate(args.invalidate)
+    if args.evict_days is not None:
+        evict_older_than(args.evict_days)
+    if args.prune:
+        prune()
+    stats = cache_stats()
+    logger.info(
+        "%s: %i entries (%.1f MiB)",
+        stats["path"],
+        stats["entries"],
+        stats["size"] / 2**20,
+    )
+    for module, count in sorted(stats["modules"].items()):
+        logger.info("    %s: %i", module, count)
@@ -8,18 +8,11 @@ import os
 from datetime import datetime as dt
 from pathlib import Path
 from struct import error
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import numpy as np
-from hyperspy.exceptions import (
-    DM3DataTypeError,
-    DM3FileVersionError,
-    DM3TagError,
-    DM3TagIDError,
-    DM3TagTypeError,
-)
-from hyperspy.io import load as hs_load
 
+from nexusLIMS.extractors.dm_tags import DMTagError, read_dm_tags
 from nexusLIMS.extractors.utils import (
     _coerce_to_list,
     _find_val,
@@ -41,7 +34,6 @@ from nexusLIMS.utils import (
     get_nested_dict_key,
     get_nested_dict_value_by_path,
     remove_dict_nones,
-    remove_dtb_element,
     set_nested_dict_value,
     sort_dict,
     try_getting_dict_value,
@@ -50,7 +42,10 @@ from nexusLIMS.utils import (
 logger = logging.getLogger(__name__)
 
 
-def get_dm3_metadata(filename: Path):  # noqa: PLR0912
+def get_dm3_metadata(
+    filename: Path,
+    mtime: Optional[float] = None,
+):
     """
     Get metadata from a dm3 or dm4 file.
 
@@ -62,24 +57,24 @@ def get_dm3_metadata(filename: Path):  # noqa: PLR0912
     ----------
     filename : str
         path to a .dm3 file saved by Gatan's Digital Micrograph
+    mtime : float or None
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
     metadata : dict or None
         The extracted metadata of interest. If None, the file could not be opened
     """
-    # We do lazy loading so we don't actually read the data from the disk to
-    # save time and memory.
+    # Only the tags of interest are read (without the image data), rather than
+    # loading the whole file with HyperSpy. Within the DocumentObjectList tree
+    # (which contains information about the display of the images), we only
+    # care about the AnnotationGroupList of each TagGroup; within ImageList
+    # (which contains the actual image information) we only care about the
+    # ImageTags and Name of each TagGroup.
     try:
-        s = hs_load(filename, lazy=True)
-    except (
-        DM3DataTypeError,
-        DM3FileVersionError,
-        DM3TagError,
-        DM3TagIDError,
-        DM3TagTypeError,
-        error,
-    ) as exc:
+        images = read_dm_tags(filename)
+    except (DMTagError, error) as exc:
         logger.warning(
             "File reader could not open %s, received exception: %s",
             filename,
@@ -87,96 +82,25 @@ def get_dm3_metadata(filename: Path):  # noqa: PLR0912
         )
         return None
 
-    if isinstance(s, list):
-        # s is a list, rather than a single signal
-        m_list = [{}] * len(s)
-        for i, _ in enumerate(s):
-            m_list[i] = s[i].original_metadata
-    else:
-        s = [s]
-        m_list = [s[0].original_metadata]
-
-    for i, m_tree in enumerate(m_list):
-        # Important trees:
-        #   DocumentObjectList
-        #     Contains information about the display of the information, including bits
-        #     about annotations that are included on top of the image data, the CLUT
-        #     (color look-up table), data min/max.
-        #
-        #   ImageList
-        #     Contains the actual image information
-
-        # Remove the trees that are not of interest:
-        for tag in [
-            "ApplicationBounds",
-            "LayoutType",
-            "DocumentTags",
-            "HasWindowPosition",
-            "ImageSourceList",
-            "Image_Behavior",
-            "InImageMode",
-            "MinVersionList",
-            "NextDocumentObjectID",
-            "PageSetup",
-            "Page_Behavior",
-            "SentinelList",
-            "Thumbnails",
-            "WindowPosition",
-            "root",
-        ]:
-            m_tree = remove_dtb_element(m_tree, tag)  # noqa: PLW2901
-
-        # Within the DocumentObjectList tree, we really only care about the
-        # AnnotationGroupList for each TagGroup, so go into each TagGroup and
-        # delete everything but that...
-        # NB: the hyperspy DictionaryTreeBrowser __iter__ function returns each
-        #   tree element as a tuple containing the tree name and the actual
-        #   tree, so we loop through the tag names by taking the first part
-        #   of the tuple:
-        for tg_name, tag in m_tree.DocumentObjectList:
-            # tg_name should be 'TagGroup0', 'TagGroup1', etc.
-            keys = tag.keys()
-            # we want to keep this, so remove from the list to loop through
-            if "AnnotationGroupList" in keys:
-                keys.remove("AnnotationGroupList")
-            for k in keys:
-                m_tree = remove_dtb_element(  # noqa: PLW2901
-                    m_tree,
-                    f"DocumentObjectList.{tg_name}.{k}",
-                )
-
-        for tg_name, tag in m_tree.ImageList:
-            # tg_name should be 'TagGroup0', 'TagGroup1', etc.
-            keys = tag.keys()
-            # We want to keep 'ImageTags' and 'Name', so remove from list
-            keys.remove("ImageTags")
-            keys.remove("Name")
-            for k in keys:
-                # k should be in ['ImageData', 'UniqueID']
-                m_tree = remove_dtb_element(  # noqa: PLW2901
-                    m_tree,
-                    f"ImageList.{tg_name}.{k}",
-                )
-
-        m_list[i] = m_tree.as_dictionary()
-
-        # Get the instrument object associated with this file
-        instr = get_instr_from_filepath(filename)
-        # get the modification time (as ISO format):
-        mtime = os.path.getmtime(filename)
-        mtime_iso = dt.fromtimestamp(
-            mtime,
-            tz=instr.timezone if instr else None,
-        ).isoformat()
-        # if we found the instrument, then store the name as string, else None
-        instr_name = instr.name if instr is not None else None
+    # Get the instrument object associated with this file
+    instr = get_instr_from_filepath(filename)
+    # get the modification time (as ISO format):
+    mtime_iso = dt.fromtimestamp(
+        os.path.getmtime(filename) if mtime is None else mtime,
+        tz=instr.timezone if instr else None,
+    ).isoformat()
+    # if we found the instrument, then store the name as string, else None
+    instr_name = instr.name if instr is not None else None
+
+    m_list = [image.metadata for image in images]
+    for i, image in enumerate(images):
         m_list[i]["nx_meta"] = {}
         m_list[i]["nx_meta"]["fname"] = str(filename)
         # set type to Image by default
         m_list[i]["nx_meta"]["DatasetType"] = "Image"
         m_list[i]["nx_meta"]["Data Type"] = "TEM_Imaging"
         m_list[i]["nx_meta"]["Creation Time"] = mtime_iso
-        m_list[i]["nx_meta"]["Data Dimensions"] = str(s[i].data.shape)
+        m_list[i]["nx_meta"]["Data Dimensions"] = str(image.shape)
         m_list[i]["nx_meta"]["Instrument ID"] = instr_name
         m_list[i]["nx_meta"]["warnings"] = []
         m_list[i] = parse_dm3_microscope_info(m_list[i])
@@ -0,0 +1,344 @@
+#  NIST Public License - 2023
+#
+#  See the LICENSE file in the root of this project
+#
+"""
+Read the tags of interest from DigitalMicrograph files without reading their data.
+
+Loading a .dm3 or .dm4 file with HyperSpy parses every tag in the file into a
+tree (including the image data and thumbnail of each image, and the display
+settings of every object in the document) before any of it can be used, even
+though :py:func:`~nexusLIMS.extractors.digital_micrograph.get_dm3_metadata`
+only uses a few of the tag groups. :py:func:`read_dm_tags` instead walks the
+tag directory of the file and only reads the tags of interest (see
+:py:data:`KEPT_TAGS`), seeking past everything else. The tags are returned in
+the same form as the ``original_metadata`` of the signals that HyperSpy loads
+from the file.
+
+The file format is described at
+https://www.er-c.org/cbb/info/dmformat/ and is the same as that read by
+:py:mod:`hyperspy.io_plugins.digital_micrograph`.
+"""
+import copy
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import IO, Any, Dict, List, NamedTuple, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+KEPT_TAGS = {
+    "ImageList": {
+        "*": {
+            "ImageTags": True,
+            "Name": True,
+            "ImageData": {"Dimensions": True},
+        },
+    },
+    "DocumentObjectList": {"*": {"AnnotationGroupList": True}},
+    "Thumbnails": {"*": {"ImageIndex": True}},
+}
+"""
+The tags that are read from the file.
+
+Each key is the name of a tag (with ``"*"`` matching any name), and each value
+is either ``True`` (to read the tag and everything below it) or another
+dictionary of this form (to read only some of the tags in that tag group).
+``ImageData.Dimensions`` and ``Thumbnails`` are only used to find the shape of
+each image and which of the images are thumbnails, and are not returned.
+"""
+
+_GROUP = 20
+_DATA = 21
+_STRUCT = 15
+_STRING = 18
+_ARRAY = 20
+# the struct format characters of DM's simple data types
+_SIMPLE_TYPES = {
+    2: "h",
+    3: "l",
+    4: "H",
+    5: "L",
+    6: "f",
+    7: "d",
+    8: "B",
+    9: "c",
+    10: "b",
+    11: "q",
+    12: "Q",
+}
+_UNICODE_CHAR = 4
+
+
+class DMTagError(Exception):
+    """The tags of a DigitalMicrograph file could not be read."""
+
+
+class DMImage(NamedTuple):
+    """The tags of interest for one image in a DigitalMicrograph file."""
+
+    metadata: Dict[str, Any]
+    """
+    The tags, laid out as in the ``original_metadata`` of the signal loaded by
+    HyperSpy (with this image as ``ImageList.TagGroup0``)
+    """
+    shape: Tuple[int, ...]
+    """The shape of the image's data, as loaded by HyperSpy"""
+
+
+class _TagReader:
+    """Reads the kept tags from an open DigitalMicrograph file."""
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+        # the lengths and sizes in corrupt files may be far beyond the end of
+        # the file, so they are checked before reading or seeking
+        start = f.tell()
+        self.file_size = f.seek(0, os.SEEK_END)
+        f.seek(start)
+        self.version = self._read_struct(">l")
+        if self.version not in (3, 4):
+            msg = f"Unsupported DigitalMicrograph file version: {self.version}"
+            raise DMTagError(msg)
+        # the lengths, counts and type codes are 4 bytes long in DM3 files and 8
+        # bytes long in DM4 files (and always big-endian)
+        self.length_fmt = ">l" if self.version == 3 else ">q"  # noqa: PLR2004
+        self._read_length()  # the size of the file
+        self.endian = "<" if self._read_struct(">l") else ">"
+
+    def _check_size(self, size: int, action: str):
+        position = self.f.tell()
+        if size < 0:
+            msg = f"Cannot {action} {size} bytes at byte {position}"
+            raise DMTagError(msg)
+        if position + size > self.file_size:
+            msg = (
+                f"Unexpected end of file: cannot {action} {size} bytes at byte "
+                f"{position} of {self.file_size}"
+            )
+            raise DMTagError(msg)
+
+    def _read(self, size: int) -> bytes:
+        self._check_size(size, "read")
+        data = self.f.read(size)
+        if len(data) != size:
+            msg = f"Unexpected end of file at byte {self.f.tell()}"
+            raise DMTagError(msg)
+        return data
+
+    def _read_struct(self, fmt: str):
+        return struct.unpack(fmt, self._read(struct.calcsize(fmt)))[0]
+
+    def _read_length(self) -> int:
+        return self._read_struct(self.length_fmt)
+
+    def _skip(self, size: int):
+        self._check_size(size, "skip")
+        self.f.seek(size, os.SEEK_CUR)
+
+    def _read_string(self, length: int) -> str:
+        data = self._read(length)
+        try:
+            return data.decode("utf8")
+        except UnicodeDecodeError:
+            # some files' strings are encoded as latin-1 rather than utf8
+            return data.decode("latin-1", errors="ignore")
+
+    def read_root(self) -> Dict[str, Any]:
+        """Read the kept tags in the root tag group of the file."""
+        self._read(2)  # whether the group is sorted and open
+        return self._read_group(self._read_length(), KEPT_TAGS)
+
+    def _read_group(self, n_tags: int, kept: Union[dict, bool]) -> Dict[str, Any]:
+        # unnamed tags are named as HyperSpy names them, counting each type
+        group = {}
+        n_unnamed = {_DATA: 0, _GROUP: 0}
+        for _ in range(n_tags):
+            tag_type = self._read_struct(">b")
+            name = self._read_string(self._read_struct(">h"))
+            if tag_type not in n_unnamed:
+                msg = f"Unknown tag type {tag_type} at byte {self.f.tell()}"
+                raise DMTagError(msg)
+            if not name:
+                prefix = "Data" if tag_type == _DATA else "TagGroup"
+                name = f"{prefix}{n_unnamed[tag_type]}"
+                n_unnamed[tag_type] += 1
+            sub_kept = kept if kept is True else kept.get(name, kept.get("*"))
+            if sub_kept is None:
+                self._skip_tag(tag_type)
+            elif tag_type == _DATA:
+                if self.version == 4:  # noqa: PLR2004
+                    self._read(8)  # the size of the tag
+                group[name] = self._read_data()
+            else:
+                if self.version == 4:  # noqa: PLR2004
+                    self._read(8)
+                self._read(2)
+                group[name] = self._read_group(self._read_length(), sub_kept)
+        return group
+
+    def _skip_tag(self, tag_type: int):
+        if self.version == 4:  # noqa: PLR2004
+            # DM4 files give the size of every tag, so it can be skipped at once
+            self._skip(self._read_struct(">q"))
+        elif tag_type == _DATA:
+            self._skip_data()
+        else:
+            self._read(2)
+            for _ in range(self._read_length()):
+                tag_type = self._read_struct(">b")
+                self._skip(self._read_struct(">h"))
+                self._skip_tag(tag_type)
+
+    def _read_info(self) -> List[int]:
+        if self._read(4) != b"%%%%":
+            msg = f"Missing data tag delimiter at byte {self.f.tell() - 4}"
+            raise DMTagError(msg)
+        n_info = self._read_length()
+        return [self._read_length() for _ in range(n_info)]
+
+    def _skip_data(self):
+        info = self._read_info()
+        self._skip(self._data_size(info))
+
+    def _data_size(self, info: List[int]) -> int:  # noqa: PLR0911
+        enc_type = info[0]
+        if enc_type in _SIMPLE_TYPES:
+            return self._struct_size([enc_type])
+        if enc_type == _STRING:
+            return info[1]
+        if enc_type == _STRUCT:
+            return self._struct_size(info[4::2])
+        if enc_type == _ARRAY:
+            el_type = info[1]
+            if el_type in _SIMPLE_TYPES:
+                return self._struct_size([el_type]) * info[2]
+            if el_type == _STRUCT:
+                return self._struct_size(info[5:-1:2]) * info[-1]
+            if el_type == _STRING:
+                return info[2] * info[3]
+            if el_type == _ARRAY:
+                return self._struct_size([info[2]]) * info[3] * info[4]
+        msg = f"Unsupported data type {info} at byte {self.f.tell()}"
+        raise DMTagError(msg)
+
+    @staticmethod
+    def _struct_format(field_types: List[int]) -> str:
+        try:
+            return "".join(_SIMPLE_TYPES[t] for t in field_types)
+        except KeyError as exc:
+            msg = f"Unsupported struct field types: {field_types}"
+            raise DMTagError(msg) from exc
+
+    def _struct_size(self, field_types: List[int]) -> int:
+        # in bytes, using the standard sizes of each type (and no padding)
+        return struct.calcsize("=" + self._struct_format(field_types))
+
+    def _read_values(self, fmt: str, count: int) -> list:
+        data = self._read(struct.calcsize("=" + fmt) * count)
+        return list(struct.unpack(f"{self.endian}{count}{fmt}", data))
+
+    def _read_data(self):  # noqa: PLR0911
+        # the values are converted the same way as HyperSpy does
+        info = self._read_info()
+        enc_type = info[0]
+        if enc_type in _SIMPLE_TYPES:
+            return self._read_values(_SIMPLE_TYPES[enc_type], 1)[0]
+        if enc_type == _STRING:
+            return self._read_string(info[1])
+        if enc_type == _STRUCT:
+            return tuple(self._read_values(self._struct_format(info[4::2]), 1))
+        el_type = info[1] if enc_type == _ARRAY else None
+        if el_type in _SIMPLE_TYPES:
+            values = self._read_values(_SIMPLE_TYPES[el_type], info[2])
+            if el_type == _UNICODE_CHAR and values:
+                # arrays of 2-byte characters are strings
+                return "".join(chr(v) for v in values)
+            return values
+        if el_type == _STRUCT:
+            fmt = self.endian + self._struct_format(info[5:-1:2])
+            data = self._read(struct.calcsize(fmt) * info[-1])
+            return list(struct.iter_unpack(fmt, data))
+        if el_type == _STRING:
+            return [self._read_string(info[2]) for _ in range(info[3])]
+        if el_type == _ARRAY and info[2] in _SIMPLE_TYPES:
+            return [
+                self._read_values(_SIMPLE_TYPES[info[2]], info[3])
+                for _ in range(info[4])
+            ]
+        msg = f"Unsupported data type {info} at byte {self.f.tell()}"
+        raise DMTagError(msg)
+
+
+def _data_shape(image: Dict[str, Any]) -> Tuple[int, ...]:
+    """
+    Get the shape of an image's data, as loaded by HyperSpy.
+
+    HyperSpy reverses the order of the dimensions given in the file, makes
+    spectrum images into spectra (moving the spectral axis last), and then
+    removes any dimensions of size 1.
+    """
+    dims = list(image.get("ImageData", {}).get("Dimensions", {}).values())
+    shape = dims[::-1]
+    tags = image.get("ImageTags", {})
+    meta_data = tags.get("Meta Data")
+    is_spectrum_image = (
+        isinstance(meta_data, dict) and meta_data.get("Format") == "Spectrum image"
+    ) or "spim" in tags
+    if is_spectrum_image and len(shape) > 2:  # noqa: PLR2004
+        shape = shape[1:] + shape[:1]
+    return tuple(d for d in shape if d != 1)
+
+
+def read_dm_tags(filename: Path) -> List[DMImage]:
+    """
+    Read the tags of interest for each image in a DigitalMicrograph file.
+
+    Only the ``ImageTags`` and ``Name`` of each image (in ``ImageList``) and the
+    ``AnnotationGroupList`` of each document object (in ``DocumentObjectList``)
+    are read; the image data, thumbnails, and all other tags are skipped.
+
+    Parameters
+    ----------
+    filename
+        The .dm3 or .dm4 file to read
+
+    Returns
+    -------
+    list of DMImage
+        The tags (and data shape) of each image in the file, other than its
+        thumbnail(s), in the same order as the signals that HyperSpy loads
+        from the file
+
+    Raises
+    ------
+    DMTagError
+        If the file could not be read as a DigitalMicrograph file
+    """
+    with Path(filename).open("rb") as f:
+        tags = _TagReader(f).read_root()
+
+    if "ImageList" not in tags:
+        msg = f"No images were found in {filename}"
+        raise DMTagError(msg)
+    thumbnails = [tag.get("ImageIndex") for tag in tags.get("Thumbnails", {}).values()]
+    images = [
+        image
+        for name, image in tags["ImageList"].items()
+        if name.replace("TagGroup", "") not in [str(i) for i in thumbnails]
+    ]
+    if not images:
+        msg = f"No images (other than thumbnails) were found in {filename}"
+        raise DMTagError(msg)
+
+    result = []
+    for image in images:
+        kept = {k: v for k, v in image.items() if k in ("ImageTags", "Name")}
+        metadata = {
+            "DocumentObjectList": copy.deepcopy(tags.get("DocumentObjectList", {})),
+            "ImageList": {"TagGroup0": kept},
+        }
+        result.append(DMImage(metadata, _data_shape(image)))
+    logger.debug("Read the tags of %i image(s) from %s", len(result), filename)
+    return result
@@ -30,15 +30,16 @@ import logging
 from pathlib import Path
 from typing import Dict, Optional
 
-from hyperspy.io import load
-
-from nexusLIMS.extractors.utils import _set_instr_name_and_time
+from nexusLIMS.extractors.utils import _set_instr_name_and_time, load_signal
 from nexusLIMS.utils import try_getting_dict_value
 
 logger = logging.getLogger(__name__)
 
 
-def get_spc_metadata(filename: Path) -> Optional[Dict]:
+def get_spc_metadata(
+    filename: Path,
+    mtime: Optional[float] = None,
+) -> Optional[Dict]:
     """
     Return the metadata (as a dict) from a .spc file.
 
@@ -49,6 +50,9 @@ def get_spc_metadata(filename: Path) -> Optional[Dict]:
     ----------
     filename
         path to a .spc file saved by EDAX software (Genesis, TEAM, etc.)
+    mtime
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
@@ -62,9 +66,9 @@ def get_spc_metadata(filename: Path) -> Optional[Dict]:
     mdict["nx_meta"]["DatasetType"] = "Spectrum"
     mdict["nx_meta"]["Data Type"] = "EDS_Spectrum"
 
-    _set_instr_name_and_time(mdict, filename)
+    _set_instr_name_and_time(mdict, filename, mtime)
 
-    s = load(filename, lazy=True)
+    s = load_signal(filename)
 
     # original_metadata puts the entire xml under the root node "spc_header",
     # so this will just bump that all up to the root level for ease of use.
@@ -94,7 +98,10 @@ def get_spc_metadata(filename: Path) -> Optional[Dict]:
     return mdict
 
 
-def get_msa_metadata(filename: Path) -> Optional[Dict]:
+def get_msa_metadata(
+    filename: Path,
+    mtime: Optional[float] = None,
+) -> Optional[Dict]:
     """
     Return the metadata (as a dict) from an .msa spectrum file.
 
@@ -108,6 +115,9 @@ def get_msa_metadata(filename: Path) -> Optional[Dict]:
     ----------
     filename
         path to a .msa file saved by various EDS software packages
+    mtime
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
@@ -115,7 +125,7 @@ def get_msa_metadata(filename: Path) -> Optional[Dict]:
         The metadata of interest extracted from the file. If None, the file
         could not be opened
     """
-    s = load(filename, lazy=True)
+    s = load_signal(filename)
     mdict = {"nx_meta": {}}
     mdict["original_metadata"] = s.original_metadata.as_dictionary()
 
@@ -123,7 +133,7 @@ def get_msa_metadata(filename: Path) -> Optional[Dict]:
     mdict["nx_meta"]["DatasetType"] = "Spectrum"
     mdict["nx_meta"]["Data Type"] = "EDS_Spectrum"
 
-    _set_instr_name_and_time(mdict, filename)
+    _set_instr_name_and_time(mdict, filename, mtime)
 
     term_mapping = {
         "AZIMANGLE-dg": "Azimuthal Angle (deg)",
@@ -37,12 +37,11 @@ import logging
 import os
 from datetime import datetime as dt
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
-from hyperspy.io import load as hs_load
-from hyperspy.signal import BaseSignal
 
+from nexusLIMS.extractors.utils import keep_signal, load_signal
 from nexusLIMS.instruments import get_instr_from_filepath
 from nexusLIMS.utils import set_nested_dict_value, sort_dict, try_getting_dict_value
 
@@ -50,7 +49,10 @@ logger = logging.getLogger(__name__)
 
 
 # noinspection PyBroadException
-def get_ser_metadata(filename: Path):
+def get_ser_metadata(  # noqa: PLR0915
+    filename: Path,
+    mtime: Optional[float] = None,
+):
     """
     Get metadat from .ser file.
 
@@ -61,6 +63,9 @@ def get_ser_metadata(filename: Path):
     ----------
     filename
         Path to FEI .ser file
+    mtime
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
@@ -69,6 +74,8 @@ def get_ser_metadata(filename: Path):
         files cannot be opened, at least basic metadata will be returned (
         creation time, etc.)
     """
+    from hyperspy.signal import BaseSignal
+
     # ObjectInfo present in emi; ser_header_parameters present in .ser
     # ObjectInfo should contain all the interesting metadata,
     # while ser_header_parameters is mostly technical stuff not really of
@@ -79,6 +86,9 @@ def get_ser_metadata(filename: Path):
     try:
         emi_filename, ser_index = get_emi_from_ser(filename)
         s, emi_loaded = _load_ser(emi_filename, ser_index)
+        # the preview can be generated from the same signal (which is what
+        # loading the .ser file itself would give)
+        keep_signal(filename, s, only_valid_data=True)
 
     except FileNotFoundError:
         # if emi wasn't found, specifically mention that
@@ -108,7 +118,7 @@ def get_ser_metadata(filename: Path):
         # if we couldn't load the emi, lets at least open the .ser to pull
         # out the ser_header_info
         try:
-            s = hs_load(filename, only_valid_data=True, lazy=True)
+            s = load_signal(filename, only_valid_data=True)
         except Exception:
             warning = (
                 "The .ser file could not be opened (perhaps file is "
@@ -158,7 +168,7 @@ def get_ser_metadata(filename: Path):
     metadata["nx_meta"]["fname"] = filename
     # get the modification time:
     metadata["nx_meta"]["Creation Time"] = dt.fromtimestamp(
-        os.path.getmtime(filename),
+        os.path.getmtime(filename) if mtime is None else mtime,
         tz=instr.timezone if instr else None,
     ).isoformat()
     metadata["nx_meta"]["Instrument ID"] = instr_name
@@ -219,10 +229,12 @@ def _load_ser(emi_filename: Path, ser_index: int):
     # are related to this emi, HyperSpy returns a list, so we select out
     # the right signal from that list if that's what is returned
 
+    from hyperspy.signal import BaseSignal
+
     # make sure to load with "only_valid_data" so data shape is correct
     # loading the emi with HS will try loading the .ser too, so this will
     # fail if there's an issue with the .ser file
-    emi_s = hs_load(emi_filename, lazy=True, only_valid_data=True)
+    emi_s = load_signal(emi_filename, only_valid_data=True)
 
     # if there is more than one dataset, emi_s will be a list, so pick
     # out the matching signal from the list, which will be the "index"
@@ -30,9 +30,13 @@ import configparser
 import contextlib
 import io
 import logging
+import mmap
+import os
+import struct
 from decimal import Decimal, InvalidOperation
 from math import degrees
 from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
 
 from nexusLIMS.extractors.utils import _set_instr_name_and_time
 from nexusLIMS.utils import set_nested_dict_value, sort_dict, try_getting_dict_value
@@ -40,8 +44,122 @@ from nexusLIMS.utils import set_nested_dict_value, sort_dict, try_getting_dict_v
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+FEI_METADATA_TAGS = (34682, 34680)
+"""
+The private TIFF tags in which FEI/Thermo Fisher software saves the metadata
+(``FEI_HELIOS`` and ``FEI_SFEG``)
+"""
+METADATA_SEARCH_SIZE = 1024 * 1024
+"""
+How far from the end of a file (in bytes) to look for the metadata, if it is
+not found through the TIFF tags
+"""
 
-def get_quanta_metadata(filename: Path):
+# the size (in bytes) of each TIFF field type
+_TIFF_TYPE_SIZES = {3: 2, 4: 4, 5: 8, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8}
+
+
+def _find_tiff_tag(f: BinaryIO, tags: Tuple[int, ...]) -> Optional[Tuple[int, int]]:
+    """
+    Find the value of the first of some tags in the first IFD of a TIFF file.
+
+    Only the header and the first image file directory are read. Both classic
+    TIFF and BigTIFF files are supported.
+
+    Parameters
+    ----------
+    f
+        The file, opened in binary mode
+    tags
+        The tags to look for
+
+    Returns
+    -------
+    tuple of int or None
+        The position (in bytes from the start of the file) and size (in bytes)
+        of the tag's value, or None if the file is not a TIFF file or has none
+        of the tags
+    """
+    f.seek(0)
+    header = f.read(16)
+    byte_order = {b"II": "<", b"MM": ">"}.get(header[:2])
+    if byte_order is None:
+        return None
+    version = struct.unpack(byte_order + "H", header[2:4])[0]
+    if version == 42:  # noqa: PLR2004
+        # classic TIFF: 2-byte entry counts, and 4-byte value counts and offsets
+        ifd_offset = struct.unpack(byte_order + "I", header[4:8])[0]
+        n_entries_fmt, entry_fmt = "H", "HHII"
+    elif version == 43:  # noqa: PLR2004
+        # BigTIFF: 8-byte entry counts, value counts and offsets
+        ifd_offset = struct.unpack(byte_order + "Q", header[8:16])[0]
+        n_entries_fmt, entry_fmt = "Q", "HHQQ"
+    else:
+        return None
+
+    n_entries_size = struct.calcsize(byte_order + n_entries_fmt)
+    entry_size = struct.calcsize(byte_order + entry_fmt)
+    # values that fit in the place of the offset are stored there instead
+    inline_size = (entry_size - 4) // 2
+    f.seek(ifd_offset)
+    n_entries = struct.unpack(byte_order + n_entries_fmt, f.read(n_entries_size))[0]
+    for i in range(n_entries):
+        entry = f.read(entry_size)
+        tag, field_type, count, offset = struct.unpack(byte_order + entry_fmt, entry)
+        if tag in tags:
+            size = count * _TIFF_TYPE_SIZES.get(field_type, 1)
+            if size <= inline_size:
+                offset = ifd_offset + n_entries_size + i * entry_size
+                offset += entry_size - inline_size
+            return offset, size
+    return None
+
+
+def _read_metadata_bytes(filename: Path) -> Optional[bytes]:
+    """
+    Read the FEI metadata of a file, without reading the rest of the file.
+
+    The metadata (starting with the ``[User]`` section) is found through the
+    FEI TIFF tags (see :py:data:`FEI_METADATA_TAGS`) if possible, or otherwise
+    by searching the end of the file (see :py:data:`METADATA_SEARCH_SIZE`) for
+    it. Metadata near the end of the file is read up to the end of the file,
+    so that metadata that was edited without updating the tag is read in full.
+
+    Parameters
+    ----------
+    filename
+        The .tif file
+
+    Returns
+    -------
+    bytes or None
+        The metadata, or None if it was not found
+    """
+    with filename.open(mode="rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None
+        try:
+            location = _find_tiff_tag(f, FEI_METADATA_TAGS)
+        except struct.error:
+            # the file is too short to be a valid TIFF file
+            location = None
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if location is not None:
+                start, end = location[0], sum(location)
+                if size - end <= METADATA_SEARCH_SIZE:
+                    end = size
+                user_idx = mapped.find(b"[User]", start, end)
+                if user_idx != -1:
+                    return mapped[user_idx:end]
+            user_idx = mapped.rfind(b"[User]", max(size - METADATA_SEARCH_SIZE, 0))
+            if user_idx == -1:
+                return None
+            return mapped[user_idx:]
+
+
+def get_quanta_metadata(filename: Path, mtime: Optional[float] = None):
     """
     Get metadata from a Quanta-style tif file.
 
@@ -53,26 +171,26 @@ def get_quanta_metadata(filename: Path):
     ----------
     filename
         path to a .tif file saved by the Quanta
+    mtime
+        The modification time of the file, if already known; if None, it is
+        read from the file system
 
     Returns
     -------
     mdict : dict
         The metadata text extracted from the file
     """
-    with filename.open(mode="rb") as f:
-        content = f.read()
-    user_idx = content.find(b"[User]")
+    metadata_bytes = _read_metadata_bytes(filename)
 
     mdict = {"nx_meta": {}}
     # assume all datasets coming from Quanta are Images, currently
     mdict["nx_meta"]["DatasetType"] = "Image"
     mdict["nx_meta"]["Data Type"] = "SEM_Imaging"
 
-    _set_instr_name_and_time(mdict, filename)
+    _set_instr_name_and_time(mdict, filename, mtime)
 
-    # if the user_idx is -1, it means the [User] tag was not found in the
-    # file, and so the metadata is missing (so we should just return 0)
-    if user_idx == -1:
+    # if the [User] tag was not found in the file, the metadata is missing
+    if metadata_bytes is None:
         logger.warning("Did not find expected FEI tags in .tif file: %s", filename)
         mdict["nx_meta"]["Data Type"] = "Unknown"
         mdict["nx_meta"][
@@ -82,7 +200,6 @@ def get_quanta_metadata(filename: Path):
 
         return mdict
 
-    metadata_bytes = content[user_idx:]
     # remove any null bytes since they break the extractor
     metadata_bytes = metadata_bytes.replace(b"\x00", b"")
     metadata_str = metadata_bytes.decode().replace("\r\n", "\n")
@@ -0,0 +1,622 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Record how long metadata extraction and preview generation take for each file.
+
+When the :ref:`NexusLIMS_extraction_stats <NexusLIMS-extraction-stats>`
+environment variable is enabled, every call of
+:py:func:`~nexusLIMS.extractors.parse_metadata` (and
+:py:func:`~nexusLIMS.extractors.create_preview`) adds a row to a table in a
+SQLite database stored next to the NexusLIMS database (see
+:ref:`nexusLIMS_db_path <nexusLIMS-db-path>`). Each row records the file's
+path, extension, instrument and size, the extractor module used for that type
+of file, how long the call took, the peak memory (resident set size) of the
+process during the call, and its outcome (see :py:data:`OUTCOMES`). The peak
+memory can only be measured for each call on Linux; elsewhere, the peak memory
+of the process up to the end of the call is recorded instead.
+
+These statistics can be summarized by running this module directly, which
+shows the throughput of each extractor, the slowest files, and an estimate of
+how long it would take to extract the files of the sessions that are waiting
+to be built:
+
+.. code-block:: bash
+
+    $ python -m nexusLIMS.extractors.stats --report
+    $ python -m nexusLIMS.extractors.stats --report --days 7 --slowest 20
+    $ python -m nexusLIMS.extractors.stats --report --backlog
+    $ python -m nexusLIMS.extractors.stats --clear
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from subprocess import CalledProcessError
+from timeit import default_timer
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from nexusLIMS.instruments import get_instr_from_filepath
+from nexusLIMS.utils import get_env_bool, get_env_int
+from nexusLIMS.version import __version__
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on Windows, where peak memory is not recorded
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+STATS_FILENAME = "nexuslims_extraction_stats.sqlite"
+"""The name of the statistics database file (created next to the NexusLIMS DB)."""
+
+OUTCOMES = {
+    "extraction": ["extracted", "cached", "failed", "error"],
+    "preview": ["rendered", "up_to_date", "placeholder", "failed", "error"],
+}
+"""
+The possible outcomes of each operation: for ``extraction``, whether the
+metadata was ``extracted`` from the file or read from the extraction
+``cached``, or whether the extractor returned nothing (``failed``) or raised an
+exception (``error``); for ``preview``, whether the preview was ``rendered``,
+an existing preview was ``up_to_date``, a ``placeholder`` image (or an
+existing one that was not overwritten) was used instead, or whether no preview
+could be made (``failed``) or an exception was raised (``error``).
+"""
+
+_CREATE_TABLE = (
+    "CREATE TABLE IF NOT EXISTS extraction_stats ("
+    "timestamp REAL NOT NULL, "
+    "operation TEXT NOT NULL, "
+    "path TEXT NOT NULL, "
+    "extension TEXT NOT NULL, "
+    "instrument TEXT, "
+    "size INTEGER, "
+    "module TEXT NOT NULL, "
+    "version TEXT NOT NULL, "
+    "duration REAL NOT NULL, "
+    "peak_rss INTEGER, "
+    "outcome TEXT NOT NULL)"
+)
+
+_CREATED_TABLES: Set[Path] = set()
+"""The statistics databases in which this process has already created the table."""
+
+_RECORDER: Dict[str, Any] = {}
+"""The connection used by :py:func:`record_call` in this process (and its key)."""
+_RECORDER_LOCK = threading.Lock()
+
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+_PROC_STATUS = Path("/proc/self/status")
+
+
+def is_enabled() -> bool:
+    """
+    Determine whether extraction statistics should be recorded.
+
+    Returns
+    -------
+    bool
+        The value of the ``NexusLIMS_extraction_stats`` environment variable
+        (``False`` if it is not set)
+    """
+    return get_env_bool("NexusLIMS_extraction_stats", default=False)
+
+
+def get_stats_path() -> Path:
+    """
+    Get the location of the statistics database.
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the statistics database, which lives in the same folder as
+        the NexusLIMS database
+    """
+    return Path(os.environ["nexusLIMS_db_path"]).parent / STATS_FILENAME
+
+
+def _connect() -> contextlib.closing:
+    """
+    Open a connection to the statistics database, creating the table if needed.
+
+    The table is only created by the first connection (to each statistics
+    database) of a process.
+
+    Returns
+    -------
+    contextlib.closing
+        A wrapped :py:class:`sqlite3.Connection` that will be closed when used
+        as a context manager
+    """
+    return contextlib.closing(_open_connection(get_stats_path()))
+
+
+def _open_connection(
+    stats_path: Path,
+    *,
+    check_same_thread: bool = True,
+) -> sqlite3.Connection:
+    """Connect to a statistics database, creating the table if needed."""
+    conn = sqlite3.connect(
+        stats_path,
+        timeout=30,
+        check_same_thread=check_same_thread,
+    )
+    if stats_path not in _CREATED_TABLES:
+        with conn:
+            conn.execute(_CREATE_TABLE)
+        _CREATED_TABLES.add(stats_path)
+    return conn
+
+
+def _insert_row(row: Tuple):
+    """
+    Add a row to the statistics table, using one connection per process.
+
+    A new connection is only opened in a new (forked) process, or if the
+    location of the statistics database changes.
+    """
+    key = (os.getpid(), get_stats_path())
+    with _RECORDER_LOCK:
+        if _RECORDER.get("key") != key:
+            # the previous connection (if any) belongs to the parent process
+            _RECORDER["conn"] = _open_connection(key[1], check_same_thread=False)
+            _RECORDER["key"] = key
+        conn = _RECORDER["conn"]
+        with conn:
+            conn.execute(
+                "INSERT INTO extraction_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+
+
+@lru_cache(maxsize=256)
+def _file_details(fname: Path) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Get the instrument name and size of a file.
+
+    Files in the centralized file store do not change once written, so these
+    are only looked up once for the extraction and preview of each file.
+    """
+    try:
+        size = fname.stat().st_size
+    except OSError:
+        size = None
+    instrument = get_instr_from_filepath(fname)
+    return instrument.name if instrument is not None else None, size
+
+
+def _reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size of this process (only possible on Linux).
+
+    Returns
+    -------
+    bool
+        Whether the peak was reset, so that :py:func:`_peak_rss` gives the peak
+        since this call
+    """
+    try:
+        _CLEAR_REFS.write_text("5", encoding="ascii")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss(*, since_reset: bool = False) -> Optional[int]:
+    """
+    Get the peak resident set size of this process.
+
+    Parameters
+    ----------
+    since_reset
+        Whether :py:func:`_reset_peak_rss` succeeded, in which case the peak
+        since then is read from ``/proc``; otherwise, the peak of the process
+        so far is returned
+
+    Returns
+    -------
+    int or None
+        The peak memory use (in bytes), or ``None`` if it is not available
+    """
+    if since_reset:
+        try:
+            with _PROC_STATUS.open(encoding="ascii") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, but in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def record_call(
+    operation: str,
+    fname: Path,
+    module: str,
+) -> Iterator[Dict[str, str]]:
+    """
+    Time an extraction or preview call, and record it in the statistics table.
+
+    The caller should set the ``"outcome"`` of the yielded dictionary to one of
+    the :py:data:`OUTCOMES` for the operation; if the call raises an
+    exception, the outcome is recorded as ``"error"``. Nothing is recorded
+    unless :py:func:`is_enabled`, and errors writing to the database are
+    logged, but not raised.
+
+    Parameters
+    ----------
+    operation
+        Either ``"extraction"`` or ``"preview"``
+    fname
+        The file being processed
+    module
+        The fully qualified name of the extractor module for the file
+
+    Yields
+    ------
+    dict
+        A dictionary in which to set the ``"outcome"`` of the call
+    """
+    call = {"outcome": "error"}
+    if not is_enabled():
+        yield call
+        return
+    peak_reset = _reset_peak_rss()
+    start = default_timer()
+    try:
+        yield call
+    finally:
+        duration = default_timer() - start
+        peak_rss = _peak_rss(since_reset=peak_reset)
+        instrument, size = _file_details(fname)
+        row = (
+            time.time(),
+            operation,
+            str(fname),
+            fname.suffix[1:].lower(),
+            instrument,
+            size,
+            module,
+            __version__,
+            duration,
+            peak_rss,
+            call["outcome"],
+        )
+        try:
+            _insert_row(row)
+        except sqlite3.Error as exception:
+            logger.warning("Could not record extraction statistics: %s", exception)
+
+
+def _since(days: Optional[float]) -> float:
+    """Get the timestamp ``days`` ago (or 0, to include everything)."""
+    return 0.0 if days is None else time.time() - days * 24 * 60 * 60
+
+
+def throughput(days: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Summarize the speed of each extractor (and of preview generation).
+
+    Parameters
+    ----------
+    days
+        Only include calls from this many days ago onwards (or all calls, if
+        ``None``)
+
+    Returns
+    -------
+    list of dict
+        For each operation and extractor ``module``: the number of ``calls``,
+        how many of those were ``failed`` (or raised an error), the number of
+        ``bytes`` processed, the ``total`` and ``mean`` duration and the
+        ``max_duration`` (in seconds), and the largest ``peak_rss`` (in
+        bytes). Calls that reused cached metadata or up-to-date previews are
+        not included, since they do not reflect the extractor's speed.
+    """
+    query = (
+        "SELECT operation, module, COUNT(*), "
+        "SUM(outcome IN ('failed', 'error')), COALESCE(SUM(size), 0), "
+        "SUM(duration), AVG(duration), MAX(duration), MAX(peak_rss) "
+        "FROM extraction_stats WHERE timestamp >= ? "
+        "AND outcome NOT IN ('cached', 'up_to_date') "
+        "GROUP BY operation, module ORDER BY SUM(duration) DESC"
+    )
+    keys = [
+        "operation",
+        "module",
+        "calls",
+        "failed",
+        "bytes",
+        "total",
+        "mean",
+        "max_duration",
+        "peak_rss",
+    ]
+    with _connect() as conn:
+        rows = conn.execute(query, (_since(days),)).fetchall()
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def slowest_files(limit: int = 10, days: Optional[float] = None) -> List[Dict]:
+    """
+    Find the calls that took the longest.
+
+    Parameters
+    ----------
+    limit
+        The number of calls to return
+    days
+        Only include calls from this many days ago onwards (or all calls, if
+        ``None``)
+
+    Returns
+    -------
+    list of dict
+        The ``path``, ``operation``, ``module``, ``size``, ``duration``,
+        ``peak_rss`` and ``outcome`` of each call, slowest first
+    """
+    keys = ["path", "operation", "module", "size", "duration", "peak_rss", "outcome"]
+    with _connect() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(keys)} FROM extraction_stats "  # noqa: S608
+            "WHERE timestamp >= ? ORDER BY duration DESC LIMIT ?",
+            (_since(days), limit),
+        ).fetchall()
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def mean_durations(days: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Get the mean time taken to extract (and preview) each type of file.
+
+    Parameters
+    ----------
+    days
+        Only include calls from this many days ago onwards (or all calls, if
+        ``None``)
+
+    Returns
+    -------
+    dict
+        For each operation, the mean duration (in seconds) of the calls that
+        extracted or rendered a file, by file extension (with the mean over
+        all extensions under the key ``"*"``)
+    """
+    query = (
+        "SELECT operation, extension, AVG(duration) FROM extraction_stats "
+        "WHERE timestamp >= ? AND outcome IN ('extracted', 'rendered') "
+        "GROUP BY operation, extension "
+        "UNION ALL SELECT operation, '*', AVG(duration) FROM extraction_stats "
+        "WHERE timestamp >= ? AND outcome IN ('extracted', 'rendered') "
+        "GROUP BY operation"
+    )
+    means: Dict[str, Dict[str, float]] = {"extraction": {}, "preview": {}}
+    with _connect() as conn:
+        for operation, extension, mean in conn.execute(
+            query,
+            (_since(days), _since(days)),
+        ):
+            means.setdefault(operation, {})[extension] = mean
+    return means
+
+
+def project_build_time(
+    sessions: Optional[List] = None,
+    days: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Estimate how long it will take to extract the files of the backlog.
+
+    The files of each session are found (as they would be by the record
+    builder), and each file is assumed to take as long as the mean time taken
+    so far to extract (and generate a preview for) files with the same
+    extension (or for all files, if there are no statistics for that
+    extension yet). This only covers metadata extraction and preview
+    generation, which take up most of the time it takes to build a record.
+
+    Parameters
+    ----------
+    sessions
+        The sessions to estimate the time for (by default, the sessions that
+        are waiting to be built; see
+        :py:func:`~nexusLIMS.db.session_handler.get_sessions_to_build`)
+    days
+        Only use statistics from this many days ago onwards (or all of them,
+        if ``None``)
+
+    Returns
+    -------
+    dict
+        The number of ``sessions``, ``files``, and ``bytes`` in the backlog,
+        the number of files with no statistics for their extension
+        (``unknown_files``), the estimated ``seconds`` to process them one at
+        a time, and the estimated ``wall_seconds`` when using the configured
+        number of extraction worker processes
+    """
+    # the record builder imports this module, so import it only when needed
+    from nexusLIMS.builder.record_builder import find_session_files, get_files
+    from nexusLIMS.db.session_handler import get_sessions_to_build
+
+    if sessions is None:
+        sessions = get_sessions_to_build()
+    means = mean_durations(days)
+    projection = {
+        "sessions": len(sessions),
+        "files": 0,
+        "bytes": 0,
+        "unknown_files": 0,
+        "seconds": 0.0,
+    }
+    for s, files in zip(sessions, find_session_files(sessions)):
+        if files is None:
+            path = Path(os.environ["mmfnexus_path"]) / s.instrument.filestore_path
+            try:
+                files = get_files(  # noqa: PLW2901
+                    path,
+                    s.dt_from,
+                    s.dt_to,
+                    instrument=s.instrument,
+                )
+            except (OSError, RuntimeError, CalledProcessError) as exception:
+                logger.warning("Could not find files for %s: %s", s, exception)
+                continue
+        for f in files:
+            extension = f.path.suffix[1:].lower()
+            if extension not in means["extraction"]:
+                projection["unknown_files"] += 1
+            for operation in ["extraction", "preview"]:
+                durations = means.get(operation, {})
+                projection["seconds"] += durations.get(
+                    extension,
+                    durations.get("*", 0.0),
+                )
+            projection["files"] += 1
+            projection["bytes"] += f.size
+    workers = max(1, get_env_int("NexusLIMS_extraction_workers", 0))
+    projection["wall_seconds"] = projection["seconds"] / workers
+    return projection
+
+
+def clear() -> int:
+    """
+    Remove all rows from the statistics table.
+
+    Returns
+    -------
+    int
+        The number of rows removed
+    """
+    with _connect() as conn, conn:
+        removed = conn.execute("DELETE FROM extraction_stats").rowcount
+    logger.info("Removed %i rows from the extraction statistics", removed)
+    return removed
+
+
+def _report(days: Optional[float], n_slowest: int, *, backlog: bool):
+    """Log a summary of the extraction statistics."""
+    logger.info("Throughput by extractor (%s):", get_stats_path())
+    for row in throughput(days):
+        logger.info(
+            "    %-10s %-45s %6i calls (%i failed) %8.1f s total, "
+            "%6.2f s mean, %6.2f s max, %7.1f MiB/s, peak RSS %.0f MiB",
+            row["operation"],
+            row["module"],
+            row["calls"],
+            row["failed"],
+            row["total"],
+            row["mean"],
+            row["max_duration"],
+            row["bytes"] / 2**20 / row["total"] if row["total"] else 0.0,
+            (row["peak_rss"] or 0) / 2**20,
+        )
+    logger.info("Slowest files:")
+    for row in slowest_files(n_slowest, days):
+        logger.info(
+            "    %8.2f s  %-10s %-10s %8.1f MiB  %s",
+            row["duration"],
+            row["operation"],
+            row["outcome"],
+            (row["size"] or 0) / 2**20,
+            row["path"],
+        )
+    if backlog:
+        projection = project_build_time(days=days)
+        logger.info(
+            "Backlog: %i sessions with %i files (%.1f GiB); estimated "
+            "extraction time %.1f h (%.1f h with the configured workers)",
+            projection["sessions"],
+            projection["files"],
+            projection["bytes"] / 2**30,
+            projection["seconds"] / 3600,
+            projection["wall_seconds"] / 3600,
+        )
+        if projection["unknown_files"]:
+            logger.info(
+                "    (%i files are of types with no statistics yet, so were "
+                "estimated using the mean of all files)",
+                projection["unknown_files"],
+            )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from nexusLIMS.utils import setup_loggers
+
+    parser = argparse.ArgumentParser(
+        description="Report on the NexusLIMS metadata extraction statistics",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Show the throughput of each extractor and the slowest files "
+        "(the default action)",
+    )
+    parser.add_argument(
+        "--days",
+        type=float,
+        help="Only include statistics from this many days ago onwards",
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=10,
+        help="The number of slowest files to show",
+    )
+    parser.add_argument(
+        "--backlog",
+        action="store_true",
+        help="Also estimate the time needed to extract the files of the "
+        "sessions waiting to be built (this searches for their files)",
+    )
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="Remove all statistics",
+    )
+    args = parser.parse_args()
+
+    setup_loggers(logging.INFO)
+    logger.setLevel(logging.INFO)
+
+    if args.clear:
+        clear()
+    else:
+        _report(args.days, args.slowest, backlog=args.backlog)
@@ -32,34 +32,67 @@ Data files are represented as either HyperSpy Signals, or as raw data files
 (in the case of tiff images)
 """
 import logging
+import math
+import os
 import shutil
 import tempfile
 import textwrap
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
-import hyperspy.api as hs_api
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 import numpy as np
-from hyperspy.drawing.marker import dict2marker
-from matplotlib.figure import Figure
-from matplotlib.offsetbox import AnchoredOffsetbox, OffsetImage
-from matplotlib.transforms import Bbox
-from PIL import Image, UnidentifiedImageError
-from skimage import transform
-from skimage.io import imread
-from skimage.transform import resize
+from PIL import Image, ImageDraw, ImageFont, UnidentifiedImageError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from matplotlib.figure import Figure
 
 try:
     _LANCZOS = Image.Resampling.LANCZOS
+    _NEAREST = Image.Resampling.NEAREST
 except AttributeError:  # pragma: no cover
     # above is deprecated as of Pillow 9.1.0
     _LANCZOS = Image.LANCZOS
+    _NEAREST = Image.NEAREST
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-mpl.use("Agg")
+
+RENDERER_VERSION = 1
+"""
+Version of the preview images produced by this module.
+
+This should be incremented whenever a change is made that alters the appearance
+of generated previews, so existing previews are regenerated (see
+:py:func:`nexusLIMS.extractors.create_preview`).
+"""
+
+THUMBNAIL_RENDERERS = ("matplotlib", "pillow")
+"""
+The renderers that can be used to draw previews of single images (see
+:ref:`NexusLIMS_thumbnail_renderer <NexusLIMS-thumbnail-renderer>`)
+"""
+
+# the percentiles of the data shown as black and white by the pillow renderer
+_CONTRAST_PERCENTILES = (0.5, 99.5)
+# the width (in pixels) of the previews drawn by the pillow renderer
+_PREVIEW_SIZE = 500
+_TITLE_FONT_SIZE = 14
+
+
+def _pyplot():
+    """
+    Import :py:mod:`matplotlib.pyplot`, using the non-interactive Agg backend.
+
+    Matplotlib, HyperSpy (for plotting) and scikit-image are slow to import, so
+    the functions of this module only import them when a preview is actually
+    generated, rather than whenever :py:mod:`nexusLIMS.extractors` is imported.
+    """
+    import matplotlib as mpl
+
+    mpl.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
 
 
 def _full_extent(axis, items, pad=0.0):
@@ -68,6 +101,8 @@ def _full_extent(axis, items, pad=0.0):
 
     Adapted from https://stackoverflow.com/a/26432947/1435788.
     """
+    from matplotlib.transforms import Bbox
+
     # For text objects, we need to draw the figure first, otherwise the extents
     # are undefined.
     axis.figure.canvas.draw()
@@ -112,8 +147,10 @@ def _get_visible_labels(axis):
     vis_labels_x, vis_labels_y : tuple of lists
         lists of only the label objects that are visible on the current axis
     """
-    vis_labels_x = mpl.cbook.silent_list("Text xticklabel")
-    vis_labels_y = mpl.cbook.silent_list("Text yticklabel")
+    from matplotlib import cbook
+
+    vis_labels_x = cbook.silent_list("Text xticklabel")
+    vis_labels_y = cbook.silent_list("Text yticklabel")
 
     for label in axis.get_xticklabels():
         label_pos = label.get_position()[0]
@@ -158,6 +195,10 @@ def _project_image_stack(s, num=5, dpi=92, v_shear=0.3, h_scale=0.3):
     output : :py:class:`numpy.ndarray`
         The `num` frames loaded into a single NumPy array for plotting
     """
+    import hyperspy.api as hs_api
+    from skimage import transform
+
+    plt = _pyplot()
     tmps = []
     for i in np.linspace(0, s.axes_manager.navigation_size - 1, num=num, dtype=int):
         hs_api.plot.plot_images(
@@ -438,6 +479,8 @@ def add_annotation_markers(s):
     s : :py:class:`hyperspy.signal.BaseSignal` (or subclass)
         The HyperSpy signal for which a thumbnail should be generated
     """
+    from hyperspy.drawing.marker import dict2marker
+
     # pylint: disable=broad-exception-caught
     # Parsing markers can potentially lead to errors, so to avoid
     # this any Exceptions are caught and logged instead of the files
@@ -483,14 +526,21 @@ def sig_to_thumbnail(s, out_path: Path, dpi: int = 92):
 
     Returns
     -------
-    f : :py:class:`matplotlib.figure.Figure`
-        Handle to a matplotlib Figure
+    f : :py:class:`matplotlib.figure.Figure` or :py:class:`PIL.Image.Image`
+        Handle to a matplotlib Figure (or the preview image, if it was drawn
+        with the ``pillow`` :ref:`thumbnail renderer
+        <NexusLIMS-thumbnail-renderer>`)
 
     Notes
     -----
     This method heavily utilizes HyperSpy's existing plotting functions to
-    figure out how to best display the image
+    figure out how to best display the image. Single images can instead be
+    drawn directly with Pillow, which is much faster (see
+    :ref:`NexusLIMS_thumbnail_renderer <NexusLIMS-thumbnail-renderer>`).
     """
+    import hyperspy.api as hs_api
+
+    plt = _pyplot()
     # close all currently open plots to ensure we don't leave a mess behind
     # in memory
     plt.close("all")
@@ -517,7 +567,7 @@ def text_to_thumbnail(
     f: Path,
     out_path: Path,
     output_size: int = 500,
-) -> Union[Figure, bool]:
+) -> Union["Figure", bool]:
     """
     Generate a preview thumbnail from a text file.
 
@@ -549,6 +599,7 @@ def text_to_thumbnail(
         Handle to a matplotlib Figure, or the value False if a preview could not be
         generated
     """
+    plt = _pyplot()
     # close all currently open plots to ensure we don't leave a mess behind
     # in memory
     plt.close("all")
@@ -694,6 +745,8 @@ def _plot_1d_signal(s, out_path, dpi):
 def _plot_2d_signal(s, out_path, dpi):
     # signal is single image
     if s.axes_manager.navigation_dimension == 0:
+        if _thumbnail_renderer() == "pillow" and _can_plot_with_pillow(s):
+            return _plot_single_image_pillow(s, out_path)
         return _plot_single_image(s, out_path, dpi)
 
     # we're looking at an image stack
@@ -705,6 +758,7 @@ def _plot_2d_signal(s, out_path, dpi):
 
 
 def _plot_spectrum(s, out_path, dpi):
+    plt = _pyplot()
     # pylint: disable=protected-access
     s.plot()
     # get signal plot figure
@@ -733,6 +787,12 @@ def _plot_linescan(s, out_path, dpi):
 
 
 def _plot_si(s, out_path, dpi):
+    import hyperspy.api as hs_api
+    from matplotlib.offsetbox import AnchoredOffsetbox, OffsetImage
+    from skimage.io import imread
+    from skimage.transform import resize
+
+    plt = _pyplot()
     nav_size = s.axes_manager.navigation_size
     max_nav_size = 9
 
@@ -782,6 +842,9 @@ def _plot_si(s, out_path, dpi):
 
 
 def _plot_single_image(s, out_path, dpi):
+    import hyperspy.api as hs_api
+
+    plt = _pyplot()
     # check to see if this is a dm3/dm4; if so try to plot with
     # annotations
     orig_fname = s.metadata.General.original_filename
@@ -807,7 +870,207 @@ def _plot_single_image(s, out_path, dpi):
     return f
 
 
+def _thumbnail_renderer() -> str:
+    """
+    Get the renderer used to draw previews of single images.
+
+    Returns
+    -------
+    str
+        The value of the :ref:`NexusLIMS_thumbnail_renderer
+        <NexusLIMS-thumbnail-renderer>` environment variable (one of
+        :py:data:`THUMBNAIL_RENDERERS`), or ``"matplotlib"`` if it is not set
+        to one of those
+    """
+    renderer = os.environ.get("NexusLIMS_thumbnail_renderer", "matplotlib").lower()
+    if renderer not in THUMBNAIL_RENDERERS:
+        logger.warning(
+            'Thumbnail renderer (env variable "NexusLIMS_thumbnail_renderer") had '
+            'an unexpected value: "%s". Setting value to "matplotlib".',
+            renderer,
+        )
+        renderer = "matplotlib"
+    return renderer
+
+
+def _can_plot_with_pillow(s) -> bool:
+    """
+    Check whether the preview of a single image can be drawn without matplotlib.
+
+    RGB images and DigitalMicrograph images with annotations (which are drawn
+    as HyperSpy markers) are left to matplotlib.
+    """
+    if s.data.dtype.names is not None:
+        return False
+    orig_fname = s.metadata.General.original_filename
+    if ".dm3" in orig_fname or ".dm4" in orig_fname:
+        # pylint: disable=broad-exception-caught
+        try:
+            return not _get_markers_dict(s, s.original_metadata.as_dictionary())
+        except Exception:
+            # there are no annotations that add_annotation_markers could draw
+            return True
+    return True
+
+
+def _preview_font(size: int):
+    """
+    Get a font of (about) the given size for text drawn with Pillow.
+
+    DejaVu Sans is used if it is installed; otherwise, Pillow's default font is
+    used (which can only be scaled in Pillow 10.1 and later).
+    """
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except (OSError, ImportError):
+        pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # pragma: no cover
+        # Pillow older than 10.1
+        return ImageFont.load_default()
+
+
+def _block_mean(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Down-sample a 2D array by averaging each ``factor`` x ``factor`` block.
+
+    Rows and columns at the end of the array that do not make up a full block
+    are dropped.
+    """
+    if factor <= 1:
+        return data
+    rows, cols = (dim // factor for dim in data.shape)
+    blocks = data[: rows * factor, : cols * factor].reshape(
+        rows,
+        factor,
+        cols,
+        factor,
+    )
+    return blocks.mean(axis=(1, 3))
+
+
+def _stretch_contrast(data: np.ndarray) -> np.ndarray:
+    """
+    Scale an image's values to 8-bit greyscale, between two percentiles.
+
+    The values below and above the :py:data:`_CONTRAST_PERCENTILES` are shown
+    as black and white; non-finite values are shown as black.
+    """
+    finite = np.isfinite(data)
+    if not finite.any():
+        return np.zeros(data.shape, dtype=np.uint8)
+    vmin, vmax = np.percentile(data[finite], _CONTRAST_PERCENTILES)
+    scaled = (data - vmin) / (vmax - vmin if vmax > vmin else 1)
+    scaled = np.clip(np.nan_to_num(scaled, nan=0.0, posinf=1.0, neginf=0.0), 0, 1)
+    return (scaled * 255).round().astype(np.uint8)
+
+
+def _draw_scalebar(image: Image.Image, s, data_width: int):
+    """
+    Draw a scalebar in the bottom left of an image, as HyperSpy does.
+
+    The scalebar's length is the "nice" number closest to (and below) a quarter
+    of the image's width. Nothing is drawn if the signal's axes have no units.
+
+    Parameters
+    ----------
+    image
+        The rendered image (which is drawn on)
+    s : :py:class:`hyperspy.signal.BaseSignal`
+        The signal the image was rendered from
+    data_width
+        The width (in pixels) of the signal's data
+    """
+    axis = s.axes_manager.signal_axes[0]
+    units = str(axis.units)
+    width = abs(axis.scale) * data_width
+    if units in ("", "<undefined>") or not np.isfinite(width) or width <= 0:
+        return
+    # the same as hyperspy.misc.math_tools.closest_nice_number
+    order = 10 ** math.floor(math.log10(width / 4))
+    length = order * (width / 4 // order)
+    bar_length = round(length / width * image.width)
+
+    draw = ImageDraw.Draw(image)
+    font = _preview_font(max(image.width // 30, 10))
+    x_0 = round(0.05 * image.width)
+    y_0 = round(0.95 * image.height)
+    line_width = max(image.height // 150, 2)
+    draw.line([(x_0, y_0), (x_0 + bar_length, y_0)], fill="white", width=line_width)
+    # centre the label just above the line
+    label = f"{length:g} {units}"
+    _, _, label_width, label_height = draw.textbbox((0, 0), label, font=font)
+    draw.text(
+        (x_0 + (bar_length - label_width) / 2, y_0 - 2 * line_width - label_height),
+        label,
+        fill="white",
+        font=font,
+    )
+
+
+def _plot_single_image_pillow(s, out_path):
+    """
+    Draw the preview of a single image with NumPy and Pillow.
+
+    This is a faster alternative to :py:func:`_plot_single_image` (which draws
+    a matplotlib figure) for the ``pillow`` :ref:`thumbnail renderer
+    <NexusLIMS-thumbnail-renderer>`. The image is down-sampled by averaging
+    blocks of pixels, its contrast is stretched (see
+    :py:data:`_CONTRAST_PERCENTILES`), and a scalebar and title are drawn.
+
+    Parameters
+    ----------
+    s : :py:class:`hyperspy.signal.BaseSignal`
+        The signal containing a single 2D image
+    out_path
+        A path to the desired thumbnail filename
+
+    Returns
+    -------
+    PIL.Image.Image
+        The preview image, before it was padded to square
+    """
+    data = np.asarray(s.data, dtype=np.float32)
+    factor = max(min(max(data.shape) // _PREVIEW_SIZE, min(data.shape)), 1)
+    image = Image.fromarray(_stretch_contrast(_block_mean(data, factor)))
+    ratio = _PREVIEW_SIZE / max(image.size)
+    image = image.resize(
+        tuple(max(round(dim * ratio), 1) for dim in image.size),
+        _NEAREST if ratio > 1 else _LANCZOS,
+    ).convert("RGB")
+    _draw_scalebar(image, s, data.shape[1])
+
+    # add the title above the image, with half a line of space around it
+    font = _preview_font(_TITLE_FONT_SIZE)
+    title = textwrap.fill(s.metadata.General.title, 60)
+    pad = _TITLE_FONT_SIZE // 2
+    title_width, title_height = 0, 0
+    if title:
+        _, _, title_width, title_height = ImageDraw.Draw(image).multiline_textbbox(
+            (0, 0),
+            title,
+            font=font,
+        )
+        title_width, title_height = title_width + 2 * pad, title_height + 2 * pad
+    width = max(image.width, title_width)
+    preview = Image.new("RGB", (width, image.height + title_height), "white")
+    if title:
+        ImageDraw.Draw(preview).multiline_text(
+            ((width - title_width) / 2 + pad, pad),
+            title,
+            fill="black",
+            font=font,
+            align="center",
+        )
+    preview.paste(image, ((width - image.width) // 2, title_height))
+    preview.save(out_path)
+    _pad_to_square(out_path, 500)
+    return preview
+
+
 def _plot_image_stack(s, out_path, dpi):
+    plt = _pyplot()
     plt.figure()
     plt.imshow(
         _project_image_stack(s, num=min(5, s.axes_manager.navigation_size), dpi=dpi),
@@ -835,6 +1098,9 @@ def _plot_image_stack(s, out_path, dpi):
 
 
 def _plot_tableau(s, out_path, dpi):
+    import hyperspy.api as hs_api
+
+    plt = _pyplot()
     asp_ratio = s.axes_manager.signal_shape[1] / s.axes_manager.signal_shape[0]
     f = plt.figure(figsize=(6, 6 * asp_ratio))
     if s.axes_manager.navigation_size >= 9:  # noqa: PLR2004
@@ -898,6 +1164,7 @@ def _plot_tableau(s, out_path, dpi):
 
 
 def _plot_complex_signal(s, out_path, dpi):
+    plt = _pyplot()
     # in tests, setting minimum to a percentile around 66% looks good
     s.amplitude.plot(
         interpolation="bilinear",
@@ -918,6 +1185,7 @@ def _plot_complex_signal(s, out_path, dpi):
 
 
 def _plot_axes_manager(s, out_path, dpi):
+    plt = _pyplot()
     f, mpl_axis = plt.subplots()
     mpl_axis.set_position([0, 0, 1, 1])
     mpl_axis.set_axis_off()
@@ -971,6 +1239,7 @@ def down_sample_image(
         results in an image that is 50% of each original dimension). Either
         this argument or ``output_size`` should be provided (not both).
     """
+    plt = _pyplot()
     if output_size is None and factor is None:
         msg = "One of output_size or factor must be provided"
         raise ValueError(msg)
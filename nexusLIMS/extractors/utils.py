@@ -32,17 +32,104 @@ import os
 import re
 import shutil
 import tarfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Dict, List, Optional
-
-from hyperspy.io_plugins.digital_micrograph import DigitalMicrographReader, ImageObject
+from typing import Any, Dict, Iterator, List, Optional
 
 from nexusLIMS.instruments import Instrument, get_instr_from_filepath
 from nexusLIMS.utils import set_nested_dict_value, try_getting_dict_value
 
 logger = logging.getLogger(__name__)
+_SHARED_SIGNALS = threading.local()
+
+
+@contextmanager
+def shared_signals() -> Iterator[None]:
+    """
+    Share the signals loaded from a file between metadata extraction and preview.
+
+    Within this context, each signal loaded with :py:func:`load_signal` (or
+    given to :py:func:`keep_signal`) is kept, and loading the same file (with
+    the same options) again returns that signal rather than opening and
+    parsing the file a second time. The signals are released when the
+    outermost context exits. Used by
+    :py:func:`~nexusLIMS.extractors.parse_metadata`, so that the preview of a
+    file is generated from the (lazily loaded) signal that was read to extract
+    its metadata. Signals are kept separately for each thread.
+
+    Since the signals are shared, extractors must not modify them (such as
+    their ``original_metadata``) in place.
+    """
+    outermost = getattr(_SHARED_SIGNALS, "signals", None) is None
+    if outermost:
+        _SHARED_SIGNALS.signals = {}
+    try:
+        yield
+    finally:
+        if outermost:
+            del _SHARED_SIGNALS.signals
+
+
+def _signal_key(fname: Path, options: Dict[str, Any]):
+    return Path(fname), tuple(sorted(options.items()))
+
+
+def load_signal(fname: Path, **options):
+    """
+    Lazily load a file with HyperSpy, reusing a shared signal if possible.
+
+    Parameters
+    ----------
+    fname
+        The file to load
+    **options
+        Other options for :py:func:`hyperspy.io.load` (the file is always
+        loaded with ``lazy=True``)
+
+    Returns
+    -------
+    hyperspy.signal.BaseSignal or list
+        The signal (or list of signals) in the file. Within
+        :py:func:`shared_signals`, this is the signal kept from an earlier
+        load of the same file, if any
+    """
+    signals = getattr(_SHARED_SIGNALS, "signals", None)
+    key = _signal_key(fname, options)
+    if signals is not None and key in signals:
+        logger.debug("Reusing signal loaded from %s", fname)
+        return signals[key]
+
+    from hyperspy.io import load as hs_load
+
+    s = hs_load(fname, lazy=True, **options)
+    if signals is not None:
+        signals[key] = s
+    return s
+
+
+def keep_signal(fname: Path, s, **options):
+    """
+    Share a signal read from a file (by other means than :py:func:`load_signal`).
+
+    Within :py:func:`shared_signals`, calling :py:func:`load_signal` with the
+    same arguments will return ``s``; outside of it, this does nothing.
+
+    Parameters
+    ----------
+    fname
+        The file the signal was read from
+    s : hyperspy.signal.BaseSignal
+        The (lazily loaded) signal
+    **options
+        The options with which :py:func:`load_signal` would load the same
+        signal from ``fname``
+    """
+    signals = getattr(_SHARED_SIGNALS, "signals", None)
+    if signals is not None:
+        signals[_signal_key(fname, options)] = s
 
 
 def _coerce_to_list(meta_key):
@@ -51,20 +138,28 @@ def _coerce_to_list(meta_key):
     return meta_key
 
 
-def _get_mtime_iso(filename: Path, instrument: Optional[Instrument] = None):
+def _get_mtime_iso(
+    filename: Path,
+    instrument: Optional[Instrument] = None,
+    mtime: Optional[float] = None,
+):
     return datetime.fromtimestamp(
-        os.path.getmtime(filename),
+        os.path.getmtime(filename) if mtime is None else mtime,
         tz=instrument.timezone if instrument else None,
     ).isoformat()
 
 
-def _set_instr_name_and_time(mdict: Dict, filename: Path):
+def _set_instr_name_and_time(
+    mdict: Dict,
+    filename: Path,
+    mtime: Optional[float] = None,
+):
     instr = get_instr_from_filepath(filename)
     # if we found the instrument, then store the name as string, else None
     instr_name = instr.name if instr is not None else None
 
     mdict["nx_meta"]["Instrument ID"] = instr_name
-    mdict["nx_meta"]["Creation Time"] = _get_mtime_iso(filename, instr)
+    mdict["nx_meta"]["Creation Time"] = _get_mtime_iso(filename, instr, mtime)
     mdict["nx_meta"]["warnings"] = []
 
 
@@ -319,6 +414,11 @@ def _zero_data_in_dm3(
     Path
         The path of the compressed (or zeroed) file
     """
+    from hyperspy.io_plugins.digital_micrograph import (
+        DigitalMicrographReader,
+        ImageObject,
+    )
+
     # zero out extent of data in DM3 file and compress to tar.gz:
     if not out_filename:
         mod_fname = filename.parent / (filename.stem + "_dataZeroed" + filename.suffix)
@@ -7,6 +7,7 @@ from typing import Dict, List, Optional, Tuple, Union
 from urllib.parse import parse_qs, urljoin, urlparse
 
 from nexusLIMS.db.session_handler import Session
+from nexusLIMS.utils import current_system_tz
 
 from .connector import NemoConnector
 
@@ -44,7 +45,7 @@ def add_all_usage_events_to_db(
     dt_from: datetime = None,
     dt_to: datetime = None,
     tool_id: Optional[Union[int, List[int]]] = None,
-):
+) -> Optional[datetime]:
     """
     Add all usage events to database for enabled NEMO connectors.
 
@@ -66,7 +67,15 @@ def add_all_usage_events_to_db(
         The tools(s) for which to add usage events. If ``'None'`` (default),
         the tool IDs for each instrument in the NexusLIMS DB will be extracted
         and used to limit the API response
+
+    Returns
+    -------
+    datetime.datetime or None
+        The start of the earliest usage event that had not ended yet (and so
+        was not added), if any. Since events are selected by their start time,
+        a later call must include this time to add the event once it has ended
     """
+    unfinished = []
     for nemo_connector in get_harvesters_enabled():
         events = nemo_connector.get_usage_events(
             user=user,
@@ -74,7 +83,12 @@ def add_all_usage_events_to_db(
             tool_id=tool_id,
         )
         for event in events:
+            if event["end"] is None:
+                # servers without a timezone give naive (local) times
+                start = nemo_connector.strptime(event["start"])
+                unfinished.append(start.astimezone(current_system_tz()))
             nemo_connector.write_usage_event_to_session_log(event["id"])
+    return min(unfinished, default=None)
 
 
 def get_usage_events_as_sessions(
@@ -42,13 +42,12 @@ import datetime
 import logging
 import os
 import sqlite3
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
 import pytz
 
-from nexusLIMS.utils import is_subpath
-
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -283,11 +282,104 @@ class Instrument:  # pylint: disable=too-many-instance-attributes
 
 instrument_db = _get_instrument_db()
 
+PATH_CACHE_SIZE = 4096
+"""
+The number of folders for which :py:func:`get_instr_from_filepath` remembers
+the matching instrument.
+"""
+
+# marks the trie nodes that are the filestore_path of an instrument
+_INSTRUMENT = object()
+# the index of the instruments' folders, keyed on the mmfnexus_path it was
+# built for
+_PATH_INDEX: Dict[str, "_InstrumentPathIndex"] = {}
+
+
+class _InstrumentPathIndex:
+    """
+    An index of instruments by the folder in which they save their files.
+
+    The folders are stored in a trie (keyed on each part of their paths), so
+    the instrument of a file can be found by walking the parts of its path,
+    rather than testing the folder of every instrument in turn. The instrument
+    found for each folder is also cached, since most files are in a folder
+    alongside many others.
+    """
+
+    def __init__(self, root: str, instruments: Iterable[Instrument]):
+        self.trie = {}
+        for instr in instruments:
+            if instr.filestore_path is None:
+                continue
+            node = self.trie
+            for part in (Path(root) / instr.filestore_path).parts:
+                node = node.setdefault(part, {})
+            # if instruments share a folder, the first one is used
+            node.setdefault(_INSTRUMENT, instr)
+        self.find = lru_cache(maxsize=PATH_CACHE_SIZE)(self._find)
+
+    def _find(self, folder: Path) -> Optional[Instrument]:
+        """Find the instrument of the deepest filestore_path containing a folder."""
+        node = self.trie
+        # only relative paths are in the current directory, which has no parts
+        found = None if folder.is_absolute() else node.get(_INSTRUMENT)
+        for part in folder.parts:
+            node = node.get(part)
+            if node is None:
+                break
+            found = node.get(_INSTRUMENT, found)
+        return found
+
+
+def _get_path_index() -> _InstrumentPathIndex:
+    root = os.environ["mmfnexus_path"]
+    index = _PATH_INDEX.get(root)
+    if index is None:
+        _PATH_INDEX.clear()
+        index = _InstrumentPathIndex(root, instrument_db.values())
+        _PATH_INDEX[root] = index
+    return index
+
+
+def reload_instrument_db() -> bool:
+    """
+    Re-read the instruments from the NexusLIMS database.
+
+    :py:data:`instrument_db` is updated in place, so modules that imported it
+    see the changes. Used by long-running processes (such as the
+    :py:mod:`record builder daemon <nexusLIMS.builder.daemon>`) to pick up
+    instruments that were added or changed after they started. This also
+    rebuilds the index used by :py:func:`get_instr_from_filepath`, so it
+    should be called after any other change to :py:data:`instrument_db`.
+
+    Returns
+    -------
+    bool
+        Whether the instruments changed (any other processes that read them
+        when they started, such as metadata extraction workers, are then out
+        of date)
+    """
+    new_db = _get_instrument_db()
+    changed = {name: vars(i) for name, i in new_db.items()} != {
+        name: vars(i) for name, i in instrument_db.items()
+    }
+    instrument_db.clear()
+    instrument_db.update(new_db)
+    _PATH_INDEX.clear()
+    return changed
+
 
 def get_instr_from_filepath(path: Path):
     """
     Get an instrument object by a given path Using the NexusLIMS database.
 
+    The instrument is the one whose ``filestore_path`` (within
+    :ref:`mmfnexus_path <mmfnexus-path>`) contains the file; if the folders of
+    several instruments contain it, the instrument with the deepest folder is
+    returned. The folders are indexed (and the result for each folder is
+    cached) the first time this is called, and again whenever
+    :py:func:`reload_instrument_db` is called or ``mmfnexus_path`` changes.
+
     Parameters
     ----------
     path
@@ -306,14 +398,7 @@ def get_instr_from_filepath(path: Path):
     >>> str(inst)
     'FEI-Titan-TEM-635816 in xxx/xxxx'
     """
-    for _, v in instrument_db.items():
-        if is_subpath(
-            path,
-            Path(os.environ["mmfnexus_path"]) / v.filestore_path,
-        ):
-            return v
-
-    return None
+    return _get_path_index().find(Path(path).parent)
 
 
 def get_instr_from_calendar_name(cal_name):
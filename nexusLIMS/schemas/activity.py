@@ -39,24 +39,22 @@ import os
 from datetime import datetime as dt
 from pathlib import Path
 from timeit import default_timer
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Union
 from urllib.parse import quote, unquote
 from xml.sax.saxutils import escape
 
 import numpy as np
 from lxml import etree
-from scipy.signal import argrelextrema
-from sklearn.model_selection import GridSearchCV, LeaveOneOut
-from sklearn.neighbors import KernelDensity
 
 from nexusLIMS.extractors import flatten_dict, parse_metadata
-from nexusLIMS.utils import current_system_tz
+from nexusLIMS.schemas import kde as fast_kde
+from nexusLIMS.utils import FileInfo, current_system_tz, get_env_bool
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def cluster_filelist_mtimes(filelist: List[str]) -> List[float]:
+def cluster_filelist_mtimes(filelist: List[Union[str, FileInfo]]) -> List[float]:
     """
     Cluster a list of files by modification time.
 
@@ -78,6 +76,14 @@ def cluster_filelist_mtimes(filelist: List[str]) -> List[float]:
     the distribution of the data itself, rather than a pre-supposed optimum.
     The KDE minima approach was suggested `here`_.
 
+    By default, the bandwidth selection and density estimation are computed
+    with :py:mod:`~nexusLIMS.schemas.kde`, which gives the same results as
+    scikit-learn's grid search in close to linear time (rather than fitting
+    a separate KDE for every file and bandwidth). If the
+    :ref:`NexusLIMS_clustering_method <NexusLIMS-clustering-method>`
+    environment variable is set to ``grid_search``, scikit-learn is used
+    instead.
+
     .. _Kernel Density Estimation: https://scikit-learn.org/stable/modules/density.html#kernel-density
     .. _grid search: https://scikit-learn.org/stable/modules/grid_search.html#grid-search
     .. _Leave One Out: https://scikit-learn.org/stable/modules/cross_validation.html#leave-one-out-loo
@@ -86,10 +92,12 @@ def cluster_filelist_mtimes(filelist: List[str]) -> List[float]:
 
     Parameters
     ----------
-    filelist : List[str]
+    filelist : List[Union[str, ~nexusLIMS.utils.FileInfo]]
         The files (as a list) whose timestamps will be interrogated to find
         "relatively" large gaps in acquisition time (as a means to find the
-        breaks between discrete Acquisition Activities)
+        breaks between discrete Acquisition Activities). If given as
+        :py:class:`~nexusLIMS.utils.FileInfo` objects, the modification times
+        they contain are used rather than reading them from the files again
 
     Returns
     -------
@@ -99,7 +107,9 @@ def cluster_filelist_mtimes(filelist: List[str]) -> List[float]:
     """  # noqa: E501
     logger.info("Starting clustering of file mtimes")
     start_timer = default_timer()
-    mtimes = sorted([os.path.getmtime(f) for f in filelist])
+    mtimes = sorted(
+        f.mtime if isinstance(f, FileInfo) else os.path.getmtime(f) for f in filelist
+    )
 
     # remove duplicate file mtimes (since they cause errors below):
     mtimes = sorted(set(mtimes))
@@ -125,26 +135,51 @@ def cluster_filelist_mtimes(filelist: List[str]) -> List[float]:
         35,
         base=math.e,
     )
-    logger.info("KDE bandwidth grid search")
-    grid = GridSearchCV(
-        KernelDensity(kernel="gaussian"),
-        {"bandwidth": bandwidths},
-        cv=LeaveOneOut(),
-        n_jobs=-1,
-    )
-    grid.fit(m_array)
-    bandwidth = grid.best_params_["bandwidth"]
-    logger.info("Using bandwidth of %.3f minutes for KDE", bandwidth)
-
-    # Calculate AcquisitionActivity boundaries by "clustering" the timestamps
-    # using KDE using KDTree nearest neighbor estimates, and the previously
-    # identified "optimal" bandwidth
-    kde = KernelDensity(kernel="gaussian", bandwidth=bandwidth)
-    kde: KernelDensity = kde.fit(m_array)
     s = np.linspace(m_array.min(), m_array.max(), num=len(mtimes) * 10)
-    scores = kde.score_samples(s.reshape(-1, 1))
 
-    mins = argrelextrema(scores, np.less)[0]  # the minima indices
+    method = os.environ.get("NexusLIMS_clustering_method", "fast").lower()
+    if method not in ["fast", "grid_search"]:
+        logger.warning(
+            'Clustering method (env variable "NexusLIMS_clustering_method") had '
+            'an unexpected value: "%s". Setting value to "fast".',
+            method,
+        )
+        method = "fast"
+
+    if method == "fast":
+        logger.info("KDE bandwidth selection")
+        m_flat = m_array.ravel()
+        bandwidth = fast_kde.select_bandwidth(m_flat, bandwidths)
+        logger.info("Using bandwidth of %.3f minutes for KDE", bandwidth)
+        scores = fast_kde.log_density(m_flat, bandwidth, s)
+    else:
+        # scikit-learn is slow to import, so only do so if it is used
+        from sklearn.model_selection import GridSearchCV, LeaveOneOut
+        from sklearn.neighbors import KernelDensity
+
+        logger.info("KDE bandwidth grid search")
+        grid = GridSearchCV(
+            KernelDensity(kernel="gaussian"),
+            {"bandwidth": bandwidths},
+            cv=LeaveOneOut(),
+            n_jobs=-1,
+        )
+        grid.fit(m_array)
+        bandwidth = grid.best_params_["bandwidth"]
+        logger.info("Using bandwidth of %.3f minutes for KDE", bandwidth)
+
+        # Calculate AcquisitionActivity boundaries by "clustering" the
+        # timestamps using KDE using KDTree nearest neighbor estimates, and the
+        # previously identified "optimal" bandwidth
+        kde = KernelDensity(kernel="gaussian", bandwidth=bandwidth)
+        kde: KernelDensity = kde.fit(m_array)
+        scores = kde.score_samples(s.reshape(-1, 1))
+
+    # the minima indices (the same as scipy.signal.argrelextrema(scores, np.less),
+    # without having to import SciPy)
+    mins = (
+        np.flatnonzero((scores[1:-1] < scores[:-2]) & (scores[1:-1] < scores[2:])) + 1
+    )
     aa_boundaries = [s[m] for m in mins]  # the minima mtime values
     end_timer = default_timer()
     logger.info(
@@ -304,13 +339,24 @@ class AcquisitionActivity:  # pylint: disable=too-many-instance-attributes
         """Return custom string representation of AcquisitionActivity."""
         return f"{self.start.isoformat()} AcquisitionActivity {self.mode}"
 
-    def add_file(self, fname: Path, *, generate_preview=True):
+    def add_file(
+        self,
+        fname: Path,
+        *,
+        generate_preview=True,
+        mtime: Optional[float] = None,
+        size: Optional[int] = None,
+    ):
         """
         Add file to AcquisitionActivity.
 
         Add a file to this activity's file list, parse its metadata (storing
         a flattened copy of it to this activity), generate a preview
-        thumbnail, get the file's type, and a lazy HyperSpy signal.
+        thumbnail, get the file's type, and a lazy HyperSpy signal. An existing
+        preview thumbnail is reused if the file has not changed since it was
+        generated, unless the ``NexusLIMS_force_preview_refresh`` environment
+        variable is set. As with any other file whose metadata cannot be read,
+        a warning is logged for a file that no longer exists.
 
         Parameters
         ----------
@@ -318,27 +364,59 @@ class AcquisitionActivity:  # pylint: disable=too-many-instance-attributes
             The file to be added to the file list
         generate_preview : bool
             Whether or not to create the preview thumbnail images
+        mtime
+            The modification time of the file, if already known (passed on to
+            :py:func:`~nexusLIMS.extractors.parse_metadata`)
+        size
+            The size of the file, if already known (passed on to
+            :py:func:`~nexusLIMS.extractors.parse_metadata`)
         """
-        if fname.exists():
-            self.files.append(str(fname))
-            gen_prev = generate_preview
-            meta, preview_fname = parse_metadata(fname, generate_preview=gen_prev)
-
-            if meta is None:
-                # Something bad happened, so we need to alert the user
-                logger.warning("Could not parse metadata of %s", fname)
-            else:
-                self.previews.append(preview_fname)
-                self.meta.append(flatten_dict(meta["nx_meta"]))
-                if "warnings" in meta["nx_meta"]:
-                    self.warnings.append(
-                        [" ".join(w) for w in meta["nx_meta"]["warnings"]],
-                    )
-                else:
-                    self.warnings.append([])
+        meta, preview_fname = parse_metadata(
+            fname,
+            generate_preview=generate_preview,
+            overwrite_preview=get_env_bool("NexusLIMS_force_preview_refresh"),
+            mtime=mtime,
+            size=size,
+        )
+        self.add_parsed_file(fname, meta, preview_fname)
+
+    def add_parsed_file(
+        self,
+        fname: Path,
+        meta: Optional[Dict[str, Any]],
+        preview_fname: Optional[Path],
+    ):
+        """
+        Add a file whose metadata has already been parsed to AcquisitionActivity.
+
+        Used by :py:meth:`add_file`, and directly by the record builder when
+        metadata extraction was performed elsewhere (such as in a worker process).
+
+        Parameters
+        ----------
+        fname
+            The file to be added to the file list
+        meta
+            The metadata dictionary for this file, as returned by
+            :py:func:`~nexusLIMS.extractors.parse_metadata` (only the ``nx_meta``
+            key is used). If None, a warning will be logged
+        preview_fname
+            The path to the preview image for this file (if any)
+        """
+        self.files.append(str(fname))
+
+        if meta is None:
+            # Something bad happened, so we need to alert the user
+            logger.warning("Could not parse metadata of %s", fname)
         else:
-            msg = f"{fname} was not found"
-            raise FileNotFoundError(msg)
+            self.previews.append(preview_fname)
+            self.meta.append(flatten_dict(meta["nx_meta"]))
+            if "warnings" in meta["nx_meta"]:
+                self.warnings.append(
+                    [" ".join(w) for w in meta["nx_meta"]["warnings"]],
+                )
+            else:
+                self.warnings.append([])
         logger.debug("appended %s to files", fname)
         logger.debug("self.files is now %s", self.files)
 
@@ -0,0 +1,343 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Fast one-dimensional Gaussian kernel density estimation.
+
+These functions compute the same quantities as scikit-learn's
+:py:class:`~sklearn.neighbors.KernelDensity` (with a Gaussian kernel) for
+one-dimensional data, as used to cluster file modification times in
+:py:func:`~nexusLIMS.schemas.activity.cluster_filelist_mtimes`, but in close
+to linear time:
+
+* Since the data are one-dimensional, they can be sorted, and the points that
+  contribute to the density at any location are found with a binary search.
+  All values are computed in log space, and the sum for each location only
+  includes points whose kernel value is within a factor of
+  ``exp(-LOG_KERNEL_CUTOFF)`` of the nearest point's, so the result matches
+  the exact value to floating point precision, even far from any data.
+* If a bandwidth is so large that each location would still need to include
+  many points (such as for a burst of thousands of files saved within a few
+  seconds), the data are first binned into bins of ``1/BINS_PER_BANDWIDTH``
+  of the bandwidth, with each bin represented by its centroid (which keeps
+  the binned density within about 0.1% of the exact value near the data).
+* Leave-one-out cross-validation of a bandwidth (which requires a separate
+  KDE fit for every point when done with scikit-learn) is computed directly,
+  by excluding each point from its own density estimate.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+LOG_KERNEL_CUTOFF = 50.0
+"""
+Points whose (log) kernel value at a location is this much smaller than that
+of the nearest point are left out of the density at that location.
+"""
+
+BINS_PER_BANDWIDTH = 64
+"""The number of bins per bandwidth used when the data need to be binned."""
+
+MAX_WORK_PER_POINT = 256
+"""
+If evaluating the exact density would require more than this many kernel
+evaluations per point on average, the data are binned first.
+"""
+
+_CHUNK_SIZE = 2**20
+
+
+def _bin(
+    x: np.ndarray,
+    width: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bin sorted data, representing each bin by the centroid of its points.
+
+    Parameters
+    ----------
+    x
+        The data (sorted in ascending order)
+    width
+        The width of each bin
+
+    Returns
+    -------
+    centers : numpy.ndarray
+        The centroid of the points in each (non-empty) bin
+    weights : numpy.ndarray
+        The number of points in each bin
+    bin_index : numpy.ndarray
+        The index of the bin each point of ``x`` belongs to
+    """
+    keys = np.floor((x - x[0]) / width).astype(np.int64)
+    _, starts, weights = np.unique(keys, return_index=True, return_counts=True)
+    bin_index = np.repeat(np.arange(len(starts)), weights)
+    centers = np.add.reduceat(x, starts) / weights
+    return centers, weights.astype(float), bin_index
+
+
+def _nearest_distance(
+    points: np.ndarray,
+    queries: np.ndarray,
+    exclude: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Find the distance from each query location to the nearest point.
+
+    Parameters
+    ----------
+    points
+        The (sorted) locations of the data points
+    queries
+        The locations to find the nearest point to
+    exclude
+        For each query, the index of a point to ignore (used to exclude a
+        point from its own leave-one-out density), or None
+
+    Returns
+    -------
+    numpy.ndarray
+        The distance to the nearest (non-excluded) point for each query
+    """
+    idx = np.searchsorted(points, queries)
+    nearest = np.full(len(queries), np.inf)
+    for offset in (-2, -1, 0, 1):
+        candidate = idx + offset
+        valid = (candidate >= 0) & (candidate < len(points))
+        if exclude is not None:
+            valid &= candidate != exclude
+        dist = np.abs(queries - points[np.clip(candidate, 0, len(points) - 1)])
+        nearest = np.where(valid, np.minimum(nearest, dist), nearest)
+    return nearest
+
+
+def _windows(
+    points: np.ndarray,
+    queries: np.ndarray,
+    bandwidth: float,
+    nearest: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the range of points that contribute to the density at each location.
+
+    Parameters
+    ----------
+    points
+        The (sorted) locations of the data points
+    queries
+        The locations at which the density will be evaluated
+    bandwidth
+        The kernel bandwidth
+    nearest
+        The distance from each query to the nearest point
+
+    Returns
+    -------
+    lo, hi : numpy.ndarray
+        For each query, the points ``points[lo:hi]`` are included
+    """
+    radius = np.sqrt(nearest**2 + 2 * LOG_KERNEL_CUTOFF * bandwidth**2)
+    lo = np.searchsorted(points, queries - radius, side="left")
+    hi = np.searchsorted(points, queries + radius, side="right")
+    return lo, hi
+
+
+def _log_kernel_sums(  # noqa: PLR0913
+    points: np.ndarray,
+    log_weights: np.ndarray,
+    queries: np.ndarray,
+    bandwidth: float,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    own_point: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Compute ``log(sum(w_j * exp(-(q - p_j)**2 / (2 * h**2))))`` for each query.
+
+    Parameters
+    ----------
+    points
+        The (sorted) locations of the data points
+    log_weights
+        The logarithm of the weight of each point
+    queries
+        The locations at which to evaluate the sums
+    bandwidth
+        The kernel bandwidth
+    lo, hi
+        The range of points to include for each query (see :py:func:`_windows`)
+    own_point
+        For leave-one-out estimates, the index of the point each query belongs
+        to, whose weight is reduced by one for that query
+
+    Returns
+    -------
+    numpy.ndarray
+        The log of the kernel sum at each query location
+    """
+    counts = hi - lo
+    result = np.empty(len(queries))
+    weighted = bool(np.any(log_weights))
+    if own_point is not None:
+        # the change in each point's log-weight when one of its points is left
+        # out (-inf for single points, which are left out entirely)
+        with np.errstate(divide="ignore"):
+            own_adjust = np.log(np.expm1(log_weights)) - log_weights
+    # process the queries in chunks to limit the memory used
+    chunk_ends = np.searchsorted(
+        np.cumsum(counts),
+        np.arange(_CHUNK_SIZE, counts.sum(), _CHUNK_SIZE),
+        side="right",
+    )
+    chunk_ends = np.unique(np.append(chunk_ends[chunk_ends > 0], len(queries)))
+    start = 0
+    for end in chunk_ends:
+        chunk = slice(start, end)
+        start = end
+        c_counts = counts[chunk]
+        seg_starts = np.concatenate(([0], np.cumsum(c_counts)[:-1]))
+        point_idx = np.repeat(lo[chunk] - seg_starts, c_counts)
+        point_idx += np.arange(len(point_idx))
+        terms = np.repeat(queries[chunk], c_counts)
+        terms -= points[point_idx]
+        terms *= terms
+        terms *= -0.5 / bandwidth**2
+        if weighted:
+            terms += log_weights[point_idx]
+        if own_point is not None:
+            # leave each query's own point out of its estimate
+            own = own_point[chunk]
+            offset = own - lo[chunk]
+            in_window = (offset >= 0) & (offset < c_counts)
+            terms[seg_starts[in_window] + offset[in_window]] += own_adjust[
+                own[in_window]
+            ]
+        maxes = np.maximum.reduceat(terms, seg_starts)
+        terms -= np.repeat(maxes, c_counts)
+        np.exp(terms, out=terms)
+        result[chunk] = maxes + np.log(np.add.reduceat(terms, seg_starts))
+    return result
+
+
+def log_density(x: np.ndarray, bandwidth: float, queries: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the log of a Gaussian KDE of one-dimensional data.
+
+    Equivalent to ``KernelDensity(bandwidth=bandwidth).fit(x).score_samples(queries)``
+    (with ``x`` and ``queries`` as column vectors).
+
+    Parameters
+    ----------
+    x
+        The (sorted, unique) data
+    bandwidth
+        The kernel bandwidth
+    queries
+        The locations at which to evaluate the density
+
+    Returns
+    -------
+    numpy.ndarray
+        The log of the density at each query location
+    """
+    x = np.asarray(x, dtype=float)
+    queries = np.asarray(queries, dtype=float)
+    points, weights = x, np.ones(len(x))
+    lo, hi = _windows(points, queries, bandwidth, _nearest_distance(points, queries))
+    if (hi - lo).sum() > MAX_WORK_PER_POINT * len(queries):
+        points, weights, _ = _bin(x, bandwidth / BINS_PER_BANDWIDTH)
+        nearest = _nearest_distance(points, queries)
+        lo, hi = _windows(points, queries, bandwidth, nearest)
+    sums = _log_kernel_sums(points, np.log(weights), queries, bandwidth, lo, hi)
+    return sums - math.log(len(x) * bandwidth * math.sqrt(2 * math.pi))
+
+
+def loo_log_likelihood(x: np.ndarray, bandwidth: float) -> float:
+    """
+    Compute the mean leave-one-out log-likelihood of a Gaussian KDE bandwidth.
+
+    This is the score that :py:class:`~sklearn.model_selection.GridSearchCV`
+    assigns to a :py:class:`~sklearn.neighbors.KernelDensity` bandwidth when
+    using :py:class:`~sklearn.model_selection.LeaveOneOut` cross-validation:
+    the average (over every point) of the log density at that point of a KDE
+    fit to all of the other points. If the data need to be binned, the
+    density is evaluated once per bin (at its centroid), with one point
+    removed from the bin's own weight.
+
+    Parameters
+    ----------
+    x
+        The (sorted, unique) data; must contain at least two values
+    bandwidth
+        The kernel bandwidth
+
+    Returns
+    -------
+    float
+        The mean leave-one-out log-likelihood
+    """
+    x = np.asarray(x, dtype=float)
+    points, weights, own = x, np.ones(len(x)), np.arange(len(x))
+    nearest = _nearest_distance(points, points, exclude=own)
+    lo, hi = _windows(points, points, bandwidth, nearest)
+    if (hi - lo).sum() > MAX_WORK_PER_POINT * len(x):
+        points, weights, _ = _bin(x, bandwidth / BINS_PER_BANDWIDTH)
+        own = np.arange(len(points))
+        # the nearest other point is in the bin itself if it has several points
+        nearest = _nearest_distance(
+            points,
+            points,
+            exclude=np.where(weights > 1, -1, own),
+        )
+        lo, hi = _windows(points, points, bandwidth, nearest)
+    sums = _log_kernel_sums(points, np.log(weights), points, bandwidth, lo, hi, own)
+    norm = math.log((len(x) - 1) * bandwidth * math.sqrt(2 * math.pi))
+    return float(np.average(sums, weights=weights) - norm)
+
+
+def select_bandwidth(x: np.ndarray, bandwidths: np.ndarray) -> float:
+    """
+    Choose the bandwidth with the best leave-one-out log-likelihood.
+
+    Parameters
+    ----------
+    x
+        The (sorted, unique) data; must contain at least two values
+    bandwidths
+        The candidate bandwidths
+
+    Returns
+    -------
+    float
+        The first of the ``bandwidths`` with the highest
+        :py:func:`loo_log_likelihood` (as chosen by
+        :py:class:`~sklearn.model_selection.GridSearchCV`)
+    """
+    scores = [loo_log_likelihood(x, h) for h in bandwidths]
+    return float(bandwidths[int(np.argmax(scores))])
@@ -0,0 +1,275 @@
+#  NIST Public License - 2023
+#
+#  This software was developed by employees of the National Institute of
+#  Standards and Technology (NIST), an agency of the Federal Government
+#  and is being made available as a public service. Pursuant to title 17
+#  United States Code Section 105, works of NIST employees are not subject
+#  to copyright protection in the United States.  This software may be
+#  subject to foreign copyright.  Permission in the United States and in
+#  foreign countries, to the extent that NIST may hold copyright, to use,
+#  copy, modify, create derivative works, and distribute this software and
+#  its documentation without fee is hereby granted on a non-exclusive basis,
+#  provided that this notice and disclaimer of warranty appears in all copies.
+#
+#  THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+#  EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+#  TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+#  IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE,
+#  AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE DOCUMENTATION
+#  WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE SOFTWARE WILL BE
+#  ERROR FREE.  IN NO EVENT SHALL NIST BE LIABLE FOR ANY DAMAGES, INCLUDING,
+#  BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR CONSEQUENTIAL DAMAGES,
+#  ARISING OUT OF, RESULTING FROM, OR IN ANY WAY CONNECTED WITH THIS SOFTWARE,
+#  WHETHER OR NOT BASED UPON WARRANTY, CONTRACT, TORT, OR OTHERWISE, WHETHER
+#  OR NOT INJURY WAS SUSTAINED BY PERSONS OR PROPERTY OR OTHERWISE, AND
+#  WHETHER OR NOT LOSS WAS SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF,
+#  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+#
+"""
+Strategies for splitting the files of a session into acquisition activities.
+
+Each strategy is a function that takes the files of a session (as paths or
+:py:class:`~nexusLIMS.utils.FileInfo` objects) and returns the boundaries
+between activities as a list of modification times, in the same way as
+:py:func:`~nexusLIMS.schemas.activity.cluster_filelist_mtimes` (files
+modified at or before the first boundary belong to the first activity, and
+so on). The strategies available are listed in :py:data:`strategies`:
+
+``kde``
+    :py:func:`~nexusLIMS.schemas.activity.cluster_filelist_mtimes` (the
+    default), which finds the minima of a kernel density estimate of the
+    modification times
+``gap_quantile``
+    :py:func:`gap_quantile_boundaries`, which splits the files at every gap
+    that is much longer than is typical for the session
+``changepoint``
+    :py:func:`changepoint_boundaries`, which goes through the files in order
+    and starts a new activity when the gap before a file is unusually long
+    compared to the gaps in the current activity
+
+The strategy used for each instrument is set with the
+:ref:`NexusLIMS_segmentation_strategy <NexusLIMS-segmentation-strategy>`
+environment variable.
+"""
+import json
+import logging
+import math
+import os
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from nexusLIMS.instruments import Instrument
+from nexusLIMS.schemas.activity import cluster_filelist_mtimes
+from nexusLIMS.utils import FileInfo
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRATEGY = "kde"
+"""The strategy used for instruments without a configured strategy."""
+
+
+def _sorted_mtimes(filelist: List[Union[str, FileInfo]]) -> np.ndarray:
+    """
+    Get the unique, sorted modification times of a list of files.
+
+    Parameters
+    ----------
+    filelist
+        The files (as paths or :py:class:`~nexusLIMS.utils.FileInfo` objects)
+
+    Returns
+    -------
+    numpy.ndarray
+        The sorted unique modification times
+    """
+    return np.unique(
+        [f.mtime if isinstance(f, FileInfo) else os.path.getmtime(f) for f in filelist],
+    )
+
+
+def gap_quantile_boundaries(
+    filelist: List[Union[str, FileInfo]],
+    *,
+    quantile: float = 0.75,
+    factor: float = 5.0,
+    min_gap: float = 30.0,
+) -> List[float]:
+    """
+    Split files into activities at unusually long gaps between files.
+
+    A gap between consecutive files (in modification time order) is treated as
+    a boundary between activities if it is longer than ``factor`` times the
+    ``quantile`` of all the gaps in the session, and longer than ``min_gap``
+    seconds. Each boundary is placed halfway through its gap.
+
+    Parameters
+    ----------
+    filelist
+        The files (as paths or :py:class:`~nexusLIMS.utils.FileInfo` objects)
+    quantile
+        The quantile of the gaps used as the "typical" gap
+    factor
+        How many times longer than the typical gap a boundary gap must be
+    min_gap
+        The minimum length of a boundary gap (in seconds)
+
+    Returns
+    -------
+    aa_boundaries : List[float]
+        The modification times of the boundaries between activities
+    """
+    mtimes = _sorted_mtimes(filelist)
+    if len(mtimes) < 2:  # noqa: PLR2004
+        return mtimes.tolist()
+    gaps = np.diff(mtimes)
+    threshold = max(factor * float(np.quantile(gaps, quantile)), min_gap)
+    split = np.nonzero(gaps > threshold)[0]
+    return ((mtimes[split] + mtimes[split + 1]) / 2).tolist()
+
+
+def changepoint_boundaries(
+    filelist: List[Union[str, FileInfo]],
+    *,
+    threshold: float = 3.0,
+    min_files: int = 5,
+    min_gap: float = 30.0,
+    fallback_gap: float = 300.0,
+) -> List[float]:
+    """
+    Split files into activities with a streaming changepoint detector.
+
+    The files are processed in modification time order, keeping the running
+    mean and standard deviation of the logarithm of the gaps between files in
+    the current activity. A file starts a new activity if the gap before it is
+    longer than ``min_gap`` seconds and its logarithm is more than
+    ``threshold`` standard deviations above the mean. Until the current
+    activity has ``min_files`` files, a new one is instead started by any gap
+    longer than ``fallback_gap`` seconds. This only needs a single pass over
+    the files, so it could also be run as files are created.
+
+    Parameters
+    ----------
+    filelist
+        The files (as paths or :py:class:`~nexusLIMS.utils.FileInfo` objects)
+    threshold
+        The number of standard deviations (of the log gaps) above the mean at
+        which a gap is considered a boundary
+    min_files
+        The number of files an activity needs before its gap statistics are
+        used
+    min_gap
+        The minimum length of a boundary gap (in seconds)
+    fallback_gap
+        The gap that starts a new activity while the current one has fewer
+        than ``min_files`` files (in seconds)
+
+    Returns
+    -------
+    aa_boundaries : List[float]
+        The modification times of the boundaries between activities
+    """
+    mtimes = _sorted_mtimes(filelist)
+    if len(mtimes) < 2:  # noqa: PLR2004
+        return mtimes.tolist()
+    boundaries = []
+    # running count, mean, and sum of squared deviations (Welford's algorithm)
+    count, mean, m2 = 0, 0.0, 0.0
+    for prev, mtime in zip(mtimes[:-1], mtimes[1:]):
+        gap = mtime - prev
+        log_gap = math.log(gap)
+        if count + 1 < min_files:
+            is_boundary = gap > fallback_gap
+        else:
+            std = math.sqrt(m2 / count) if count > 1 else 0.0
+            is_boundary = gap > min_gap and log_gap > mean + threshold * std
+        if is_boundary:
+            boundaries.append((prev + mtime) / 2)
+            count, mean, m2 = 0, 0.0, 0.0
+            continue
+        count += 1
+        delta = log_gap - mean
+        mean += delta / count
+        m2 += delta * (log_gap - mean)
+    return [float(b) for b in boundaries]
+
+
+strategies: Dict[str, Callable[[List[Union[str, FileInfo]]], List[float]]] = {
+    "kde": cluster_filelist_mtimes,
+    "gap_quantile": gap_quantile_boundaries,
+    "changepoint": changepoint_boundaries,
+}
+"""The available segmentation strategies, by name."""
+
+
+def get_strategy_name(instrument: Optional[Instrument] = None) -> str:
+    """
+    Get the name of the segmentation strategy to use for an instrument.
+
+    The :ref:`NexusLIMS_segmentation_strategy <NexusLIMS-segmentation-strategy>`
+    environment variable can either be the name of a strategy (used for all
+    instruments), or a JSON object mapping instrument names (or ``"default"``)
+    to strategy names. Unknown strategies (and values that are not valid JSON
+    or not strings) are logged and replaced by :py:data:`DEFAULT_STRATEGY`.
+
+    Parameters
+    ----------
+    instrument
+        The instrument whose files are being split into activities (if None,
+        the default strategy is returned)
+
+    Returns
+    -------
+    str
+        The name of the strategy (a key of :py:data:`strategies`)
+    """
+    setting = os.environ.get("NexusLIMS_segmentation_strategy", DEFAULT_STRATEGY)
+    name = setting
+    if setting.strip().startswith("{"):
+        try:
+            by_instrument = json.loads(setting)
+        except ValueError as exception:
+            logger.warning(
+                'Segmentation strategy (env variable "NexusLIMS_segmentation_'
+                'strategy") could not be read as JSON (%s). Setting value to "%s".',
+                exception,
+                DEFAULT_STRATEGY,
+            )
+            return DEFAULT_STRATEGY
+        default = by_instrument.get("default", DEFAULT_STRATEGY)
+        name = by_instrument.get(getattr(instrument, "name", None), default)
+    if isinstance(name, str):
+        name = name.strip().lower()
+    if not isinstance(name, str) or name not in strategies:
+        logger.warning(
+            'Segmentation strategy (env variable "NexusLIMS_segmentation_strategy") '
+            'had an unexpected value: "%s". Setting value to "%s".',
+            name,
+            DEFAULT_STRATEGY,
+        )
+        name = DEFAULT_STRATEGY
+    return name
+
+
+def find_activity_boundaries(
+    filelist: List[Union[str, FileInfo]],
+    instrument: Optional[Instrument] = None,
+) -> List[float]:
+    """
+    Find the boundaries between activities with an instrument's strategy.
+
+    Parameters
+    ----------
+    filelist
+        The files (as paths or :py:class:`~nexusLIMS.utils.FileInfo` objects)
+    instrument
+        The instrument the files are from (see :py:func:`get_strategy_name`)
+
+    Returns
+    -------
+    aa_boundaries : List[float]
+        The modification times of the boundaries between activities
+    """
+    name = get_strategy_name(instrument)
+    logger.info("Finding activity boundaries using the %s strategy", name)
+    return strategies[name](filelist)
@@ -26,6 +26,7 @@
 #  OR USE OF, THE SOFTWARE OR SERVICES PROVIDED HEREUNDER.
 #
 """Utility functions used in potentially multiple places by NexusLIMS."""
+import fnmatch
 import json
 import logging
 import os
@@ -33,12 +34,13 @@ import subprocess
 import tempfile
 import time
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from configparser import ConfigParser
 from datetime import datetime, timedelta, timezone
 from os.path import getmtime
 from pathlib import Path
 from shutil import copyfile
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import certifi
 from requests import Session
@@ -362,6 +364,87 @@ def try_getting_dict_value(dict_, key):
         return "not found"
 
 
+class FileInfo(NamedTuple):
+    """
+    A file found by one of the file-finding functions, along with its stat values.
+
+    Since the centralized file store is usually a network share, where every
+    ``stat`` call requires a round trip to the server, the file-finding
+    functions return the modification time and size of each file they find, so
+    these values do not need to be read again later in the record building
+    process.
+    """
+
+    path: Path
+    """The full path of the file"""
+    mtime: float
+    """The modification time of the file (as a POSIX timestamp)"""
+    size: int
+    """The size of the file (in bytes)"""
+
+    @classmethod
+    def from_path(cls, path: Path) -> "FileInfo":
+        """
+        Get the information for a file by reading its stat values.
+
+        Parameters
+        ----------
+        path
+            The file for which to get information
+
+        Returns
+        -------
+        FileInfo
+            The file's path, modification time, and size
+        """
+        stat = Path(path).stat()
+        return cls(Path(path), stat.st_mtime, stat.st_size)
+
+
+def _parse_find_timestamp(value: str) -> float:
+    """
+    Convert a timestamp printed by ``find -printf %T@`` to a float.
+
+    The conversion is done the same way Python computes ``st_mtime`` from the
+    underlying seconds and nanoseconds values, so the result will exactly match
+    the value returned by :py:func:`os.stat`.
+
+    Parameters
+    ----------
+    value
+        The timestamp string, such as ``"1542135335.3290690000"``
+
+    Returns
+    -------
+    float
+        The timestamp as a float
+    """
+    seconds, _, fraction = value.partition(".")
+    nanoseconds = int(fraction[:9].ljust(9, "0"))
+    return int(seconds) + nanoseconds * 1e-9
+
+
+def find_timestamp(value: datetime) -> float:
+    """
+    Convert a datetime to a POSIX timestamp, the same way ``find`` would.
+
+    Parameters
+    ----------
+    value
+        The datetime; if it is naive, it is adjusted by :py:data:`tz_offset`
+        and interpreted in the system's local time zone (as it would be by
+        :py:func:`gnu_find_file_info_by_mtime`)
+
+    Returns
+    -------
+    float
+        The timestamp, suitable for comparing with the
+        :py:attr:`FileInfo.mtime` of a file
+    """
+    value += tz_offset if value.tzinfo is None else timedelta(0)
+    return value.timestamp()
+
+
 def find_dirs_by_mtime(
     path: str,
     dt_from: datetime,
@@ -496,7 +579,124 @@ def gnu_find_files_by_mtime(
     last modified between the two. Uses the system-provided GNU ``find``
     command. In basic testing, this method was found to be approximately 3 times
     faster than using :py:meth:`find_files_by_mtime` (which is implemented in
-    pure Python).
+    pure Python). See :py:func:`gnu_find_file_info_by_mtime` for a version of
+    this function that also returns the modification time and size of each file.
+
+    Parameters
+    ----------
+    path
+        The root path from which to start the search, relative to
+        the :ref:`mmfnexus_path <mmfnexus-path>` environment setting.
+    dt_from
+        The "starting" point of the search timeframe
+    dt_to
+        The "ending" point of the search timeframe
+    extensions
+        A list of strings representing the extensions to find. If None,
+        all files between are found between the two times.
+    followlinks
+        Whether to follow symlinks using the ``find`` command via
+        the ``-H`` command line flag (see
+        :py:func:`gnu_find_file_info_by_mtime` for details)
+
+    Returns
+    -------
+    List[pathlib.Path]
+        A list of the files that have modification times within the
+        time range provided (sorted by modification time)
+
+    Raises
+    ------
+    RuntimeError
+        If the find command cannot be found, or running it results in output
+        to `stderr`
+    """
+    return [
+        f.path
+        for f in gnu_find_file_info_by_mtime(
+            path,
+            dt_from,
+            dt_to,
+            extensions,
+            followlinks=followlinks,
+        )
+    ]
+
+
+def _find_expression(
+    dt_from: datetime,
+    dt_to: datetime,
+    extensions: Optional[List[str]],
+) -> List[str]:
+    """
+    Build the tests and actions of a ``find`` command used to find files.
+
+    Parameters
+    ----------
+    dt_from
+        The "starting" point of the search timeframe
+    dt_to
+        The "ending" point of the search timeframe
+    extensions
+        The extensions to find (or None to find files with any extension)
+
+    Returns
+    -------
+    List[str]
+        The arguments to pass to ``find`` after the starting points
+    """
+    cmd = [
+        "-type",
+        "f",
+        "-newermt",
+        dt_from.isoformat(),
+        "-not",
+        "-newermt",
+        dt_to.isoformat(),
+    ]
+
+    # add extensions as -iname patterns to find arguments
+    if extensions is not None:
+        cmd += ["("]
+        for ext in extensions:
+            cmd += ["-iname", f"*.{ext}", "-o"]
+        cmd.pop()
+        cmd += [")"]
+
+    # if we need to ignore patterns, add them as an "and (-not -iname ...)"
+    # syntax as find arguments
+    if "NexusLIMS_ignore_patterns" in os.environ:
+        ignore_patterns = json.loads(os.environ.get("NexusLIMS_ignore_patterns"))
+        if ignore_patterns:
+            cmd += ["-and", "("]
+            for i in ignore_patterns:
+                cmd += ["-not", "-iname", i, "-and"]
+            cmd.pop()
+            cmd += [")"]
+
+    # add -printf at the end since it will preempt our filename patterns if we
+    # add it at the beginning; each file is output as its modification time,
+    # size, and path (separated by tabs), followed by a null character
+    cmd += ["-printf", "%T@\\t%s\\t%p\\0"]
+    return cmd
+
+
+def gnu_find_file_info_by_mtime(
+    path: Path,
+    dt_from: datetime,
+    dt_to: datetime,
+    extensions: Optional[List[str]] = None,
+    *,
+    followlinks: bool = True,
+) -> List[FileInfo]:
+    """
+    Find files (and their modification times and sizes) modified between two times.
+
+    Given two timestamps, find files under a path that were
+    last modified between the two. Uses the system-provided GNU ``find``
+    command, which also prints the modification time and size of each file it
+    finds, so that no further ``stat`` calls are needed to sort the files or
+    to use these values later on.
 
     Parameters
     ----------
@@ -518,11 +718,14 @@ def gnu_find_files_by_mtime(
         ``False``, no files will ever be found because the ``find``
         command will not "dereference" the symbolic links it finds.
         See comments in the code for more comments on implementation
-        of this feature.
+        of this feature. Each linked directory is searched by a separate
+        ``find`` process, with up to
+        :ref:`NexusLIMS_find_processes <NexusLIMS-find-processes>` of them
+        running at once.
 
     Returns
     -------
-    List[str]
+    List[FileInfo]
         A list of the files that have modification times within the
         time range provided (sorted by modification time)
 
@@ -597,50 +800,224 @@ def gnu_find_files_by_mtime(
     # Actually run find command (ignoring mib files if specified by
     # environment variable):
 
-    cmd = ["find", "-H" if followlinks else ""]
-    cmd += [str(p) for p in find_path]
-    cmd += [
-        "-type",
-        "f",
-        "-newermt",
-        dt_from.isoformat(),
-        "-not",
-        "-newermt",
-        dt_to.isoformat(),
-    ]
+    cmd = _find_expression(dt_from, dt_to, extensions)
 
-    # add extensions as -iname patterns to find arguments
-    if extensions is not None:
-        cmd += ["("]
-        for ext in extensions:
-            cmd += ["-iname", f"*.{ext}", "-o"]
-        cmd.pop()
-        cmd += [")"]
+    def _run_find(roots) -> bytes:
+        full_cmd = ["find", "-H" if followlinks else ""]
+        full_cmd += [str(p) for p in roots]
+        full_cmd += cmd
+        logger.info('Running via subprocess.run: "%s"', full_cmd)
+        logger.info(
+            'Running via subprocess.run (as string): "%s"',
+            " ".join(full_cmd),
+        )
+        return subprocess.run(full_cmd, capture_output=True, check=True).stdout
+
+    # when there are multiple roots (such as symlinks to separate volumes),
+    # search each with its own find process, so the total time is that of the
+    # slowest root rather than the sum of all of them
+    n_processes = min(
+        len(find_path),
+        get_env_int("NexusLIMS_find_processes", 4, minimum=1),
+    )
+    if n_processes > 1:
+        logger.info(
+            "Searching %i folders with up to %i concurrent find processes",
+            len(find_path),
+            n_processes,
+        )
+        with ThreadPoolExecutor(
+            max_workers=n_processes,
+            thread_name_prefix="gnu_find",
+        ) as executor:
+            outputs = list(executor.map(_run_find, [[p] for p in find_path]))
+    else:
+        outputs = [_run_find(find_path)]
+
+    files = {}
+    for line in (ln for out in outputs for ln in out.split(b"\x00")):
+        if len(line) > 0:
+            mtime, size, fname = line.decode().split("\t", 2)
+            # use a dictionary keyed by path to remove any duplicates
+            files[fname] = FileInfo(
+                Path(fname),
+                _parse_find_timestamp(mtime),
+                int(size),
+            )
+
+    # sort by mtime
+    files = sorted(files.values(), key=lambda f: f.mtime)
+    logger.info("Found %i files", len(files))
+    return files
 
-    # if we need to ignore patterns, add them as an "and (-not -iname ...)"
-    # syntax as find arguments
-    if "NexusLIMS_ignore_patterns" in os.environ:
-        ignore_patterns = json.loads(os.environ.get("NexusLIMS_ignore_patterns"))
-        if ignore_patterns:
-            cmd += ["-and", "("]
-            for i in ignore_patterns:
-                cmd += ["-not", "-iname", i, "-and"]
-            cmd.pop()
-            cmd += [")"]
 
-    # add -print0 at the end since it will preempt our filename
-    # patterns if we add it at the beginning
-    cmd += ["-print0"]
+def _get_ignore_patterns() -> List[str]:
+    """
+    Get the file name patterns to ignore when finding files.
 
-    logger.info('Running via subprocess.run: "%s"', cmd)
-    logger.info('Running via subprocess.run (as string): "%s"', " ".join(cmd))
-    out = subprocess.run(cmd, capture_output=True, check=True)
-    files = out.stdout.split(b"\x00")
-    files = [Path(f.decode()) for f in files if len(f) > 0]
+    Returns
+    -------
+    List[str]
+        The (lowercase) patterns from the ``NexusLIMS_ignore_patterns``
+        environment variable (empty if not set)
+    """
+    patterns = json.loads(os.environ.get("NexusLIMS_ignore_patterns", "[]"))
+    return [p.lower() for p in patterns or []]
 
-    # convert to set and back to remove duplicates and sort my mtime
-    files = list(set(files))
-    files.sort(key=getmtime)
+
+def _scandir_file_info(
+    directory: str,
+    ts_from: float,
+    ts_to: float,
+    name_filter,
+) -> Tuple[List[FileInfo], List[str], List[str]]:
+    """
+    List the matching files (and the subdirectories) of a single directory.
+
+    Parameters
+    ----------
+    directory
+        The directory to list
+    ts_from
+        Only files modified after this timestamp are included
+    ts_to
+        Only files modified at or before this timestamp are included
+    name_filter
+        A function that returns whether a file name should be included
+
+    Returns
+    -------
+    files : List[FileInfo]
+        The matching files in this directory
+    subdirs : List[str]
+        The subdirectories of this directory (not including symbolic links)
+    dir_links : List[str]
+        Any symbolic links to directories within this directory
+    """
+    files, subdirs, dir_links = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                if entry.is_dir():
+                    dir_links.append(entry.path)
+            elif entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and name_filter(entry.name):
+                # the stat result is cached by the DirEntry (and comes for
+                # free with the directory listing on some platforms)
+                stat = entry.stat(follow_symlinks=False)
+                if ts_from < stat.st_mtime <= ts_to:
+                    files.append(
+                        FileInfo(Path(entry.path), stat.st_mtime, stat.st_size),
+                    )
+    return files, subdirs, dir_links
+
+
+def scandir_find_file_info_by_mtime(
+    path: Path,
+    dt_from: datetime,
+    dt_to: datetime,
+    extensions: Optional[List[str]] = None,
+    *,
+    followlinks: bool = True,
+    n_threads: Optional[int] = None,
+) -> List[FileInfo]:
+    """
+    Find files (and their modification times and sizes) modified between two times.
+
+    A pure Python alternative to :py:func:`gnu_find_file_info_by_mtime` that
+    returns the same results without needing the GNU ``find`` command. The
+    tree is walked using :py:func:`os.scandir`, with sibling directories
+    listed concurrently on a pool of threads (which helps most on network file
+    systems, where each listing has a high latency). Each matching file is
+    ``stat``-ed only once, using the cached result of its directory entry.
+
+    Parameters
+    ----------
+    path
+        The root path from which to start the search, relative to
+        the :ref:`mmfnexus_path <mmfnexus-path>` environment setting.
+    dt_from
+        The "starting" point of the search timeframe
+    dt_to
+        The "ending" point of the search timeframe
+    extensions
+        A list of strings representing the extensions to find (matched
+        case-insensitively). If None, all files between are found between the
+        two times.
+    followlinks
+        Whether to follow symbolic links to directories in the same way as
+        :py:func:`gnu_find_file_info_by_mtime`: if any symbolic links to
+        directories are found within ``path``, only the folders they point to
+        are searched (and symbolic links within those are not followed);
+        otherwise, ``path`` itself is searched
+    n_threads
+        The number of threads used to list directories (if None, the default
+        of :py:class:`concurrent.futures.ThreadPoolExecutor` is used)
+
+    Returns
+    -------
+    List[FileInfo]
+        A list of the files that have modification times within the
+        time range provided (sorted by modification time)
+
+    Raises
+    ------
+    OSError
+        If a directory in the tree cannot be listed
+    """
+    logger.info("Using os.scandir to search for files")
+    ts_from = find_timestamp(dt_from)
+    ts_to = find_timestamp(dt_to)
+    ext_patterns = (
+        None if extensions is None else [f"*.{e.lower()}" for e in extensions]
+    )
+    ignore_patterns = _get_ignore_patterns()
+
+    def _name_filter(name: str) -> bool:
+        name = name.lower()
+        if ext_patterns is not None and not any(
+            fnmatch.fnmatchcase(name, p) for p in ext_patterns
+        ):
+            return False
+        return not any(fnmatch.fnmatchcase(name, p) for p in ignore_patterns)
+
+    def _walk(roots: List[str], executor) -> Tuple[List[FileInfo], List[str]]:
+        files, dir_links = [], []
+        futures = {
+            executor.submit(_scandir_file_info, r, ts_from, ts_to, _name_filter)
+            for r in roots
+        }
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_files, subdirs, links = future.result()
+                files.extend(dir_files)
+                dir_links.extend(links)
+                futures.update(
+                    executor.submit(
+                        _scandir_file_info,
+                        d,
+                        ts_from,
+                        ts_to,
+                        _name_filter,
+                    )
+                    for d in subdirs
+                )
+        return files, dir_links
+
+    root = str(Path(os.environ["mmfnexus_path"]) / path)
+    with ThreadPoolExecutor(
+        max_workers=n_threads,
+        thread_name_prefix="scandir_find",
+    ) as executor:
+        files, dir_links = _walk([root], executor)
+        if followlinks and dir_links:
+            logger.info('Found the following symlinks: "%s"', dir_links)
+            files, _ = _walk(dir_links, executor)
+
+    # use a dictionary keyed by path to remove any duplicates, then sort by mtime
+    files = sorted({f.path: f for f in files}.values(), key=lambda f: f.mtime)
     logger.info("Found %i files", len(files))
     return files
 
@@ -893,6 +1270,94 @@ def has_delay_passed(date: datetime) -> bool:
     return delta > delay
 
 
+def get_env_int(name: str, default: int, minimum: int = 0) -> int:
+    """
+    Get an integer-valued setting from the environment.
+
+    If the variable is not set, the default is returned. If it is set to a value that
+    cannot be understood as an integer (or is less than ``minimum``), a warning is
+    logged and the default is returned instead.
+
+    Parameters
+    ----------
+    name
+        The name of the environment variable to read
+    default
+        The value to use if the variable is not set or cannot be used
+    minimum
+        The smallest value that will be accepted
+
+    Returns
+    -------
+    int
+        The value of the setting
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        logger.warning(
+            "The environment variable value of %s (%s) could not be understood as "
+            "an integer, so using the default of %i.",
+            name,
+            value,
+            default,
+        )
+        return default
+    if value < minimum:
+        logger.warning(
+            "The environment variable value of %s (%i) was less than %i, so using "
+            "the default of %i.",
+            name,
+            value,
+            minimum,
+            default,
+        )
+        return default
+    return value
+
+
+def get_env_bool(name: str, *, default: bool = False) -> bool:
+    """
+    Get a boolean (on/off) setting from the environment.
+
+    Values of ``1``, ``true``, ``yes``, or ``on`` (case-insensitive) are
+    treated as ``True``, and ``0``, ``false``, ``no``, ``off``, or an empty
+    string as ``False``. If the variable is not set, the default is returned;
+    if it is set to any other value, a warning is logged and the default is
+    returned instead.
+
+    Parameters
+    ----------
+    name
+        The name of the environment variable to read
+    default
+        The value to use if the variable is not set or cannot be used
+
+    Returns
+    -------
+    bool
+        The value of the setting
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    if value.strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.strip().lower() in ("", "0", "false", "no", "off"):
+        return False
+    logger.warning(
+        "The environment variable value of %s (%s) could not be understood as "
+        "true or false, so using the default of %s.",
+        name,
+        value,
+        default,
+    )
+    return default
+
+
 def current_system_tz():
     """Get the current system timezone information."""
     return (
@@ -8,21 +8,35 @@ import filecmp
 import json
 import logging
 import os
+import sqlite3
+import struct
+import sys
+import time
 from datetime import datetime as dt
 from pathlib import Path
+from types import SimpleNamespace
 
 import hyperspy.api as hs
 import numpy as np
 import pytest
+from PIL import Image
 
 import nexusLIMS
 from nexusLIMS import instruments
 from nexusLIMS.extractors import (
+    FINGERPRINT_CHUNK_SIZE,
     PLACEHOLDER_PREVIEW,
+    RENDERER_VERSION,
+    _file_fingerprint,
+    cache,
+    create_preview,
     digital_micrograph,
+    dm_tags,
     fei_emi,
     flatten_dict,
     parse_metadata,
+    quanta_tif,
+    stats,
     thumbnail_generator,
 )
 from nexusLIMS.extractors.basic_metadata import get_basic_metadata
@@ -34,7 +48,13 @@ from nexusLIMS.extractors.thumbnail_generator import (
     sig_to_thumbnail,
     text_to_thumbnail,
 )
-from nexusLIMS.extractors.utils import _try_decimal, _zero_data_in_dm3
+from nexusLIMS.extractors.utils import (
+    _try_decimal,
+    _zero_data_in_dm3,
+    keep_signal,
+    load_signal,
+    shared_signals,
+)
 from nexusLIMS.version import __version__
 
 from .utils import assert_images_equal, get_full_file_path
@@ -280,6 +300,72 @@ class TestThumbnailGenerator:  # pylint: disable=too-many-public-methods
         with pytest.raises(AssertionError):
             assert_images_equal(image_thumb_source_tif, quanta_test_file[0])
 
+    @pytest.fixture()
+    def image_signal(self):
+        y, x = np.mgrid[0:1200, 0:900]
+        s = hs.signals.Signal2D((np.sin(x / 40) * np.cos(y / 60)).astype("float32"))
+        for axis in s.axes_manager.signal_axes:
+            axis.scale, axis.units = 0.5, "nm"
+        s.metadata.General.title = "Pillow preview"
+        s.metadata.General.original_filename = "pillow_preview.tif"
+        return s
+
+    def test_pillow_renderer(self, monkeypatch, image_signal, tmp_path):
+        monkeypatch.setenv("NexusLIMS_thumbnail_renderer", "pillow")
+
+        def fail(*_):
+            msg = "matplotlib should not be used"
+            raise AssertionError(msg)
+
+        monkeypatch.setattr(thumbnail_generator, "_plot_single_image", fail)
+        out_path = tmp_path / "pillow_preview.png"
+        preview = sig_to_thumbnail(image_signal, out_path)
+        # the title is drawn above the (down-sampled) image
+        assert preview.size[0] == 375
+        assert preview.size[1] > 500
+        with Image.open(out_path) as image:
+            assert image.size == (500, 500)
+
+    def test_pillow_renderer_fallback(self, monkeypatch, image_signal, caplog):
+        rendered = []
+        monkeypatch.setattr(
+            thumbnail_generator,
+            "_plot_single_image",
+            lambda *_: rendered.append("matplotlib"),
+        )
+        monkeypatch.setattr(
+            thumbnail_generator,
+            "_plot_single_image_pillow",
+            lambda *_: rendered.append("pillow"),
+        )
+        monkeypatch.setenv("NexusLIMS_thumbnail_renderer", "bogus")
+        sig_to_thumbnail(image_signal, Path("unused.png"))
+        assert "unexpected value" in caplog.text
+        monkeypatch.setenv("NexusLIMS_thumbnail_renderer", "pillow")
+        sig_to_thumbnail(image_signal, Path("unused.png"))
+        # RGB images are always drawn with matplotlib
+        rgb = hs.signals.Signal1D(np.zeros((4, 4, 3), dtype="uint8"))
+        rgb.change_dtype("rgb8")
+        rgb.metadata.General.original_filename = "rgb.png"
+        sig_to_thumbnail(rgb, Path("unused.png"))
+        assert rendered == ["matplotlib", "pillow", "matplotlib"]
+
+    def test_block_mean_and_contrast(self):
+        data = np.arange(20, dtype="float32").reshape(4, 5)
+        assert thumbnail_generator._block_mean(data, 2).tolist() == [  # noqa: SLF001
+            [3.0, 5.0],
+            [13.0, 15.0],
+        ]
+        data[0, 0] = np.nan
+        stretched = thumbnail_generator._stretch_contrast(data)  # noqa: SLF001
+        assert stretched.dtype == np.uint8
+        assert stretched[0, 0] == 0
+        assert stretched[0, 1] == 0
+        assert stretched[-1, -1] == 255
+        assert not thumbnail_generator._stretch_contrast(  # noqa: SLF001
+            np.full((2, 2), np.nan),
+        ).any()
+
 
 class TestExtractorModule:
     """Tests the methods from __init__.py of nexusLIMS.extractors."""
@@ -421,6 +507,11 @@ class TestExtractorModule:
 
         self.remove_thumb_and_json(thumb_fname)
 
+    def test_parse_metadata_missing_file(self, caplog, tmp_path):
+        missing = tmp_path / "missing.txt"
+        assert parse_metadata(missing, size=0) == (None, None)
+        assert f"{missing} was not found" in caplog.text
+
     def test_parse_metadata_bad_ser(self, fei_ser_files):
         # if we find a bad ser that can't be read, we should get minimal
         # metadata and a placeholder thumbnail image
@@ -518,6 +609,128 @@ class TestExtractorModule:
         )
         assert meta["nx_meta"]["NexusLIMS Extraction"]["Version"] == __version__
 
+    def test_create_preview_manifest(self, monkeypatch, tmp_path, caplog):
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmf"))
+        monkeypatch.setenv("nexusLIMS_path", str(tmp_path / "nexusLIMS"))
+        fname = tmp_path / "mmf" / "preview_test.txt"
+        fname.parent.mkdir()
+        fname.write_text("Some text\nfor a preview")
+        manifest = tmp_path / "nexusLIMS" / "preview_test.txt.thumb.json"
+        manifest.parent.mkdir()
+        nexusLIMS.extractors.logger.setLevel(logging.INFO)
+
+        preview = create_preview(fname, overwrite=False)
+        assert preview.is_file()
+        with manifest.open(encoding="utf-8") as f:
+            assert json.load(f)["renderer_version"] == RENDERER_VERSION
+
+        # an unchanged file reuses the existing preview
+        assert create_preview(fname, overwrite=False) == preview
+        assert "Preview is up to date" in caplog.text
+
+        # forcing a refresh, changing the file, or changing the renderer
+        # version will all regenerate the preview
+        caplog.clear()
+        create_preview(fname, overwrite=True)
+        fname.write_text("Some different text")
+        create_preview(fname, overwrite=False)
+        monkeypatch.setattr(
+            nexusLIMS.extractors,
+            "RENDERER_VERSION",
+            RENDERER_VERSION + 1,
+        )
+        create_preview(fname, overwrite=False)
+        assert "Preview is up to date" not in caplog.text
+        with manifest.open(encoding="utf-8") as f:
+            assert json.load(f)["renderer_version"] == RENDERER_VERSION + 1
+
+    @pytest.fixture()
+    def signal_preview(self, monkeypatch, tmp_path):
+        """Make a .dm3 file whose (mocked) signal previews are counted."""
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmf"))
+        monkeypatch.setenv("nexusLIMS_path", str(tmp_path / "nexusLIMS"))
+        fname = tmp_path / "mmf" / "preview_test.dm3"
+        fname.parent.mkdir()
+        fname.write_text("not really a dm3 file")
+        preview = tmp_path / "nexusLIMS" / "preview_test.dm3.thumb.png"
+        preview.parent.mkdir()
+        rendered = []
+
+        def mock_sig_to_thumbnail(_s, out_path):
+            rendered.append(out_path)
+            out_path.write_bytes(b"rendered")
+
+        signal = SimpleNamespace(
+            metadata=SimpleNamespace(
+                General=SimpleNamespace(title="test", original_filename=fname.name),
+            ),
+            compute=lambda **_: None,
+        )
+        monkeypatch.setattr(nexusLIMS.extractors, "load_signal", lambda *_: signal)
+        monkeypatch.setattr(
+            nexusLIMS.extractors,
+            "sig_to_thumbnail",
+            mock_sig_to_thumbnail,
+        )
+        return fname, preview, rendered
+
+    def test_create_preview_without_manifest(self, signal_preview):
+        fname, preview, rendered = signal_preview
+        # a preview made before manifests were written is regenerated once
+        preview.write_bytes(b"legacy")
+        assert create_preview(fname, overwrite=False) == preview
+        assert preview.read_bytes() == b"rendered"
+        assert preview.with_suffix(".json").is_file()
+        create_preview(fname, overwrite=False)
+        assert rendered == [preview]
+
+    def test_create_preview_renderer_change(self, monkeypatch, signal_preview):
+        fname, preview, rendered = signal_preview
+        monkeypatch.setenv("NexusLIMS_thumbnail_renderer", "matplotlib")
+        create_preview(fname, overwrite=False)
+        create_preview(fname, overwrite=False)
+        assert rendered == [preview]
+
+        # previews are regenerated with a newly selected renderer
+        monkeypatch.setenv("NexusLIMS_thumbnail_renderer", "pillow")
+        create_preview(fname, overwrite=False)
+        assert rendered == [preview, preview]
+        assert json.loads(preview.with_suffix(".json").read_text())["renderer"] == (
+            "pillow"
+        )
+        create_preview(fname, overwrite=False)
+        assert rendered == [preview, preview]
+
+    def test_create_preview_after_placeholder(self, monkeypatch, signal_preview):
+        fname, preview, rendered = signal_preview
+        load_signal = nexusLIMS.extractors.load_signal
+
+        def fail(*_):
+            msg = "Mocked load error"
+            raise ValueError(msg)
+
+        # a placeholder is used if the file cannot be loaded...
+        monkeypatch.setattr(nexusLIMS.extractors, "load_signal", fail)
+        assert create_preview(fname, overwrite=False) == preview
+        assert filecmp.cmp(preview, PLACEHOLDER_PREVIEW, shallow=False)
+        assert not preview.with_suffix(".json").exists()
+
+        # ...and the preview is generated once the file can be loaded
+        monkeypatch.setattr(nexusLIMS.extractors, "load_signal", load_signal)
+        assert create_preview(fname, overwrite=False) == preview
+        assert rendered == [preview]
+        assert preview.with_suffix(".json").is_file()
+
+    def test_file_fingerprint(self, tmp_path):
+        fname = tmp_path / "large_file.bin"
+        data = bytearray(3 * FINGERPRINT_CHUNK_SIZE)
+        fname.write_bytes(data)
+        fingerprint = _file_fingerprint(fname, len(data))
+        assert fingerprint == _file_fingerprint(fname, len(data))
+        data[-1] = 1
+        fname.write_bytes(data)
+        assert _file_fingerprint(fname, len(data)) != fingerprint
+
     def test_flatten_dict(self):
         dict_to_flatten = {
             "level1.1": "level1.1v",
@@ -528,6 +741,349 @@ class TestExtractorModule:
         assert flattened == {"level1.1": "level1.1v", "level1.2 level2.1": "level2.1v"}
 
 
+class TestExtractionCache:
+    """Tests the extraction cache in nexusLIMS.extractors.cache."""
+
+    @pytest.fixture()
+    def cache_db(self, monkeypatch, tmp_path):
+        # the cache is created next to the NexusLIMS DB, so point that to tmp_path
+        monkeypatch.setenv("nexusLIMS_db_path", str(tmp_path / "nexuslims_db.sqlite"))
+        return tmp_path / cache.CACHE_FILENAME
+
+    def test_parse_metadata_uses_cache(self, monkeypatch, tmp_path, cache_db):
+        monkeypatch.setenv("NexusLIMS_extraction_cache", "true")
+        fname = tmp_path / "basic_test_no_extension"
+        fname.write_text("some data")
+
+        meta, _ = parse_metadata(fname=fname, write_output=False)
+        assert cache_db.is_file()
+        assert cache.cache_stats()["entries"] == 1
+
+        # an identical extraction date shows the file was not extracted again
+        meta_cached, _ = parse_metadata(fname=fname, write_output=False)
+        assert meta_cached == meta
+
+        # changing the file's modification time causes a new extraction that
+        # replaces the previous entry
+        mtime = fname.stat().st_mtime_ns
+        os.utime(fname, ns=(mtime - 10**9, mtime - 10**9))
+        meta_changed, _ = parse_metadata(fname=fname, write_output=False)
+        assert (
+            meta_changed["nx_meta"]["NexusLIMS Extraction"]["Date"]
+            != meta["nx_meta"]["NexusLIMS Extraction"]["Date"]
+        )
+        assert cache.cache_stats()["entries"] == 1
+
+    def test_parse_metadata_cache_disabled(self, monkeypatch, tmp_path, cache_db):
+        monkeypatch.delenv("NexusLIMS_extraction_cache", raising=False)
+        fname = tmp_path / "basic_test_no_extension"
+        fname.write_text("some data")
+        parse_metadata(fname=fname, write_output=False)
+        assert not cache_db.exists()
+
+    @pytest.mark.usefixtures("cache_db")
+    def test_cache_management(self, tmp_path):
+        module = "nexusLIMS.extractors.basic_metadata"
+        files = [tmp_path / "a" / "1.txt", tmp_path / "a" / "2.txt", tmp_path / "b.txt"]
+        for f in files:
+            f.parent.mkdir(exist_ok=True)
+            f.write_text("data")
+            assert cache.cache_metadata(
+                f,
+                module,
+                {"nx_meta": {"f": f.name}},
+            )
+
+        assert cache.get_cached_metadata(files[0], module) == {
+            "nx_meta": {"f": "1.txt"},
+        }
+        assert cache.get_cached_metadata(files[0], "other") is None
+        assert cache.cache_stats()["modules"] == {module: 3}
+
+        # invalidating a directory removes the entries of all files within it
+        assert cache.invalidate([tmp_path / "a"]) == 2
+        assert cache.get_cached_metadata(files[0], module) is None
+
+        # entries were just used, so nothing should be evicted
+        assert cache.evict_older_than(1) == 0
+        assert cache.evict_older_than(-1) == 1
+
+        # changed and deleted files are pruned
+        for f in files:
+            cache.cache_metadata(f, module, {"nx_meta": {}})
+        files[0].write_text("changed data")
+        files[1].unlink()
+        assert cache.prune() == 2
+        assert cache.get_cached_metadata(files[2], module) is not None
+
+        assert cache.clear() == 1
+        assert cache.cache_stats()["entries"] == 0
+
+    def test_cache_format_and_paths(self, monkeypatch, tmp_path, cache_db):
+        module = "nexusLIMS.extractors.basic_metadata"
+        monkeypatch.chdir(tmp_path)
+        Path("1.txt").write_text("data")
+
+        # metadata is stored as JSON, under the absolute path of the file
+        assert cache.cache_metadata(
+            Path("1.txt"),
+            module,
+            {"nx_meta": {"n": np.int64(3), "shape": np.arange(2)}},
+        )
+        with sqlite3.connect(cache_db) as conn:
+            path, metadata = conn.execute(
+                "SELECT path, metadata FROM extraction_cache",
+            ).fetchone()
+        assert path == str(tmp_path / "1.txt")
+        assert json.loads(metadata) == {"nx_meta": {"n": 3, "shape": [0, 1]}}
+        assert cache.get_cached_metadata(tmp_path / "1.txt", module) == {
+            "nx_meta": {"n": 3, "shape": [0, 1]},
+        }
+        assert not cache.cache_metadata(Path("1.txt"), module, {"x": object()})
+
+        # entries that are not JSON (from older versions) are not used
+        with sqlite3.connect(cache_db) as conn:
+            conn.execute("UPDATE extraction_cache SET metadata = ?", (b"\x80\x05",))
+        assert cache.get_cached_metadata(Path("1.txt"), module) is None
+
+        assert cache.invalidate(["1.txt"]) == 1
+        assert cache.cache_stats()["entries"] == 0
+        assert cache_db in cache._CREATED_TABLES  # noqa: SLF001
+
+
+class TestExtractionStats:
+    """Tests the extraction statistics in nexusLIMS.extractors.stats."""
+
+    @pytest.fixture()
+    def stats_db(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("nexusLIMS_db_path", str(tmp_path / "nexuslims_db.sqlite"))
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmfnexus"))
+        monkeypatch.setenv("nexusLIMS_path", str(tmp_path / "nexusLIMS"))
+        monkeypatch.setenv("NexusLIMS_extraction_stats", "true")
+        monkeypatch.setenv("NexusLIMS_extraction_cache", "true")
+        return tmp_path / stats.STATS_FILENAME
+
+    def _rows(self):
+        with stats._connect() as conn:  # noqa: SLF001
+            return conn.execute(
+                "SELECT operation, extension, module, size, outcome, peak_rss "
+                "FROM extraction_stats ORDER BY timestamp",
+            ).fetchall()
+
+    def test_parse_metadata_records_stats(self, stats_db, tmp_path):
+        fname = tmp_path / "mmfnexus" / "test.txt"
+        fname.parent.mkdir()
+        (tmp_path / "nexusLIMS").mkdir()
+        fname.write_text("some text to preview")
+        parse_metadata(fname=fname, write_output=False, overwrite=False)
+        parse_metadata(fname=fname, write_output=False, overwrite=False)
+        assert stats_db.is_file()
+        module = "nexusLIMS.extractors.basic_metadata"
+        rows = self._rows()
+        assert [r[:5] for r in rows] == [
+            ("extraction", "txt", module, 20, "extracted"),
+            ("preview", "txt", module, 20, "rendered"),
+            ("extraction", "txt", module, 20, "cached"),
+            ("preview", "txt", module, 20, "up_to_date"),
+        ]
+        assert all(r[5] > 0 for r in rows)
+
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"),
+        reason="the peak memory of each call is only measured on Linux",
+    )
+    @pytest.mark.usefixtures("stats_db")
+    def test_stats_peak_rss_per_call(self, tmp_path):
+        fname = tmp_path / "test.txt"
+        fname.write_text("data")
+        module = "nexusLIMS.extractors.basic_metadata"
+        with stats.record_call("extraction", fname, module) as call:
+            data = bytearray(200 * 2**20)
+            call["outcome"] = "extracted"
+        del data
+        with stats.record_call("extraction", fname, module) as call:
+            call["outcome"] = "extracted"
+        conn = stats._RECORDER["conn"]  # noqa: SLF001
+
+        large, small = (r[5] for r in self._rows())
+        assert large > 200 * 2**20
+        assert small < large - 100 * 2**20
+        # the same connection is used for every call
+        with stats.record_call("extraction", fname, module) as call:
+            call["outcome"] = "extracted"
+        assert stats._RECORDER["conn"] is conn  # noqa: SLF001
+        assert len(self._rows()) == 3
+
+    def test_stats_disabled(self, stats_db, monkeypatch, tmp_path):
+        monkeypatch.setenv("NexusLIMS_extraction_stats", "false")
+        fname = tmp_path / "basic_test_no_extension"
+        fname.write_text("some data")
+        parse_metadata(fname=fname, write_output=False)
+        assert not stats_db.exists()
+
+    @pytest.mark.usefixtures("stats_db")
+    def test_stats_error(self, tmp_path):
+        fname = tmp_path / "test.dm3"
+        module = "nexusLIMS.extractors.digital_micrograph"
+        msg = "bad file"
+        with pytest.raises(ValueError, match=msg), stats.record_call(
+            "extraction",
+            fname,
+            module,
+        ):
+            raise ValueError(msg)
+        assert [r[:5] for r in self._rows()] == [
+            ("extraction", "dm3", module, None, "error"),
+        ]
+
+    @pytest.mark.usefixtures("stats_db")
+    def test_stats_report(self, monkeypatch):
+        from nexusLIMS.builder import record_builder
+        from nexusLIMS.utils import FileInfo
+
+        rows = [
+            ("extraction", "dm3", "dm", 100, 2.0, "extracted"),
+            ("extraction", "dm3", "dm", 300, 4.0, "extracted"),
+            ("extraction", "dm3", "dm", 300, 0.1, "cached"),
+            ("preview", "dm3", "dm", 300, 1.0, "rendered"),
+            ("extraction", "tif", "quanta", 50, 0.5, "error"),
+            ("extraction", "tif", "quanta", 50, 1.5, "extracted"),
+        ]
+        with stats._connect() as conn, conn:  # noqa: SLF001
+            for i, (operation, ext, module, size, duration, outcome) in enumerate(
+                rows,
+            ):
+                conn.execute(
+                    "INSERT INTO extraction_stats VALUES "
+                    "(?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)",
+                    (
+                        time.time() - i,
+                        operation,
+                        f"/{i}.{ext}",
+                        ext,
+                        size,
+                        module,
+                        __version__,
+                        duration,
+                        1000 * i,
+                        outcome,
+                    ),
+                )
+
+        by_module = {(r["operation"], r["module"]): r for r in stats.throughput()}
+        assert by_module["extraction", "dm"]["calls"] == 2
+        assert by_module["extraction", "dm"]["bytes"] == 400
+        assert by_module["extraction", "dm"]["mean"] == 3.0
+        assert by_module["extraction", "quanta"]["failed"] == 1
+        assert [f["path"] for f in stats.slowest_files(2)] == ["/1.dm3", "/0.dm3"]
+        assert stats.mean_durations()["extraction"] == {
+            "dm3": 3.0,
+            "tif": 1.5,
+            "*": 2.5,
+        }
+
+        sessions = ["session 1", "session 2"]
+        files = [
+            [FileInfo(Path("a.dm3"), 0, 10), FileInfo(Path("b.tif"), 0, 20)],
+            [FileInfo(Path("c.ser"), 0, 30)],
+        ]
+        monkeypatch.setenv("NexusLIMS_extraction_workers", "2")
+        monkeypatch.setattr(
+            record_builder,
+            "find_session_files",
+            lambda _sessions: files,
+        )
+        projection = stats.project_build_time(sessions)
+        assert projection == {
+            "sessions": 2,
+            "files": 3,
+            "bytes": 60,
+            "unknown_files": 1,
+            # dm3: 3 + 1, tif: 1.5 + 1 (the mean preview time), ser: 2.5 + 1
+            "seconds": 10.0,
+            "wall_seconds": 5.0,
+        }
+        assert stats.clear() == len(rows)
+
+
+class TestSharedSignals:
+    """Tests sharing loaded signals between metadata extraction and preview."""
+
+    @pytest.fixture()
+    def loads(self, monkeypatch):
+        """Count the files loaded by HyperSpy (returning a fake signal)."""
+        loaded = []
+
+        def fake_load(fname, **kwargs):
+            loaded.append((Path(fname).name, kwargs))
+            return SimpleNamespace(
+                metadata=SimpleNamespace(
+                    General=SimpleNamespace(
+                        title="",
+                        original_filename=Path(fname).name,
+                    ),
+                ),
+                compute=lambda **_kwargs: None,
+            )
+
+        monkeypatch.setattr("hyperspy.io.load", fake_load)
+        return loaded
+
+    def test_load_signal(self, loads):
+        fname = Path("test.dm3")
+        with shared_signals():
+            s = load_signal(fname)
+            assert load_signal(fname) is s
+            # nested contexts share the same signals
+            with shared_signals():
+                assert load_signal(fname) is s
+            assert load_signal(fname) is s
+            # different options load the file again
+            assert load_signal(fname, only_valid_data=True) is not s
+        assert loads == [
+            ("test.dm3", {"lazy": True}),
+            ("test.dm3", {"lazy": True, "only_valid_data": True}),
+        ]
+        # outside of the context, signals are not kept
+        assert load_signal(fname) is not s
+        assert len(loads) == 3
+
+    def test_keep_signal(self, loads):
+        fname = Path("test.ser")
+        s = object()
+        keep_signal(fname, s, only_valid_data=True)
+        with shared_signals():
+            keep_signal(fname, s, only_valid_data=True)
+            assert load_signal(fname, only_valid_data=True) is s
+            assert load_signal(fname) is not s
+        assert len(loads) == 1
+
+    def test_parse_metadata_loads_once(self, loads, monkeypatch, tmp_path):
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmfnexus"))
+        monkeypatch.setenv("nexusLIMS_path", str(tmp_path / "nexusLIMS"))
+        fname = tmp_path / "mmfnexus" / "test.msa"
+        fname.parent.mkdir()
+        (tmp_path / "nexusLIMS").mkdir()
+        fname.write_text("some data")
+        signals = []
+
+        def extractor(filename):
+            signals.append(load_signal(filename))
+            return {"nx_meta": {}}
+
+        def thumbnail(s, out_path):
+            signals.append(s)
+            out_path.write_bytes(b"")
+
+        monkeypatch.setitem(nexusLIMS.extractors.extension_reader_map, "msa", extractor)
+        monkeypatch.setattr(nexusLIMS.extractors, "sig_to_thumbnail", thumbnail)
+        _, preview_fname = parse_metadata(fname=fname, write_output=False)
+        assert preview_fname.is_file()
+        assert loads == [("test.msa", {"lazy": True})]
+        assert len(signals) == 2
+        assert signals[0] is signals[1]
+
+
 @pytest.fixture(name="_titan_tem_db")
 def _fixture_titan_tem_db(monkeypatch):
     """Monkeypatch so DM extractor thinks this file came from FEI Titan TEM."""
@@ -550,7 +1106,7 @@ class TestDigitalMicrographExtractor:
     """Tests nexusLIMS.extractors.digital_migrograph."""
 
     def test_corrupted_file(self, corrupted_file):
-        assert digital_micrograph.get_dm3_metadata(corrupted_file) is None
+        assert digital_micrograph.get_dm3_metadata(corrupted_file[0]) is None
 
     @pytest.mark.usefixtures("_titan_tem_db")
     def test_dm3_list_file(self, list_signal):
@@ -779,6 +1335,168 @@ class TestDigitalMicrographExtractor:
             filename.unlink(missing_ok=True)
 
 
+class TestDMTagReader:
+    """Tests reading DigitalMicrograph tags with nexusLIMS.extractors.dm_tags."""
+
+    # the tags of a small file; names starting with "#" are written unnamed
+    ROOT = {
+        "ApplicationBounds": (0, 0, 600, 800),
+        "DocumentObjectList": {
+            "#0": {
+                "AnnotationGroupList": {
+                    "#0": {"Label": "scale bar", "Rectangle": (1.5, 2.0, 3.0, 4.0)},
+                },
+                "ImageDisplayInfo": {"Gamma": 0.5},
+            },
+        },
+        "ImageList": {
+            "#0": {
+                "ImageData": {"Data": bytes(64), "Dimensions": {"#0": 8, "#1": 8}},
+                "ImageTags": {},
+                "Name": "thumbnail",
+            },
+            "#1": {
+                "ImageData": {
+                    "Data": bytes(2**20),
+                    "Dimensions": {"#0": 4, "#1": 1, "#2": 16},
+                },
+                "ImageTags": {
+                    "Meta Data": {"Format": "Spectrum image"},
+                    "Microscope Info": {"Voltage": 300000.0, "Emission": [1, 2]},
+                },
+                "Name": "EELS SI",
+                "UniqueID": {"#0": 7},
+            },
+        },
+        "Thumbnails": {"#0": {"ImageIndex": 0, "SourceSize_Pixels": (8, 8)}},
+    }
+
+    @staticmethod
+    def write_dm_file(path: Path, version: int, root: dict) -> Path:
+        """Write tags to a DigitalMicrograph file (with little-endian data)."""
+        length = ">l" if version == 3 else ">q"
+
+        def pack_lengths(*values):
+            return b"".join(struct.pack(length, v) for v in values)
+
+        def encode(value):
+            if isinstance(value, float):
+                return [7], struct.pack("<d", value)
+            if isinstance(value, int):
+                return [3], struct.pack("<l", value)
+            if isinstance(value, str):
+                chars = [ord(c) for c in value]
+                return [20, 4, len(chars)], struct.pack(f"<{len(chars)}H", *chars)
+            if isinstance(value, bytes):
+                return [20, 10, len(value)], value
+            if isinstance(value, list):
+                return [20, 3, len(value)], struct.pack(f"<{len(value)}l", *value)
+            # tuples are written as structs of floats or longs
+            el_type, fmt = (7, "d") if isinstance(value[0], float) else (3, "l")
+            info = [15, 0, len(value)] + [0, el_type] * len(value)
+            return info, struct.pack(f"<{len(value)}{fmt}", *value)
+
+        def group(tags):
+            out = b"\x00\x01" + pack_lengths(len(tags))
+            for name, value in tags.items():
+                label = b"" if name.startswith("#") else name.encode()
+                if isinstance(value, dict):
+                    tag_type, body = 20, group(value)
+                else:
+                    info, data = encode(value)
+                    tag_type = 21
+                    body = b"%%%%" + pack_lengths(len(info), *info) + data
+                out += struct.pack(">bh", tag_type, len(label)) + label
+                if version == 4:
+                    out += struct.pack(">q", len(body))
+                out += body
+            return out
+
+        header = struct.pack(">l", version) + pack_lengths(0) + struct.pack(">l", 1)
+        path.write_bytes(header + group(root) + bytes(8))
+        return path
+
+    @pytest.mark.parametrize("version", [3, 4])
+    def test_read_dm_tags(self, monkeypatch, tmp_path, version):
+        fname = self.write_dm_file(tmp_path / "test.dm3", version, self.ROOT)
+        reads = []
+        original_read = dm_tags._TagReader._read  # noqa: SLF001
+
+        def read(reader, size):
+            reads.append(size)
+            return original_read(reader, size)
+
+        monkeypatch.setattr(dm_tags._TagReader, "_read", read)  # noqa: SLF001
+        images = dm_tags.read_dm_tags(fname)
+
+        # the thumbnail is left out, and the data is skipped rather than read
+        assert images == [
+            dm_tags.DMImage(
+                metadata={
+                    "DocumentObjectList": {
+                        "TagGroup0": {
+                            "AnnotationGroupList": {
+                                "TagGroup0": {
+                                    "Label": "scale bar",
+                                    "Rectangle": (1.5, 2.0, 3.0, 4.0),
+                                },
+                            },
+                        },
+                    },
+                    "ImageList": {
+                        "TagGroup0": {
+                            "ImageTags": {
+                                "Meta Data": {"Format": "Spectrum image"},
+                                "Microscope Info": {
+                                    "Voltage": 300000.0,
+                                    "Emission": [1, 2],
+                                },
+                            },
+                            "Name": "EELS SI",
+                        },
+                    },
+                },
+                # spectrum images are loaded with the spectral axis last
+                shape=(4, 16),
+            ),
+        ]
+        assert max(reads) < 64
+
+    def test_read_dm_tags_errors(self, tmp_path):
+        fname = self.write_dm_file(tmp_path / "test.dm3", 3, self.ROOT)
+        contents = fname.read_bytes()
+        fname.write_bytes(contents[:200])
+        with pytest.raises(dm_tags.DMTagError, match="Unexpected end of file"):
+            dm_tags.read_dm_tags(fname)
+        assert digital_micrograph.get_dm3_metadata(fname) is None
+
+        fname.write_bytes(struct.pack(">l", 5) + contents[4:])
+        with pytest.raises(dm_tags.DMTagError, match="file version: 5"):
+            dm_tags.read_dm_tags(fname)
+
+        self.write_dm_file(fname, 4, {"DocumentObjectList": {}})
+        with pytest.raises(dm_tags.DMTagError, match="No images"):
+            dm_tags.read_dm_tags(fname)
+
+        # corrupt DM4 tag sizes and array lengths beyond the end of the file
+        contents = self.write_dm_file(fname, 4, self.ROOT).read_bytes()
+        data_size = b"Data" + struct.pack(">q", 4 + 4 * 8 + 2**20)
+        assert contents.count(data_size) == 1
+        for size, match in ((2**62, "cannot skip"), (-100, "Cannot skip -100")):
+            fname.write_bytes(
+                contents.replace(data_size, b"Data" + struct.pack(">q", size)),
+            )
+            with pytest.raises(dm_tags.DMTagError, match=match):
+                dm_tags.read_dm_tags(fname)
+        emission = struct.pack(">3q", 20, 3, 2)
+        fname.write_bytes(
+            contents.replace(emission, struct.pack(">3q", 20, 3, 2**62)),
+        )
+        with pytest.raises(dm_tags.DMTagError, match=f"cannot read {2**64} bytes"):
+            dm_tags.read_dm_tags(fname)
+        assert digital_micrograph.get_dm3_metadata(fname) is None
+
+
 class TestEDAXSPCExtractor:
     """Tests nexusLIMS.extractors.edax."""
 
@@ -845,6 +1563,75 @@ class TestEDAXSPCExtractor:
 class TestQuantaExtractor:
     """Tests nexusLIMS.extractors.quanta_tif."""
 
+    METADATA = (
+        b"[User]\r\nDate=12/18/2017\r\nTime=01:04:14 PM\r\nUser=user\r\n"
+        b"\r\n[System]\r\nType=SEM\r\nDnumber=D8439\r\n\x00\x00"
+    )
+
+    @staticmethod
+    def write_tiff(path: Path, byte_order: str, tag_size: int, *, bigtiff: bool):
+        """Write a TIFF file with the FEI metadata tag, followed by image data."""
+        if bigtiff:
+            header = b"II+\x00" if byte_order == "<" else b"MM\x00+"
+            header += struct.pack(byte_order + "HHQ", 8, 0, 16)
+            ifd_fmt, entry_fmt, next_fmt = "Q", "HHQQ", "Q"
+        else:
+            header = b"II*\x00" if byte_order == "<" else b"MM\x00*"
+            header += struct.pack(byte_order + "I", 8)
+            ifd_fmt, entry_fmt, next_fmt = "H", "HHII", "I"
+        mdata_offset = len(header) + sum(
+            struct.calcsize(byte_order + fmt) for fmt in (ifd_fmt, entry_fmt, next_fmt)
+        )
+        ifd = struct.pack(byte_order + ifd_fmt, 1)
+        ifd += struct.pack(byte_order + entry_fmt, 34682, 2, tag_size, mdata_offset)
+        ifd += struct.pack(byte_order + next_fmt, 0)
+        path.write_bytes(header + ifd + TestQuantaExtractor.METADATA + bytes(4096))
+        return path
+
+    @pytest.mark.parametrize("byte_order", ["<", ">"])
+    @pytest.mark.parametrize("bigtiff", [False, True])
+    def test_metadata_from_tag(self, monkeypatch, tmp_path, byte_order, bigtiff):
+        monkeypatch.setattr(quanta_tif, "METADATA_SEARCH_SIZE", 1024)
+        fname = self.write_tiff(
+            tmp_path / "tagged.tif",
+            byte_order,
+            len(self.METADATA),
+            bigtiff=bigtiff,
+        )
+        # metadata in the image data (as far as the tag says) is not read
+        with fname.open("ab") as f:
+            f.write(b"[User]\r\nDate=not the date\r\n")
+        metadata = get_quanta_metadata(fname)
+        assert metadata["User"]["Date"] == "12/18/2017"
+        assert metadata["System"]["Dnumber"] == "D8439"
+
+    def test_metadata_longer_than_tag(self, tmp_path):
+        # metadata edited without updating the tag is read up to the end of
+        # the file, if it is near the end of the file
+        fname = self.write_tiff(tmp_path / "edited.tif", "<", 20, bigtiff=False)
+        metadata = get_quanta_metadata(fname)
+        assert metadata["System"]["Dnumber"] == "D8439"
+
+    def test_metadata_without_tag(self, monkeypatch, tmp_path):
+        fname = tmp_path / "untagged.tif"
+        fname.write_bytes(bytes(2048) + self.METADATA)
+        assert get_quanta_metadata(fname)["User"]["Time"] == "01:04:14 PM"
+
+        # metadata too far from the end of the file is not found
+        monkeypatch.setattr(quanta_tif, "METADATA_SEARCH_SIZE", 16)
+        metadata = get_quanta_metadata(fname)
+        assert metadata["nx_meta"]["Data Type"] == "Unknown"
+        assert (
+            "Did not find expected FEI tags"
+            in metadata["nx_meta"]["Extractor Warnings"]
+        )
+
+    def test_empty_file(self, tmp_path):
+        fname = tmp_path / "empty.tif"
+        fname.touch()
+        metadata = get_quanta_metadata(fname)
+        assert metadata["nx_meta"]["Data Type"] == "Unknown"
+
     def test_quanta_extraction(self, quanta_test_file):
         metadata = get_quanta_metadata(quanta_test_file[0])
 
@@ -655,7 +655,11 @@ class TestNemoConnectorUsers:
 
     @pytest.mark.parametrize(
         ("test_user_id_input", "expected_usernames"),
-        [(3, ["***REMOVED***"]), ([2, 3, 4], ["***REMOVED***", "***REMOVED***", "***REMOVED***"]), (-1, [])],
+        [
+            (3, ["***REMOVED***"]),
+            ([2, 3, 4], ["***REMOVED***", "***REMOVED***", "***REMOVED***"]),
+            (-1, []),
+        ],
     )
     def test_get_users(
         self,
@@ -672,7 +676,10 @@ class TestNemoConnectorUsers:
         ("test_username_input", "expected_usernames"),
         [
             ("***REMOVED***", ["***REMOVED***"]),
-            (["***REMOVED***", "***REMOVED***", "***REMOVED***"], ["***REMOVED***", "***REMOVED***", "***REMOVED***"]),
+            (
+                ["***REMOVED***", "***REMOVED***", "***REMOVED***"],
+                ["***REMOVED***", "***REMOVED***", "***REMOVED***"],
+            ),
             ("ernst_ruska", []),
         ],
     )
@@ -714,7 +721,10 @@ class TestNemoConnectorUsers:
         )
         to_test = [
             ("***REMOVED***", ["***REMOVED***"]),
-            (["***REMOVED***", "***REMOVED***", "***REMOVED***"], ["***REMOVED***", "***REMOVED***", "***REMOVED***"]),
+            (
+                ["***REMOVED***", "***REMOVED***", "***REMOVED***"],
+                ["***REMOVED***", "***REMOVED***", "***REMOVED***"],
+            ),
             ("ernst_ruska", []),
             (["***REMOVED***", "***REMOVED***"], ["***REMOVED***", "***REMOVED***"]),
             ("***REMOVED***", ["***REMOVED***"]),
@@ -973,6 +983,32 @@ class TestNemoConnectorEvents:
         nemo_utils.add_all_usage_events_to_db(tool_id=10)
         _, _ = db_query("SELECT * FROM session_log;")
 
+    def test_add_all_usage_events_to_db_unfinished(self, monkeypatch):
+        conn = NemoConnector(
+            base_url="https://example.org",
+            token="not_needed",
+            timezone="America/Denver",
+        )
+        events = [
+            {"id": 1, "start": "2023-01-02T09:00:00", "end": "2023-01-02T10:00:00"},
+            {"id": 2, "start": "2023-01-02T11:00:00", "end": None},
+            {"id": 3, "start": "2023-01-02T10:30:00", "end": None},
+        ]
+        written = []
+        monkeypatch.setattr(nemo_utils, "get_harvesters_enabled", lambda: [conn])
+        monkeypatch.setattr(conn, "get_usage_events", lambda **_kwargs: events)
+        monkeypatch.setattr(conn, "write_usage_event_to_session_log", written.append)
+
+        unfinished = nemo_utils.add_all_usage_events_to_db()
+        assert written == [1, 2, 3]
+        assert unfinished == timezone("America/Denver").localize(
+            dt(2023, 1, 2, 10, 30),  # noqa: DTZ001
+        )
+
+        events.pop()
+        events.pop()
+        assert nemo_utils.add_all_usage_events_to_db() is None
+
     @pytest.mark.usefixtures("_cleanup_session_log")
     def test_usage_event_to_session_log(self, nemo_connector):
         _, results_before = db_query("SELECT * FROM session_log;")
@@ -1075,11 +1111,7 @@ class TestNemoConnectorEvents:
         res_event = nemo.res_event_from_session(s)
         assert res_event.instrument == instrument_db["testsurface-CPU_P1111111"]
         assert res_event.experiment_title == "***REMOVED***"
-        assert (
-            res_event.experiment_purpose
-            == "***REMOVED*** "
-            "***REMOVED***."
-        )
+        assert res_event.experiment_purpose == "***REMOVED*** " "***REMOVED***."
         assert res_event.sample_name[0] == "***REMOVED***"
         assert res_event.project_id[0] is None
         assert res_event.username == "***REMOVED***"
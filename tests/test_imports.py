@@ -0,0 +1,68 @@
+"""Test that the non-extraction entry points of NexusLIMS start up quickly."""
+# pylint: disable=missing-function-docstring
+# ruff: noqa: D102
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# modules that are slow to import, and are only needed to extract metadata,
+# generate previews, or cluster files with scikit-learn
+HEAVY_MODULES = ["hyperspy", "matplotlib", "scipy", "skimage", "sklearn"]
+
+# the import time (in seconds) that the entry points below should stay under
+IMPORT_TIME_TARGET = 2.0
+
+ENTRY_POINTS = [
+    "nexusLIMS.builder.record_builder",
+    "nexusLIMS.builder.daemon",
+    "nexusLIMS.cdcs",
+    "nexusLIMS.db.session_handler",
+    "nexusLIMS.harvesters.nemo",
+    "nexusLIMS.harvesters.sharepoint_calendar",
+]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy}))
+print(json.dumps({{"time": elapsed, "heavy": heavy}}))
+"""
+
+
+def _time_import(module: str) -> dict:
+    """Import a module in a new interpreter, timing it and listing heavy imports."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES),
+        ],
+        capture_output=True,
+        check=True,
+        env=os.environ.copy(),
+        text=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime:
+    """Tests that importing NexusLIMS does not import its heavy dependencies."""
+
+    @pytest.mark.parametrize("module", ENTRY_POINTS)
+    def test_entry_point_import_time(self, module):
+        result = _time_import(module)
+        assert result["heavy"] == []
+        assert result["time"] < IMPORT_TIME_TARGET
+
+    @pytest.mark.parametrize(
+        "module",
+        ["nexusLIMS.extractors", "nexusLIMS.extractors.thumbnail_generator"],
+    )
+    def test_extractors_import_lazily(self, module):
+        # the heavy modules are only imported once a file is actually read
+        assert _time_import(module)["heavy"] == []
@@ -33,6 +33,7 @@ import os
 from datetime import datetime
 from pathlib import Path
 
+from nexusLIMS import instruments
 from nexusLIMS.instruments import (
     Instrument,
     get_instr_from_api_url,
@@ -153,3 +154,42 @@ class TestInstruments:
             "https://***REMOVED***/api/tools/?id=-1",
         )
         assert returned_item is None
+
+    def test_get_instr_from_filepath_deepest_folder(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path))
+        outer = Instrument(name="outer", filestore_path="./shared")
+        inner = Instrument(name="inner", filestore_path="shared/inner")
+        monkeypatch.setitem(instrument_db, "outer", outer)
+        monkeypatch.setitem(instrument_db, "inner", inner)
+
+        assert get_instr_from_filepath(tmp_path / "shared" / "a.dm3") is outer
+        assert get_instr_from_filepath(tmp_path / "shared" / "inner.dm3") is outer
+        assert get_instr_from_filepath(tmp_path / "shared/inner/a/b.dm3") is inner
+        assert get_instr_from_filepath(tmp_path / "shared2" / "a.dm3") is None
+        # the folder itself is not "in" the folder
+        assert get_instr_from_filepath(tmp_path / "shared") is None
+
+    def test_get_instr_from_filepath_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path))
+        instr = Instrument(name="test", filestore_path="test")
+        monkeypatch.setitem(instrument_db, "test", instr)
+
+        for i in range(3):
+            assert get_instr_from_filepath(tmp_path / "test" / f"{i}.tif") is instr
+        cache_info = instruments._get_path_index().find.cache_info()  # noqa: SLF001
+        assert (cache_info.hits, cache_info.misses) == (2, 1)
+
+        # the index is rebuilt when the instruments are reloaded
+        moved = Instrument(name="test", filestore_path="moved")
+        original_db = dict(instrument_db)
+        monkeypatch.setattr(instruments, "_get_instrument_db", lambda: {"test": moved})
+        try:
+            assert instruments.reload_instrument_db()
+            assert get_instr_from_filepath(tmp_path / "test" / "0.tif") is None
+            assert get_instr_from_filepath(tmp_path / "moved" / "0.tif") is moved
+            same = {"test": Instrument(name="test", filestore_path="moved")}
+            monkeypatch.setattr(instruments, "_get_instrument_db", lambda: same)
+            assert not instruments.reload_instrument_db()
+        finally:
+            monkeypatch.setattr(instruments, "_get_instrument_db", lambda: original_db)
+            instruments.reload_instrument_db()
@@ -7,25 +7,38 @@ module, acquisition activity representations, session handling, and CDCS connect
 # pylint: disable=C0302,missing-function-docstring,too-many-lines,too-many-locals
 # ruff: noqa: D102
 
+import json
 import os
 import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime as dt
 from datetime import timedelta as td
 from functools import partial
+from io import BytesIO, StringIO
+from multiprocessing import get_context
 from pathlib import Path
 
+import numpy as np
 import pytest
 from lxml import etree
+from scipy.special import logsumexp
 
-from nexusLIMS.builder import record_builder
+from nexusLIMS import extractors
+from nexusLIMS.builder import daemon, metrics, record_builder
 from nexusLIMS.builder.record_builder import build_record
 from nexusLIMS.db import make_db_query, session_handler
 from nexusLIMS.db.session_handler import Session, SessionLog, db_query
 from nexusLIMS.harvesters.nemo import utils as nemo_utils
 from nexusLIMS.harvesters.reservation_event import ReservationEvent
 from nexusLIMS.instruments import Instrument, instrument_db
-from nexusLIMS.schemas import activity
-from nexusLIMS.utils import current_system_tz
+from nexusLIMS.schemas import activity, kde, segmentation
+from nexusLIMS.utils import FileInfo, current_system_tz
 
 
 @pytest.fixture(name="_remove_nemo_gov_harvester")
@@ -52,6 +65,14 @@ def _remove_nemo_gov_harvester(monkeypatch):
         monkeypatch.undo()
 
 
+def _crashing_extract_file(fname, _mtime, _size, _generate_preview):
+    """Stand in for the extraction worker, dying on files named "crash"."""
+    if fname.stem == "crash":
+        os._exit(1)  # noqa: SLF001
+    time.sleep(0.1)  # so that other files are running when one crashes
+    return {"nx_meta": {"fname": fname.name}}, None, {}
+
+
 class TestRecordBuilder:
     """Tests the record building module."""
 
@@ -674,6 +695,212 @@ class TestRecordBuilder:
         assert "ERROR" in caplog.text
         assert "Could not validate record, did not write to disk" in caplog.text
 
+    @pytest.mark.usefixtures("_remove_nemo_gov_harvester")
+    def test_concurrent_session_building(self, monkeypatch, caplog):
+        instr_names = ["FEI-Titan-TEM-635816_n", "testsurface-CPU_P1111111"]
+        sessions = [
+            session_handler.Session(
+                session_identifier=f"concurrent_{i}",
+                instrument=instrument_db[instr_names[i % 2]],
+                dt_range=(
+                    dt.fromisoformat("2021-12-08T09:00:00.000-07:00"),
+                    dt.fromisoformat("2021-12-08T12:00:00.000-07:00"),
+                ),
+                user="None",
+            )
+            for i in range(6)
+        ]
+        lock = threading.Lock()
+        running = {"total": 0, **{n: 0 for n in instr_names}}
+        max_running = dict.fromkeys(running, 0)
+
+        def mock_build_session_record(s, **build_kwargs):
+            assert build_kwargs["extraction_workers"] == 1
+            with lock:
+                for k in ("total", s.instrument.name):
+                    running[k] += 1
+                    max_running[k] = max(max_running[k], running[k])
+            time.sleep(0.1)
+            with lock:
+                for k in ("total", s.instrument.name):
+                    running[k] -= 1
+            return [Path(f"{s.session_identifier}.xml")]
+
+        monkeypatch.setattr(record_builder, "get_sessions_to_build", lambda: sessions)
+        monkeypatch.setattr(
+            record_builder,
+            "_build_session_record",
+            mock_build_session_record,
+        )
+        monkeypatch.setenv("NexusLIMS_session_workers", "3")
+        monkeypatch.setenv("NexusLIMS_instrument_session_workers", "1")
+        monkeypatch.delenv("NexusLIMS_extraction_workers", raising=False)
+        caplog.set_level("INFO")
+
+        xml_files = record_builder.build_new_session_records()
+
+        # results are returned in session order, regardless of finish order
+        assert xml_files == [Path(f"concurrent_{i}.xml") for i in range(6)]
+        # only one session per instrument, so at most two at once in total
+        assert max_running == {"total": 2, instr_names[0]: 1, instr_names[1]: 1}
+        assert "ran in parallel with: concurrent_1" in caplog.text
+
+    def test_get_files_finder_setting(self, monkeypatch, caplog):
+        def mock_finder(name):
+            def _finder(*_args, **_kwargs):
+                return [FileInfo(Path(name), 0.0, 0)]
+
+            return _finder
+
+        def mock_gnu_find_error(*_args, **_kwargs):
+            msg = "find command was not found on the system PATH"
+            raise RuntimeError(msg)
+
+        monkeypatch.setattr(
+            record_builder,
+            "gnu_find_file_info_by_mtime",
+            mock_finder("gnu"),
+        )
+        monkeypatch.setattr(
+            record_builder,
+            "scandir_find_file_info_by_mtime",
+            mock_finder("scandir"),
+        )
+        args = (
+            Path("path"),
+            dt.now(tz=current_system_tz()),
+            dt.now(tz=current_system_tz()),
+        )
+
+        for setting, expected in [
+            (None, "gnu"),
+            ("gnu", "gnu"),
+            ("scandir", "scandir"),
+            ("bogus", "gnu"),
+        ]:
+            if setting is None:
+                monkeypatch.delenv("NexusLIMS_file_finder", raising=False)
+            else:
+                monkeypatch.setenv("NexusLIMS_file_finder", setting)
+            assert record_builder.get_files(*args)[0].path == Path(expected)
+        assert 'had an unexpected value: "bogus"' in caplog.text
+
+        # if GNU find is not available, the scandir finder is used instead
+        monkeypatch.setattr(
+            record_builder,
+            "gnu_find_file_info_by_mtime",
+            mock_gnu_find_error,
+        )
+        monkeypatch.setenv("NexusLIMS_file_finder", "gnu")
+        assert record_builder.get_files(*args)[0].path == Path("scandir")
+
+    def test_find_session_files(self, monkeypatch):
+        titan = instrument_db["FEI-Titan-TEM-635816_n"]
+        cpu = instrument_db["testsurface-CPU_P1111111"]
+
+        def _session(s_id, instr, start, end):
+            return session_handler.Session(
+                session_identifier=s_id,
+                instrument=instr,
+                dt_range=(
+                    dt.fromisoformat(f"2021-12-08T{start}:00:00.000-07:00"),
+                    dt.fromisoformat(f"2021-12-08T{end}:00:00.000-07:00"),
+                ),
+                user="None",
+            )
+
+        sessions = [
+            _session("titan_1", titan, "09", "10"),
+            _session("cpu_1", cpu, "09", "12"),
+            _session("titan_2", titan, "11", "12"),
+            _session("titan_3", titan, "14", "15"),
+        ]
+        # one file at each half hour of the day
+        all_files = [
+            FileInfo(
+                Path(f"file_{h:02d}{m:02d}.dm3"),
+                dt.fromisoformat(f"2021-12-08T{h:02d}:{m:02d}:00-07:00").timestamp(),
+                0,
+            )
+            for h in range(24)
+            for m in (0, 30)
+        ]
+        calls = []
+
+        def mock_get_files(_path, dt_from, dt_to, *, instrument=None):
+            calls.append((instrument.name, dt_from, dt_to))
+            return [
+                f
+                for f in all_files
+                if dt_from.timestamp() < f.mtime <= dt_to.timestamp()
+            ]
+
+        monkeypatch.setattr(record_builder, "get_files", mock_get_files)
+        session_files = record_builder.find_session_files(sessions)
+
+        # only one search was made, covering all three Titan sessions
+        assert calls == [(titan.name, sessions[0].dt_from, sessions[3].dt_to)]
+        assert [f.path.stem for f in session_files[0]] == [
+            "file_0930",
+            "file_1000",
+        ]
+        assert session_files[1] is None
+        assert [f.path.stem for f in session_files[2]] == [
+            "file_1130",
+            "file_1200",
+        ]
+        assert [f.path.stem for f in session_files[3]] == [
+            "file_1430",
+            "file_1500",
+        ]
+
+    def test_new_session_records_use_found_files(self, monkeypatch):
+        titan = instrument_db["FEI-Titan-TEM-635816_n"]
+        sessions = [
+            session_handler.Session(
+                session_identifier=f"batched_{i}",
+                instrument=titan,
+                dt_range=(
+                    dt.fromisoformat("2021-12-08T09:00:00.000-07:00"),
+                    dt.fromisoformat("2021-12-08T12:00:00.000-07:00"),
+                ),
+                user="None",
+            )
+            for i in range(2)
+        ]
+        found = [[FileInfo(Path(f"file_{i}"), 0.0, 0)] for i in range(2)]
+        received = {}
+
+        def mock_build_session_record(s, **build_kwargs):
+            received[s.session_identifier] = build_kwargs["files"]
+            return []
+
+        monkeypatch.setattr(record_builder, "get_sessions_to_build", lambda: sessions)
+        monkeypatch.setattr(record_builder, "find_session_files", lambda _s: found)
+        monkeypatch.setattr(
+            record_builder,
+            "_build_session_record",
+            mock_build_session_record,
+        )
+        monkeypatch.delenv("NexusLIMS_session_workers", raising=False)
+        record_builder.build_new_session_records()
+        assert received == {"batched_0": found[0], "batched_1": found[1]}
+
+        received.clear()
+        monkeypatch.setenv("NexusLIMS_session_workers", "2")
+        monkeypatch.setenv("NexusLIMS_instrument_session_workers", "2")
+        record_builder.build_new_session_records()
+        assert received == {"batched_0": found[0], "batched_1": found[1]}
+
+    def test_parallel_session_report(self):
+        timings = {"a": (0.0, 2.0), "b": (1.0, 3.0), "c": (2.0, 4.0), "d": (5, 6)}
+        assert record_builder._parallel_session_report(timings) == {  # noqa: SLF001
+            "a": ["b"],
+            "b": ["a", "c"],
+            "c": ["b"],
+            "d": [],
+        }
+
     @pytest.mark.usefixtures("_remove_nemo_gov_harvester")
     def test_dump_record(self):
         dt_str_from = "2021-08-02T12:00:00-06:00"
@@ -687,6 +914,236 @@ class TestRecordBuilder:
         out_fname = record_builder.dump_record(session=session, generate_previews=False)
         out_fname.unlink()
 
+    @pytest.fixture(name="streamed_session")
+    def streamed_session(self, monkeypatch, tmp_path):
+        """Set up a session of 3 activities (of 4 files) with fake metadata."""
+        parsed = []
+
+        def mock_parse_metadata(fname, **_kwargs):
+            parsed.append(fname)
+            meta = {"DatasetType": "Image", "Data Type": "SEM_Imaging"}
+            meta["Voltage"] = int(fname.stem) % 2
+            return {"nx_meta": meta}, None
+
+        instr = Instrument(
+            name="test-instrument",
+            schema_name="Test Instrument",
+            filestore_path="test",
+            harvester="nemo",
+            timezone="America/New_York",
+        )
+        files = []
+        for i in range(12):
+            fname = tmp_path / f"{i}.dm3"
+            fname.touch()
+            files.append(FileInfo(fname, 1.6e9 + (i // 4) * 3600 + i % 4, 0))
+        session = Session(
+            session_identifier="an-identifier-string",
+            instrument=instr,
+            dt_range=(
+                dt.fromtimestamp(1.6e9, tz=current_system_tz()),
+                dt.fromtimestamp(1.6e9 + 3 * 3600, tz=current_system_tz()),
+            ),
+            user="unused",
+        )
+        monkeypatch.setattr(activity, "parse_metadata", mock_parse_metadata)
+        monkeypatch.setattr(
+            record_builder,
+            "get_reservation_event",
+            lambda s: ReservationEvent(instrument=instr, start_time=s.dt_from),
+        )
+        return {"session": session, "files": files, "parsed": parsed}
+
+    def test_iter_acq_activities_is_lazy(self, streamed_session):
+        session = streamed_session["session"]
+        activities = record_builder.iter_acq_activities(
+            session.instrument,
+            session.dt_from,
+            session.dt_to,
+            generate_previews=False,
+            files=streamed_session["files"],
+        )
+        assert streamed_session["parsed"] == []
+        first = next(activities)
+        # only the files of the first activity have been processed
+        assert len(first.files) == 4  # noqa: PLR2004
+        assert len(streamed_session["parsed"]) == 4  # noqa: PLR2004
+        assert first.setup_params == {
+            "Data Type": "SEM_Imaging",
+            "DatasetType": "Image",
+        }
+        assert len(list(activities)) == 2  # noqa: PLR2004
+        assert len(streamed_session["parsed"]) == 12  # noqa: PLR2004
+
+    def test_write_record(self, streamed_session, tmp_path):
+        out_fname = tmp_path / "record.xml"
+        record_builder.write_record(
+            streamed_session["session"],
+            out_fname,
+            "sample-id",
+            generate_previews=False,
+            files=streamed_session["files"],
+        )
+        assert record_builder.validate_record(out_fname)
+        doc = etree.parse(out_fname)
+        ns = {"nx": "https://data.nist.gov/od/dm/nexus/experiment/v1.0"}
+        activities = doc.findall("nx:acquisitionActivity", ns)
+        assert [len(a.findall("nx:dataset", ns)) for a in activities] == [4, 4, 4]
+        text = record_builder.build_record(
+            streamed_session["session"],
+            "sample-id",
+            generate_previews=False,
+            files=streamed_session["files"],
+        )
+        assert out_fname.read_text(encoding="utf-8") == text
+        assert '\n  <acquisitionActivity seqno="1">\n    <startTime>' in text
+
+    def test_validate_record_inputs(self, streamed_session, tmp_path, caplog):
+        record = tmp_path / "record.xml"
+        record_builder.write_record(
+            streamed_session["session"],
+            record,
+            generate_previews=False,
+            files=streamed_session["files"],
+        )
+        record_bytes = record.read_bytes()
+        doc = etree.parse(record)
+        assert record_builder.validate_record(record)
+        assert record_builder.validate_record(str(record))
+        assert record_builder.validate_record(BytesIO(record_bytes))
+        assert record_builder.validate_record(
+            StringIO(record.read_text(encoding="utf-8")),
+        )
+        assert record_builder.validate_record(doc)
+        assert record_builder.validate_record(doc.getroot())
+
+        # an error deep inside an activity is still found
+        invalid = record_bytes.replace(b"startTime>", b"endTime>", 2)
+        assert not record_builder.validate_record(BytesIO(invalid))
+        assert "Record did not validate" in caplog.text
+        assert not record_builder.validate_record(etree.fromstring(invalid))
+        assert not record_builder.validate_record(BytesIO(b"<Experiment>"))
+        assert not record_builder.validate_record(StringIO(invalid.decode()))
+        assert not record_builder.validate_record(StringIO("<Experiment>"))
+
+    def test_schema_cache(self):
+        schema = record_builder.get_schema()
+        assert record_builder.get_schema() is schema
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(record_builder.get_schema()),
+        )
+        thread.start()
+        thread.join()
+        assert other[0] is not schema
+
+    @pytest.mark.parametrize("n_workers", [0, 2])
+    def test_validate_records(self, streamed_session, tmp_path, n_workers):
+        record = tmp_path / "record.xml"
+        record_builder.write_record(
+            streamed_session["session"],
+            record,
+            generate_previews=False,
+            files=streamed_session["files"],
+        )
+        invalid = tmp_path / "invalid.xml"
+        invalid.write_text("<xml>Record that will not validate</xml>")
+        results = record_builder.validate_records(
+            [record, invalid, record, record],
+            n_workers=n_workers,
+        )
+        assert results == [True, False, True, True]
+
+    def test_build_metrics(self, streamed_session, monkeypatch, tmp_path):
+        metrics_file = tmp_path / "metrics.jsonl"
+        textfile = tmp_path / "nexuslims.prom"
+        monkeypatch.setenv("NexusLIMS_metrics_file", str(metrics_file))
+        monkeypatch.setenv("NexusLIMS_metrics_textfile", str(textfile))
+        for totals in ["_TOTALS", "_SESSIONS", "_LAST_BUILD"]:
+            monkeypatch.setattr(metrics, totals, {})
+
+        session = streamed_session["session"]
+        with metrics.collect(session.session_identifier, "test-instrument") as m:
+            record_builder.build_record(
+                session,
+                generate_previews=False,
+                files=streamed_session["files"],
+            )
+            metrics.set_status("COMPLETED")
+        assert metrics.current() is None
+        assert list(m.stages) == ["discovery", "clustering", "xml"]
+        assert m.stages["discovery"]["files"] == 12  # noqa: PLR2004
+        assert m.stages["clustering"]["files"] == 12  # noqa: PLR2004
+        assert m.stages["xml"]["wall_time"] > 0
+
+        metrics.record(m)
+        metrics.record(m)
+        lines = metrics_file.read_text().splitlines()
+        assert len(lines) == 2  # noqa: PLR2004
+        assert json.loads(lines[0]) == m.as_dict()
+        assert json.loads(lines[0])["status"] == "COMPLETED"
+        prom = textfile.read_text()
+        assert "# TYPE nexuslims_build_stage_files_total counter" in prom
+        assert (
+            'nexuslims_build_stage_files_total{instrument="test-instrument",'
+            'stage="clustering"} 24'
+        ) in prom
+        assert (
+            'nexuslims_build_sessions_total{instrument="test-instrument",'
+            'status="COMPLETED"} 2'
+        ) in prom
+
+    def test_metrics_known_file_size(self, tmp_path, monkeypatch):
+        data = tmp_path / "data.bin"
+        data.write_bytes(b"0123456789")
+        sized = []
+        monkeypatch.setattr(metrics, "_file_size", lambda p: sized.append(p) or 10)
+
+        # a size that is already known is not read from the file system again
+        with metrics.collect() as m:
+            extractors.parse_metadata(data, write_output=False, size=1000)
+        assert m.stages["extraction"]["bytes_read"] == 1000  # noqa: PLR2004
+        assert m.stages["extraction"]["files"] == 1
+        assert sized == []
+
+        with metrics.collect() as m:
+            extractors.parse_metadata(data, write_output=False)
+        assert m.stages["extraction"]["bytes_read"] == 10  # noqa: PLR2004
+        assert sized == [data]
+
+    def test_metrics_stage(self, tmp_path, monkeypatch, caplog):
+        data = tmp_path / "data.bin"
+        data.write_bytes(b"0123456789")
+        # nothing is recorded unless metrics are being collected
+        with metrics.stage("extraction", paths=[data]):
+            assert metrics.current() is None
+        metrics.count("extraction", files=1)
+
+        with metrics.collect() as m:
+            with metrics.stage("extraction", paths=[data, tmp_path / "missing"]):
+                pass
+            with pytest.raises(ValueError, match="failed"), metrics.stage("preview"):
+                raise ValueError("failed")  # noqa: EM101
+            m.merge({"preview": {"files": 3, "bytes_read": 5}})
+        assert m.stages["extraction"]["files"] == 2  # noqa: PLR2004
+        assert m.stages["extraction"]["bytes_read"] == 10  # noqa: PLR2004
+        assert m.stages["preview"]["files"] == 3  # noqa: PLR2004
+        assert m.stages["preview"]["bytes_read"] == 5  # noqa: PLR2004
+        assert (
+            metrics._labels(  # noqa: SLF001
+                instrument='a "quoted"\\name',
+                stage=None,
+            )
+            == '{instrument="a \\"quoted\\"\\\\name"}'
+        )
+
+        # errors writing the metrics are logged, but not raised
+        monkeypatch.setenv("NexusLIMS_metrics_file", str(tmp_path / "no" / "file"))
+        for totals in ["_TOTALS", "_SESSIONS", "_LAST_BUILD"]:
+            monkeypatch.setattr(metrics, totals, {})
+        metrics.record(m)
+        assert "Could not write build metrics" in caplog.text
+
     @pytest.mark.usefixtures("_remove_nemo_gov_harvester")
     def test_no_sessions(self, monkeypatch):
         # monkeypatch to return empty list (as if there are no sessions)
@@ -932,18 +1389,21 @@ def gnu_find_activities():
 class TestActivity:
     """Test the representation and functionality of acquisition activities."""
 
-    @pytest.mark.skip(reason="method deprecated in v1.2.0")
     def test_gnu_find_vs_pure_python(
         self,
         monkeypatch,
         _gnu_find_activities,  # noqa: PT019
-    ):  # pragma: no cover
-        # force the GNU find method to fail
-        def mock_gnu_find(_path, _dt_from, _dt_to, _extensions, _followlinks):
+    ):
+        # force the GNU find method to fail, so the scandir finder is used
+        def mock_gnu_find(*_args, **_kwargs):
             msg = "Mock failure for GNU find method"
             raise RuntimeError(msg)
 
-        monkeypatch.setattr(record_builder, "gnu_find_files_by_mtime", mock_gnu_find)
+        monkeypatch.setattr(
+            record_builder,
+            "gnu_find_file_info_by_mtime",
+            mock_gnu_find,
+        )
         activities_list_python_find = record_builder.build_acq_activities(
             instrument=_gnu_find_activities["instr"],
             dt_from=_gnu_find_activities["dt_from"],
@@ -954,6 +1414,70 @@ class TestActivity:
         for i, this_activity in enumerate(activities_list_python_find):
             assert str(_gnu_find_activities["activities_list"][i]) == str(this_activity)
 
+    def test_parallel_extraction_matches_serial(
+        self,
+        _gnu_find_activities,  # noqa: PT019
+    ):
+        activities_list_parallel = record_builder.build_acq_activities(
+            instrument=_gnu_find_activities["instr"],
+            dt_from=_gnu_find_activities["dt_from"],
+            dt_to=_gnu_find_activities["dt_to"],
+            generate_previews=False,
+            n_workers=2,
+        )
+        serial = _gnu_find_activities["activities_list"]
+        assert len(activities_list_parallel) == len(serial)
+        for serial_act, parallel_act in zip(serial, activities_list_parallel):
+            assert repr(serial_act) == repr(parallel_act)
+            assert serial_act.files == parallel_act.files
+            assert serial_act.setup_params == parallel_act.setup_params
+            assert serial_act.unique_meta == parallel_act.unique_meta
+
+    def test_parallel_extraction_error_isolation(self, caplog, eels_si_643):
+        results = record_builder._extract_files_in_pool(  # noqa: SLF001
+            [
+                FileInfo(Path("dummy_file_does_not_exist.dm3"), 0.0, 0),
+                FileInfo.from_path(eels_si_643[0]),
+            ],
+            generate_previews=False,
+            n_workers=2,
+        )
+        assert results[0] is None
+        assert "Metadata extraction failed for dummy_file_does_not_exist.dm3" in (
+            caplog.text
+        )
+        meta, preview = results[1]
+        assert meta["nx_meta"]["DatasetType"] == "SpectrumImage"
+        assert preview is None
+
+    @pytest.mark.parametrize("shared_pool", [False, True])
+    def test_parallel_extraction_worker_crash(self, monkeypatch, caplog, shared_pool):
+        # forked workers see the monkeypatched extraction function
+        monkeypatch.setattr(
+            record_builder,
+            "_new_extraction_pool",
+            partial(ProcessPoolExecutor, mp_context=get_context("fork")),
+        )
+        monkeypatch.setattr(record_builder, "_extract_file", _crashing_extract_file)
+        names = [f"{i}.dm3" for i in range(12)]
+        names[5] = "crash.dm3"
+        files = [FileInfo(Path(name), 0.0, 0) for name in names]
+        with record_builder.keep_extraction_pool(
+            2,
+        ) if shared_pool else nullcontext():
+            results = record_builder._extract_files_in_pool(  # noqa: SLF001
+                files,
+                generate_previews=False,
+                n_workers=2,
+            )
+
+        assert results[5] is None
+        assert [r[0]["nx_meta"]["fname"] for r in results if r is not None] == [
+            name for name in names if name != "crash.dm3"
+        ]
+        assert "died again while processing crash.dm3" in caplog.text
+        assert "Metadata extraction failed" not in caplog.text
+
     def test_activity_repr(self, _gnu_find_activities):  # noqa: PT019
         expected = (
             "             AcquisitionActivity; "
@@ -989,11 +1513,13 @@ class TestActivity:
         )
         assert f"Could not parse metadata of {eels_si_643[0]}" in caplog.text
 
-    def test_add_file_bad_file(self, _gnu_find_activities):  # noqa: PT019
-        with pytest.raises(FileNotFoundError):
-            _gnu_find_activities["activities_list"][0].add_file(
-                Path("dummy_file_does_not_exist"),
-            )
+    def test_add_file_bad_file(self, _gnu_find_activities, caplog):  # noqa: PT019
+        activity = _gnu_find_activities["activities_list"][0]
+        orig_activity_file_length = len(activity.files)
+        activity.add_file(Path("dummy_file_does_not_exist"))
+        assert len(activity.files) == orig_activity_file_length + 1
+        assert "dummy_file_does_not_exist was not found" in caplog.text
+        assert "Could not parse metadata of dummy_file_does_not_exist" in caplog.text
 
     def test_store_unique_before_setup(
         self,
@@ -1017,3 +1543,368 @@ class TestActivity:
         activity_1.unique_meta[0]["Imaging Mode"] = "<IMAGING>"
 
         _ = activity_1.as_xml(seqno=0, sample_id="sample_id")
+
+    def test_clustering_methods_match_on_fixture(
+        self,
+        monkeypatch,
+        _gnu_find_activities,  # noqa: PT019
+    ):
+        monkeypatch.setenv("NexusLIMS_clustering_method", "grid_search")
+        activities_list_grid_search = record_builder.build_acq_activities(
+            instrument=_gnu_find_activities["instr"],
+            dt_from=_gnu_find_activities["dt_from"],
+            dt_to=_gnu_find_activities["dt_to"],
+            generate_previews=False,
+        )
+        fast = _gnu_find_activities["activities_list"]
+        assert len(activities_list_grid_search) == len(fast)
+        for fast_act, grid_act in zip(fast, activities_list_grid_search):
+            assert repr(fast_act) == repr(grid_act)
+            assert fast_act.files == grid_act.files
+
+    @pytest.mark.parametrize("seed", [0, 1, 2])
+    def test_fast_clustering_matches_grid_search(self, monkeypatch, seed):
+        rng = np.random.default_rng(seed)
+        # bursts of files saved close together, spaced by longer gaps
+        mtimes = np.concatenate(
+            [
+                rng.normal(1.6e9, 5, 30),
+                rng.normal(1.6e9 + 300, 2, 20),
+                rng.normal(1.6e9 + 1000, 20, 40),
+                1.6e9 + 1500 + np.arange(15) * 0.01,
+            ],
+        )
+        files = [FileInfo(Path(f"{i}.dm3"), m, 0) for i, m in enumerate(mtimes)]
+        monkeypatch.setenv("NexusLIMS_clustering_method", "grid_search")
+        grid_search = activity.cluster_filelist_mtimes(files)
+        monkeypatch.setenv("NexusLIMS_clustering_method", "fast")
+        fast = activity.cluster_filelist_mtimes(files)
+        assert len(grid_search) >= 3  # noqa: PLR2004
+        assert fast == pytest.approx(grid_search, abs=1e-3)
+
+    def test_clustering_method_bad_value(self, monkeypatch, caplog):
+        monkeypatch.setenv("NexusLIMS_clustering_method", "bad_value")
+        files = [
+            FileInfo(Path(f"{i}.dm3"), m, 0) for i, m in enumerate([0, 1, 2, 100, 101])
+        ]
+        boundaries = activity.cluster_filelist_mtimes(files)
+        assert 'had an unexpected value: "bad_value"' in caplog.text
+        monkeypatch.setenv("NexusLIMS_clustering_method", "fast")
+        assert activity.cluster_filelist_mtimes(files) == boundaries
+
+    def test_fast_kde_binned(self):
+        rng = np.random.default_rng(0)
+        # a burst of many files means each kernel covers many points, so the
+        # files are binned before computing the KDE
+        x = np.unique(
+            np.concatenate([rng.uniform(0, 2, 3000), 600 + np.arange(100) * 3.0]),
+        )
+        for bandwidth in [0.5, 5.0]:
+            diff = x[:, None] - x[None, :]
+            log_k = -(diff**2) / (2 * bandwidth**2)
+            np.fill_diagonal(log_k, -np.inf)
+            expected = np.mean(logsumexp(log_k, axis=1)) - np.log(
+                (len(x) - 1) * bandwidth * np.sqrt(2 * np.pi),
+            )
+            assert kde.loo_log_likelihood(x, bandwidth) == pytest.approx(
+                expected,
+                abs=1e-4,
+            )
+
+            np.fill_diagonal(log_k, 0)
+            expected_density = logsumexp(log_k, axis=1) - np.log(
+                len(x) * bandwidth * np.sqrt(2 * np.pi),
+            )
+            assert kde.log_density(x, bandwidth, x) == pytest.approx(
+                expected_density,
+                abs=1e-3,
+            )
+
+
+class TestSegmentation:
+    """Test the acquisition activity segmentation strategies."""
+
+    @pytest.fixture(name="session_files")
+    def session_files(self):
+        # three groups of files separated by 10 minute gaps (the last one
+        # acquired more slowly), followed by a file one minute later
+        mtimes = [
+            *(1000 + 2 * i for i in range(10)),
+            *(1620 + 3 * i for i in range(10)),
+            *(2250 + 20 * i for i in range(10)),
+            2490,
+        ]
+        return [FileInfo(Path(f"{i}.dm3"), m, 0) for i, m in enumerate(mtimes)]
+
+    def test_gap_quantile(self, session_files):
+        # the last gap is short compared to the typical gaps of the session
+        assert segmentation.gap_quantile_boundaries(session_files) == [1319, 1948.5]
+        assert segmentation.gap_quantile_boundaries(session_files, min_gap=1000) == []
+
+    def test_changepoint(self, session_files):
+        # the last gap is long compared to the gaps in the last group
+        assert segmentation.changepoint_boundaries(session_files) == [
+            1319,
+            1948.5,
+            2460,
+        ]
+        assert segmentation.changepoint_boundaries(session_files, min_gap=100) == [
+            1319,
+            1948.5,
+        ]
+
+    @pytest.mark.parametrize("name", ["gap_quantile", "changepoint"])
+    def test_single_file(self, name):
+        files = [FileInfo(Path("a.dm3"), 1000.0, 0)]
+        assert segmentation.strategies[name](files) == [1000.0]
+
+    def test_strategy_setting(self, monkeypatch, caplog):
+        titan = Instrument(name="FEI-Titan-TEM-635816_n")
+        quanta = Instrument(name="FEI-Quanta200-ESEM-633137_n")
+        monkeypatch.delenv("NexusLIMS_segmentation_strategy", raising=False)
+        assert segmentation.get_strategy_name(titan) == "kde"
+
+        monkeypatch.setenv("NexusLIMS_segmentation_strategy", "changepoint")
+        assert segmentation.get_strategy_name(titan) == "changepoint"
+        assert segmentation.get_strategy_name() == "changepoint"
+
+        monkeypatch.setenv(
+            "NexusLIMS_segmentation_strategy",
+            '{"default": "gap_quantile", "FEI-Titan-TEM-635816_n": "changepoint"}',
+        )
+        assert segmentation.get_strategy_name(titan) == "changepoint"
+        assert segmentation.get_strategy_name(quanta) == "gap_quantile"
+
+        monkeypatch.setenv(
+            "NexusLIMS_segmentation_strategy",
+            '{"FEI-Titan-TEM-635816_n": "bad_value"}',
+        )
+        assert segmentation.get_strategy_name(quanta) == "kde"
+        assert segmentation.get_strategy_name(titan) == "kde"
+        assert 'had an unexpected value: "bad_value"' in caplog.text
+
+        monkeypatch.setenv(
+            "NexusLIMS_segmentation_strategy",
+            '{"FEI-Titan-TEM-635816_n": null, "default": ["changepoint"]}',
+        )
+        assert segmentation.get_strategy_name(titan) == "kde"
+        assert segmentation.get_strategy_name(quanta) == "kde"
+        assert 'had an unexpected value: "None"' in caplog.text
+
+        monkeypatch.setenv("NexusLIMS_segmentation_strategy", '{"default": "kde",}')
+        assert segmentation.get_strategy_name(titan) == "kde"
+        assert "could not be read as JSON" in caplog.text
+
+    def test_assign_activities_uses_strategy(self, monkeypatch, session_files):
+        instr = Instrument(name="FEI-Titan-TEM-635816_n")
+        monkeypatch.setenv(
+            "NexusLIMS_segmentation_strategy",
+            '{"FEI-Titan-TEM-635816_n": "gap_quantile"}',
+        )
+        n_activities, aa_indices = record_builder._assign_activities(  # noqa: SLF001
+            session_files,
+            instr,
+        )
+        assert n_activities == 3  # noqa: PLR2004
+        assert aa_indices == [0] * 10 + [1] * 10 + [2] * 11
+
+
+class TestBuilderDaemon:
+    """Tests the record builder daemon in nexusLIMS.builder.daemon."""
+
+    @pytest.fixture()
+    def status_path(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("nexusLIMS_path", str(tmp_path / "nexusLIMS"))
+        monkeypatch.setattr(daemon, "reload_instrument_db", lambda: None)
+        monkeypatch.setattr(
+            daemon.nemo_utils,
+            "add_all_usage_events_to_db",
+            lambda **_kwargs: None,
+        )
+        return tmp_path / "status.json"
+
+    def test_daemon_cycles(self, monkeypatch, status_path, tmp_path):
+        results = [[Path("a.xml"), Path("b.xml")], SystemExit("Nothing to build")]
+        calls = []
+
+        def _process_new_records(**kwargs):
+            calls.append(kwargs)
+            assert (tmp_path / ".builder.lock").is_file()
+            result = results.pop(0)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+
+        monkeypatch.setattr(record_builder, "process_new_records", _process_new_records)
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        builder_daemon.run(max_cycles=2)
+
+        assert calls == [{"harvest": False}] * 2
+        assert not (tmp_path / ".builder.lock").exists()
+        status = daemon.read_status(status_path)
+        assert status["state"] == "stopped"
+        assert status["cycles"] == 2  # noqa: PLR2004
+        assert status["last_cycle"]["result"] == "no_sessions"
+        assert status["last_success"] == status["last_cycle"]["finished"]
+        assert status["consecutive_locked"] == 0
+        assert daemon.check_status(status_path) == (
+            False,
+            f"the daemon stopped at {status['updated']}",
+        )
+
+    def test_daemon_incremental_harvest(self, monkeypatch, status_path):
+        now = dt.now(tz=current_system_tz())
+        unfinished = [now - td(hours=3), None, None]
+        harvests = []
+
+        def _harvest(**kwargs):
+            harvests.append(kwargs["dt_from"])
+            return unfinished.pop(0)
+
+        monkeypatch.setattr(daemon.nemo_utils, "add_all_usage_events_to_db", _harvest)
+        monkeypatch.setattr(record_builder, "process_new_records", lambda **_: [])
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        for _ in range(3):
+            builder_daemon.run_cycle()
+
+        # the first check looks back a week, and the second as far as the
+        # event that was still in progress during the first one
+        assert harvests[0] < now - td(days=6)
+        assert harvests[1] == now - td(hours=3)
+        # the third only overlaps the second a little
+        last_harvest = dt.fromisoformat(builder_daemon.status["last_harvest"])
+        assert harvests[2] > now - daemon.HARVEST_OVERLAP - td(minutes=1)
+        assert harvests[2] <= last_harvest - daemon.HARVEST_OVERLAP
+        assert builder_daemon.status["oldest_unfinished_event"] is None
+
+    def test_daemon_lock_and_errors(self, monkeypatch, status_path, tmp_path):
+        def _fail(**_kwargs):
+            msg = "CDCS is down"
+            raise ValueError(msg)
+
+        monkeypatch.setattr(record_builder, "process_new_records", _fail)
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        (tmp_path / ".builder.lock").touch()
+        assert builder_daemon.run_cycle()["result"] == "locked"
+        (tmp_path / ".builder.lock").unlink()
+
+        builder_daemon.run(max_cycles=3)
+        status = daemon.read_status(status_path)
+        assert status["last_cycle"]["result"] == "error"
+        assert status["last_cycle"]["error"] == "ValueError('CDCS is down')"
+        assert status["last_success"] is None
+        assert not (tmp_path / ".builder.lock").exists()
+
+        # pretend the daemon is still running
+        status["state"] = "idle"
+        status_path.write_text(json.dumps(status))
+        healthy, message = daemon.check_status(status_path, max_errors=4)
+        assert healthy
+        assert "3 checks done" in message
+        healthy, message = daemon.check_status(status_path)
+        assert not healthy
+        assert "the last 3 checks failed" in message
+
+        status["updated"] = (
+            dt.now(tz=current_system_tz()) - td(minutes=10)
+        ).isoformat()
+        status_path.write_text(json.dumps(status))
+        healthy, message = daemon.check_status(status_path)
+        assert not healthy
+        assert "is not responding" in message
+        assert daemon.check_status(status_path.with_name("missing.json")) == (
+            False,
+            "no status file found; the daemon is not running",
+        )
+
+    def test_daemon_stale_lock(self, monkeypatch, status_path, tmp_path):
+        def _nothing(**_kwargs):
+            msg = "Nothing to build"
+            raise SystemExit(msg)
+
+        monkeypatch.setattr(record_builder, "process_new_records", _nothing)
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        lock_path = tmp_path / ".builder.lock"
+        with subprocess.Popen([sys.executable, "-c", ""]) as finished:
+            pass
+        dead_pid = finished.pid
+
+        # locks of running processes, other hosts or process_new_records.sh
+        for lock in (
+            f"{os.getpid()} {socket.gethostname()}\n",
+            f"{dead_pid} another-host\n",
+            "",
+        ):
+            lock_path.write_text(lock)
+            assert builder_daemon.run_cycle()["result"] == "locked"
+            assert lock_path.read_text() == lock
+
+        lock_path.write_text(f"{dead_pid} {socket.gethostname()}\n")
+        assert builder_daemon.run_cycle()["result"] == "no_sessions"
+        assert not lock_path.exists()
+
+    def test_daemon_stays_locked(self, monkeypatch, status_path, tmp_path):
+        monkeypatch.setattr(record_builder, "process_new_records", lambda **_: [])
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        (tmp_path / ".builder.lock").touch()
+        builder_daemon.run(max_cycles=3)
+
+        status = daemon.read_status(status_path)
+        assert status["consecutive_locked"] == 3  # noqa: PLR2004
+        assert status["consecutive_errors"] == 0
+        status["state"] = "idle"
+        status_path.write_text(json.dumps(status))
+        assert daemon.check_status(status_path)[0]
+        healthy, message = daemon.check_status(status_path, max_locked=3)
+        assert not healthy
+        assert "the last 3 checks found the lock file" in message
+
+        # no check ever succeeded
+        status["started"] = (dt.now(tz=current_system_tz()) - td(days=1)).isoformat()
+        status_path.write_text(json.dumps(status))
+        healthy, message = daemon.check_status(status_path)
+        assert not healthy
+        assert "no check succeeded in the last" in message
+
+    def test_daemon_recycles_pool(self, monkeypatch, status_path):
+        changed = [True, False]
+        recycled = []
+        monkeypatch.setattr(daemon, "reload_instrument_db", lambda: changed.pop(0))
+        monkeypatch.setattr(
+            record_builder,
+            "recycle_extraction_pool",
+            lambda: recycled.append("recycled"),
+        )
+        monkeypatch.setattr(record_builder, "process_new_records", lambda **_: [])
+        builder_daemon = daemon.BuilderDaemon(interval=0.01, status_path=status_path)
+        assert builder_daemon.run_cycle()["result"] == "built"
+        assert recycled == ["recycled"]
+        assert builder_daemon.run_cycle()["result"] == "built"
+        assert recycled == ["recycled"]
+
+    def test_keep_extraction_pool(self):
+        with record_builder._extraction_pool(1) as pool:  # noqa: SLF001
+            pass
+        assert pool._shutdown_thread  # noqa: SLF001
+
+        with record_builder.keep_extraction_pool(2):
+            with record_builder._extraction_pool(1) as pool:  # noqa: SLF001
+                pass
+            with record_builder._extraction_pool(1) as same_pool:  # noqa: SLF001
+                pass
+            assert same_pool is pool
+            assert pool._max_workers == 2  # noqa: SLF001, PLR2004
+
+            record_builder._discard_extraction_pool(pool)  # noqa: SLF001
+            with record_builder._extraction_pool(1) as new_pool:  # noqa: SLF001
+                pass
+            assert new_pool is not pool
+
+            record_builder.recycle_extraction_pool()
+            assert new_pool._shutdown_thread  # noqa: SLF001
+            with record_builder._extraction_pool(1) as recycled_pool:  # noqa: SLF001
+                pass
+            assert recycled_pool is not new_pool
+        assert not record_builder._RESIDENT_POOL  # noqa: SLF001
+        assert recycled_pool._shutdown_thread  # noqa: SLF001
+        assert new_pool._shutdown_thread  # noqa: SLF001
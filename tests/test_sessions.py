@@ -2,14 +2,21 @@
 # pylint: disable=missing-function-docstring
 # ruff: noqa: D102
 
+import errno
+import os
+import time
 from datetime import datetime as dt
+from datetime import timedelta as td
+from pathlib import Path
 from uuid import uuid4
 
 import pytest
 
-from nexusLIMS.db import make_db_query, session_handler
+from nexusLIMS.builder import record_builder
+from nexusLIMS.db import file_index, file_watcher, make_db_query, session_handler
 from nexusLIMS.db.session_handler import db_query
 from nexusLIMS.instruments import instrument_db
+from nexusLIMS.utils import FileInfo, gnu_find_file_info_by_mtime
 
 
 class TestSession:
@@ -116,3 +123,255 @@ class TestSessionLog:
         assert "WARNING" in caplog.text
         assert "SessionLog already existed in DB, so no row was added:" in caplog.text
         assert result
+
+
+class TestFileIndex:
+    """Test the index of instrument files in nexusLIMS.db.file_index."""
+
+    @pytest.fixture()
+    def instr_files(self, monkeypatch, tmp_path):
+        # the index is created next to the NexusLIMS DB, so point that to tmp_path
+        monkeypatch.setenv("nexusLIMS_db_path", str(tmp_path / "nexuslims_db.sqlite"))
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmf"))
+        monkeypatch.setenv("NexusLIMS_ignore_patterns", '["*.mib"]')
+        instr = instrument_db["FEI-Titan-TEM-635816_n"]
+        root = file_index.get_instrument_root(instr)
+        files = [root / "a.dm3", root / "sub" / "b.TIF", root / "sub" / "c.mib"]
+        for i, f in enumerate(files):
+            f.parent.mkdir(parents=True, exist_ok=True)
+            f.write_text("x" * i)
+            mtime = dt.fromisoformat(f"2021-01-01T12:0{i}:00-05:00").timestamp()
+            os.utime(f, (mtime, mtime))
+        return instr, files
+
+    @staticmethod
+    def _get_files(instr, dt_to="2021-01-02T00:00:00-05:00"):
+        return file_index.get_files_by_mtime(
+            instr,
+            dt.fromisoformat("2021-01-01T00:00:00-05:00"),
+            dt.fromisoformat(dt_to),
+            extensions=["dm3", "tif", "mib"],
+        )
+
+    def test_scan_and_query(self, instr_files):
+        instr, files = instr_files
+        # nothing can be found before the instrument is scanned
+        assert self._get_files(instr) is None
+
+        result = file_index.scan(instr)
+        assert result == {"directories": 2, "listed": 2, "files": 3, "removed": 0}
+        indexed = self._get_files(instr)
+        assert indexed == [FileInfo.from_path(f) for f in files[:2]]
+        assert indexed == gnu_find_file_info_by_mtime(
+            file_index.get_instrument_root(instr),
+            dt.fromisoformat("2021-01-01T00:00:00-05:00"),
+            dt.fromisoformat("2021-01-02T00:00:00-05:00"),
+            extensions=["dm3", "tif", "mib"],
+        )
+
+        # a time range that ends after the last scan is stale
+        assert self._get_files(instr, dt_to="2999-01-01T00:00:00-05:00") is None
+
+        stats = file_index.index_stats()["instruments"][instr.name]
+        assert stats["files"] == len(files)
+        assert file_index.clear() == len(files)
+
+    def test_incremental_scan(self, instr_files):
+        instr, files = instr_files
+        file_index.scan(instr)
+
+        # nothing has changed, so no directories need to be listed again
+        result = file_index.scan(instr)
+        assert result == {"directories": 2, "listed": 0, "files": 0, "removed": 0}
+
+        # adding or removing a file only relists that file's directory
+        files[0].unlink()
+        new_file = files[1].parent / "d.dm3"
+        new_file.write_text("new")
+        mtime = dt.fromisoformat("2021-01-01T13:00:00-05:00").timestamp()
+        os.utime(new_file, (mtime, mtime))
+        result = file_index.scan(instr)
+        assert result == {"directories": 2, "listed": 2, "files": 3, "removed": 1}
+        assert [f.path for f in self._get_files(instr)] == [files[1], new_file]
+
+        # files modified in place do not change their directory, but are
+        # checked again if they had been modified recently
+        recent_file = files[1].parent / "e.dm3"
+        recent_file.write_text("still being written")
+        file_index.scan(instr)
+        with recent_file.open("a") as f:
+            f.write("...done")
+        result = file_index.scan(instr)
+        assert result == {"directories": 2, "listed": 0, "files": 1, "removed": 0}
+        assert file_index.index_stats()["instruments"][instr.name]["size"] == sum(
+            f.stat().st_size for f in recent_file.parent.iterdir()
+        )
+
+        # removed directories are removed from the index
+        for f in files[1].parent.iterdir():
+            f.unlink()
+        files[1].parent.rmdir()
+        result = file_index.scan(instr)
+        assert result == {"directories": 1, "listed": 1, "files": 0, "removed": 4}
+        assert self._get_files(instr) == []
+
+    def test_record_builder_uses_index(self, monkeypatch, instr_files):
+        instr, files = instr_files
+
+        def mock_gnu_find(*_args, **_kwargs):
+            return [FileInfo(Path("found_by_find"), 0.0, 0)]
+
+        monkeypatch.setattr(
+            record_builder,
+            "gnu_find_file_info_by_mtime",
+            mock_gnu_find,
+        )
+        monkeypatch.setenv("NexusLIMS_file_index", "true")
+        args = (
+            file_index.get_instrument_root(instr),
+            dt.fromisoformat("2021-01-01T00:00:00-05:00"),
+            dt.fromisoformat("2021-01-02T00:00:00-05:00"),
+        )
+
+        # falls back to find until the index has been updated
+        assert record_builder.get_files(*args, instrument=instr)[0].path == Path(
+            "found_by_find",
+        )
+        record_builder._update_file_index({instr.name: instr})  # noqa: SLF001
+        found = record_builder.get_files(*args, instrument=instr)
+        assert [f.path for f in found] == files[:2]
+
+        # without an instrument (or with the index disabled), find is used
+        assert record_builder.get_files(*args)[0].path == Path("found_by_find")
+        monkeypatch.setenv("NexusLIMS_file_index", "false")
+        assert record_builder.get_files(*args, instrument=instr)[0].path == Path(
+            "found_by_find",
+        )
+
+
+class TestFileWatcher:
+    """Test keeping the file index up to date with nexusLIMS.db.file_watcher."""
+
+    @pytest.fixture()
+    def instr_root(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("nexusLIMS_db_path", str(tmp_path / "nexuslims_db.sqlite"))
+        monkeypatch.setenv("mmfnexus_path", str(tmp_path / "mmf"))
+        monkeypatch.delenv("NexusLIMS_ignore_patterns", raising=False)
+        instr = instrument_db["FEI-Titan-TEM-635816_n"]
+        root = file_index.get_instrument_root(instr)
+        (root / "existing").mkdir(parents=True)
+        (root / "existing" / "old.dm3").write_text("old")
+        return instr, root
+
+    @staticmethod
+    def _indexed_paths(instr):
+        # query up to the time the index was last brought up to date
+        stats = file_index.index_stats()["instruments"][instr.name]
+        files = file_index.get_files_by_mtime(
+            instr,
+            dt.fromisoformat("2000-01-01T00:00:00-05:00"),
+            # (less a microsecond, since the timestamp may have been rounded up)
+            dt.fromisoformat(stats["last_scanned"]) - td(microseconds=1),
+        )
+        return sorted(f.path.name for f in files)
+
+    def test_inotify_watcher(self, instr_root):
+        instr, root = instr_root
+        watcher = file_watcher.FileWatcher(
+            [instr],
+            mode="inotify",
+            batch_size=50,
+            flush_interval=60,
+        )
+        watcher.start()
+        assert watcher.watched == [instr.name]
+        assert watcher.polled == []
+        assert self._indexed_paths(instr) == ["old.dm3"]
+
+        # a burst of new files (more than the batch size) is written at once
+        series = root / "existing" / "series"
+        series.mkdir()
+        for i in range(100):
+            (series / f"image_{i:03d}.dm3").write_text(str(i))
+        (root / "existing" / "old.dm3").unlink()
+        watcher.process(0.5)
+        assert len(self._indexed_paths(instr)) == 100  # noqa: PLR2004
+        assert "old.dm3" not in self._indexed_paths(instr)
+
+        # moving a directory away removes its files (and watches)
+        series.rename(root.parent / "moved")
+        watcher.process(0.5)
+        watcher.flush()
+        assert self._indexed_paths(instr) == []
+        assert len(watcher._watches) == 2  # noqa: SLF001, PLR2004
+        watcher.close()
+
+    def test_inotify_overflow(self, instr_root):
+        instr, root = instr_root
+        watcher = file_watcher.FileWatcher([instr], mode="inotify", flush_interval=60)
+        watcher.start()
+
+        # a directory is created (with a file in it) while events are lost
+        lost = root / "lost"
+        lost.mkdir()
+        (lost / "first.dm3").write_text("first")
+        watcher._inotify.read_events(0.1)  # noqa: SLF001
+        watcher._handle_event(-1, file_watcher.IN_Q_OVERFLOW, "")  # noqa: SLF001
+        watcher.process(0.1)
+        assert self._indexed_paths(instr) == ["first.dm3", "old.dm3"]
+
+        # the directory is watched again, so later files in it are not missed
+        (lost / "second.dm3").write_text("second")
+        watcher.process(0.5)
+        watcher.flush()
+        assert self._indexed_paths(instr) == ["first.dm3", "old.dm3", "second.dm3"]
+        watcher.close()
+
+    def test_inotify_watch_failure(self, monkeypatch, instr_root):
+        instr, root = instr_root
+        watcher = file_watcher.FileWatcher([instr], mode="auto", flush_interval=60)
+        watcher.start()
+        assert watcher.watched == [instr.name]
+
+        def no_watches(*_):
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        monkeypatch.setattr(watcher._inotify, "add_watch", no_watches)  # noqa: SLF001
+        (root / "unwatched").mkdir()
+        watcher.process(0.5)
+        # the instrument could not be watched again, so it is polled instead
+        assert watcher.watched == []
+        assert watcher.polled == [instr.name]
+        last_scanned = file_index.index_stats()["instruments"][instr.name][
+            "last_scanned"
+        ]
+
+        # and its index is not marked as up to date by the watcher
+        (root / "unwatched" / "new.dm3").write_text("new")
+        watcher.flush()
+        assert (
+            file_index.index_stats()["instruments"][instr.name]["last_scanned"]
+            == last_scanned
+        )
+        watcher.close()
+
+    def test_polling_watcher(self, instr_root):
+        instr, root = instr_root
+        watcher = file_watcher.FileWatcher(
+            [instr],
+            mode="poll",
+            poll_interval=1,
+            flush_interval=0.1,
+        )
+        watcher.start()
+        assert watcher.watched == []
+        assert watcher.polled == [instr.name]
+
+        (root / "new.dm3").write_text("new")
+        time.sleep(1)
+        watcher.process(0.1)
+        assert self._indexed_paths(instr) == ["new.dm3", "old.dm3"]
+        watcher.close()
+
+    def test_is_network_fs(self, tmp_path):
+        assert not file_watcher.is_network_fs(tmp_path)
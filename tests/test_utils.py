@@ -34,6 +34,9 @@ import gzip
 import logging
 import os
 import shutil
+import subprocess
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from subprocess import CalledProcessError
@@ -46,16 +49,21 @@ from nexusLIMS.extractors import extension_reader_map as ext_map
 from nexusLIMS.extractors import quanta_tif
 from nexusLIMS.utils import (
     AuthenticationError,
+    FileInfo,
     _zero_bytes,
     current_system_tz,
     find_dirs_by_mtime,
     find_files_by_mtime,
     get_auth,
+    get_env_bool,
+    get_env_int,
     get_nested_dict_value,
+    gnu_find_file_info_by_mtime,
     gnu_find_files_by_mtime,
     has_delay_passed,
     nexus_req,
     replace_mmf_path,
+    scandir_find_file_info_by_mtime,
     setup_loggers,
     try_getting_dict_value,
 )
@@ -127,6 +135,42 @@ class TestUtils:
 
         assert len(files) == self.TITAN_FILE_COUNT
 
+    def test_gnu_find_file_info(self):
+        infos = gnu_find_file_info_by_mtime(
+            Path(os.environ["mmfnexus_path"]) / "Titan",
+            dt_from=datetime.fromisoformat("2018-11-13T13:00:00.000-05:00"),
+            dt_to=datetime.fromisoformat("2018-11-13T16:00:00.000-05:00"),
+            extensions=ext_map.keys(),
+        )
+
+        assert len(infos) == self.TITAN_FILE_COUNT
+        assert infos == sorted(infos, key=lambda f: f.mtime)
+        for info in infos:
+            assert info == FileInfo.from_path(info.path)
+
+    def test_gnu_find_file_info_odd_names(self, tmp_path):
+        fnames = ["plain.txt", "with space.txt", "with\ttab.txt"]
+        for fname in fnames:
+            (tmp_path / fname).write_text(fname)
+        infos = gnu_find_file_info_by_mtime(
+            tmp_path,
+            dt_from=datetime.fromtimestamp(0, tz=current_system_tz()),
+            dt_to=datetime.now(tz=current_system_tz()),
+        )
+
+        assert sorted(f.path.name for f in infos) == sorted(fnames)
+        for info in infos:
+            assert info == FileInfo.from_path(info.path)
+            assert info.size == len(info.path.name)
+
+    def test_parse_find_timestamp(self):
+        seconds, nanoseconds = 1542132088, 179682000
+        expected = seconds + nanoseconds * 1e-9
+        parse = utils._parse_find_timestamp  # noqa: SLF001
+        assert parse(f"{seconds}.{nanoseconds:09d}0") == expected
+        assert parse(f"{seconds}.{nanoseconds:09d}") == expected
+        assert parse(str(seconds)) == float(seconds)
+
     def test_gnu_find_no_extensions(self):
         # assumption is there are the following additional files
         # in the same 2018-11-13 Titan folder:
@@ -166,6 +210,127 @@ class TestUtils:
         assert len(find_files) == self.JEOL_FILE_COUNT
         assert gnu_files == find_files
 
+    def test_scandir_find(self):
+        args = (
+            Path(os.environ["mmfnexus_path"]) / "Titan",
+            datetime.fromisoformat("2018-11-13T13:00:00.000-05:00"),
+            datetime.fromisoformat("2018-11-13T16:00:00.000-05:00"),
+        )
+        files = scandir_find_file_info_by_mtime(*args, extensions=ext_map.keys())
+        assert len(files) == self.TITAN_FILE_COUNT
+        assert files == gnu_find_file_info_by_mtime(*args, extensions=ext_map.keys())
+
+    @pytest.fixture()
+    def find_tree(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("NexusLIMS_ignore_patterns", '["*.mib"]')
+        tree = tmp_path / "tree"
+        fnames = ["a.dm3", "b.TIF", "c.mib", "d.txt", "sub/e.dm3", "sub/f.dm3"]
+        for i, fname in enumerate(fnames):
+            (tree / fname).parent.mkdir(parents=True, exist_ok=True)
+            (tree / fname).write_text(fname)
+            # the last file is outside the time range searched below
+            mtime = datetime.fromisoformat(
+                f"2021-01-0{1 if i < len(fnames) - 1 else 3}T12:0{i}:00-05:00",
+            ).timestamp()
+            os.utime(tree / fname, (mtime, mtime))
+        return tree
+
+    @pytest.mark.parametrize("extensions", [None, ["dm3", "tif", "mib"]])
+    def test_scandir_find_matches_gnu_find(self, find_tree, extensions):
+        args = (
+            find_tree,
+            datetime.fromisoformat("2021-01-01T00:00:00-05:00"),
+            datetime.fromisoformat("2021-01-02T00:00:00-05:00"),
+        )
+        scandir_files = scandir_find_file_info_by_mtime(
+            *args,
+            extensions=extensions,
+            n_threads=2,
+        )
+        assert scandir_files == gnu_find_file_info_by_mtime(
+            *args,
+            extensions=extensions,
+        )
+        expected = ["a.dm3", "b.TIF", "e.dm3"]
+        if extensions is None:
+            expected.insert(2, "d.txt")
+        assert [f.path.name for f in scandir_files] == expected
+
+    def test_scandir_find_symlinks(self, find_tree, tmp_path):
+        # if a folder contains symlinks to directories, only those are searched
+        links = tmp_path / "links"
+        (links / "real_dir").mkdir(parents=True)
+        (links / "real_dir" / "ignored.dm3").write_text("not found")
+        (links / "linked").symlink_to(find_tree / "sub")
+        args = (
+            links,
+            datetime.fromisoformat("2021-01-01T00:00:00-05:00"),
+            datetime.fromisoformat("2099-01-01T00:00:00-05:00"),
+        )
+        scandir_files = scandir_find_file_info_by_mtime(*args)
+        assert scandir_files == gnu_find_file_info_by_mtime(*args)
+        assert [f.path for f in scandir_files] == [
+            links / "linked" / "e.dm3",
+            links / "linked" / "f.dm3",
+        ]
+
+    @pytest.mark.parametrize("n_processes", [1, 2, 4])
+    def test_gnu_find_concurrent_roots(
+        self,
+        find_tree,
+        tmp_path,
+        monkeypatch,
+        n_processes,
+    ):
+        # a folder of symlinks to separate "volumes"
+        links = tmp_path / "links"
+        links.mkdir()
+        for i in range(3):
+            volume = tmp_path / f"volume_{i}"
+            shutil.copytree(find_tree, volume, symlinks=True)
+            (links / f"link_{i}").symlink_to(volume)
+
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+        find_calls = []
+        real_run = subprocess.run
+
+        def mock_run(cmd, **kwargs):
+            with lock:
+                find_calls.append(cmd)
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.1)
+            try:
+                return real_run(cmd, **kwargs)
+            finally:
+                with lock:
+                    running["now"] -= 1
+
+        monkeypatch.setattr(utils.subprocess, "run", mock_run)
+        monkeypatch.setenv("NexusLIMS_find_processes", str(n_processes))
+        files = gnu_find_file_info_by_mtime(
+            links,
+            datetime.fromisoformat("2021-01-01T00:00:00-05:00"),
+            datetime.fromisoformat("2021-01-02T00:00:00-05:00"),
+        )
+
+        # one call to find the symlinks, then either one call for all three
+        # roots or one call per root (with no more than n_processes at once)
+        search_calls = find_calls[1:]
+        if n_processes == 1:
+            assert len(search_calls) == 1
+        else:
+            assert sorted(c[2] for c in search_calls) == [
+                str(links / f"link_{i}") for i in range(3)
+            ]
+        assert running["max"] == min(n_processes, 3)
+        assert sorted(str(f.path.relative_to(links)) for f in files) == sorted(
+            f"link_{i}/{name}"
+            for i in range(3)
+            for name in ["a.dm3", "b.TIF", "d.txt", "sub/e.dm3"]
+        )
+
     def test_gnu_find_not_on_path(self, monkeypatch):
         monkeypatch.setenv("PATH", ".")
 
@@ -276,6 +441,32 @@ class TestUtils:
             "The environment variable value of nexusLIMS_file_delay_days" in caplog.text
         )
 
+    def test_get_env_int(self, monkeypatch, caplog):
+        monkeypatch.delenv("NexusLIMS_test_int", raising=False)
+        assert get_env_int("NexusLIMS_test_int", 3) == 3  # noqa: PLR2004
+        monkeypatch.setenv("NexusLIMS_test_int", "5")
+        assert get_env_int("NexusLIMS_test_int", 3) == 5  # noqa: PLR2004
+        monkeypatch.setenv("NexusLIMS_test_int", "bad_int")
+        assert get_env_int("NexusLIMS_test_int", 3) == 3  # noqa: PLR2004
+        assert "could not be understood as an integer" in caplog.text
+        monkeypatch.setenv("NexusLIMS_test_int", "-1")
+        assert get_env_int("NexusLIMS_test_int", 3) == 3  # noqa: PLR2004
+        assert "was less than 0" in caplog.text
+
+    def test_get_env_bool(self, monkeypatch, caplog):
+        monkeypatch.delenv("NexusLIMS_test_bool", raising=False)
+        assert get_env_bool("NexusLIMS_test_bool") is False
+        assert get_env_bool("NexusLIMS_test_bool", default=True) is True
+        for val in ["1", "True", "yes", " ON "]:
+            monkeypatch.setenv("NexusLIMS_test_bool", val)
+            assert get_env_bool("NexusLIMS_test_bool") is True
+        for val in ["0", "false", "No", ""]:
+            monkeypatch.setenv("NexusLIMS_test_bool", val)
+            assert get_env_bool("NexusLIMS_test_bool", default=True) is False
+        monkeypatch.setenv("NexusLIMS_test_bool", "maybe")
+        assert get_env_bool("NexusLIMS_test_bool", default=True) is True
+        assert "could not be understood as true or false" in caplog.text
+
     @pytest.fixture()
     def _change_paths_in_env(self, monkeypatch):
         monkeypatch.setenv("mmfnexus_path", "/tmp/mmf_test_path")